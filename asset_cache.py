@@ -0,0 +1,155 @@
+# asset_cache.py
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import ASSET_RECHECK_INTERVAL
+except ImportError:
+    ASSET_RECHECK_INTERVAL = 30
+
+CREATE_ASSETS_SQL = '''
+    CREATE TABLE IF NOT EXISTS media_assets (
+        path TEXT PRIMARY KEY,
+        file_hash TEXT NOT NULL,
+        file_id TEXT NOT NULL,
+        size INTEGER,
+        mtime REAL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+UPSERT_ASSET_SQL = '''
+    INSERT OR REPLACE INTO media_assets (path, file_hash, file_id, size, mtime, updated_at)
+    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+'''
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _Asset:
+    __slots__ = ('file_hash', 'file_id', 'size', 'mtime', 'checked_at', 'missing')
+
+    def __init__(self, file_hash: str = None, file_id: str = None, size: int = None, mtime: float = None):
+        self.file_hash = file_hash
+        self.file_id = file_id
+        self.size = size
+        self.mtime = mtime
+        self.checked_at = 0.0
+        self.missing = False
+
+
+class AssetCache:
+    """file_id Telegram для локальных картинок бота
+
+    Картинка загружается в Telegram один раз, дальше отправляется по
+    file_id из таблицы media_assets. Файл на диске проверяется (os.stat)
+    не чаще раза в ASSET_RECHECK_INTERVAL секунд; если изменились размер
+    или время изменения - пересчитывается sha256, и при новом хеше
+    картинка загружается заново.
+    """
+
+    def __init__(self, recheck_interval: float = ASSET_RECHECK_INTERVAL):
+        self.recheck_interval = recheck_interval
+        self._assets: Dict[str, _Asset] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.uploads = 0
+
+    def load(self, connection) -> int:
+        """Загрузка сохраненных file_id из БД"""
+        connection.execute(CREATE_ASSETS_SQL)
+        connection.commit()
+        rows = connection.execute('SELECT path, file_hash, file_id, size, mtime FROM media_assets').fetchall()
+        with self._lock:
+            for path, file_hash, file_id, size, mtime in rows:
+                self._assets[path] = _Asset(file_hash, file_id, size, mtime)
+        return len(rows)
+
+    def _checked(self, path: str) -> _Asset:
+        """Запись картинки, сверенная с диском не позже recheck_interval назад"""
+        asset = self._assets.get(path)
+        if asset is None:
+            asset = self._assets[path] = _Asset()
+
+        now = time.monotonic()
+        if now - asset.checked_at >= self.recheck_interval:
+            self._verify(path, asset)
+            asset.checked_at = now
+        return asset
+
+    def is_available(self, path: str) -> bool:
+        """Есть ли файл на диске (без os.path.exists на каждый вызов)"""
+        with self._lock:
+            return not self._checked(path).missing
+
+    def lookup(self, path: str) -> Optional[str]:
+        """file_id картинки или None, если ее нужно загрузить
+
+        FileNotFoundError, если файла нет на диске.
+        """
+        with self._lock:
+            asset = self._checked(path)
+            if asset.missing:
+                raise FileNotFoundError(path)
+            if asset.file_id:
+                self.hits += 1
+            return asset.file_id
+
+    def _verify(self, path: str, asset: _Asset):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            asset.missing = True
+            return
+        asset.missing = False
+
+        if (stat.st_size, stat.st_mtime) == (asset.size, asset.mtime):
+            return
+
+        file_hash = file_sha256(path)
+        if file_hash != asset.file_hash:
+            if asset.file_id:
+                logger.info(f"🔄 Картинка изменилась, будет загружена заново: {path}")
+            asset.file_hash = file_hash
+            asset.file_id = None
+        asset.size, asset.mtime = stat.st_size, stat.st_mtime
+
+    def remember(self, connection, path: str, file_id: str):
+        """Сохранение file_id после загрузки картинки"""
+        with self._lock:
+            asset = self._assets.get(path)
+            if asset is None or asset.file_hash is None:
+                return
+            asset.file_id = file_id
+            self.uploads += 1
+            row = (path, asset.file_hash, file_id, asset.size, asset.mtime)
+        connection.execute(UPSERT_ASSET_SQL, row)
+        connection.commit()
+
+    def forget(self, path: str):
+        """Сброс file_id, который Telegram больше не принимает"""
+        with self._lock:
+            asset = self._assets.get(path)
+            if asset is not None:
+                asset.file_id = None
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'assets': len(self._assets),
+                'cached': sum(1 for asset in self._assets.values() if asset.file_id),
+                'hits': self.hits,
+                'uploads': self.uploads
+            }
@@ -0,0 +1,73 @@
+# async_db.py
+import asyncio
+import functools
+import inspect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseWorker:
+    """Выделенный поток для всех запросов к SQLite
+
+    Соединение sqlite3 используется только из этого потока, поэтому запросы
+    и fsync при commit() не блокируют event loop, а порядок записей сохраняется.
+    """
+
+    def __init__(self, thread_name: str = 'db-worker'):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=thread_name)
+        self._closed = False
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполняет синхронную функцию в потоке БД и возвращает результат"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True):
+        """Останавливает поток БД, дожидаясь уже поставленных запросов"""
+        if not self._closed:
+            self._closed = True
+            self._executor.shutdown(wait=wait)
+
+
+class AsyncDatabase:
+    """Асинхронный фасад над синхронным классом базы данных
+
+    Сохраняет набор методов обернутой БД: синхронные методы возвращают корутину,
+    которая выполняется в потоке DatabaseWorker, асинхронные методы и атрибуты
+    отдаются как есть. Обработчики пишут `await db.get_user(user_id)`.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.worker = getattr(database, 'worker', None) or DatabaseWorker()
+        self._wrappers = {}
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполнение произвольной синхронной функции в потоке БД"""
+        return await self.worker.run(func, *args, **kwargs)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.database, name)
+
+        if not callable(attr) or inspect.iscoroutinefunction(attr) or name.startswith('__'):
+            return attr
+
+        wrapper = self._wrappers.get(name)
+        if wrapper is None:
+            @functools.wraps(attr)
+            async def wrapper(*args, **kwargs):
+                return await self.worker.run(getattr(self.database, name), *args, **kwargs)
+
+            self._wrappers[name] = wrapper
+
+        return wrapper
+
+    async def close(self):
+        """Закрытие БД в ее потоке и остановка потока"""
+        try:
+            await self.worker.run(self.database.close)
+        finally:
+            self.worker.shutdown()
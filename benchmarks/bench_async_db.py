@@ -0,0 +1,144 @@
+# benchmarks/bench_async_db.py
+"""Сравнение задержек обработчиков: синхронный sqlite3 в event loop против потока БД
+
+Запуск: python benchmarks/bench_async_db.py [--users 500] [--light 2000] [--rate 2000]
+
+Моделирует N одновременных игроков, каждый делает ставку (чтение баланса,
+запись ставки, обновление баланса с commit), и параллельно поток "легких"
+обработчиков (меню, кнопки), которые БД не трогают. Апдейты приходят
+с постоянной частотой --rate. В режиме sync запросы выполняются прямо
+в event loop, в режиме async — через AsyncDatabase.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from async_db import AsyncDatabase, DatabaseWorker
+
+
+class BenchDatabase:
+    """Минимальная БД с той же схемой записи ставки, что и в боте"""
+
+    def __init__(self, db_path: str):
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.worker = DatabaseWorker()
+        cursor = self.connection.cursor()
+        cursor.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, balance REAL)')
+        cursor.execute('''
+            CREATE TABLE bets (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER, amount REAL, win_amount REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.connection.commit()
+
+    def add_users(self, count: int):
+        self.connection.executemany(
+            'INSERT INTO users (user_id, balance) VALUES (?, ?)',
+            [(user_id, 1000.0) for user_id in range(count)]
+        )
+        self.connection.commit()
+
+    def place_bet(self, user_id: int, amount: float, win_amount: float) -> float:
+        cursor = self.connection.cursor()
+        cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,))
+        balance = cursor.fetchone()['balance']
+        cursor.execute('INSERT INTO bets (user_id, amount, win_amount) VALUES (?, ?, ?)',
+                       (user_id, amount, win_amount))
+        new_balance = balance - amount + win_amount
+        cursor.execute('UPDATE users SET balance = ? WHERE user_id = ?', (new_balance, user_id))
+        self.connection.commit()
+        return new_balance
+
+    def close(self):
+        self.connection.close()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))]
+    return {
+        'p50': pick(0.50) * 1000,
+        'p95': pick(0.95) * 1000,
+        'p99': pick(0.99) * 1000,
+        'max': samples[-1] * 1000,
+        'mean': statistics.mean(samples) * 1000,
+    }
+
+
+async def run_mode(mode: str, users: int, light: int, rate: float):
+    tmp_dir = tempfile.mkdtemp(prefix='bench_async_db_')
+    database = BenchDatabase(os.path.join(tmp_dir, 'bench.db'))
+    database.add_users(users)
+    db = AsyncDatabase(database)
+
+    bet_latency = []
+    light_latency = []
+    interval = 1.0 / rate
+
+    # Задержка считается от запланированного момента прихода апдейта,
+    # поэтому время ожидания заблокированного event loop тоже учитывается
+    async def bettor(user_id: int, arrival: float):
+        if mode == 'sync':
+            database.place_bet(user_id, 1.0, 0.0)
+        else:
+            await db.place_bet(user_id, 1.0, 0.0)
+        bet_latency.append(time.perf_counter() - arrival)
+
+    async def light_handler(arrival: float):
+        # Обработчик без обращения к БД (меню, кнопки)
+        await asyncio.sleep(0)
+        light_latency.append(time.perf_counter() - arrival)
+
+    events = ['bet'] * users + ['light'] * light
+    random.Random(42).shuffle(events)
+
+    tasks = []
+    started = time.perf_counter()
+    for index, kind in enumerate(events):
+        arrival = started + index * interval
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if kind == 'bet':
+            tasks.append(asyncio.create_task(bettor(index % users, arrival)))
+        else:
+            tasks.append(asyncio.create_task(light_handler(arrival)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    await db.close()
+    return elapsed, percentiles(bet_latency), percentiles(light_latency)
+
+
+def print_report(mode: str, elapsed: float, bets: dict, light: dict):
+    print(f"\n=== {mode} ===  всего: {elapsed:.2f} с")
+    for name, stats in (('ставка', bets), ('легкий', light)):
+        print(f"  {name:<7} p50={stats['p50']:8.2f} мс  p95={stats['p95']:8.2f} мс  "
+              f"p99={stats['p99']:8.2f} мс  max={stats['max']:8.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=500, help='одновременных игроков')
+    parser.add_argument('--light', type=int, default=2000, help='легких обработчиков без БД')
+    parser.add_argument('--rate', type=float, default=2000, help='апдейтов в секунду')
+    args = parser.parse_args()
+
+    for mode in ('sync', 'async'):
+        elapsed, bets, light = asyncio.run(run_mode(mode, args.users, args.light, args.rate))
+        print_report(mode, elapsed, bets, light)
+
+
+if __name__ == '__main__':
+    main()
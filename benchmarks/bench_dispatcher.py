@@ -0,0 +1,368 @@
+# benchmarks/bench_dispatcher.py
+"""Нагрузочный прогон main.dp: синтетические апдейты N одновременных игроков без сети
+
+Запуск: python benchmarks/bench_dispatcher.py [--users 200] [--rounds 3] [--think 0]
+                                             [--api-delay 0] [--save base.json] [--compare base.json]
+
+main.py импортируется в пустом временном каталоге (своя casino.db), у бота
+подменяется Bot.request: вызовы API только записываются и получают
+правдоподобный ответ, опционально с задержкой --api-delay мс. Каждый
+игрок проходит сценарий: /start, меню ставки, выбор игры и исхода,
+сумма ставки, ввод промокода, баланс - --rounds раз.
+
+Отчет: пропускная способность, перцентили задержки по обработчикам,
+SQL-запросы на апдейт (sqlite3 trace callback), вызовы Bot API на апдейт
+и пиковая память. --save сохраняет результат в JSON, --compare печатает
+разницу с сохраненным базовым прогоном.
+"""
+import argparse
+import asyncio
+import contextvars
+import itertools
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from fake_bot_api import BOT_USER, build_result
+
+PROMO_CODE = 'BENCHPROMO'
+FIRST_USER_ID = 5000000
+PHOTOS = os.path.join(ROOT, 'Photos')
+
+# Обработчики, сработавшие на текущий апдейт (заполняет HandlerProbe)
+handled_by = contextvars.ContextVar('handled_by')
+
+
+def import_bot(work_dir: str, placeholders: bool = True):
+    """Импорт main.py во временном каталоге без настоящего токена и сервера"""
+    os.environ.update({'BOT_TOKEN': '123456:BENCH-TOKEN', 'BOT_MODE': 'polling', 'TELEGRAM_API_SERVER': ''})
+    os.chdir(work_dir)
+    photo_dir = os.path.join(work_dir, 'photos')
+    os.makedirs(photo_dir)
+    for name in os.listdir(PHOTOS):
+        os.symlink(os.path.join(PHOTOS, name), os.path.join(photo_dir, name))
+    import main
+
+    # Картинки из PHOTO_MAPPING, которых нет в репозитории, как в боевой установке
+    if placeholders:
+        for name in set(main.PHOTO_MAPPING.values()):
+            path = os.path.join(photo_dir, name)
+            if not os.path.exists(path):
+                os.symlink(os.path.join(PHOTOS, 'game.jpg'), path)
+    return main
+
+
+# ==================== ЗАГЛУШКИ ====================
+
+class RecordingRequest:
+    """Замена Bot.request: считает вызовы API и возвращает правдоподобный ответ"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = defaultdict(int)
+        self.uploads = 0
+        # Последнее сообщение бота в каждом чате: из него приходят callback
+        self.last_message = {}
+        self._message_ids = itertools.count(1)
+
+    async def __call__(self, method, data=None, files=None, **kwargs):
+        self.calls[method] += 1
+        if files:
+            self.uploads += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        result = build_result(method, data or {}, self._message_ids)
+        if isinstance(result, dict) and 'chat' in result:
+            self.last_message[result['chat']['id']] = result
+        return result
+
+
+class StatementCounter:
+    """Счетчик SQL-запросов через sqlite3.Connection.set_trace_callback"""
+
+    def __init__(self):
+        self.by_kind = defaultdict(int)
+
+    def __call__(self, statement: str):
+        kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else '?'
+        self.by_kind[kind] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(self.by_kind.values())
+
+    def attach(self, connection):
+        connection.set_trace_callback(self)
+
+
+def make_probe():
+    from aiogram.dispatcher.handler import current_handler
+    from aiogram.dispatcher.middlewares import BaseMiddleware
+
+    class HandlerProbe(BaseMiddleware):
+        """Запоминает имя обработчика, выбранного диспетчером"""
+
+        def _record(self):
+            handlers = handled_by.get(None)
+            if handlers is not None:
+                handlers.append(current_handler.get().__name__)
+
+        async def on_process_message(self, message, data):
+            self._record()
+
+        async def on_process_callback_query(self, callback, data):
+            self._record()
+
+    return HandlerProbe()
+
+
+# ==================== СИНТЕТИЧЕСКИЕ АПДЕЙТЫ ====================
+
+class UpdateFactory:
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': f'Player{user_id}',
+                'username': f'player{user_id}', 'language_code': 'ru'}
+
+    def message(self, user_id: int, text: str) -> dict:
+        message = {
+            'message_id': next(self._message_ids),
+            'from': self._user(user_id),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': f'Player{user_id}'},
+            'date': int(time.time()),
+            'text': text
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'offset': 0, 'length': len(text.split()[0]), 'type': 'bot_command'}]
+        return {'update_id': next(self._update_ids), 'message': message}
+
+    def callback(self, user_id: int, data: str, message: dict = None) -> dict:
+        """Нажатие кнопки под сообщением бота (по умолчанию - под текстовым)"""
+        message = message or {
+            'message_id': next(self._message_ids),
+            'from': BOT_USER,
+            'chat': {'id': user_id, 'type': 'private'},
+            'date': int(time.time()),
+            'text': '🎰'
+        }
+        return {
+            'update_id': next(self._update_ids),
+            'callback_query': {
+                'id': str(next(self._update_ids)),
+                'from': self._user(user_id),
+                'message': message,
+                'chat_instance': str(user_id),
+                'data': data
+            }
+        }
+
+
+GAMES = [('more_less', ['more', 'less']), ('even_odd', ['even', 'odd']), ('number', ['1', '3', '6'])]
+
+
+def scenario(round_no: int, rnd: random.Random):
+    """Действия одного круга игрока: ('message', текст) или ('callback', data)"""
+    game, outcomes = rnd.choice(GAMES)
+    steps = [('message', '/start')] if round_no == 0 else []
+    steps += [
+        ('message', '🎲 Сделать ставку'),
+        ('callback', f'game_{game}'),
+        ('callback', f'outcome_{rnd.choice(outcomes)}'),
+        ('message', str(rnd.choice([1, 2, 5]))),
+        ('callback', 'activate_promo'),
+        ('message', PROMO_CODE),
+        ('message', '💰 Мой баланс')
+    ]
+    return steps
+
+
+# ==================== ПРОГОН ====================
+
+async def seed(main, users: int):
+    """Пользователи с балансом и промокод до начала замеров"""
+    for i in range(users):
+        user_id = FIRST_USER_ID + i
+        await main.db.add_user(user_id, f'player{user_id}', f'Player{user_id}')
+        await main.db.update_balance(user_id, 1000000, 'adjustment', 'bench')
+    await main.db.create_promo_code(PROMO_CODE, 1.0, max_uses=0, description='bench')
+    await main.db.flush_logs()
+
+
+async def run(main, args):
+    from aiogram import Bot, Dispatcher, types
+
+    Bot.set_current(main.bot)
+    Dispatcher.set_current(main.dp)
+
+    recorder = RecordingRequest(args.api_delay / 1000)
+    # Подменяем транспорт базового Bot, чтобы запросы шли через очередь отправки
+    Bot.request = recorder
+    if not args.telegram_limits and hasattr(main, 'send_queue'):
+        main.send_queue.__init__(global_rate=0, chat_rate=0, group_rate=0,
+                                 priorities=main.send_queue.priorities)
+    main.dp.middleware.setup(make_probe())
+
+    await seed(main, args.users)
+
+    statements = StatementCounter()
+    statements.attach(main.db.database.connection)
+    if hasattr(main.dp.storage, 'connection'):
+        statements.attach(main.dp.storage.connection)
+
+    factory = UpdateFactory()
+    latencies = defaultdict(list)
+    errors = 0
+
+    async def player(index: int):
+        nonlocal errors
+        rnd = random.Random(index)
+        user_id = FIRST_USER_ID + index
+        for round_no in range(args.rounds):
+            for kind, payload in scenario(round_no, rnd):
+                if kind == 'message':
+                    raw = factory.message(user_id, payload)
+                else:
+                    raw = factory.callback(user_id, payload, recorder.last_message.get(user_id))
+                handlers = []
+                handled_by.set(handlers)
+                started = time.perf_counter()
+                try:
+                    # Как в executor: отдельная задача на апдейт, иначе aiogram
+                    # переиспользует состояние FSM, закэшированное в контексте
+                    await asyncio.get_running_loop().create_task(main.dp.process_update(types.Update(**raw)))
+                except Exception:
+                    errors += 1
+                elapsed = time.perf_counter() - started
+                latencies[handlers[0] if handlers else 'unhandled'].append(elapsed)
+                if args.think:
+                    await asyncio.sleep(rnd.uniform(0, args.think / 1000))
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(player(i) for i in range(args.users)))
+    elapsed = time.perf_counter() - started
+    heap_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    tracemalloc.stop()
+
+    # Отложенная запись логов и FSM тоже часть нагрузки на БД
+    await main.db.flush_logs()
+    if hasattr(main.dp.storage, 'flush'):
+        await main.dp.storage.flush()
+
+    updates = sum(len(v) for v in latencies.values())
+    return {
+        'users': args.users,
+        'rounds': args.rounds,
+        'updates': updates,
+        'errors': errors,
+        'elapsed': elapsed,
+        'throughput': updates / elapsed,
+        'handlers': {name: summarize(samples) for name, samples in latencies.items()},
+        'sql_per_update': statements.total / updates,
+        'sql_by_kind': dict(statements.by_kind),
+        'api_per_update': sum(recorder.calls.values()) / updates,
+        'api_calls': dict(recorder.calls),
+        'uploads': recorder.uploads,
+        'send_queue': main.send_queue.get_stats() if hasattr(main, 'send_queue') else None,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'peak_heap_mb': heap_peak / 1024 / 1024 if heap_peak is not None else None
+    }
+
+
+def summarize(samples) -> dict:
+    samples = sorted(samples)
+
+    def pick(q: float) -> float:
+        return samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+
+    return {'count': len(samples), 'mean': statistics.mean(samples) * 1000,
+            'p50': pick(0.5), 'p95': pick(0.95), 'p99': pick(0.99)}
+
+
+# ==================== ОТЧЕТ ====================
+
+def delta(current, base) -> str:
+    if base in (None, 0) or current is None:
+        return ''
+    return f' ({(current - base) / base * 100:+.0f}%)'
+
+
+def report(result: dict, base: dict = None):
+    base = base or {}
+    base_handlers = base.get('handlers', {})
+    print(f"\n=== {result['users']} игроков x {result['rounds']} кругов ===")
+    print(f"  апдейтов: {result['updates']}, ошибок: {result['errors']}, время: {result['elapsed']:.2f} с")
+    print(f"  пропускная способность: {result['throughput']:.0f} апд/с{delta(result['throughput'], base.get('throughput'))}")
+    print(f"  SQL на апдейт: {result['sql_per_update']:.1f}{delta(result['sql_per_update'], base.get('sql_per_update'))}  "
+          f"{', '.join(f'{k}={v}' for k, v in sorted(result['sql_by_kind'].items()))}")
+    print(f"  Bot API на апдейт: {result['api_per_update']:.2f}  "
+          f"{', '.join(f'{k}={v}' for k, v in sorted(result['api_calls'].items()))}")
+    print(f"  загрузок файлов: {result.get('uploads', 0)}{delta(result.get('uploads'), base.get('uploads'))}")
+    queue = result.get('send_queue')
+    if queue:
+        waits = ', '.join(f"{name} p95 {wait['p95'] * 1000:.0f} мс" for name, wait in queue['wait'].items())
+        print(f"  очередь отправки: макс. глубина {queue['max_depth']}, {waits}")
+    print(f"  пик RSS: {result['peak_rss_mb']:.0f} МБ{delta(result['peak_rss_mb'], base.get('peak_rss_mb'))}", end='')
+    if result['peak_heap_mb'] is not None:
+        print(f", пик Python heap: {result['peak_heap_mb']:.1f} МБ", end='')
+    print()
+
+    print(f"\n  {'обработчик':<28}{'кол-во':>8}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}  мс")
+    for name, stats in sorted(result['handlers'].items(), key=lambda item: -item[1]['p95']):
+        line = f"  {name:<28}{stats['count']:>8}{stats['mean']:>9.2f}{stats['p50']:>9.2f}{stats['p95']:>9.2f}{stats['p99']:>9.2f}"
+        if name in base_handlers:
+            line += f"  p95{delta(stats['p95'], base_handlers[name]['p95'])}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--think', type=float, default=0, help='пауза игрока между апдейтами, до N мс')
+    parser.add_argument('--api-delay', type=float, default=0, help='задержка ответа Bot API, мс')
+    parser.add_argument('--no-placeholders', action='store_true',
+                        help='не подставлять картинки, которых нет в Photos/')
+    parser.add_argument('--telegram-limits', action='store_true',
+                        help='лимиты Telegram в очереди отправки (по умолчанию сняты)')
+    parser.add_argument('--tracemalloc', action='store_true', help='пик Python heap (замедляет прогон)')
+    parser.add_argument('--save', metavar='JSON', help='сохранить результат как базовый')
+    parser.add_argument('--compare', metavar='JSON', help='сравнить с сохраненным результатом')
+    args = parser.parse_args()
+
+    save_path = os.path.abspath(args.save) if args.save else None
+    base = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            base = json.load(f)
+
+    bot_module = import_bot(tempfile.mkdtemp(prefix='bench_dp_'), not args.no_placeholders)
+    loop = asyncio.get_event_loop()
+    result = loop.run_until_complete(run(bot_module, args))
+    loop.run_until_complete(bot_module.db.close())
+
+    report(result, base)
+    if save_path:
+        with open(save_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n  сохранено: {save_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# benchmarks/bench_fsm_storage.py
+"""Накладные расходы FSM-хранилища на один апдейт: MemoryStorage против SQLiteStorage
+
+Запуск: python benchmarks/bench_fsm_storage.py [--users 2000] [--updates 20000]
+
+Каждый апдейт повторяет то, что делает диспетчер aiogram и обработчик ставки:
+get_state (фильтр состояния), get_data, update_data и set_state/finish.
+Для SQLiteStorage отдельно показано время финального сброса в БД.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+from fsm_storage import SQLiteStorage
+
+STATES = ['UserStates:waiting_bet_amount', 'UserStates:waiting_deposit_amount', 'UserStates:waiting_promo_code']
+
+
+async def simulate_update(storage, user_id: int, step: int):
+    state = await storage.get_state(chat=user_id, user=user_id)
+    data = await storage.get_data(chat=user_id, user=user_id)
+
+    if state is None:
+        await storage.set_state(chat=user_id, user=user_id, state=random.choice(STATES))
+        await storage.update_data(chat=user_id, user=user_id, game_type='more_less', outcome='more')
+    elif data.get('outcome'):
+        await storage.update_data(chat=user_id, user=user_id, amount=step % 30 + 1)
+        await storage.reset_state(chat=user_id, user=user_id, with_data=True)
+
+
+async def run(name: str, storage, users: int, updates: int):
+    rnd = random.Random(7)
+    samples = []
+
+    started = time.perf_counter()
+    for step in range(updates):
+        user_id = rnd.randrange(users)
+        t = time.perf_counter()
+        await simulate_update(storage, user_id, step)
+        samples.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+
+    t = time.perf_counter()
+    await storage.close()
+    close_time = time.perf_counter() - t
+
+    samples.sort()
+    print(f"\n=== {name} ===")
+    print(f"  апдейтов: {updates}, всего: {elapsed:.3f} с")
+    print(f"  на апдейт: mean={statistics.mean(samples) * 1e6:7.1f} мкс  "
+          f"p50={samples[len(samples) // 2] * 1e6:7.1f} мкс  "
+          f"p99={samples[int(len(samples) * 0.99)] * 1e6:7.1f} мкс")
+    print(f"  close/flush: {close_time * 1000:.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--updates', type=int, default=20000)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='bench_fsm_')
+
+    asyncio.run(run('MemoryStorage', MemoryStorage(), args.users, args.updates))
+    asyncio.run(run('SQLiteStorage', SQLiteStorage(os.path.join(tmp_dir, 'fsm.db')), args.users, args.updates))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+# benchmarks/bench_payments.py
+"""Пропускная способность и задержки платежей на локальном эмуляторе Crypto Pay API
+
+Запуск: python benchmarks/bench_payments.py [--deposits 500] [--withdrawals 500] [--latency 0.03]
+        [--error-rate 0.02] [--rate-limit 0] [--mode webhook|polling] [--webhook-drop-rate 0.05]
+
+main.py импортируется во временном каталоге (своя casino.db), эмулятор
+(cryptobot_emulator.py) запускается в том же процессе, CryptoBotTurbo
+направляется на него. Замеряются два пути:
+- пополнение: createInvoice, оплата счета в эмуляторе через pay_delay
+  секунд и зачисление на баланс по подписанному webhook invoice_paid
+  (--mode webhook, потерянные обновления подбирает сверка reconcile) или
+  опросом getInvoices раз в poll_interval (--mode polling); задержка -
+  от оплаты счета до зачисления;
+- вывод: create_withdrawal и очередь выплат payout_outbox с transfer
+  в эмулятор; задержка - от создания вывода до проведения перевода.
+Для каждого пути печатаются пропускная способность, p50/p95/p99/max
+задержки и счетчики эмулятора и клиента (повторы, 429, ошибки).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from check_query_plans import import_database
+from cryptobot_emulator import CryptoBotEmulator, start_emulator
+from cryptobot_fast import CryptoBotTurbo
+from cryptopay_webhook import CryptoPayWebhook, reconcile
+from payout_outbox import PAYOUT_WORKERS, PAYOUT_BACKOFF_BASE, PayoutOutbox
+
+TOKEN = 'bench:token'
+FIRST_USER_ID = 5_000_000
+
+
+def summary(name: str, latencies: list, elapsed: float, done: int, total: int):
+    ordered = sorted(latencies)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000 if ordered else 0.0
+
+    print(f"\n=== {name}: {done}/{total} за {elapsed:.2f} с, {done / elapsed if elapsed else 0:.1f} в секунду ===")
+    print(f"  задержка, мс: p50 {pick(0.5):.0f}, p95 {pick(0.95):.0f}, p99 {pick(0.99):.0f}, "
+          f"max {ordered[-1] * 1000 if ordered else 0:.0f}")
+
+
+def print_client(client: CryptoBotTurbo):
+    metrics = client.get_metrics()
+    print(f"  выключатель: {metrics['breaker']}, срабатываний {metrics['breaker_opened']}")
+    for endpoint, stats in metrics['endpoints'].items():
+        print(f"  {endpoint:<16} запросов {stats['requests']:>6}, повторов {stats['retries']:>4}, "
+              f"ошибок {stats['error_rate']:>5.1f}%, p50 {stats['p50'] or 0:.0f} мс, p95 {stats['p95'] or 0:.0f} мс")
+
+
+async def bench_deposits(main, emulator: CryptoBotEmulator, client: CryptoBotTurbo, args):
+    db = main.db
+    semaphore = asyncio.Semaphore(args.concurrency)
+    created, failed = [], 0
+    credited = {}
+
+    async def on_paid(invoice) -> bool:
+        if not await db.credit_deposit(invoice):
+            return False
+        credited[invoice['invoice_id']] = time.monotonic()
+        return True
+
+    webhook, webhook_url, runner = None, None, None
+    if args.mode == 'webhook':
+        webhook = CryptoPayWebhook(TOKEN, on_paid)
+        app = web.Application()
+        webhook.register(app, '/cryptopay')
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        webhook_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/cryptopay"
+
+    async def deposit(number: int):
+        nonlocal failed
+        user_id = FIRST_USER_ID + number % args.users
+        async with semaphore:
+            invoice = await client.create_invoice(1.0 + number % 10, payload=str(user_id))
+        if not invoice['success']:
+            failed += 1
+            return
+        await db.create_deposit(user_id, invoice['amount'], invoice)
+        created.append(invoice['invoice_id'])
+
+    async def poll():
+        # Опрос счетов пачками по 1000 (лимит getInvoices), как при зачислении без webhook
+        while True:
+            pending = [invoice_id for invoice_id in created if invoice_id not in credited]
+            for start in range(0, len(pending), 1000):
+                for invoice in await client.get_invoices(invoice_ids=pending[start:start + 1000], status='paid'):
+                    await on_paid(invoice)
+            await asyncio.sleep(args.poll_interval)
+
+    async def reconcile_loop():
+        # Сверка раз в poll_interval подбирает потерянные webhook
+        while True:
+            await asyncio.sleep(args.poll_interval)
+            report = await reconcile(db, client, on_paid)
+            reconciled['credited'] += report['credited']
+
+    reconciled = {'credited': 0}
+    emulator.webhook_url = webhook_url
+    started = time.monotonic()
+    poller = asyncio.get_running_loop().create_task(poll() if args.mode == 'polling' else reconcile_loop())
+    await asyncio.gather(*(deposit(number) for number in range(args.deposits)))
+    deadline = time.monotonic() + args.timeout
+    while len(credited) < len(created) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.monotonic() - started
+    poller.cancel()
+    emulator.webhook_url = None
+    if runner:
+        await runner.cleanup()
+
+    latencies = [credited[invoice_id] - emulator.paid_at[invoice_id] for invoice_id in credited]
+    summary(f'Пополнение, {args.mode} (оплата счета -> зачисление)', latencies, elapsed, len(credited),
+            args.deposits)
+    print(f"  счетов не создано (ошибка createInvoice): {failed}")
+    if webhook:
+        print(f"  webhook: {webhook.get_stats()}, зачислено сверкой: {reconciled['credited']}")
+
+
+async def bench_withdrawals(main, emulator: CryptoBotEmulator, client: CryptoBotTurbo, args):
+    db = main.db
+    created_at = {}
+
+    async def transfer(user_id: int, amount: float, currency: str, spend_id: str):
+        return await client.transfer(user_id, amount, currency, spend_id=spend_id)
+
+    async def find_transfer(spend_id: str):
+        transfers = await client.get_transfers(spend_id=spend_id, count=1)
+        return transfers[0] if transfers else None
+
+    outbox = PayoutOutbox(db, transfer, workers=args.workers, poll_interval=0.5, backoff_base=args.backoff_base,
+                          find_transfer=find_transfer)
+    await outbox.start()
+
+    started = time.monotonic()
+    for number in range(args.withdrawals):
+        result = await db.create_withdrawal(FIRST_USER_ID + number % args.users, 1.0)
+        created_at[f"withdraw-{result['withdrawal_id']}"] = time.monotonic()
+        outbox.notify()
+
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        stats = await outbox.get_stats()
+        if not stats['pending'] and not stats['processing']:
+            break
+        await asyncio.sleep(0.05)
+    elapsed = time.monotonic() - started
+    await outbox.close(5)
+
+    latencies = [emulator.transferred_at[spend_id] - moment for spend_id, moment in created_at.items()
+                 if spend_id in emulator.transferred_at]
+    summary('Вывод (создание -> перевод)', latencies, elapsed, len(latencies), args.withdrawals)
+    print(f"  dead-letter: {stats['dead']}, повторных transfer с тем же spend_id: {emulator.stats['duplicate_transfers']}, "
+          f"найдено по spend_id: {outbox.reconciled}")
+
+
+async def run(args):
+    main = sys.modules['main']
+    emulator = CryptoBotEmulator(token=TOKEN, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                 rate_limit=args.rate_limit, auto_pay=args.pay_delay, seed=1,
+                                 webhook_drop_rate=args.webhook_drop_rate)
+    runner, base_url = await start_emulator(emulator)
+    client = CryptoBotTurbo(TOKEN, base_url=base_url)
+
+    for number in range(args.users):
+        await main.db.add_user(FIRST_USER_ID + number, f'bench{number}', 'Bench')
+    await main.db.run(lambda: (main.db.database.connection.execute(
+        'UPDATE users SET balance = 1000000 WHERE user_id >= ?', (FIRST_USER_ID,)),
+        main.db.database.connection.commit()))
+
+    print(f"⏳ Эмулятор {base_url}: задержка {args.latency * 1000:.0f}+{args.jitter * 1000:.0f} мс, "
+          f"ошибок {args.error_rate * 100:.1f}%, лимит {args.rate_limit or '∞'} запр/с")
+    try:
+        if args.deposits:
+            await bench_deposits(main, emulator, client, args)
+        if args.withdrawals:
+            await bench_withdrawals(main, emulator, client, args)
+        print(f"\n=== Эмулятор ===\n  {emulator.get_stats()}")
+        print("\n=== Клиент CryptoBotTurbo ===")
+        print_client(client)
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--deposits', type=int, default=500)
+    parser.add_argument('--withdrawals', type=int, default=500)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=50, help='одновременных createInvoice')
+    parser.add_argument('--latency', type=float, default=0.03, help='задержка эмулятора, сек')
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.02, help='доля ответов 500')
+    parser.add_argument('--rate-limit', type=float, default=0, help='запросов в секунду (0 - без лимита)')
+    parser.add_argument('--pay-delay', type=float, default=0.1, help='через сколько секунд счет оплачивается')
+    parser.add_argument('--mode', choices=('webhook', 'polling'), default='webhook', help='зачисление пополнений')
+    parser.add_argument('--webhook-drop-rate', type=float, default=0.0, help='доля потерянных webhook')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='период опроса getInvoices или сверки, сек')
+    parser.add_argument('--workers', type=int, default=PAYOUT_WORKERS, help='обработчиков очереди выплат')
+    parser.add_argument('--backoff-base', type=float, default=PAYOUT_BACKOFF_BASE)
+    parser.add_argument('--timeout', type=float, default=120, help='предел ожидания каждой фазы, сек')
+    args = parser.parse_args()
+
+    database = import_database(tempfile.mkdtemp(prefix='bench-payments-'))
+    try:
+        asyncio.run(run(args))
+    finally:
+        database.worker.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+# benchmarks/bench_send_queue.py
+"""Всплеск исходящих сообщений: прямые вызовы с повтором через sleep(1) против SendQueue
+
+Запуск: python benchmarks/bench_send_queue.py [--bets 300] [--users 100] [--window 10] [--speedup 10]
+
+Эмулятор ведет себя как Telegram: лимит на бота (30 сообщений в секунду),
+на личный чат (1 в секунду, запас 5) и на канал (20 в минуту); при
+превышении возвращает RetryAfter. Одновременно рассчитывается --bets
+ставок (пост в игровой канал и в канал логов), а --users игроков
+получают по два ответа в течение --window секунд. Время сжато в
+--speedup раз, чтобы прогон шел секунды.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from send_queue import SendQueue, TokenBucket, PRIORITY_CHANNEL, PRIORITY_LOG
+
+CHANNEL_ID = -1001
+LOG_CHANNEL_ID = -1002
+
+
+class RetryAfter(Exception):
+    def __init__(self, timeout: float):
+        super().__init__(f"Flood control exceeded. Retry in {timeout} seconds.")
+        self.timeout = timeout
+
+
+class FloodControlAPI:
+    """Лимиты Telegram, после превышения - RetryAfter"""
+
+    def __init__(self, speedup: float):
+        self.speedup = speedup
+        self.global_bucket = TokenBucket(30 * speedup, 30)
+        self.chats = {}
+        self.delivered = 0
+        self.rejected = 0
+
+    async def send(self, chat_id: int):
+        await asyncio.sleep(0.03 / self.speedup)
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            rate, burst = (20 / 60, 20) if chat_id < 0 else (1.0, 5)
+            bucket = self.chats[chat_id] = TokenBucket(rate * self.speedup, burst)
+
+        now = time.monotonic()
+        wait = max(bucket.delay(now), self.global_bucket.delay(now))
+        if wait > 0:
+            self.rejected += 1
+            # Telegram отдает целые секунды; в сжатом времени - доли
+            raise RetryAfter(max(1, round(wait * self.speedup)) / self.speedup)
+        bucket.consume(now)
+        self.global_bucket.consume(now)
+        self.delivered += 1
+
+
+async def send_direct(api: FloodControlAPI, chat_id: int, speedup: float) -> bool:
+    """Старая схема send_message_with_retry: 3 попытки через sleep(1)"""
+    for attempt in range(3):
+        try:
+            await api.send(chat_id)
+            return True
+        except RetryAfter:
+            await asyncio.sleep(1 / speedup)
+    return False
+
+
+async def scenario(name: str, send, args) -> dict:
+    rnd = random.Random(1)
+    user_waits = []
+    results = []
+
+    async def user_reply(user_id: int):
+        await asyncio.sleep(rnd.random() * args.window / args.speedup)
+        started = time.perf_counter()
+        ok = await send(user_id)
+        user_waits.append((time.perf_counter() - started) * args.speedup)
+        results.append(ok)
+
+    async def settle_bet():
+        results.append(await send(CHANNEL_ID))
+        results.append(await send(LOG_CHANNEL_ID))
+
+    started = time.perf_counter()
+    tasks = [settle_bet() for _ in range(args.bets)]
+    tasks += [user_reply(1000 + i % args.users) for i in range(args.users * 2)]
+    await asyncio.gather(*tasks)
+    elapsed = (time.perf_counter() - started) * args.speedup
+
+    user_waits.sort()
+    return {
+        'name': name,
+        'sent': sum(results),
+        'lost': len(results) - sum(results),
+        'elapsed': elapsed,
+        'user_p50': statistics.median(user_waits),
+        'user_p95': user_waits[int(len(user_waits) * 0.95)]
+    }
+
+
+async def run(args):
+    api = FloodControlAPI(args.speedup)
+    direct = await scenario('прямые вызовы', lambda chat_id: send_direct(api, chat_id, args.speedup), args)
+    direct['rejected'] = api.rejected
+
+    api = FloodControlAPI(args.speedup)
+    queue = SendQueue(
+        global_rate=30 * args.speedup, global_burst=30,
+        chat_rate=1.0 * args.speedup, chat_burst=5,
+        group_rate=20 / 60 * args.speedup, group_burst=20,
+        priorities={CHANNEL_ID: PRIORITY_CHANNEL, LOG_CHANNEL_ID: PRIORITY_LOG},
+        retry_after_errors=(RetryAfter,)
+    )
+
+    async def send_queued(chat_id: int) -> bool:
+        try:
+            await queue.submit(chat_id, lambda: api.send(chat_id))
+            return True
+        except RetryAfter:
+            return False
+
+    queued = await scenario('SendQueue', send_queued, args)
+    queued['rejected'] = api.rejected
+    return [direct, queued], queue.get_stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bets', type=int, default=300)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--window', type=float, default=10, help='за сколько секунд приходят ответы игрокам')
+    parser.add_argument('--speedup', type=float, default=10)
+    args = parser.parse_args()
+
+    results, stats = asyncio.run(run(args))
+
+    print(f"\n=== {args.bets} ставок (канал + логи) и {args.users * 2} ответов игрокам ===")
+    print(f"  {'схема':<16}{'доставлено':>12}{'потеряно':>10}{'429':>7}{'время, с':>10}{'ответ p50':>11}{'ответ p95':>11}")
+    for r in results:
+        print(f"  {r['name']:<16}{r['sent']:>12}{r['lost']:>10}{r['rejected']:>7}{r['elapsed']:>10.1f}"
+              f"{r['user_p50']:>10.2f}с{r['user_p95']:>10.2f}с")
+
+    print(f"\n  очередь: макс. глубина {stats['max_depth']}, RetryAfter {stats['retry_after']}")
+    for name, wait in stats['wait'].items():
+        print(f"  ожидание {name}: p50 {wait['p50'] * args.speedup:.2f} с, "
+              f"p95 {wait['p95'] * args.speedup:.2f} с, макс. {wait['max'] * args.speedup:.2f} с")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# benchmarks/bench_user_search.py
+"""Поиск пользователей в админке: LIKE '%...%' против индексов FTS5
+
+Запуск: python benchmarks/bench_user_search.py [--users 1000000] [--repeat 5]
+
+Во временной БД создается таблица users со случайными именами и
+username, затем строятся индексы user_search (время построения тоже
+печатается). Для каждого запроса сравнивается медианное время старого
+пути (LIKE по username или по имени, как в search_users до FTS5) и
+user_search.search, а также число найденных строк. LIKE с LIMIT быстр,
+когда совпадений много и они в начале таблицы; редкий пользователь или
+отсутствие совпадений - полный просмотр таблицы.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import user_search
+
+FIRST_NAMES = ['Иван', 'Петр', 'Алексей', 'Мария', 'Анна', 'Ольга', 'Дмитрий', 'Сергей', 'Елена', 'Наталья',
+               'John', 'Michael', 'Anna', 'Maria', 'David', 'Alex', 'Kate', 'Max', 'Ivan', 'Oleg']
+LAST_NAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Новиков',
+              'Smith', 'Johnson', 'Brown', 'Miller', 'Wilson', 'Taylor', None]
+SYLLABLES = ['ka', 'zo', 'mi', 'ro', 'lu', 'ne', 'ta', 'vi', 'so', 'pe', 'dra', 'gon', 'x', 'pro', 'bet']
+
+QUERIES = [
+    ('префикс имени', 'Ива'),
+    ('подстрока имени', 'ванов'),
+    ('имя и фамилия', 'Мария Смирн'),
+    ('начало username', '@dragon'),
+    ('подстрока username', '@rolu'),
+    ('редкое имя', 'Радомир'),
+    ('редкий username', '@velesov'),
+    ('нет совпадений', 'Зюзюка')
+]
+
+# Искомый пользователь в конце таблицы - худший случай для LIKE
+NEEDLE = ('velesov_real', 'Радомир', 'Велесов')
+
+
+def like_search(connection, query: str, limit: int):
+    """Старый путь search_users"""
+    if query.startswith('@'):
+        return connection.execute('SELECT * FROM users WHERE username LIKE ? LIMIT ?',
+                                  (f'%{query[1:]}%', limit)).fetchall()
+    return connection.execute('SELECT * FROM users WHERE first_name LIKE ? OR last_name LIKE ? LIMIT ?',
+                              (f'%{query}%', f'%{query}%', limit)).fetchall()
+
+
+def build(path: str, users: int) -> float:
+    connection = sqlite3.connect(path)
+    connection.execute('''
+        CREATE TABLE users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            balance REAL DEFAULT 0.0
+        )
+    ''')
+    rnd = random.Random(1)
+
+    def rows():
+        for i in range(users):
+            username = ''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))) + str(rnd.randint(0, 999))
+            yield (1_000_000 + i, username if rnd.random() < 0.7 else None,
+                   rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES), rnd.random() * 100)
+
+    connection.executemany('INSERT INTO users VALUES (?, ?, ?, ?, ?)', rows())
+    connection.execute('INSERT INTO users VALUES (?, ?, ?, ?, 0)', (1_000_000 + users, *NEEDLE))
+    connection.commit()
+
+    started = time.perf_counter()
+    if not user_search.install(connection):
+        sys.exit('SQLite собран без FTS5')
+    elapsed = time.perf_counter() - started
+    connection.close()
+    return elapsed
+
+
+def timed(func, repeat: int):
+    times, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--limit', type=int, default=5, help='как в админке: search_users(query, limit=5)')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='bench-search-'), 'users.db')
+    print(f"⏳ Создание {args.users} пользователей...")
+    build_time = build(path, args.users)
+    print(f"  индексы FTS5 построены за {build_time:.1f} с, размер БД {os.path.getsize(path) / 2**20:.0f} МБ")
+
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+
+    print(f"\n=== {args.users} пользователей, limit {args.limit}, медиана {args.repeat} прогонов ===")
+    print(f"  {'запрос':<22}{'LIKE, мс':>10}{'найдено':>9}{'FTS5, мс':>10}{'найдено':>9}{'ускорение':>11}")
+    for name, query in QUERIES:
+        like_ms, like_found = timed(lambda: like_search(connection, query, args.limit), args.repeat)
+        fts_ms, fts_found = timed(lambda: user_search.search(connection, query, args.limit), args.repeat)
+        print(f"  {name:<22}{like_ms:>10.2f}{like_found:>9}{fts_ms:>10.2f}{fts_found:>9}{like_ms / fts_ms:>10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
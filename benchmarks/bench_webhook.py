@@ -0,0 +1,245 @@
+# benchmarks/bench_webhook.py
+"""Задержка ответа бота: long polling против webhook на записанных апдейтах
+
+Запуск: python benchmarks/bench_webhook.py [--users 50] [--updates 400] [--rate 50]
+        python benchmarks/bench_webhook.py --replay http://127.0.0.1:8080/webhook [--secret ...]
+
+Бот (main.py) запускается отдельным процессом в пустом каталоге и ходит
+в локальный эмулятор Bot API (fake_bot_api.py) вместо api.telegram.org.
+Апдейты из benchmarks/updates/*.json размножаются на --users пользователей
+и подаются с частотой --rate: в режиме polling через getUpdates, в режиме
+webhook - POST-запросом на WEBHOOK_PATH. Задержка считается от подачи
+апдейта до первого вызова API боту в этот чат. В конце режима webhook
+бот останавливается посреди пачки апдейтов, чтобы проверить, что
+начатые апдейты дообрабатываются.
+
+С --replay записанные апдейты просто отправляются на уже запущенный webhook.
+"""
+import argparse
+import asyncio
+import copy
+import glob
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotAPI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UPDATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'updates')
+WEBHOOK_PATH = '/webhook'
+REPLY_TIMEOUT = 10
+
+
+def load_updates(path: str):
+    updates = []
+    for file_name in sorted(glob.glob(os.path.join(path, '*.json'))):
+        with open(file_name, encoding='utf-8') as f:
+            updates.append(json.load(f))
+    if not updates:
+        raise SystemExit(f"Нет записанных апдейтов в {path}")
+    return updates
+
+
+def personalize(update: dict, update_id: int, user_id: int) -> dict:
+    """Копия записанного апдейта от имени другого пользователя"""
+    update = copy.deepcopy(update)
+    update['update_id'] = update_id
+    for key in ('message', 'callback_query'):
+        event = update.get(key)
+        if not event:
+            continue
+        event['from']['id'] = user_id
+        message = event if key == 'message' else event.get('message')
+        if message:
+            message['chat']['id'] = user_id
+            message['date'] = int(time.time())
+    return update
+
+
+def chat_of(update: dict) -> int:
+    if 'message' in update:
+        return update['message']['chat']['id']
+    return update['callback_query']['from']['id']
+
+
+# ==================== ЗАПУСК БОТА ====================
+
+def start_bot(mode: str, api_url: str, port: int, python: str, work_dir: str):
+    env = dict(os.environ)
+    env.update({
+        'BOT_TOKEN': '123456:BENCH-TOKEN',
+        'BOT_MODE': mode,
+        'TELEGRAM_API_SERVER': api_url,
+        'WEBHOOK_HOST': f'http://127.0.0.1:{port}',
+        'WEBHOOK_PATH': WEBHOOK_PATH,
+        'WEBAPP_HOST': '127.0.0.1',
+        'WEBAPP_PORT': str(port),
+        'PYTHONPATH': ROOT
+    })
+    log = open(os.path.join(work_dir, 'bot.log'), 'w')
+    return subprocess.Popen([python, os.path.join(ROOT, 'main.py')], cwd=work_dir, env=env,
+                            stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_ready(mode: str, fake: FakeBotAPI, session: aiohttp.ClientSession, port: int, proc):
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('бот завершился при запуске')
+        if mode == 'polling' and fake.polling_started.is_set():
+            return
+        if mode == 'webhook' and fake.webhook_url:
+            try:
+                async with session.get(f'http://127.0.0.1:{port}/health') as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+        await asyncio.sleep(0.05)
+    raise RuntimeError('бот не запустился за 30 сек')
+
+
+async def deliver(mode: str, fake: FakeBotAPI, session: aiohttp.ClientSession, port: int, update: dict):
+    if mode == 'polling':
+        fake.push_update(update)
+    else:
+        async with session.post(f'http://127.0.0.1:{port}{WEBHOOK_PATH}', json=update) as response:
+            await response.read()
+
+
+async def measure(mode: str, fake, session, port, updates, interval: float):
+    """Подача апдейтов с постоянной частотой, возвращает задержки в секундах"""
+    loop = asyncio.get_running_loop()
+    latencies, timeouts = [], 0
+    pending = []
+
+    async def one(update):
+        nonlocal timeouts
+        reply = fake.wait_reply(chat_of(update))
+        sent = time.perf_counter()
+        loop.create_task(deliver(mode, fake, session, port, update))
+        try:
+            latencies.append(await asyncio.wait_for(reply, REPLY_TIMEOUT) - sent)
+        except asyncio.TimeoutError:
+            timeouts += 1
+
+    started = loop.time()
+    for i, update in enumerate(updates):
+        delay = started + i * interval - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        pending.append(loop.create_task(one(update)))
+    await asyncio.gather(*pending)
+    return latencies, timeouts
+
+
+async def check_drain(fake, session, port, updates, proc):
+    """Остановка бота сразу после пачки апдейтов: сколько из них получили ответ"""
+    replies = [fake.wait_reply(chat_of(update)) for update in updates]
+    for update in updates:
+        asyncio.get_running_loop().create_task(deliver('webhook', fake, session, port, update))
+    await asyncio.sleep(0.05)
+    proc.send_signal(signal.SIGINT)
+    done, _ = await asyncio.wait(replies, timeout=REPLY_TIMEOUT)
+    return len(done)
+
+
+async def run_mode(mode: str, args, recorded):
+    fake = FakeBotAPI()
+    api_url = await fake.start()
+    port = args.port
+    work_dir = tempfile.mkdtemp(prefix=f'bench_{mode}_')
+
+    # Каждый пользователь выполняет /start, затем остальные записанные апдейты по кругу
+    updates = []
+    for i in range(args.updates):
+        user_id = 2000000 + i % args.users
+        template = recorded[0] if i < args.users else recorded[i // args.users % len(recorded)]
+        updates.append(personalize(template, i + 1, user_id))
+
+    proc = start_bot(mode, api_url, port, args.python, work_dir)
+    async with aiohttp.ClientSession() as session:
+        try:
+            await wait_ready(mode, fake, session, port, proc)
+            latencies, timeouts = await measure(mode, fake, session, port, updates, 1 / args.rate)
+
+            drained = None
+            if mode == 'webhook':
+                burst = [personalize(recorded[-1], args.updates + i + 1, 3000000 + i) for i in range(args.drain)]
+                drained = await check_drain(fake, session, port, burst, proc)
+            else:
+                proc.send_signal(signal.SIGINT)
+
+            stop_started = time.perf_counter()
+            await asyncio.get_running_loop().run_in_executor(None, proc.wait, 60)
+            stop_time = time.perf_counter() - stop_started
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            await fake.stop()
+
+    print(f"\n=== {mode} ===  (лог бота: {os.path.join(work_dir, 'bot.log')})")
+    if latencies:
+        latencies.sort()
+        print(f"  ответов: {len(latencies)}/{len(updates)}, без ответа: {timeouts}")
+        print(f"  задержка: mean={statistics.mean(latencies) * 1000:6.1f} мс  "
+              f"p50={latencies[len(latencies) // 2] * 1000:6.1f} мс  "
+              f"p95={latencies[int(len(latencies) * 0.95)] * 1000:6.1f} мс  "
+              f"p99={latencies[int(len(latencies) * 0.99)] * 1000:6.1f} мс")
+    else:
+        print(f"  ни одного ответа (без ответа: {timeouts})")
+    if drained is not None:
+        print(f"  остановка посреди пачки: ответ получили {drained}/{args.drain}, "
+              f"deleteWebhook: {fake.calls['deleteWebhook']}")
+    print(f"  остановка заняла: {stop_time:.2f} с")
+
+
+# ==================== ПОВТОР ЗАПИСАННЫХ АПДЕЙТОВ ====================
+
+async def replay(url: str, secret: str, recorded):
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret else {}
+    async with aiohttp.ClientSession() as session:
+        for update in recorded:
+            started = time.perf_counter()
+            async with session.post(url, json=update, headers=headers) as response:
+                body = await response.text()
+            print(f"update_id={update['update_id']}: HTTP {response.status} "
+                  f"за {(time.perf_counter() - started) * 1000:.1f} мс {body[:80]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--updates', type=int, default=400)
+    parser.add_argument('--rate', type=float, default=50, help='апдейтов в секунду')
+    parser.add_argument('--drain', type=int, default=20, help='апдейтов в пачке при остановке')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--mode', choices=['polling', 'webhook', 'both'], default='both')
+    parser.add_argument('--python', default=sys.executable, help='интерпретатор с aiogram для main.py')
+    parser.add_argument('--updates-dir', default=UPDATES_DIR)
+    parser.add_argument('--replay', metavar='URL', help='только отправить записанные апдейты на webhook')
+    parser.add_argument('--secret', default='', help='WEBHOOK_SECRET для --replay')
+    args = parser.parse_args()
+
+    recorded = load_updates(args.updates_dir)
+    if args.replay:
+        asyncio.run(replay(args.replay, args.secret, recorded))
+        return
+
+    modes = ['polling', 'webhook'] if args.mode == 'both' else [args.mode]
+    for mode in modes:
+        asyncio.run(run_mode(mode, args, recorded))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# benchmarks/check_query_plans.py
+"""Проверка планов горячих запросов: ни один не должен сканировать таблицу целиком
+
+Запуск: python benchmarks/check_query_plans.py [--verbose]
+
+main.py импортируется в пустом временном каталоге (своя casino.db).
+Методы Database вызываются с типичными аргументами, их SQL
+перехватывается trace callback, и для каждого запроса к bets, logs и users
+выполняется EXPLAIN QUERY PLAN. Полное сканирование таблицы (SCAN без
+индекса) или сортировка во временном B-дереве считаются регрессией:
+скрипт печатает план и завершается с кодом 1.
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pagination import FORWARD, encode_cursor
+
+USER_ID = 1000
+TABLES = ('bets', 'logs', 'users')
+
+# (название, метод Database, аргументы)
+HOT_QUERIES = [
+    ('история ставок', 'get_user_bets', {'user_id': USER_ID}),
+    ('история ставок, глубокая страница', 'get_user_bets',
+     {'user_id': USER_ID, 'cursor': encode_cursor(FORWARD, '2024-01-01 00:00:00', 500000)}),
+    ('статистика игрока', 'get_bet_stats', {'user_id': USER_ID}),
+    ('статистика игрока за период', 'get_bet_stats',
+     {'user_id': USER_ID, 'date_from': '2024-01-01', 'date_to': '2024-01-31'}),
+    ('статистика игры за период', 'get_bet_stats',
+     {'game_type': 'dice', 'date_from': '2024-01-01', 'date_to': '2024-01-31'}),
+    ('статистика за период', 'get_bet_stats', {'date_from': '2024-01-01', 'date_to': '2024-01-31'}),
+    ('последние логи', 'get_logs', {'limit': 50}),
+    ('логи по уровню', 'get_logs', {'level': 'ERROR', 'limit': 50}),
+    ('логи пользователя', 'get_logs', {'user_id': USER_ID, 'limit': 50}),
+    ('активные пользователи', 'get_active_users_counts', {}),
+    *[(f'список пользователей ({sort})', 'get_users_page', {'sort': sort, 'cursor': encode_cursor(FORWARD, value, 500)})
+      for sort, value in (('new', '2024-01-01 00:00:00'), ('balance', 10.0), ('bets', 10.0), ('id', 500))]
+]
+
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+def import_database(work_dir: str):
+    """Импорт main.py во временном каталоге без настоящего токена"""
+    os.environ.update({'BOT_TOKEN': '123456:PLAN-CHECK', 'BOT_MODE': 'polling', 'TELEGRAM_API_SERVER': ''})
+    os.chdir(work_dir)
+    import main
+    return main.db.database
+
+
+def capture_queries(database, method: str, kwargs: dict) -> list:
+    """SQL, выполненный методом (с подставленными параметрами)"""
+    statements = []
+    database.connection.set_trace_callback(statements.append)
+    try:
+        getattr(database, method)(**kwargs)
+    finally:
+        database.connection.set_trace_callback(None)
+    return [sql for sql in statements
+            if sql.lstrip().upper().startswith('SELECT') and any(re.search(rf'\b{t}\b', sql) for t in TABLES)]
+
+
+def check_plan(connection, sql: str) -> tuple:
+    plan = [row[3] for row in connection.execute(f'EXPLAIN QUERY PLAN {sql}')]
+    problems = []
+    for detail in plan:
+        match = FULL_SCAN.match(detail)
+        if match and match.group(1) in TABLES:
+            problems.append(f'полное сканирование {match.group(1)}')
+        if 'USE TEMP B-TREE FOR ORDER BY' in detail:
+            problems.append('сортировка без индекса')
+    return plan, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--verbose', action='store_true', help='печатать планы всех запросов')
+    args = parser.parse_args()
+
+    database = import_database(tempfile.mkdtemp(prefix='plan-check-'))
+    failed = 0
+
+    for name, method, kwargs in HOT_QUERIES:
+        queries = capture_queries(database, method, kwargs)
+        if not queries:
+            print(f"⚠️ {name}: {method} не выполнил запросов к {', '.join(TABLES)}")
+            failed += 1
+            continue
+
+        for sql in queries:
+            plan, problems = check_plan(database.connection, sql)
+            print(f"{'❌' if problems else '✅'} {name} ({method}){': ' + ', '.join(problems) if problems else ''}")
+            if problems or args.verbose:
+                print('   ' + ' '.join(sql.split()))
+                for detail in plan:
+                    print(f'   └ {detail}')
+            failed += bool(problems)
+
+    database.worker.shutdown()
+    if failed:
+        print(f"\n❌ Запросов с регрессией плана: {failed}")
+        sys.exit(1)
+    print("\n✅ Все горячие запросы используют индексы")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+# benchmarks/fake_bot_api.py
+"""Локальный эмулятор Bot API для бенчмарков: бот работает с ним вместо api.telegram.org
+
+Бот запускается с TELEGRAM_API_SERVER=http://127.0.0.1:<порт>. Эмулятор
+отдает апдейты через getUpdates (long polling), отвечает на send*/edit*
+правдоподобными объектами Message и запоминает время каждого вызова по
+chat_id, чтобы бенчмарк мог измерить задержку от апдейта до ответа.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from aiohttp import web
+
+BOT_USER = {'id': 100000, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_casino_bot'}
+
+
+def build_result(method: str, params: Dict, message_ids) -> object:
+    """Правдоподобный result для метода Bot API (без состояния эмулятора)"""
+    if method == 'getMe':
+        return BOT_USER
+    if method.startswith('send') or method.startswith('edit'):
+        message = {
+            'message_id': next(message_ids),
+            'date': int(time.time()),
+            'chat': {'id': int(params.get('chat_id') or 0), 'type': 'private'},
+            'from': BOT_USER
+        }
+        if 'text' in params:
+            message['text'] = params['text']
+        if 'caption' in params:
+            message['caption'] = params['caption']
+        if method in ('sendPhoto', 'editMessageMedia'):
+            # Повторная отправка по file_id возвращает тот же file_id
+            if method == 'sendPhoto':
+                photo = params.get('photo')
+            else:
+                # По HTTP приходит JSON, в заглушке Bot.request - объект InputMedia
+                media = params.get('media') or '{}'
+                media = json.loads(media) if isinstance(media, str) else media.to_python()
+                photo = media.get('media')
+                message['caption'] = media.get('caption')
+            if not isinstance(photo, str) or photo.startswith('attach://'):
+                photo = f"bench-photo-{message['message_id']}"
+            message['photo'] = [{'file_id': photo, 'file_unique_id': photo, 'width': 1280, 'height': 720}]
+        return message
+    return True
+
+
+class FakeBotAPI:
+    def __init__(self):
+        self.updates: List[Dict] = []
+        self.new_update = asyncio.Event()
+        self.calls = defaultdict(int)
+        self.webhook_url = None
+        self.polling_started = asyncio.Event()
+        self._message_ids = itertools.count(1)
+        self._waiters: Dict[int, List[asyncio.Future]] = defaultdict(list)
+
+    # ==================== ОЖИДАНИЕ ОТВЕТОВ ====================
+
+    def wait_reply(self, chat_id: int) -> asyncio.Future:
+        """Future, которое получит время первого вызова API для этого чата"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id].append(future)
+        return future
+
+    def _notify(self, chat_id):
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            return
+        now = time.perf_counter()
+        for future in self._waiters.pop(chat_id, []):
+            if not future.done():
+                future.set_result(now)
+
+    def push_update(self, update: Dict):
+        """Апдейт для режима polling: отдается ближайшим getUpdates"""
+        self.updates.append(update)
+        self.new_update.set()
+
+    # ==================== МЕТОДЫ API ====================
+
+    async def _get_updates(self, params: Dict):
+        self.polling_started.set()
+        offset = int(params.get('offset') or 0)
+        self.updates = [u for u in self.updates if u['update_id'] >= offset]
+
+        if not self.updates:
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(), min(float(params.get('timeout') or 0), 1.0))
+            except asyncio.TimeoutError:
+                pass
+
+        limit = int(params.get('limit') or 100)
+        return self.updates[:limit]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = dict(await request.post())
+        if not params and request.can_read_body:
+            try:
+                params = await request.json()
+            except (json.JSONDecodeError, ValueError):
+                params = {}
+        self.calls[method] += 1
+
+        if method == 'getUpdates':
+            result = await self._get_updates(params)
+        elif method == 'setWebhook':
+            self.webhook_url = params.get('url')
+            result = True
+        elif method == 'getWebhookInfo':
+            result = {'url': self.webhook_url or '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        elif method == 'deleteWebhook':
+            self.webhook_url = None
+            result = True
+        else:
+            self._notify(params.get('chat_id'))
+            result = build_result(method, params, self._message_ids)
+
+        return web.json_response({'ok': True, 'result': result})
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Запуск сервера, возвращает базовый URL для TELEGRAM_API_SERVER"""
+        self.runner = web.AppRunner(self.create_app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f'http://{host}:{port}'
+
+    async def stop(self):
+        await self.runner.cleanup()
@@ -0,0 +1,207 @@
+# broadcast.py
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from send_queue import PRIORITY_BROADCAST, TokenBucket, current_priority
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import BROADCAST_RATE, BROADCAST_PAGE_SIZE
+except ImportError:
+    BROADCAST_RATE = 25
+    BROADCAST_PAGE_SIZE = 200
+
+CREATE_BROADCASTS_SQL = '''
+    CREATE TABLE IF NOT EXISTS broadcasts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        text TEXT NOT NULL,
+        created_by INTEGER,
+        status TEXT DEFAULT 'running',
+        last_user_id INTEGER DEFAULT 0,
+        total INTEGER DEFAULT 0,
+        sent INTEGER DEFAULT 0,
+        failed INTEGER DEFAULT 0,
+        unreachable INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP
+    )
+'''
+
+# Keyset-пагинация по первичному ключу: страница не зависит от размера таблицы
+SELECT_RECIPIENTS_SQL = '''
+    SELECT user_id FROM users
+    WHERE user_id > ? AND unreachable = 0
+    ORDER BY user_id
+    LIMIT ?
+'''
+
+COUNT_RECIPIENTS_SQL = 'SELECT COUNT(*) FROM users WHERE unreachable = 0'
+
+
+def save_progress(connection, broadcast_id: int, last_user_id: int, sent: int, failed: int,
+                  unreachable: List[int]):
+    """Контрольная точка после страницы получателей (выполняется в потоке БД)"""
+    if unreachable:
+        connection.executemany('UPDATE users SET unreachable = 1 WHERE user_id = ?', [(uid,) for uid in unreachable])
+    connection.execute('''
+        UPDATE broadcasts
+        SET last_user_id = ?, sent = sent + ?, failed = failed + ?, unreachable = unreachable + ?
+        WHERE id = ?
+    ''', (last_user_id, sent, failed, len(unreachable), broadcast_id))
+    connection.commit()
+
+
+class BroadcastEngine:
+    """Рассылка сообщения всем пользователям бота
+
+    Получатели читаются страницами по user_id (keyset), сообщения страницы
+    отправляются параллельно, не быстрее BROADCAST_RATE в секунду, с самым
+    низким приоритетом в очереди отправки - ответы игрокам не ждут
+    рассылку. После каждой страницы прогресс записывается в broadcasts,
+    поэтому после перезапуска рассылка продолжается со следующей страницы.
+    Пользователи, заблокировавшие бота или удаленные, помечаются
+    users.unreachable и в следующие рассылки не попадают.
+    """
+
+    def __init__(self, db, send: Callable[[int, str], Awaitable], unreachable_errors: Tuple = (),
+                 rate: float = BROADCAST_RATE, page_size: int = BROADCAST_PAGE_SIZE):
+        self.db = db
+        self.send = send
+        self.unreachable_errors = unreachable_errors
+        self.rate = rate
+        self.page_size = page_size
+        self.broadcast: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._cancelled = False
+        self._bucket = TokenBucket(rate, rate)
+        self._recent = deque()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, broadcast: Dict):
+        """Запуск новой или продолжение прерванной рассылки"""
+        if self.running:
+            raise RuntimeError('Рассылка уже идет')
+        self.broadcast = dict(broadcast)
+        self._stopping = self._cancelled = False
+        self._recent.clear()
+        self.broadcast['started'] = time.monotonic()
+        self.broadcast['sent_before'] = self.broadcast['sent']
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def cancel(self):
+        """Отмена рассылки администратором"""
+        self._cancelled = True
+        self._stopping = True
+
+    async def close(self, timeout: float):
+        """Остановка при выключении бота: рассылка продолжится после запуска"""
+        self._stopping = True
+        if self.running:
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except asyncio.TimeoutError:
+                logger.warning("⚠️ Рассылка прервана, будет продолжена после запуска")
+
+    # ==================== ОТПРАВКА ====================
+
+    async def _throttle(self):
+        while True:
+            now = time.monotonic()
+            delay = self._bucket.delay(now)
+            if delay <= 0:
+                self._bucket.consume(now)
+                return
+            await asyncio.sleep(delay)
+
+    async def _deliver(self, user_id: int, text: str) -> str:
+        # При отмене оставшиеся получатели страницы пропускаются; при выключении
+        # страница досылается, чтобы контрольная точка была точной
+        if self._cancelled:
+            return 'skipped'
+        await self._throttle()
+        if self._cancelled:
+            return 'skipped'
+        try:
+            await self.send(user_id, text)
+            self._mark_sent(time.monotonic())
+            return 'sent'
+        except self.unreachable_errors:
+            return 'unreachable'
+        except Exception as e:
+            logger.error(f"❌ Рассылка: ошибка отправки {user_id}: {e}")
+            return 'failed'
+
+    def _mark_sent(self, now: float):
+        self._recent.append(now)
+        while self._recent and now - self._recent[0] > 10:
+            self._recent.popleft()
+
+    async def _run(self):
+        broadcast = self.broadcast
+        current_priority.set(PRIORITY_BROADCAST)
+        logger.info(f"📣 Рассылка #{broadcast['id']} с user_id > {broadcast['last_user_id']}")
+
+        try:
+            while not self._stopping:
+                recipients = await self.db.fetch_broadcast_recipients(broadcast['last_user_id'], self.page_size)
+                if not recipients:
+                    break
+
+                results = await asyncio.gather(*(self._deliver(uid, broadcast['text']) for uid in recipients))
+                delivered = list(zip(recipients, results))
+                last_user_id = recipients[-1]
+                sent = sum(1 for _, status in delivered if status == 'sent')
+                failed = sum(1 for _, status in delivered if status == 'failed')
+                unreachable = [uid for uid, status in delivered if status == 'unreachable']
+
+                await self.db.save_broadcast_progress(broadcast['id'], last_user_id, sent, failed, unreachable)
+                broadcast['last_user_id'] = last_user_id
+                broadcast['sent'] += sent
+                broadcast['failed'] += failed
+                broadcast['unreachable'] += len(unreachable)
+
+            if self._cancelled:
+                await self.db.finish_broadcast(broadcast['id'], 'cancelled')
+                logger.info(f"⏹ Рассылка #{broadcast['id']} отменена")
+            elif not self._stopping:
+                await self.db.finish_broadcast(broadcast['id'], 'done')
+                logger.info(f"✅ Рассылка #{broadcast['id']} завершена: отправлено {broadcast['sent']}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка рассылки #{broadcast['id']}: {e}")
+
+    # ==================== МЕТРИКИ ====================
+
+    def get_stats(self) -> Optional[Dict]:
+        """Прогресс текущей рассылки и скорость за последние 10 секунд"""
+        if not self.broadcast:
+            return None
+        broadcast = self.broadcast
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 10:
+            self._recent.popleft()
+
+        elapsed = now - broadcast['started']
+        rate = len(self._recent) / min(10.0, elapsed) if elapsed > 0 else 0.0
+        done = broadcast['sent'] + broadcast['failed'] + broadcast['unreachable']
+        remaining = max(0, broadcast['total'] - done)
+
+        return {
+            'id': broadcast['id'],
+            'running': self.running,
+            'total': broadcast['total'],
+            'sent': broadcast['sent'],
+            'failed': broadcast['failed'],
+            'unreachable': broadcast['unreachable'],
+            'progress': done / broadcast['total'] * 100 if broadcast['total'] else 100.0,
+            'rate': rate,
+            'avg_rate': (broadcast['sent'] - broadcast['sent_before']) / elapsed if elapsed > 0 else 0.0,
+            'eta': remaining / rate if rate > 0 and self.running else None
+        }
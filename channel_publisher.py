@@ -0,0 +1,147 @@
+# channel_publisher.py
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import CHANNEL_POST_BATCH, CHANNEL_POST_INTERVAL, CHANNEL_POST_MAX_ATTEMPTS
+except ImportError:
+    CHANNEL_POST_BATCH = 20
+    CHANNEL_POST_INTERVAL = 5.0
+    CHANNEL_POST_MAX_ATTEMPTS = 5
+
+CREATE_CHANNEL_POSTS_SQL = '''
+    CREATE TABLE IF NOT EXISTS channel_posts (
+        bet_id INTEGER PRIMARY KEY,
+        chat_id INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        attempts INTEGER DEFAULT 0,
+        last_error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+INSERT_CHANNEL_POST_SQL = 'INSERT OR REPLACE INTO channel_posts (bet_id, chat_id, text) VALUES (?, ?, ?)'
+
+SELECT_CHANNEL_POSTS_SQL = '''
+    SELECT bet_id, chat_id, text, attempts FROM channel_posts
+    ORDER BY bet_id
+    LIMIT ?
+'''
+
+
+def complete_posts(connection, published: List[Tuple[int, int]], failed: List[Tuple[str, int]],
+                   max_attempts: int = CHANNEL_POST_MAX_ATTEMPTS) -> int:
+    """Запись результата пачки одной транзакцией (выполняется в потоке БД)
+
+    published - пары (message_id, bet_id), failed - пары (ошибка, bet_id).
+    Возвращает число постов, снятых после max_attempts неудачных попыток.
+    """
+    if published:
+        connection.executemany('UPDATE bets SET channel_message_id = ? WHERE id = ?', published)
+        connection.executemany('DELETE FROM channel_posts WHERE bet_id = ?', [(bet_id,) for _, bet_id in published])
+    if failed:
+        connection.executemany(
+            'UPDATE channel_posts SET attempts = attempts + 1, last_error = ? WHERE bet_id = ?', failed
+        )
+    dropped = connection.execute('DELETE FROM channel_posts WHERE attempts >= ?', (max_attempts,)).rowcount
+    connection.commit()
+    return dropped
+
+
+class ChannelPublisher:
+    """Фоновая публикация результатов ставок в игровой канал
+
+    Пост записывается в таблицу channel_posts той же транзакцией, что и
+    ставка, поэтому игрок получает ответ сразу, а пост не теряется при
+    перезапуске. Фоновая задача отправляет посты пачками по bet_id и
+    одной транзакцией проставляет bets.channel_message_id по первичному
+    ключу. После сбоя между отправкой и записью пост может уйти повторно.
+    """
+
+    def __init__(self, db, send: Callable[[int, str], Awaitable[int]], batch_size: int = CHANNEL_POST_BATCH,
+                 interval: float = CHANNEL_POST_INTERVAL, max_attempts: int = CHANNEL_POST_MAX_ATTEMPTS):
+        self.db = db
+        self.send = send
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.published = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def notify(self):
+        """Новый пост в очереди: не ждать следующего интервала"""
+        self._wakeup.set()
+
+    async def _run(self):
+        while not self._closed:
+            try:
+                # Пока очередь не пуста, пачки идут подряд
+                while not self._closed and await self.publish_batch():
+                    pass
+            except Exception as e:
+                logger.error(f"❌ Ошибка публикации в канал: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _publish(self, post: Dict) -> Tuple[Optional[int], Optional[str]]:
+        try:
+            return await self.send(post['chat_id'], post['text']), None
+        except Exception as e:
+            return None, str(e)
+
+    async def publish_batch(self) -> int:
+        """Отправка одной пачки постов, возвращает их количество"""
+        posts = await self.db.fetch_channel_posts(self.batch_size)
+        if not posts:
+            return 0
+
+        # Очередь отправки сохраняет порядок сообщений в чат, значит и порядок bet_id
+        results = await asyncio.gather(*(self._publish(post) for post in posts))
+
+        published, failed = [], []
+        for post, (message_id, error) in zip(posts, results):
+            if error is None:
+                published.append((message_id, post['bet_id']))
+            else:
+                logger.error(f"❌ Пост ставки #{post['bet_id']} не отправлен (попытка {post['attempts'] + 1}): {error}")
+                failed.append((error, post['bet_id']))
+
+        dropped = await self.db.complete_channel_posts(published, failed, self.max_attempts)
+        if dropped:
+            logger.error(f"❌ Снято постов после {self.max_attempts} неудачных попыток: {dropped}")
+
+        self.published += len(published)
+        self.failed += len(failed)
+        self.dropped += dropped
+        # Пачка только из ошибок - ждем интервал, а не повторяем сразу
+        return len(published)
+
+    async def close(self, timeout: float):
+        """Остановка после текущей пачки; неотправленные посты остаются в БД"""
+        self._closed = True
+        self._wakeup.set()
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            logger.warning("⚠️ Публикация в канал прервана, посты будут отправлены после запуска")
+
+    def get_stats(self) -> Dict:
+        return {'published': self.published, 'failed': self.failed, 'dropped': self.dropped}
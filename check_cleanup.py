@@ -0,0 +1,147 @@
+# check_cleanup.py
+"""Массовое удаление активных чеков CryptoBot
+
+Сначала getChecks постранично (до CHECK_CLEANUP_PAGE_SIZE за запрос)
+собирает id активных чеков: удаление во время обхода сдвигало бы offset
+и часть чеков пропускалась. Затем чеки удаляются CHECK_CLEANUP_CONCURRENCY
+обработчиками не чаще CHECK_CLEANUP_RATE запросов в секунду. Не удаленные
+чеки повторяются отдельными кругами с паузой, всего до
+CHECK_CLEANUP_ATTEMPTS раз. В конце активные чеки запрашиваются снова:
+чек, которого там уже нет (обналичен во время очистки), не считается
+ошибкой.
+
+Ошибка getChecks - не пустая страница: страница запрашивается повторно,
+и если список так и не получен, очистка не начинается (error в отчете),
+а не удаленные чеки без проверочного списка считаются неудачными.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from send_queue import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import (CHECK_CLEANUP_CONCURRENCY, CHECK_CLEANUP_RATE, CHECK_CLEANUP_ATTEMPTS,
+                        CHECK_CLEANUP_BACKOFF, CHECK_CLEANUP_PAGE_SIZE)
+except ImportError:
+    CHECK_CLEANUP_CONCURRENCY = 10
+    CHECK_CLEANUP_RATE = 20
+    CHECK_CLEANUP_ATTEMPTS = 3
+    CHECK_CLEANUP_BACKOFF = 2.0
+    CHECK_CLEANUP_PAGE_SIZE = 1000
+
+
+def _check_id(check) -> int:
+    # CryptoBotTurbo возвращает словари, aiocryptopay - объекты
+    return int(check['check_id'] if isinstance(check, dict) else check.check_id)
+
+
+async def _get_page(crypto, asset: str, offset: int, page_size: int, attempts: int,
+                    backoff: float) -> Optional[List]:
+    """Страница активных чеков с повторами; None - API так и не ответил"""
+    for attempt in range(attempts):
+        if attempt:
+            await asyncio.sleep(backoff * 2 ** (attempt - 1))
+        try:
+            page = await crypto.get_checks(asset=asset, status='active', offset=offset, count=page_size)
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения чеков (offset {offset}): {e}")
+            page = None
+        if page is not None:
+            return page
+    return None
+
+
+async def list_active_checks(crypto, asset: str = 'USDT', page_size: int = CHECK_CLEANUP_PAGE_SIZE,
+                             attempts: int = CHECK_CLEANUP_ATTEMPTS,
+                             backoff: float = CHECK_CLEANUP_BACKOFF) -> Optional[List[int]]:
+    """id всех активных чеков, постранично; None, если страницу получить не удалось"""
+    check_ids, offset = [], 0
+    while True:
+        page = await _get_page(crypto, asset, offset, page_size, attempts, backoff)
+        if page is None:
+            return None
+        check_ids.extend(_check_id(check) for check in page)
+        if len(page) < page_size:
+            # dict.fromkeys убирает повторы, если список сдвинулся между страницами
+            return list(dict.fromkeys(check_ids))
+        offset += page_size
+
+
+async def delete_checks(crypto, check_ids: List[int], concurrency: int = CHECK_CLEANUP_CONCURRENCY,
+                        rate: float = CHECK_CLEANUP_RATE) -> List[int]:
+    """Один круг удаления, возвращает id, которые удалить не удалось"""
+    bucket = TokenBucket(rate, max(1.0, min(rate, concurrency)))
+    pending = iter(check_ids)
+    failed = []
+
+    async def worker():
+        for check_id in pending:
+            delay = bucket.delay(time.monotonic())
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = bucket.delay(time.monotonic())
+            bucket.consume(time.monotonic())
+            try:
+                if not await crypto.delete_check(check_id):
+                    failed.append(check_id)
+            except Exception as e:
+                logger.error(f"❌ Ошибка удаления чека {check_id}: {e}")
+                failed.append(check_id)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(check_ids))))))
+    return failed
+
+
+async def purge_checks(crypto, asset: str = 'USDT', concurrency: int = CHECK_CLEANUP_CONCURRENCY,
+                       rate: float = CHECK_CLEANUP_RATE, attempts: int = CHECK_CLEANUP_ATTEMPTS,
+                       backoff: float = CHECK_CLEANUP_BACKOFF, page_size: int = CHECK_CLEANUP_PAGE_SIZE) -> Dict:
+    """Удаление всех активных чеков; отчет: total, deleted, gone, failed, rounds, elapsed, error"""
+    started = time.monotonic()
+    report = {'total': 0, 'deleted': 0, 'gone': 0, 'failed': 0, 'rounds': 0, 'error': None}
+    check_ids = await list_active_checks(crypto, asset, page_size, attempts, backoff)
+    if check_ids is None:
+        report['error'] = 'getChecks недоступен, список чеков не получен'
+        report['elapsed'] = time.monotonic() - started
+        logger.error(f"❌ Удаление чеков: {format_summary(report)}")
+        return report
+    report['total'] = len(check_ids)
+
+    remaining = check_ids
+    for attempt in range(attempts):
+        if not remaining:
+            break
+        if attempt:
+            await asyncio.sleep(backoff * 2 ** (attempt - 1))
+        failed = await delete_checks(crypto, remaining, concurrency, rate)
+        report['deleted'] += len(remaining) - len(failed)
+        report['rounds'] += 1
+        remaining = failed
+
+    if remaining:
+        still_active = await list_active_checks(crypto, asset, page_size, attempts, backoff)
+        if still_active is None:
+            # Без проверочного списка обналиченный чек не отличить от не удаленного
+            report['failed'] = len(remaining)
+        else:
+            still_active = set(still_active)
+            report['failed'] = sum(1 for check_id in remaining if check_id in still_active)
+            report['gone'] = len(remaining) - report['failed']
+
+    report['elapsed'] = time.monotonic() - started
+    logger.info(f"🧾 Удаление чеков: {format_summary(report)}")
+    return report
+
+
+def format_summary(report: Dict) -> str:
+    if report.get('error'):
+        return f"{report['error']}; {report['elapsed']:.1f} с"
+    text = f"удалено {report['deleted']} из {report['total']}"
+    if report['gone']:
+        text += f", уже обналичено {report['gone']}"
+    if report['failed']:
+        text += f", не удалось {report['failed']}"
+    return f"{text}; кругов {report['rounds']}, {report['elapsed']:.1f} с"
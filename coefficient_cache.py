@@ -0,0 +1,50 @@
+# coefficient_cache.py
+import logging
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CoefficientCache:
+    """Кэш коэффициентов в памяти процесса
+
+    Загружается из БД при старте и перечитывается только после записи
+    коэффициента (update_coefficient / update_KEF). Каждая перезагрузка
+    увеличивает version, которую расчет ставки сохраняет вместе со ставкой.
+    Чтение не обращается к БД и безопасно из event loop: словарь
+    заменяется целиком, а не изменяется на месте.
+    """
+
+    def __init__(self, defaults: Optional[Dict[str, float]] = None):
+        self.defaults = dict(defaults or {})
+        self._values: Dict[str, float] = {}
+        self.version = 0
+        self._listeners = []
+
+    def load(self, values: Dict[str, float]):
+        """Заменяет содержимое кэша и увеличивает версию"""
+        self._values = dict(values)
+        self.version += 1
+
+        for listener in self._listeners:
+            try:
+                listener(self.version, self._values)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработчика обновления коэффициентов: {e}")
+
+    def get(self, name: str, default: Optional[float] = None) -> float:
+        """Значение коэффициента без обращения к БД"""
+        value = self._values.get(name)
+        if value is not None:
+            return value
+        if default is not None:
+            return default
+        return self.defaults.get(name, 1.0)
+
+    def all(self) -> Dict[str, float]:
+        """Копия всех коэффициентов"""
+        return dict(self._values)
+
+    def subscribe(self, listener: Callable[[int, Dict[str, float]], None]):
+        """Подписка на перезагрузку кэша: listener(version, values)"""
+        self._listeners.append(listener)
@@ -1,11 +1,16 @@
+import os
+
 # ==================== ОСНОВНЫЕ НАСТРОЙКИ БОТА ====================
-BOT_TOKEN = '8269258723:AAHTvTAe4uonLsIRuLGWpsvKbZ8r1dm-1C0'
+BOT_TOKEN = os.getenv('BOT_TOKEN', '8269258723:AAHTvTAe4uonLsIRuLGWpsvKbZ8r1dm-1C0')
 api_cryptobot = '503730:AASfc5N8fIyUb4l4iN5Yi5ObcpfHJRsMx5U'
 
 # ==================== НАСТРОЙКИ ПРОИЗВОДИТЕЛЬНОСТИ ====================
 BOT_PROCESSING_TIMEOUT = 30  # Увеличиваем таймаут обработки
 MAX_WORKERS = 10  # Количество рабочих процессов
 RATE_LIMIT_DELAY = 0.1  # Задержка между запросами
+USER_LOCK_STRIPES = 64  # Число полос блокировок балансов по пользователям
+USER_CACHE_SIZE = 10000  # Максимум пользователей в кэше профилей
+USER_CACHE_TTL = 300  # Время жизни записи в кэше профилей (сек)
 
 # ==================== ID КАНАЛОВ И ЧАТОВ ====================
 channel_id = -1003696063206  # ID игрового канала (исправлено: было channal_id)
@@ -83,4 +88,108 @@ VIP_LEVELS = {
     'GOLD': {'min_deposit': 1000, 'cashback': 3},
     'PLATINUM': {'min_deposit': 5000, 'cashback': 5},
     'DIAMOND': {'min_deposit': 10000, 'cashback': 10}
-}
\ No newline at end of file
+}
+
+# ==================== НАСТРОЙКИ SQLITE ====================
+SQLITE_PRAGMAS = {
+    'auto_vacuum': 'INCREMENTAL',  # Освобожденные страницы возвращаются через incremental_vacuum (retention.py)
+    'journal_mode': 'WAL',  # Читатели не блокируют писателя
+    'synchronous': 'NORMAL',  # fsync только на чекпоинте WAL
+    'busy_timeout': 5000,  # Ожидание блокировки (мс)
+    'cache_size': -64000,  # Кэш страниц (отрицательное значение = КиБ)
+    'mmap_size': 268435456,  # 256 МБ memory-mapped I/O
+    'temp_store': 'MEMORY'  # Временные таблицы в памяти
+}
+
+# ==================== ЛОГИ В БД ====================
+LOG_FLUSH_SIZE = 200  # Запись пачки логов по достижении N строк
+LOG_FLUSH_INTERVAL = 2.0  # ...или через N секунд
+LOG_BUFFER_LIMIT = 5000  # Максимум строк в буфере (дальше запись сразу)
+LOG_CALLER_INFO = False  # Определять модуль/функцию вызова через inspect (медленно)
+
+# ==================== FSM ХРАНИЛИЩЕ ====================
+FSM_STORAGE = 'sqlite'  # 'sqlite' - состояния в casino.db, 'memory' - MemoryStorage
+FSM_FLUSH_INTERVAL = 1.0  # Запись измененных состояний раз в N секунд
+FSM_STATE_TTL = 86400  # Удаление состояний без активности дольше N секунд
+
+# ==================== РЕЖИМ ПОЛУЧЕНИЯ ОБНОВЛЕНИЙ ====================
+BOT_MODE = os.getenv('BOT_MODE', 'polling')  # 'polling' или 'webhook'
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', 'https://example.com')  # Публичный адрес для Telegram
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # Заголовок X-Telegram-Bot-Api-Secret-Token
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', '8080'))
+HEALTH_PATH = '/health'
+WEBHOOK_DRAIN_TIMEOUT = 30  # Ожидание незавершенных апдейтов при остановке (сек)
+TELEGRAM_API_SERVER = os.getenv('TELEGRAM_API_SERVER', '')  # Свой Bot API сервер (локальные тесты)
+
+# ==================== КЭШ КАРТИНОК (FILE_ID) ====================
+ASSET_RECHECK_INTERVAL = 30  # Проверка файла на диске (размер/mtime/хеш) не чаще раза в N секунд
+SCREEN_CACHE_SIZE = 10000  # Сколько сообщений бота помнить для пропуска одинаковых правок
+
+# ==================== ОЧЕРЕДЬ ОТПРАВКИ В TELEGRAM ====================
+SEND_GLOBAL_RATE = 30  # Сообщений в секунду на бота (0 - без ограничения)
+SEND_GLOBAL_BURST = 30
+SEND_CHAT_RATE = 1.0  # Сообщений в секунду в один личный чат
+SEND_CHAT_BURST = 5
+SEND_GROUP_RATE = 20 / 60  # Сообщений в секунду в группу или канал (20 в минуту)
+SEND_GROUP_BURST = 20
+SEND_MAX_RETRIES = 3  # Повторы после RetryAfter и сетевых ошибок
+SEND_DRAIN_TIMEOUT = 10  # Ожидание отправки очереди при остановке (сек)
+
+# ==================== ПУБЛИКАЦИЯ В КАНАЛ ====================
+CHANNEL_POST_BATCH = 20  # Постов за одну пачку (запись channel_message_id одной транзакцией)
+CHANNEL_POST_INTERVAL = 5.0  # Проверка очереди постов раз в N секунд (новые посты - сразу)
+CHANNEL_POST_MAX_ATTEMPTS = 5  # После N неудачных отправок пост снимается
+
+# ==================== РАССЫЛКА ====================
+BROADCAST_RATE = 25  # Сообщений рассылки в секунду (остаток общего лимита - ответам игрокам)
+BROADCAST_PAGE_SIZE = 200  # Получателей на страницу (контрольная точка после каждой)
+
+# ==================== ИТОГИ СТАТИСТИКИ ====================
+ROLLUP_REFRESH_INTERVAL = 60  # Досчет почасовых и суточных итогов ставок раз в N секунд
+
+# ==================== ПАГИНАЦИЯ ====================
+PAGE_SIZE = 10  # Строк на странице списков (пользователи, история ставок)
+PAGINATION_COUNT_TTL = 60  # Кэш итоговых количеств для «страница N из M» (сек)
+
+# ==================== ХРАНЕНИЕ ДАННЫХ ====================
+# Строки старше days удаляются; archive - сначала копия в archive/casino-YYYY-MM.db
+RETENTION_POLICIES = {
+    'bets': {'days': 90, 'archive': True},
+    'logs': {'days': 30, 'archive': False},
+    'notifications': {'days': 30, 'archive': False, 'where': 'is_read = 1'}
+}
+RETENTION_CHUNK_SIZE = 500  # Строк в порции (одна транзакция потока БД)
+RETENTION_PAUSE = 0.05  # Пауза между порциями (сек), чтобы проходили запросы игроков
+RETENTION_ARCHIVE_DIR = 'archive'
+RETENTION_VACUUM_PAGES = 1000  # Страниц за один шаг incremental_vacuum
+
+# ==================== ВЫПЛАТЫ ====================
+PAYOUT_WORKERS = 3  # Параллельных выплат (у одного пользователя - строго по очереди)
+PAYOUT_POLL_INTERVAL = 5.0  # Проверка очереди выплат раз в N секунд (новые выплаты - сразу)
+PAYOUT_MAX_ATTEMPTS = 8  # После N неудачных попыток выплата уходит в dead-letter (status = 'dead')
+PAYOUT_BACKOFF_BASE = 5.0  # Пауза перед повтором: случайная от 0 до BASE * 2^(попытка-1) сек
+PAYOUT_BACKOFF_MAX = 600.0  # Верхняя граница паузы между попытками (сек)
+
+# ==================== CRYPTOBOT API ====================
+CRYPTOBOT_API_URL = ''  # Пусто - pay.crypt.bot; 'http://127.0.0.1:8765' - локальный эмулятор (cryptobot_emulator.py)
+CRYPTOBOT_TIMEOUT = 5.0  # Таймаут одного запроса к pay.crypt.bot (сек)
+CRYPTOBOT_RETRY_BACKOFF = 0.2  # Пауза перед повтором: случайная от 0 до BACKOFF * 2^попытка сек
+CRYPTOBOT_BREAKER_THRESHOLD = 5  # Сбоев подряд (таймаут, 5xx), после которых запросы отклоняются сразу
+CRYPTOBOT_BREAKER_RESET = 30.0  # Через сколько секунд пропустить пробный запрос
+
+# ==================== ПОПОЛНЕНИЯ (WEBHOOK CRYPTO PAY) ====================
+# URL для Crypto Pay: WEBHOOK_HOST + CRYPTOPAY_WEBHOOK_PATH (в polling-режиме сервер на WEBAPP_HOST:WEBAPP_PORT)
+# Выключено - пополнения зачисляет только сверка раз в CRYPTOPAY_RECONCILE_INTERVAL
+CRYPTOPAY_WEBHOOK = os.getenv('CRYPTOPAY_WEBHOOK', '0') == '1'
+CRYPTOPAY_WEBHOOK_PATH = os.getenv('CRYPTOPAY_WEBHOOK_PATH', '/cryptopay')
+CRYPTOPAY_RECONCILE_INTERVAL = 300  # Сверка ожидающих счетов одним getInvoices раз в N секунд
+CRYPTOPAY_RECONCILE_BATCH = 1000  # Счетов за одну сверку (предел getInvoices)
+
+# ==================== УДАЛЕНИЕ ЧЕКОВ ====================
+CHECK_CLEANUP_CONCURRENCY = 10  # Одновременных deleteCheck
+CHECK_CLEANUP_RATE = 20  # Запросов deleteCheck в секунду (запас до лимита Crypto Pay)
+CHECK_CLEANUP_ATTEMPTS = 3  # Кругов удаления: не удаленные чеки повторяются
+CHECK_CLEANUP_BACKOFF = 2.0  # Пауза перед повтором: BACKOFF * 2^(круг-1) сек
+CHECK_CLEANUP_PAGE_SIZE = 1000  # Чеков за один getChecks (максимум API)
@@ -0,0 +1,389 @@
+# cryptobot_emulator.py
+"""Локальный эмулятор Crypto Pay API (pay.crypt.bot) для проверок и бенчмарков
+
+Запуск: python cryptobot_emulator.py [--port 8765] [--latency 0.05] [--error-rate 0.01] [--rate-limit 30]
+Затем в config.py: CRYPTOBOT_API_URL = 'http://127.0.0.1:8765'
+
+Методы: getMe, createInvoice, getInvoices, transfer, getTransfers, getBalance,
+getExchangeRates, getChecks, deleteCheck - формат ответов как у
+настоящего API ({"ok": true, "result": ...}). Задержка, доля ошибок 500
+и зависаний (дольше таймаута клиента) и лимит запросов в секунду
+(429 с Retry-After) настраиваются. Управление состоянием:
+POST /emulator/invoices/{invoice_id}/pay - оплатить счет,
+GET /emulator/stats - счетчики. С --webhook-url оплата счета отправляет
+подписанное обновление invoice_paid, как Crypto Pay (часть можно
+«потерять» через --webhook-drop-rate для проверки сверки).
+
+Повтор transfer с тем же spend_id, как в Crypto Pay, не списывает
+средства второй раз и отклоняется ошибкой SPEND_ID_ALREADY_USED; первый
+перевод находится через getTransfers?spend_id=...
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from cryptopay_webhook import SIGNATURE_HEADER, sign
+from send_queue import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATES = {('USDT', 'USD'): 1.0, ('USDT', 'RUB'): 90.0, ('TON', 'USDT'): 5.2, ('BTC', 'USDT'): 65000.0}
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def _error(code: int, name: str, status: int = None, headers: Dict = None) -> web.Response:
+    return web.json_response({'ok': False, 'error': {'code': code, 'name': name}}, status=status or code,
+                             headers=headers)
+
+
+class CryptoBotEmulator:
+    """Состояние и обработчики эмулятора
+
+    latency/jitter - задержка ответа в секундах, error_rate - доля ответов
+    500, hang_rate - доля запросов, которые висят hang_seconds (таймаут
+    клиента), rate_limit - запросов в секунду (0 - без ограничения),
+    auto_pay - через сколько секунд счет оплачивается сам (None - только
+    вручную), checks - сколько активных чеков создать при запуске,
+    webhook_url - куда отправлять invoice_paid, webhook_drop_rate - доля
+    неотправленных обновлений.
+    """
+
+    def __init__(self, token: str = None, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 hang_rate: float = 0.0, hang_seconds: float = 30.0, rate_limit: float = 0, auto_pay: float = None,
+                 checks: int = 0, balance: float = 1_000_000.0, seed: int = None, webhook_url: str = None,
+                 webhook_drop_rate: float = 0.0):
+        self.token = token
+        self.webhook_url = webhook_url
+        self.webhook_drop_rate = webhook_drop_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.auto_pay = auto_pay
+        self.random = random.Random(seed)
+        self.bucket = TokenBucket(rate_limit, max(1.0, rate_limit))
+        self.balances = {'USDT': balance, 'TON': 0.0, 'BTC': 0.0}
+        self.invoices: Dict[int, Dict] = {}
+        self.transfers: Dict[str, Dict] = {}
+        self.checks: Dict[int, Dict] = {}
+        self._ids = itertools.count(1)
+        self.stats = {'requests': 0, 'rate_limited': 0, 'errors_injected': 0, 'hangs_injected': 0,
+                      'invoices_paid': 0, 'transfers': 0, 'duplicate_transfers': 0, 'checks_deleted': 0,
+                      'webhooks_sent': 0, 'webhooks_dropped': 0, 'webhooks_failed': 0}
+        # Монотонное время оплаты счета и проведения перевода (для бенчмарков в том же процессе)
+        self.paid_at: Dict[int, float] = {}
+        self.transferred_at: Dict[str, float] = {}
+        self._timers: List[asyncio.TimerHandle] = []
+        self._webhook_tasks = set()
+        self._webhook_session: Optional[aiohttp.ClientSession] = None
+        self._update_ids = itertools.count(1)
+        for _ in range(checks):
+            self._create_check(round(self.random.uniform(0.1, 5), 2))
+
+    # ==================== ПРИЛОЖЕНИЕ ====================
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_route('*', '/api/{method}', self._dispatch)
+        app.router.add_post('/emulator/invoices/{invoice_id}/pay', self._control_pay)
+        app.router.add_get('/emulator/stats', self._control_stats)
+        app.on_cleanup.append(self._cancel_timers)
+        return app
+
+    async def _cancel_timers(self, app):
+        for timer in self._timers:
+            timer.cancel()
+        for task in list(self._webhook_tasks):
+            task.cancel()
+        if self._webhook_session:
+            await self._webhook_session.close()
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        if not request.path.startswith('/api/'):
+            return await handler(request)
+        self.stats['requests'] += 1
+
+        now = time.monotonic()
+        delay = self.bucket.delay(now)
+        if delay > 0:
+            self.stats['rate_limited'] += 1
+            return _error(429, 'FLOOD_WAIT', headers={'Retry-After': f'{delay:.2f}'})
+        self.bucket.consume(now)
+
+        if self.token and request.headers.get('Crypto-Pay-API-Token') != self.token:
+            return _error(401, 'UNAUTHORIZED')
+
+        roll = self.random.random()
+        if roll < self.hang_rate:
+            self.stats['hangs_injected'] += 1
+            await asyncio.sleep(self.hang_seconds)
+        elif roll < self.hang_rate + self.error_rate:
+            self.stats['errors_injected'] += 1
+            return _error(500, 'INTERNAL_ERROR')
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+        return await handler(request)
+
+    async def _dispatch(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        handler = getattr(self, f'api_{method}', None)
+        if handler is None:
+            return _error(405, 'METHOD_NOT_FOUND')
+
+        params = dict(request.query)
+        if request.method == 'POST' and request.can_read_body:
+            try:
+                params.update(await request.json())
+            except ValueError:
+                return _error(400, 'INVALID_JSON')
+        try:
+            return web.json_response({'ok': True, 'result': handler(params)})
+        except _ApiError as e:
+            return _error(400, e.name)
+
+    async def _control_pay(self, request: web.Request) -> web.Response:
+        invoice_id = int(request.match_info['invoice_id'])
+        if invoice_id not in self.invoices:
+            return _error(404, 'INVOICE_NOT_FOUND')
+        return web.json_response({'ok': True, 'result': self.pay_invoice(invoice_id)})
+
+    async def _control_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({'ok': True, 'result': self.get_stats()})
+
+    # ==================== МЕТОДЫ API ====================
+
+    def api_getMe(self, params: Dict) -> Dict:
+        return {'app_id': 1, 'name': 'Emulator', 'payment_processing_bot_username': 'CryptoBot'}
+
+    def api_createInvoice(self, params: Dict) -> Dict:
+        asset = _require(params, 'asset')
+        amount = _amount(params)
+        invoice_id = next(self._ids)
+        invoice = {
+            'invoice_id': invoice_id,
+            'hash': f'IV{invoice_id:010d}',
+            'currency_type': 'crypto',
+            'asset': asset,
+            'amount': _format_amount(amount),
+            'pay_url': f'https://t.me/CryptoBot?start=IV{invoice_id:010d}',
+            'bot_invoice_url': f'https://t.me/CryptoBot?start=IV{invoice_id:010d}',
+            'description': params.get('description'),
+            'status': 'active',
+            'created_at': _now_iso(),
+            'allow_comments': bool(params.get('allow_comments', True)),
+            'allow_anonymous': bool(params.get('allow_anonymous', True)),
+            'payload': params.get('payload')
+        }
+        self.invoices[invoice_id] = invoice
+        if self.auto_pay is not None:
+            self._timers.append(asyncio.get_running_loop().call_later(self.auto_pay, self.pay_invoice, invoice_id))
+        return invoice
+
+    def api_getInvoices(self, params: Dict) -> Dict:
+        items = list(self.invoices.values())
+        if params.get('invoice_ids'):
+            wanted = {int(i) for i in str(params['invoice_ids']).split(',') if i}
+            items = [invoice for invoice in items if invoice['invoice_id'] in wanted]
+        if params.get('status'):
+            items = [invoice for invoice in items if invoice['status'] == params['status']]
+        if params.get('asset'):
+            items = [invoice for invoice in items if invoice['asset'] == params['asset']]
+        return {'items': _page(items, params)}
+
+    def api_transfer(self, params: Dict) -> Dict:
+        spend_id = _require(params, 'spend_id')
+        if spend_id in self.transfers:
+            self.stats['duplicate_transfers'] += 1
+            raise _ApiError('SPEND_ID_ALREADY_USED')
+
+        asset = _require(params, 'asset')
+        amount = _amount(params)
+        if self.balances.get(asset, 0.0) < amount:
+            raise _ApiError('INSUFFICIENT_FUNDS')
+        self.balances[asset] -= amount
+
+        transfer = {
+            'transfer_id': next(self._ids),
+            'spend_id': spend_id,
+            'user_id': int(_require(params, 'user_id')),
+            'asset': asset,
+            'amount': _format_amount(amount),
+            'status': 'completed',
+            'completed_at': _now_iso(),
+            'comment': params.get('comment')
+        }
+        self.transfers[spend_id] = transfer
+        self.transferred_at[spend_id] = time.monotonic()
+        self.stats['transfers'] += 1
+        return transfer
+
+    def api_getTransfers(self, params: Dict) -> Dict:
+        items = list(self.transfers.values())
+        if params.get('spend_id'):
+            items = [transfer for transfer in items if transfer['spend_id'] == params['spend_id']]
+        if params.get('transfer_ids'):
+            transfer_ids = {int(transfer_id) for transfer_id in str(params['transfer_ids']).split(',')}
+            items = [transfer for transfer in items if transfer['transfer_id'] in transfer_ids]
+        if params.get('asset'):
+            items = [transfer for transfer in items if transfer['asset'] == params['asset']]
+        return {'items': _page(items, params)}
+
+    def api_getBalance(self, params: Dict) -> List[Dict]:
+        return [{'currency_code': asset, 'available': _format_amount(amount), 'onhold': '0'}
+                for asset, amount in self.balances.items()]
+
+    def api_getExchangeRates(self, params: Dict) -> List[Dict]:
+        return [{'is_valid': True, 'is_crypto': True, 'is_fiat': target in ('USD', 'RUB'),
+                 'source': source, 'target': target, 'rate': str(rate)}
+                for (source, target), rate in DEFAULT_RATES.items()]
+
+    def api_getChecks(self, params: Dict) -> Dict:
+        items = list(self.checks.values())
+        if params.get('status'):
+            items = [check for check in items if check['status'] == params['status']]
+        if params.get('asset'):
+            items = [check for check in items if check['asset'] == params['asset']]
+        return {'items': _page(items, params)}
+
+    def api_deleteCheck(self, params: Dict) -> bool:
+        check_id = int(_require(params, 'check_id'))
+        if check_id not in self.checks:
+            raise _ApiError('CHECK_NOT_FOUND')
+        del self.checks[check_id]
+        self.stats['checks_deleted'] += 1
+        return True
+
+    # ==================== СОСТОЯНИЕ ====================
+
+    def pay_invoice(self, invoice_id: int) -> Dict:
+        """Оплата счета «пользователем»"""
+        invoice = self.invoices[invoice_id]
+        if invoice['status'] == 'active':
+            invoice.update({'status': 'paid', 'paid_at': _now_iso(), 'paid_asset': invoice['asset'],
+                            'paid_amount': invoice['amount']})
+            self.balances[invoice['asset']] = self.balances.get(invoice['asset'], 0.0) + float(invoice['amount'])
+            self.paid_at[invoice_id] = time.monotonic()
+            self.stats['invoices_paid'] += 1
+            if self.webhook_url:
+                task = asyncio.get_running_loop().create_task(self._send_webhook(invoice))
+                self._webhook_tasks.add(task)
+                task.add_done_callback(self._webhook_tasks.discard)
+        return invoice
+
+    async def _send_webhook(self, invoice: Dict):
+        if self.random.random() < self.webhook_drop_rate:
+            self.stats['webhooks_dropped'] += 1
+            return
+        body = json.dumps({'update_id': next(self._update_ids), 'update_type': 'invoice_paid',
+                           'request_date': _now_iso(), 'payload': invoice}).encode()
+        if self._webhook_session is None:
+            self._webhook_session = aiohttp.ClientSession()
+        try:
+            async with self._webhook_session.post(
+                self.webhook_url, data=body,
+                headers={'Content-Type': 'application/json', SIGNATURE_HEADER: sign(self.token or '', body)}
+            ) as response:
+                if response.status == 200:
+                    self.stats['webhooks_sent'] += 1
+                else:
+                    self.stats['webhooks_failed'] += 1
+        except aiohttp.ClientError:
+            self.stats['webhooks_failed'] += 1
+
+    def _create_check(self, amount: float, asset: str = 'USDT') -> Dict:
+        check_id = next(self._ids)
+        check = {'check_id': check_id, 'hash': f'CQ{check_id:010d}', 'asset': asset,
+                 'amount': _format_amount(amount), 'bot_check_url': f'https://t.me/CryptoBot?start=CQ{check_id:010d}',
+                 'status': 'active', 'created_at': _now_iso()}
+        self.checks[check_id] = check
+        return check
+
+    def get_stats(self) -> Dict:
+        return {**self.stats, 'invoices': len(self.invoices), 'active_checks': len(self.checks),
+                'balances': {asset: _format_amount(amount) for asset, amount in self.balances.items()}}
+
+
+class _ApiError(Exception):
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.name = name
+
+
+def _require(params: Dict, name: str):
+    if params.get(name) in (None, ''):
+        raise _ApiError(f'{name.upper()}_REQUIRED')
+    return params[name]
+
+
+def _amount(params: Dict) -> float:
+    try:
+        amount = float(_require(params, 'amount'))
+    except ValueError:
+        raise _ApiError('AMOUNT_INVALID')
+    if amount <= 0:
+        raise _ApiError('AMOUNT_TOO_SMALL')
+    return amount
+
+
+def _format_amount(amount: float) -> str:
+    return f'{amount:.8f}'.rstrip('0').rstrip('.') or '0'
+
+
+def _page(items: List[Dict], params: Dict) -> List[Dict]:
+    offset = int(params.get('offset', 0))
+    count = min(int(params.get('count', 100)), 1000)
+    return items[offset:offset + count]
+
+
+async def start_emulator(emulator: CryptoBotEmulator, host: str = '127.0.0.1', port: int = 0):
+    """Запуск в текущем цикле событий: (runner, base_url); остановка - await runner.cleanup()"""
+    runner = web.AppRunner(emulator.create_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://{host}:{bound_port}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальный эмулятор Crypto Pay API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--token', help='требовать этот Crypto-Pay-API-Token')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа, сек')
+    parser.add_argument('--jitter', type=float, default=0.0, help='случайная добавка к задержке, сек')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 500')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='доля зависших запросов')
+    parser.add_argument('--rate-limit', type=float, default=0, help='запросов в секунду (0 - без лимита)')
+    parser.add_argument('--auto-pay', type=float, help='оплачивать счета через N секунд')
+    parser.add_argument('--checks', type=int, default=0, help='активных чеков при запуске')
+    parser.add_argument('--webhook-url', help='URL для обновлений invoice_paid')
+    parser.add_argument('--webhook-drop-rate', type=float, default=0.0, help='доля потерянных обновлений')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    emulator = CryptoBotEmulator(token=args.token, latency=args.latency, jitter=args.jitter,
+                                 error_rate=args.error_rate, hang_rate=args.hang_rate, rate_limit=args.rate_limit,
+                                 auto_pay=args.auto_pay, checks=args.checks, webhook_url=args.webhook_url,
+                                 webhook_drop_rate=args.webhook_drop_rate)
+    logger.info(f"✅ Эмулятор Crypto Pay API: http://{args.host}:{args.port}")
+    web.run_app(emulator.create_app(), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == '__main__':
+    main()
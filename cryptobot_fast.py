@@ -3,24 +3,186 @@ import aiohttp
 import asyncio
 import json
 import logging
+import random
+import time
+from bisect import bisect_left
 from datetime import datetime
 from typing import Dict, Any, Optional, List
 
 logger = logging.getLogger(__name__)
 
+try:
+    from config import (CRYPTOBOT_API_URL, CRYPTOBOT_TIMEOUT, CRYPTOBOT_RETRY_BACKOFF, CRYPTOBOT_BREAKER_THRESHOLD,
+                        CRYPTOBOT_BREAKER_RESET)
+except ImportError:
+    CRYPTOBOT_API_URL = ''
+    CRYPTOBOT_TIMEOUT = 5.0
+    CRYPTOBOT_RETRY_BACKOFF = 0.2
+    CRYPTOBOT_BREAKER_THRESHOLD = 5
+    CRYPTOBOT_BREAKER_RESET = 30.0
+
+# Повторы после таймаута, сетевой ошибки, 5xx или 429 - только для идемпотентных
+# методов. createInvoice создал бы второй счет; transfer повторяет очередь
+# выплат (payout_outbox) с тем же spend_id.
+RETRY_POLICIES = {
+    'getMe': 2,
+    'getBalance': 2,
+    'getExchangeRates': 2,
+    'getCurrencies': 2,
+    'getInvoices': 2,
+    'getChecks': 2,
+    'getTransfers': 2,
+    'deleteInvoice': 1,
+    'deleteCheck': 1
+}
+
+# Границы корзин гистограммы задержек (мс), последняя - все, что дольше
+LATENCY_BUCKETS = (25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+SLOW_RESPONSE_MS = 1000
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными корзинами: память не растет с числом запросов"""
+    
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+    
+    def observe(self, ms: float):
+        self.counts[bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля q: линейная интерполяция внутри корзины"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                upper = min(bound, self.max_ms)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.max_ms
+
+
+class CircuitBreaker:
+    """Быстрый отказ, пока pay.crypt.bot деградирует
+    
+    После threshold сбоев подряд (таймаут, сетевая ошибка, 5xx) запросы не
+    отправляются reset_timeout секунд, затем проходит один пробный запрос:
+    успех закрывает цепь, сбой снова открывает ее.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, threshold: int = CRYPTOBOT_BREAKER_THRESHOLD, reset_timeout: float = CRYPTOBOT_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_count = 0
+        self._probe = False
+    
+    @property
+    def state(self) -> str:
+        if self.failures < self.threshold:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+    
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probe:
+            self._probe = True
+            return True
+        return False
+    
+    def release(self):
+        """Пробный запрос ничего не сказал о состоянии API (отмена, ошибка в коде, 429): пропустить следующий"""
+        self._probe = False
+    
+    def record_success(self):
+        if self.failures >= self.threshold:
+            logger.info("✅ CryptoBot API снова доступен")
+        self.failures = 0
+        self._probe = False
+    
+    def record_failure(self):
+        self.failures += 1
+        self._probe = False
+        if self.failures >= self.threshold:
+            if self.failures == self.threshold:
+                self.opened_count += 1
+                logger.error(f"❌ CryptoBot API недоступен: {self.failures} сбоев подряд, "
+                             f"запросы отклоняются {self.reset_timeout:.0f} с")
+            self.opened_at = time.monotonic()
+
+
+class _EndpointStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.errors = 0
+        self.api_errors = 0
+        self.retries = 0
+        self.rejected = 0
+    
+    def snapshot(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'api_errors': self.api_errors,
+            'retries': self.retries,
+            'rejected': self.rejected,
+            'error_rate': (self.errors + self.api_errors) / self.requests * 100 if self.requests else 0.0,
+            'p50': self.latency.quantile(0.5),
+            'p95': self.latency.quantile(0.95),
+            'p99': self.latency.quantile(0.99),
+            'max': self.latency.max_ms,
+            'avg': self.latency.total_ms / self.latency.count if self.latency.count else None
+        }
+
+
 class CryptoBotTurbo:
-    """ТУРБО реализация CryptoBot API на чистом aiohttp"""
+    """ТУРБО реализация CryptoBot API на чистом aiohttp
+    
+    Все методы возвращают ответ API ({"ok": ...}) и не бросают исключений.
+    Идемпотентные методы повторяются (RETRY_POLICIES), при деградации API
+    запросы отклоняются сразу ({"ok": False, "error": "circuit_open"}).
+    """
     
-    def __init__(self, api_key: str, testnet: bool = False):
+    def __init__(self, api_key: str, testnet: bool = False, breaker: CircuitBreaker = None,
+                 retry_policies: Dict[str, int] = None, retry_backoff: float = CRYPTOBOT_RETRY_BACKOFF,
+                 base_url: str = None):
         self.api_key = api_key
-        self.base_url = "https://testnet-pay.crypt.bot" if testnet else "https://pay.crypt.bot"
+        # Адрес API из config.CRYPTOBOT_API_URL (локальный эмулятор) или боевой/тестовый
+        self.base_url = (base_url or CRYPTOBOT_API_URL or
+                         ("https://testnet-pay.crypt.bot" if testnet else "https://pay.crypt.bot")).rstrip('/')
         self.session = None
         self._lock = asyncio.Lock()
+        self.breaker = breaker or CircuitBreaker()
+        self.retry_policies = RETRY_POLICIES if retry_policies is None else retry_policies
+        self.retry_backoff = retry_backoff
+        self._stats: Dict[str, _EndpointStats] = {}
         
     async def _get_session(self):
         """Создает или возвращает сессию"""
         if self.session is None or self.session.closed:
-            timeout = aiohttp.ClientTimeout(total=5, connect=2)
+            timeout = aiohttp.ClientTimeout(total=CRYPTOBOT_TIMEOUT, connect=2)
             connector = aiohttp.TCPConnector(
                 limit=20,
                 ttl_dns_cache=300,
@@ -37,34 +199,96 @@ class CryptoBotTurbo:
             )
         return self.session
     
+    async def _send(self, method: str, endpoint: str, data: Optional[Dict]):
+        """Один HTTP-запрос: (код ответа, тело, Retry-After)"""
+        session = await self._get_session()
+        url = f"{self.base_url}/api/{endpoint}"
+        request = session.get(url, params=data) if method.upper() == "GET" else session.post(url, json=data)
+        async with request as response:
+            try:
+                result = await response.json(content_type=None)
+            except (json.JSONDecodeError, aiohttp.ContentTypeError, UnicodeDecodeError):
+                result = None
+            if not isinstance(result, dict):
+                result = {"ok": False, "error": f"HTTP {response.status}"}
+            return response.status, result, response.headers.get('Retry-After')
+    
+    def _retry_delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), CRYPTOBOT_TIMEOUT)
+            except ValueError:
+                pass
+        return random.uniform(0, self.retry_backoff * 2 ** attempt)
+    
     async def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict:
-        """Универсальный метод для запросов"""
-        try:
-            session = await self._get_session()
-            url = f"{self.base_url}/api/{endpoint}"
-            
-            start_time = datetime.now()
+        """Запрос с повторами, автоматическим выключателем и метриками"""
+        stats = self._stats.setdefault(endpoint, _EndpointStats())
+        retries = self.retry_policies.get(endpoint, 0)
+        result = {"ok": False, "error": "circuit_open"}
+        
+        for attempt in range(retries + 1):
+            if not self.breaker.allow():
+                stats.rejected += 1
+                return {"ok": False, "error": "circuit_open"}
             
-            if method.upper() == "GET":
-                async with session.get(url, params=data) as response:
-                    result = await response.json()
-            else:
-                async with session.post(url, json=data) as response:
-                    result = await response.json()
+            stats.requests += 1
+            retry_after = None
+            throttled = False
+            started = time.monotonic()
+            try:
+                status, result, retry_after = await self._send(method, endpoint, data)
+                throttled = status == 429
+                transient = status >= 500 or throttled
+                degraded = status >= 500
+            except asyncio.TimeoutError:
+                result, transient, degraded = {"ok": False, "error": "timeout"}, True, True
+            except aiohttp.ClientError as e:
+                result, transient, degraded = {"ok": False, "error": str(e) or type(e).__name__}, True, True
+            except asyncio.CancelledError:
+                # Иначе отмененный пробный запрос оставит выключатель полуоткрытым навсегда
+                self.breaker.release()
+                raise
+            except Exception as e:
+                self.breaker.release()
+                logger.error(f"❌ CryptoBot {endpoint}: {e}")
+                stats.errors += 1
+                return {"ok": False, "error": str(e)}
             
-            response_time = (datetime.now() - start_time).total_seconds() * 1000
+            elapsed_ms = (time.monotonic() - started) * 1000
+            stats.latency.observe(elapsed_ms)
+            if elapsed_ms > SLOW_RESPONSE_MS:
+                logger.warning(f"⚠️ Медленный ответ CryptoBot {endpoint}: {elapsed_ms:.0f}ms")
             
-            if response_time > 1000:
-                logger.warning(f"Медленный ответ CryptoBot: {response_time:.0f}ms")
+            if degraded:
+                self.breaker.record_failure()
+            elif throttled:
+                # 429 - лимит запросов: ни сбой, ни признак восстановления, пробный запрос не закрывает цепь
+                self.breaker.release()
+            else:
+                self.breaker.record_success()
             
-            return result
+            if not transient:
+                if not result.get("ok"):
+                    stats.api_errors += 1
+                return result
             
-        except asyncio.TimeoutError:
-            logger.error("CryptoBot: Таймаут запроса")
-            return {"ok": False, "error": "timeout"}
-        except Exception as e:
-            logger.error(f"CryptoBot ошибка: {e}")
-            return {"ok": False, "error": str(e)}
+            stats.errors += 1
+            if attempt < retries:
+                stats.retries += 1
+                await asyncio.sleep(self._retry_delay(attempt, retry_after))
+        
+        logger.error(f"❌ CryptoBot {endpoint}: {result.get('error')}")
+        return result
+    
+    def get_metrics(self) -> Dict:
+        """Состояние выключателя и метрики по методам API"""
+        return {
+            'breaker': self.breaker.state,
+            'breaker_failures': self.breaker.failures,
+            'breaker_opened': self.breaker.opened_count,
+            'endpoints': {endpoint: stats.snapshot() for endpoint, stats in sorted(self._stats.items())}
+        }
     
     async def get_me(self):
         """Проверка работы API"""
@@ -104,13 +328,19 @@ class CryptoBotTurbo:
                 "error": result.get("error", "Unknown error")
             }
     
-    async def transfer(self, user_id: int, amount: float, currency: str = "USDT", **kwargs) -> Dict:
-        """Вывод средств пользователю - МГНОВЕННО"""
+    async def transfer(self, user_id: int, amount: float, currency: str = "USDT", *, spend_id: str, **kwargs) -> Dict:
+        """Вывод средств пользователю
+        
+        spend_id - ключ идемпотентности: повтор запроса с тем же spend_id
+        CryptoBot не проведет второй раз, а отклонит ошибкой (первый перевод
+        находится через get_transfers(spend_id=...)). Должен быть постоянным
+        для выплаты (payout_outbox хранит его в withdrawals.spend_id).
+        """
         payload = {
             "user_id": user_id,
             "asset": currency,
             "amount": str(amount),
-            "spend_id": f"w_{user_id}_{int(datetime.now().timestamp())}",
+            "spend_id": spend_id,
             "comment": f"Вывод {amount} {currency} | NOXWAT Casino",
             "disable_send_notification": False
         }
@@ -134,6 +364,51 @@ class CryptoBotTurbo:
                 "error": result.get("error", "Unknown error")
             }
     
+    async def get_transfers(self, asset: str = None, transfer_ids: List[int] = None, spend_id: str = None,
+                            offset: int = 0, count: int = 100) -> Optional[List[Dict]]:
+        """Переводы (до 1000 за запрос); None при ошибке"""
+        params = {"offset": offset, "count": count}
+        if asset:
+            params["asset"] = asset
+        if transfer_ids:
+            params["transfer_ids"] = ",".join(str(transfer_id) for transfer_id in transfer_ids)
+        if spend_id:
+            params["spend_id"] = spend_id
+        
+        result = await self._make_request("GET", "getTransfers", params)
+        return result["result"].get("items", []) if result.get("ok") else None
+    
+    async def get_invoices(self, invoice_ids: List[int] = None, status: str = None, asset: str = None,
+                           offset: int = 0, count: int = 100) -> List[Dict]:
+        """Счета (до 1000 за запрос); пустой список при ошибке"""
+        params = {"offset": offset, "count": count}
+        if invoice_ids:
+            params["invoice_ids"] = ",".join(str(invoice_id) for invoice_id in invoice_ids)
+        if status:
+            params["status"] = status
+        if asset:
+            params["asset"] = asset
+        
+        result = await self._make_request("GET", "getInvoices", params)
+        return result["result"].get("items", []) if result.get("ok") else []
+    
+    async def get_checks(self, asset: str = None, status: str = None, offset: int = 0,
+                         count: int = 100) -> Optional[List[Dict]]:
+        """Чеки (до 1000 за запрос); None при ошибке - не путать с пустой страницей"""
+        params = {"offset": offset, "count": count}
+        if asset:
+            params["asset"] = asset
+        if status:
+            params["status"] = status
+        
+        result = await self._make_request("GET", "getChecks", params)
+        return result["result"].get("items", []) if result.get("ok") else None
+    
+    async def delete_check(self, check_id: int) -> bool:
+        """Удаление чека"""
+        result = await self._make_request("POST", "deleteCheck", {"check_id": check_id})
+        return bool(result.get("ok"))
+    
     async def get_balance(self) -> List[Dict]:
         """Получение баланса"""
         result = await self._make_request("GET", "getBalance")
@@ -164,64 +439,3 @@ class CryptoBotTurbo:
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.close()
-
-# Система очереди для быстрых выплат
-class PaymentQueue:
-    """Очередь выплат для избежания конфликтов"""
-    
-    def __init__(self):
-        self.queue = asyncio.Queue()
-        self.processing = set()
-        self._running = True
-        
-    async def add_payment(self, user_id: int, amount: float, currency: str = "USDT"):
-        """Добавление выплаты в очередь"""
-        await self.queue.put({
-            "user_id": user_id,
-            "amount": amount,
-            "currency": currency,
-            "timestamp": datetime.now()
-        })
-    
-    async def process_payments(self, cryptobot: CryptoBotTurbo):
-        """Обработка очереди выплат"""
-        while self._running:
-            try:
-                payment = await asyncio.wait_for(self.queue.get(), timeout=1.0)
-                
-                if payment["user_id"] in self.processing:
-                    # Уже обрабатывается
-                    continue
-                
-                self.processing.add(payment["user_id"])
-                
-                try:
-                    result = await cryptobot.transfer(
-                        payment["user_id"],
-                        payment["amount"],
-                        payment["currency"]
-                    )
-                    
-                    if result["success"]:
-                        logger.info(f"✅ Выплата {payment['amount']} {payment['currency']} пользователю {payment['user_id']}")
-                    else:
-                        logger.error(f"❌ Ошибка выплаты: {result.get('error')}")
-                        # Возвращаем в очередь при ошибке
-                        await asyncio.sleep(5)
-                        await self.queue.put(payment)
-                        
-                except Exception as e:
-                    logger.error(f"❌ Критическая ошибка выплаты: {e}")
-                    
-                finally:
-                    self.processing.remove(payment["user_id"])
-                    
-            except asyncio.TimeoutError:
-                continue
-            except Exception as e:
-                logger.error(f"❌ Ошибка обработки очереди: {e}")
-                await asyncio.sleep(1)
-    
-    def stop(self):
-        """Остановка обработки"""
-        self._running = False
\ No newline at end of file
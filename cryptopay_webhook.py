@@ -0,0 +1,238 @@
+# cryptopay_webhook.py
+"""Зачисление пополнений по webhook Crypto Pay (invoice_paid) и сверка пропущенных
+
+Crypto Pay отправляет POST с обновлением {"update_type": "invoice_paid",
+"payload": <счет>} и заголовком crypto-pay-api-signature - HMAC-SHA256
+тела запроса с ключом SHA256(API токен). Запрос с неверной подписью
+отклоняется (401).
+
+Зачисление идемпотентно по invoice_id (UNIQUE в deposits): строка
+депозита переходит из pending в completed одним условным UPDATE в той
+же транзакции, что и изменение баланса, поэтому повторный webhook или
+сверка после webhook ничего не начисляют повторно.
+
+Зачисляются только счета, для которых бот создал строку в deposits;
+чужой счет (например, с подложным payload) только записывается в лог.
+
+Сверка (reconcile) раз в CRYPTOPAY_RECONCILE_INTERVAL одним запросом
+getInvoices по ожидающим счетам ловит webhook, потерянные при
+недоступности бота, и закрывает просроченные счета.
+"""
+import datetime
+import hashlib
+import hmac
+import json
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import CRYPTOPAY_RECONCILE_BATCH
+except ImportError:
+    CRYPTOPAY_RECONCILE_BATCH = 1000
+
+SIGNATURE_HEADER = 'crypto-pay-api-signature'
+
+DEPOSIT_INDEXES = [
+    # Сверка выбирает ожидающие счета без просмотра всей таблицы
+    'CREATE INDEX IF NOT EXISTS idx_deposits_status ON deposits(status, id)'
+]
+
+
+def sign(api_token: str, body: bytes) -> str:
+    """Подпись тела запроса, как ее считает Crypto Pay"""
+    secret = hashlib.sha256(api_token.encode()).digest()
+    return hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(api_token: str, body: bytes, signature: Optional[str]) -> bool:
+    return bool(signature) and hmac.compare_digest(sign(api_token, body), signature)
+
+
+# ==================== ДЕПОЗИТЫ (ВЫПОЛНЯЕТСЯ В ПОТОКЕ БД) ====================
+
+def install(connection):
+    for statement in DEPOSIT_INDEXES:
+        connection.execute(statement)
+    connection.commit()
+
+
+def create_deposit(connection, user_id: int, amount: float, invoice: Dict, currency: str = 'USDT') -> int:
+    """Ожидающий депозит по созданному счету"""
+    cursor = connection.execute('''
+        INSERT INTO deposits (user_id, amount, currency, payment_method, status, invoice_id, invoice_url)
+        VALUES (?, ?, ?, 'cryptobot', 'pending', ?, ?)
+    ''', (user_id, amount, currency, str(invoice['invoice_id']), invoice.get('pay_url')))
+    connection.commit()
+    return cursor.lastrowid
+
+
+def deposit_owner(connection, invoice_id) -> Optional[int]:
+    """Владелец депозита по счету; None - счет создан не ботом"""
+    row = connection.execute('SELECT user_id FROM deposits WHERE invoice_id = ?', (str(invoice_id),)).fetchone()
+    return row['user_id'] if row else None
+
+
+def credit_invoice(connection, invoice: Dict) -> Optional[Dict]:
+    """Зачисление оплаченного счета одной транзакцией; None - уже зачислен или неизвестен
+
+    Счет без строки в deposits не зачисляется: payload задает тот, кто
+    создал счет, и по нему нельзя решать, чей баланс пополнить. Такой
+    счет остается в логе для ручной проверки.
+    """
+    invoice_id = str(invoice['invoice_id'])
+    cursor = connection.cursor()
+    try:
+        row = cursor.execute('SELECT id, user_id, amount, status FROM deposits WHERE invoice_id = ?',
+                             (invoice_id,)).fetchone()
+        if row is None:
+            logger.warning(f"⚠️ Оплачен счет {invoice_id} без депозита бота ({invoice.get('amount')} "
+                           f"{invoice.get('asset')}, payload {invoice.get('payload')!r}), не зачислен")
+            return None
+
+        # Ключ идемпотентности: переход pending -> completed возможен один раз
+        cursor.execute('''
+            UPDATE deposits
+            SET status = 'completed', completed_at = CURRENT_TIMESTAMP, confirmed_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'pending'
+        ''', (row['id'],))
+        if cursor.rowcount == 0:
+            connection.rollback()
+            return None
+
+        user_id, amount = row['user_id'], row['amount']
+        cursor.execute('''
+            UPDATE users
+            SET balance = balance + ?, total_deposit = total_deposit + ?, last_deposit = CURRENT_TIMESTAMP
+            WHERE user_id = ?
+        ''', (amount, amount, user_id))
+        if cursor.rowcount == 0:
+            connection.rollback()
+            logger.warning(f"⚠️ Счет {invoice_id}: пользователь {user_id} не найден, депозит не зачислен")
+            return None
+
+        new_balance = cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,)).fetchone()['balance']
+        cursor.execute('''
+            INSERT INTO transactions (user_id, type, amount, balance_before, balance_after, description, reference_id, reference_type)
+            VALUES (?, 'deposit', ?, ?, ?, ?, ?, 'deposit')
+        ''', (user_id, amount, new_balance - amount, new_balance, f'Пополнение, счет {invoice_id}', row['id']))
+
+        today = datetime.datetime.now().strftime('%Y-%m-%d')
+        cursor.execute('INSERT OR IGNORE INTO statistics (date) VALUES (?)', (today,))
+        cursor.execute('''
+            UPDATE statistics
+            SET total_deposits = total_deposits + 1, total_deposit_amount = total_deposit_amount + ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE date = ?
+        ''', (amount, today))
+
+        connection.commit()
+        return {'deposit_id': row['id'], 'user_id': user_id, 'amount': amount, 'new_balance': new_balance}
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def pending_invoice_ids(connection, limit: int = CRYPTOPAY_RECONCILE_BATCH) -> List[int]:
+    """Счета ожидающих депозитов, старые первыми (getInvoices принимает до 1000)
+
+    Просроченные счета закрываются сверкой, поэтому очередь не копится.
+    """
+    return [int(row[0]) for row in connection.execute('''
+        SELECT invoice_id FROM deposits
+        WHERE status = 'pending' AND invoice_id IS NOT NULL
+        ORDER BY id
+        LIMIT ?
+    ''', (limit,))]
+
+
+def expire_deposits(connection, invoice_ids: List[int]) -> int:
+    count = connection.executemany('''
+        UPDATE deposits SET status = 'cancelled', cancelled_at = CURRENT_TIMESTAMP
+        WHERE invoice_id = ? AND status = 'pending'
+    ''', [(str(invoice_id),) for invoice_id in invoice_ids]).rowcount
+    connection.commit()
+    return count
+
+
+# ==================== WEBHOOK ====================
+
+class CryptoPayWebhook:
+    """Обработчик webhook Crypto Pay для aiohttp
+
+    on_invoice_paid(счет) зачисляет депозит и возвращает True, если
+    зачислено сейчас, и False для повтора. Ошибка зачисления - ответ 500:
+    обновление повторит Crypto Pay или подберет сверка.
+    """
+
+    def __init__(self, api_token: str, on_invoice_paid: Callable[[Dict], Awaitable[bool]]):
+        self.api_token = api_token
+        self.on_invoice_paid = on_invoice_paid
+        self.received = 0
+        self.credited = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.errors = 0
+
+    def register(self, app: web.Application, path: str):
+        app.router.add_post(path, self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        if not verify_signature(self.api_token, body, request.headers.get(SIGNATURE_HEADER)):
+            self.rejected += 1
+            logger.warning(f"⚠️ Webhook Crypto Pay с неверной подписью от {request.remote}")
+            return web.Response(status=401)
+
+        try:
+            update = json.loads(body)
+        except ValueError:
+            self.rejected += 1
+            return web.Response(status=400)
+
+        self.received += 1
+        if update.get('update_type') != 'invoice_paid':
+            return web.Response(text='ok')
+
+        try:
+            if await self.on_invoice_paid(update['payload']):
+                self.credited += 1
+            else:
+                self.duplicates += 1
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"❌ Ошибка зачисления по webhook Crypto Pay: {e}")
+            return web.Response(status=500)
+        return web.Response(text='ok')
+
+    def get_stats(self) -> Dict:
+        return {'received': self.received, 'credited': self.credited, 'duplicates': self.duplicates,
+                'rejected': self.rejected, 'errors': self.errors}
+
+
+# ==================== СВЕРКА ====================
+
+async def reconcile(db, crypto, on_invoice_paid: Callable[[Dict], Awaitable[bool]]) -> Dict:
+    """Один запрос getInvoices по ожидающим депозитам: зачисление оплаченных, закрытие просроченных"""
+    invoice_ids = await db.run(lambda: pending_invoice_ids(db.database.connection))
+    report = {'checked': len(invoice_ids), 'credited': 0, 'expired': 0}
+    if not invoice_ids:
+        return report
+
+    invoices = await crypto.get_invoices(invoice_ids=invoice_ids, count=len(invoice_ids))
+    expired = []
+    for invoice in invoices:
+        if invoice.get('status') == 'paid':
+            if await on_invoice_paid(invoice):
+                report['credited'] += 1
+        elif invoice.get('status') == 'expired':
+            expired.append(invoice['invoice_id'])
+
+    if expired:
+        report['expired'] = await db.run(lambda: expire_deposits(db.database.connection, expired))
+    if report['credited']:
+        logger.warning(f"⚠️ Сверка зачислила пополнений без webhook: {report['credited']}")
+    return report
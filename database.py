@@ -4,15 +4,20 @@ import os
 import logging
 from typing import Optional, Dict, List, Any, Union, Tuple
 
+from db_connection import connect_sqlite
+from coefficient_cache import CoefficientCache
+from config import DEFAULT_KEF
+
 logger = logging.getLogger(__name__)
 
 class DataBase:
     def __init__(self, path: str = 'database.db'):
         """Инициализация базы данных"""
         self.path = path
-        self.connection = sqlite3.connect(self.path, check_same_thread=False)
-        self.connection.row_factory = sqlite3.Row
+        self.connection = connect_sqlite(self.path)
+        self.coefficients = CoefficientCache(DEFAULT_KEF)
         self.init_all_tables()
+        self.reload_KEF()
     
     def init_all_tables(self):
         """Инициализация всех таблиц"""
@@ -392,16 +397,16 @@ class DataBase:
     # ==================== ФУНКЦИИ ДЛЯ КОЭФФИЦИЕНТОВ ====================
     
     def get_cur_KEF(self, kef_name: str) -> float:
-        """Получить текущий коэффициент"""
-        cursor = self.connection.cursor()
-        cursor.execute("SELECT value FROM kef_values WHERE key = ?", (kef_name,))
-        result = cursor.fetchone()
-        if result:
-            return result[0]
-        else:
-            # Если коэффициент не найден, возвращаем значение по умолчанию
-            from config import DEFAULT_KEF
-            return DEFAULT_KEF.get(kef_name, 1.0)
+        """Получить текущий коэффициент (из кэша, по умолчанию - из конфига)"""
+        return self.coefficients.get(kef_name)
+    
+    def reload_KEF(self) -> int:
+        """Перечитать коэффициенты в кэш, возвращает новую версию"""
+        try:
+            self.coefficients.load(self.get_all_kef())
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки коэффициентов: {e}")
+        return self.coefficients.version
     
     def update_KEF(self, kef_name: str, value: float) -> bool:
         """Обновить коэффициент"""
@@ -409,6 +414,7 @@ class DataBase:
             cursor = self.connection.cursor()
             cursor.execute("INSERT OR REPLACE INTO kef_values (key, value) VALUES (?, ?)", (kef_name, value))
             self.connection.commit()
+            self.reload_KEF()
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка обновления коэффициента: {e}")
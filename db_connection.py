@@ -0,0 +1,82 @@
+# db_connection.py
+import logging
+import sqlite3
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import SQLITE_PRAGMAS
+except ImportError:
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -64000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY'
+    }
+
+# Значения, которые SQLite возвращает числом при чтении PRAGMA
+_SYNCHRONOUS_LEVELS = {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3}
+_TEMP_STORE_LEVELS = {'DEFAULT': 0, 'FILE': 1, 'MEMORY': 2}
+_AUTO_VACUUM_MODES = {'NONE': 0, 'FULL': 1, 'INCREMENTAL': 2}
+
+
+def _expected_value(name: str, value):
+    """Приводит значение из профиля к виду, в котором его возвращает SQLite"""
+    if name == 'synchronous':
+        return _SYNCHRONOUS_LEVELS.get(str(value).upper(), value)
+    if name == 'temp_store':
+        return _TEMP_STORE_LEVELS.get(str(value).upper(), value)
+    if name == 'auto_vacuum':
+        return _AUTO_VACUUM_MODES.get(str(value).upper(), value)
+    if name == 'journal_mode':
+        return str(value).lower()
+    return value
+
+
+def apply_pragmas(connection: sqlite3.Connection, pragmas: Optional[Dict] = None) -> Dict:
+    """Применяет профиль PRAGMA к соединению и возвращает фактические значения"""
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+    cursor = connection.cursor()
+    applied = {}
+
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+        row = cursor.execute(f'PRAGMA {name}').fetchone()
+        applied[name] = row[0] if row else None
+
+    return applied
+
+
+def verify_pragmas(applied: Dict, pragmas: Optional[Dict] = None) -> bool:
+    """Сверяет фактические значения PRAGMA с профилем"""
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+    ok = True
+
+    for name, value in pragmas.items():
+        expected = _expected_value(name, value)
+        actual = applied.get(name)
+        if str(actual).lower() != str(expected).lower():
+            # mmap_size может быть ограничен сборкой SQLite, journal_mode=WAL недоступен для :memory:,
+            # auto_vacuum у существующей БД меняется только после VACUUM (python retention.py --vacuum)
+            logger.warning(f"⚠️ PRAGMA {name}: ожидалось {expected}, получено {actual}")
+            ok = False
+
+    return ok
+
+
+def connect_sqlite(db_path: str, pragmas: Optional[Dict] = None) -> sqlite3.Connection:
+    """Открывает соединение SQLite с профилем PRAGMA из config.SQLITE_PRAGMAS"""
+    connection = sqlite3.connect(db_path, check_same_thread=False)
+    connection.row_factory = sqlite3.Row
+
+    applied = apply_pragmas(connection, pragmas)
+    if verify_pragmas(applied, pragmas):
+        logger.info(f"✅ SQLite {db_path}: journal_mode={applied.get('journal_mode')}, "
+                    f"synchronous={applied.get('synchronous')}")
+    else:
+        logger.warning(f"⚠️ SQLite {db_path}: профиль PRAGMA применен не полностью")
+
+    return connection
@@ -0,0 +1,238 @@
+# fsm_storage.py
+import asyncio
+import copy
+import json
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+from aiogram.dispatcher.storage import BaseStorage
+
+from async_db import DatabaseWorker
+from db_connection import connect_sqlite
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import FSM_FLUSH_INTERVAL, FSM_STATE_TTL
+except ImportError:
+    FSM_FLUSH_INTERVAL = 1.0
+    FSM_STATE_TTL = 86400
+
+
+class _Record:
+    __slots__ = ('state', 'data', 'bucket', 'touched')
+
+    def __init__(self, state: Optional[str] = None, data: Dict = None, bucket: Dict = None):
+        self.state = state
+        self.data = data or {}
+        self.bucket = bucket or {}
+        self.touched = time.monotonic()
+
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data and not self.bucket
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище aiogram в файле SQLite проекта
+
+    Состояния читаются и пишутся в памяти так же быстро, как в MemoryStorage.
+    Измененные записи сбрасываются в таблицу fsm_states пачкой раз в
+    FSM_FLUSH_INTERVAL секунд, поэтому незавершенные ставки, депозиты и
+    промокоды переживают перезапуск. Записи без активности дольше
+    FSM_STATE_TTL удаляются из памяти и из БД.
+    """
+
+    def __init__(self, db_path: str = 'casino.db', flush_interval: float = FSM_FLUSH_INTERVAL,
+                 ttl: float = FSM_STATE_TTL, worker: DatabaseWorker = None):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.worker = worker or DatabaseWorker(thread_name='fsm-worker')
+        self._own_worker = worker is None
+
+        self.connection = connect_sqlite(db_path)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS fsm_states (
+                chat TEXT NOT NULL,
+                user TEXT NOT NULL,
+                state TEXT,
+                data TEXT DEFAULT '{}',
+                bucket TEXT DEFAULT '{}',
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (chat, user)
+            )
+        ''')
+        # Состояния, брошенные до перезапуска дольше TTL назад
+        self.connection.execute(
+            "DELETE FROM fsm_states WHERE updated_at < datetime('now', ?)", (f'-{int(ttl)} seconds',)
+        )
+        self.connection.commit()
+
+        self._records: Dict[Tuple[str, str], _Record] = {}
+        self._dirty = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    # ==================== РАБОТА С ЗАПИСЯМИ ====================
+
+    def _resolve_address(self, chat, user) -> Tuple[str, str]:
+        chat, user = self.check_address(chat=chat, user=user)
+        return str(chat), str(user)
+
+    def _load_record(self, key: Tuple[str, str]) -> _Record:
+        """Чтение записи из БД (выполняется в потоке БД)"""
+        row = self.connection.execute(
+            'SELECT state, data, bucket FROM fsm_states WHERE chat = ? AND user = ?', key
+        ).fetchone()
+        if not row:
+            return _Record()
+        return _Record(row['state'], json.loads(row['data'] or '{}'), json.loads(row['bucket'] or '{}'))
+
+    async def _get_record(self, chat, user) -> Tuple[Tuple[str, str], _Record]:
+        key = self._resolve_address(chat, user)
+        record = self._records.get(key)
+
+        if record is None:
+            # Промах: читаем из БД один раз, дальше запись живет в памяти (в том числе пустая)
+            record = await self.worker.run(self._load_record, key)
+            record = self._records.setdefault(key, record)
+
+        record.touched = time.monotonic()
+        return key, record
+
+    def _mark_dirty(self, key: Tuple[str, str]):
+        self._dirty.add(key)
+        if self._flush_task is None and not self._closed:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    # ==================== ЗАПИСЬ В БД ====================
+
+    def _write_batch(self, upserts, deletes):
+        """Пачечная запись измененных состояний (выполняется в потоке БД)"""
+        if upserts:
+            self.connection.executemany('''
+                INSERT OR REPLACE INTO fsm_states (chat, user, state, data, bucket, updated_at)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', upserts)
+        if deletes:
+            self.connection.executemany('DELETE FROM fsm_states WHERE chat = ? AND user = ?', deletes)
+        self.connection.commit()
+
+    def _collect_batch(self):
+        upserts, deletes = [], []
+        for key in self._dirty:
+            record = self._records.get(key)
+            if record is None or record.is_empty():
+                deletes.append(key)
+            else:
+                upserts.append((*key, record.state, json.dumps(record.data), json.dumps(record.bucket)))
+        self._dirty.clear()
+        return upserts, deletes
+
+    def _evict_idle(self):
+        """Удаление состояний без активности дольше TTL"""
+        deadline = time.monotonic() - self.ttl
+        idle = [key for key, record in self._records.items() if record.touched < deadline]
+        for key in idle:
+            record = self._records.pop(key)
+            # Пустые записи (кэш отсутствия состояния) в БД не хранятся
+            if not record.is_empty():
+                self._dirty.add(key)
+        return len(idle)
+
+    async def flush(self) -> int:
+        """Сброс измененных состояний в БД одной транзакцией"""
+        upserts, deletes = self._collect_batch()
+        if not upserts and not deletes:
+            return 0
+        try:
+            await self.worker.run(self._write_batch, upserts, deletes)
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи FSM состояний: {e}")
+            self._dirty.update(key[:2] for key in upserts)
+            self._dirty.update(deletes)
+            return 0
+        return len(upserts) + len(deletes)
+
+    async def _flush_loop(self):
+        while not self._closed:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self._evict_idle()
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Ошибка фоновой записи FSM: {e}")
+
+    # ==================== ИНТЕРФЕЙС BaseStorage ====================
+
+    async def close(self):
+        # Executor aiogram закрывает хранилище повторно после on_shutdown
+        if self._closed:
+            return
+        self._closed = True
+        if self._flush_task:
+            self._flush_task.cancel()
+        await self.flush()
+        await self.worker.run(self.connection.close)
+        if self._own_worker:
+            self.worker.shutdown()
+        logger.info("✅ FSM состояния сохранены")
+
+    async def wait_closed(self):
+        pass
+
+    async def get_state(self, *, chat=None, user=None, default: Optional[str] = None) -> Optional[str]:
+        _, record = await self._get_record(chat, user)
+        return record.state if record.state is not None else self.resolve_state(default)
+
+    async def get_data(self, *, chat=None, user=None, default: Optional[Dict] = None) -> Dict:
+        _, record = await self._get_record(chat, user)
+        return copy.deepcopy(record.data) if record.data else (default or {})
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        key, record = await self._get_record(chat, user)
+        record.state = self.resolve_state(state)
+        self._mark_dirty(key)
+
+    async def set_data(self, *, chat=None, user=None, data: Dict = None):
+        key, record = await self._get_record(chat, user)
+        record.data = copy.deepcopy(data) if data else {}
+        self._mark_dirty(key)
+
+    async def update_data(self, *, chat=None, user=None, data: Dict = None, **kwargs):
+        key, record = await self._get_record(chat, user)
+        record.data.update(data or {}, **kwargs)
+        self._mark_dirty(key)
+
+    async def reset_state(self, *, chat=None, user=None, with_data: bool = True):
+        key, record = await self._get_record(chat, user)
+        record.state = None
+        if with_data:
+            record.data = {}
+        self._mark_dirty(key)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *, chat=None, user=None, default: Optional[Dict] = None) -> Dict:
+        _, record = await self._get_record(chat, user)
+        return copy.deepcopy(record.bucket) if record.bucket else (default or {})
+
+    async def set_bucket(self, *, chat=None, user=None, bucket: Dict = None):
+        key, record = await self._get_record(chat, user)
+        record.bucket = copy.deepcopy(bucket) if bucket else {}
+        self._mark_dirty(key)
+
+    async def update_bucket(self, *, chat=None, user=None, bucket: Dict = None, **kwargs):
+        key, record = await self._get_record(chat, user)
+        record.bucket.update(bucket or {}, **kwargs)
+        self._mark_dirty(key)
+
+    def get_stats(self) -> Dict:
+        """Состояние хранилища"""
+        return {
+            'in_memory': len(self._records),
+            'active': sum(1 for record in self._records.values() if record.state is not None),
+            'pending_writes': len(self._dirty)
+        }
@@ -7,8 +7,10 @@ import os
 from aiogram.filters import BaseFilter
 from aiogram.types import BotCommand, BotCommandScopeDefault, Message, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.markdown import hlink
+from aiogram.exceptions import TelegramBadRequest
 
 from loader import bot, crypto, db, scheduler
+from check_cleanup import purge_checks
 from string import digits
 from aiocryptopay.exceptions import CodeErrorFactory
 from aiogram import types
@@ -16,6 +18,31 @@ from config import *
 from keybords import *
 
 
+photo_upload_locks = {}
+
+async def send_cached_photo(photo_path: str, chat_id, **kwargs):
+    """Отправка картинки по сохраненному file_id, загрузка файла - только в первый раз"""
+    file_id = db.asset_cache.lookup(photo_path)
+    if file_id:
+        try:
+            return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+        except TelegramBadRequest as e:
+            if 'file' not in str(e).lower():
+                raise
+            print(f"file_id для {photo_path} не принят, загружаю заново: {e}")
+            db.asset_cache.forget(photo_path)
+    
+    # Одновременные первые отправки одной картинки ждут одну загрузку
+    async with photo_upload_locks.setdefault(photo_path, asyncio.Lock()):
+        file_id = db.asset_cache.lookup(photo_path)
+        if not file_id:
+            message = await bot.send_photo(chat_id=chat_id, photo=FSInputFile(photo_path), **kwargs)
+            if message.photo:
+                db.save_media_asset(photo_path, message.photo[-1].file_id)
+            return message
+    
+    return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+
 async def set_default_commands():
     await bot.set_my_commands([
         BotCommand(command="/start", description="Запустить бота")
@@ -32,16 +59,20 @@ async def del_order_day():
     print('✅ Статистика за день обновлена')
     
     try:
-        all_checks = await crypto.get_checks(asset='USDT', status='active')
-        if all_checks:
-            for check in all_checks:
-                try:
-                    await crypto.delete_check(check.check_id)
-                except Exception as e:
-                    print(f"Ошибка удаления чека: {e}")
-            await bot.send_message(channal_id, text="<b>✅ Активные чеки удалены</b>")
+        report = await purge_checks(crypto, asset='USDT')
+        if report['error']:
+            await bot.send_message(channal_id, text=f"<b>⚠️ Чеки не удалены</b>\n\n└ {report['error']}")
+        elif report['total']:
+            text = (f"<b>{'✅' if not report['failed'] else '⚠️'} Активные чеки удалены</b>\n\n"
+                    f"├ Удалено: <code>{report['deleted']}</code> из <code>{report['total']}</code>\n")
+            if report['gone']:
+                text += f"├ Обналичено во время удаления: <code>{report['gone']}</code>\n"
+            if report['failed']:
+                text += f"├ Не удалось удалить: <code>{report['failed']}</code>\n"
+            text += f"└ Время: <code>{report['elapsed']:.1f} с</code>"
+            await bot.send_message(channal_id, text=text)
     except Exception as e:
-        print(f"Ошибка получения чеков: {e}")
+        print(f"Ошибка удаления чеков: {e}")
 
 async def warning_check_day():
     """Предупреждение об удалении чеков"""
@@ -63,10 +94,9 @@ async def get_transfer_channel():
             
             # Отправляем с фоткой payments.jpg
             try:
-                photo = FSInputFile('photos/payments.jpg')
-                return await bot.send_photo(
+                return await send_cached_photo(
+                    'photos/payments.jpg',
                     chat_id=ID_SEND_TRANSFER,
-                    photo=photo,
                     caption='💸 <b>Выплата победителю:</b>\n'
                            f'<b>┠ User ID:</b> <code>*****{user}</code>\n'
                            f'<b>┠ ID перевода:</b> <code>{transfer_id}</code>\n'
@@ -91,7 +121,6 @@ async def get_transfer_channel():
 async def send_message_win_users(usdt, result_win_amount, message_id, user_name="", status=None):
     """Отправка сообщения о победе в канал (унифицированная)"""
     try:
-        photo = FSInputFile('photos/Wins.jpg')  # ИЗМЕНЕНО: .png -> .jpg
         caption = f'<b><blockquote>🟢 Победа! \n\n'
         
         if user_name:
@@ -101,9 +130,9 @@ async def send_message_win_users(usdt, result_win_amount, message_id, user_name=
         caption += f'🕊 Средства автоматически поступили на ваш кошелек CryptoBot\n'
         caption += f'♻️ Удачи в следующих играх!</blockquote></b>'
         
-        return await bot.send_photo(
+        return await send_cached_photo(
+            'photos/Wins.jpg',
             chat_id=channal_id,
-            photo=photo,
             caption=caption,
             reply_to_message_id=message_id,
             reply_markup=send_stavka()
@@ -140,10 +169,9 @@ async def fake_send_message_win_users(amount, KEF, rubs_price, message_id, user_
     
     # Отправляем в игровой канал
     try:
-        photo = FSInputFile('photos/Wins.jpg')  # ИЗМЕНЕНО: .png -> .jpg
-        await bot.send_photo(
+        await send_cached_photo(
+            'photos/Wins.jpg',
             chat_id=channal_id,
-            photo=photo,
             caption=f'<b><blockquote>🔵 Победа! \n\n'
                     f'👤 Игрок: {user_name}\n'
                     f'💸 Выигрыш: {round(float(usdt), 2)}$ ({result_win_amount}₽)\n'
@@ -166,10 +194,9 @@ async def fake_send_message_win_users(amount, KEF, rubs_price, message_id, user_
     
     # Отправляем в канал выплат с фоткой
     try:
-        photo = FSInputFile('photos/payments.jpg')
-        return await bot.send_photo(
+        return await send_cached_photo(
+            'photos/payments.jpg',
             chat_id=ID_SEND_TRANSFER,
-            photo=photo,
             caption='💸 <b>Выплата победителю:</b>\n'
                    f'<b>┠ User ID:</b> <code>*****{fake_users}</code>\n'
                    f'<b>┠ ID перевода:</b> <code>{fake_transfer}</code>\n'
@@ -193,7 +220,6 @@ async def send_message_lose_users(message_id, user_name=""):
     await asyncio.sleep(3)
     
     try:
-        photo = FSInputFile('photos/Lose.jpg')
         caption = f'<b>🥵 Поражение!\n\n'
         if user_name:
             caption += f'<blockquote>👤 Игрок: {user_name}\n\n'
@@ -203,9 +229,9 @@ async def send_message_lose_users(message_id, user_name=""):
         caption += f'Попытай свою удачу снова!\n'
         caption += f'Желаю удачи в следующих ставках!</blockquote></b>'
         
-        await bot.send_photo(
+        await send_cached_photo(
+            'photos/Lose.jpg',
             chat_id=channal_id,
-            photo=photo,
             caption=caption,
             reply_to_message_id=message_id,
             reply_markup=send_stavka()
@@ -234,10 +260,9 @@ async def fake_send_message_lose_users(message_id, name, stavka):
     await asyncio.sleep(3)
     
     try:
-        photo = FSInputFile('photos/Lose.jpg')
-        await bot.send_photo(
+        await send_cached_photo(
+            'photos/Lose.jpg',
             chat_id=channal_id,
-            photo=photo,
             caption=f'<b>🥵 Поражение!\n\n'
                     f'<blockquote>👤 Игрок: {name}\n\n'
                     f'Попытай свою удачу снова!\n'
@@ -410,10 +435,9 @@ async def fake_game_adm():
 async def send_promo_activation_photo(user_id, promo_code, amount, new_balance):
     """Отправка фотки активации промокода"""
     try:
-        photo = FSInputFile('photos/promo_activite.jpg')
-        await bot.send_photo(
+        await send_cached_photo(
+            'photos/promo_activite.jpg',
             chat_id=user_id,
-            photo=photo,
             caption=f'🎉 <b>Промокод активирован!</b>\n\n'
                    f'🎫 Код: <code>{promo_code}</code>\n'
                    f'💰 Получено: <code>{amount}$</code>\n'
@@ -8,6 +8,10 @@ from datetime import datetime, timedelta
 from typing import Optional, Dict, List, Any
 from contextlib import asynccontextmanager
 
+from db_connection import connect_sqlite
+from coefficient_cache import CoefficientCache
+from asset_cache import AssetCache
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -47,14 +51,17 @@ class Database:
     def __init__(self, db_path: str = 'database.db'):
         self.db_path = db_path
         self.connection = None
+        self.coefficients = CoefficientCache(DEFAULT_KEF)
+        self.asset_cache = AssetCache()
         self.connect()
         self.init_all_tables()
+        self.reload_KEF()
+        self.load_media_assets()
     
     def connect(self):
         """Устанавливает соединение с базой данных"""
         try:
-            self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.connection.row_factory = sqlite3.Row
+            self.connection = connect_sqlite(self.db_path)
             logger.info("✅ База данных подключена")
         except Exception as e:
             logger.error(f"❌ Ошибка подключения к БД: {e}")
@@ -431,15 +438,18 @@ class Database:
     # ==================== МЕТОДЫ ДЛЯ КОЭФФИЦИЕНТОВ ====================
     
     def get_cur_KEF(self, name: str) -> float:
-        """Получает текущий коэффициент"""
+        """Получает текущий коэффициент (из кэша)"""
+        return self.coefficients.get(name)
+    
+    def reload_KEF(self) -> int:
+        """Перечитывает коэффициенты в кэш, возвращает новую версию"""
         try:
             cursor = self.connection.cursor()
-            cursor.execute('SELECT value FROM coefficients WHERE name = ?', (name,))
-            result = cursor.fetchone()
-            return result['value'] if result else DEFAULT_KEF.get(name, 1.0)
+            cursor.execute('SELECT name, value FROM coefficients')
+            self.coefficients.load({row['name']: row['value'] for row in cursor.fetchall()})
         except Exception as e:
-            logger.error(f"❌ Ошибка получения коэффициента {name}: {e}")
-            return DEFAULT_KEF.get(name, 1.0)
+            logger.error(f"❌ Ошибка загрузки коэффициентов: {e}")
+        return self.coefficients.version
     
     def update_KEF(self, name: str, value: float) -> bool:
         """Обновляет коэффициент"""
@@ -451,11 +461,31 @@ class Database:
                 WHERE name = ?
             ''', (value, name))
             self.connection.commit()
+            self.reload_KEF()
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка обновления коэффициента {name}: {e}")
             return False
     
+    # ==================== МЕТОДЫ ДЛЯ КАРТИНОК ====================
+    
+    def load_media_assets(self) -> int:
+        """Загружает сохраненные file_id картинок в кэш"""
+        try:
+            return self.asset_cache.load(self.connection)
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки file_id картинок: {e}")
+            return 0
+    
+    def save_media_asset(self, path: str, file_id: str) -> bool:
+        """Сохраняет file_id после первой загрузки картинки"""
+        try:
+            self.asset_cache.remember(self.connection, path, file_id)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения file_id {path}: {e}")
+            return False
+    
     # ==================== МЕТОДЫ ДЛЯ ФЕЙК ИГР ====================
     
     def get_fake_games_status(self) -> bool:
@@ -646,17 +676,6 @@ except Exception as e:
 # Список админов
 admin = ADMIN
 
-# ==================== ПЛАТЕЖНАЯ ОЧЕРЕДЬ ====================
-
-# Создаем пустую заглушку для payment_queue если он не определен в cryptobot_fast
-try:
-    from cryptobot_fast import PaymentQueue
-    payment_queue = PaymentQueue()
-    logger.info("✅ Платежная очередь инициализирована")
-except ImportError:
-    payment_queue = None
-    logger.info("⚠️ Платежная очередь не доступна")
-
 # ==================== ЭКСПОРТ ====================
 
-__all__ = ['dp', 'db', 'bot', 'admin', 'lock', 'crypto', 'scheduler', 'payment_queue']
\ No newline at end of file
+__all__ = ['dp', 'db', 'bot', 'admin', 'lock', 'crypto', 'scheduler']
\ No newline at end of file
@@ -0,0 +1,94 @@
+# log_buffer.py
+import logging
+import time
+from collections import deque
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import LOG_FLUSH_SIZE, LOG_FLUSH_INTERVAL, LOG_BUFFER_LIMIT
+except ImportError:
+    LOG_FLUSH_SIZE = 200
+    LOG_FLUSH_INTERVAL = 2.0
+    LOG_BUFFER_LIMIT = 5000
+
+INSERT_LOGS_SQL = '''
+    INSERT INTO logs (level, module, function, message, user_id, data, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+class LogBuffer:
+    """Буфер отложенной записи таблицы logs
+
+    Строки копятся в памяти и пишутся пачкой через executemany одной
+    транзакцией: по достижении LOG_FLUSH_SIZE строк или через
+    LOG_FLUSH_INTERVAL секунд. Если буфер дорос до LOG_BUFFER_LIMIT,
+    запись происходит сразу в вызывающем потоке (backpressure). Пока у
+    соединения открыта чужая транзакция, запись откладывается: ее rollback()
+    стер бы строки лога. Все методы вызываются из потока БД.
+    """
+
+    def __init__(self, flush_size: int = LOG_FLUSH_SIZE, flush_interval: float = LOG_FLUSH_INTERVAL,
+                 limit: int = LOG_BUFFER_LIMIT):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.limit = limit
+        self._rows = deque()
+        self._last_flush = time.monotonic()
+        self.flushed = 0
+        self.forced_flushes = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def append(self, connection, row: Tuple):
+        """Добавляет строку лога и сбрасывает буфер при достижении порога"""
+        self._rows.append(row)
+
+        if len(self._rows) >= self.limit:
+            self.forced_flushes += 1
+            self.flush(connection)
+        elif len(self._rows) >= self.flush_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush(connection)
+
+    def flush(self, connection) -> int:
+        """Пишет накопленные строки одной транзакцией и возвращает их количество"""
+        if not self._rows:
+            self._last_flush = time.monotonic()
+            return 0
+
+        # Вызывающий открыл транзакцию (например, расчет ставки): строки
+        # остаются в буфере до следующего сброса вне транзакции
+        if connection.in_transaction:
+            return 0
+
+        rows = list(self._rows)
+        try:
+            connection.executemany(INSERT_LOGS_SQL, rows)
+            connection.commit()
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи логов ({len(rows)} строк): {e}")
+            connection.rollback()
+            # При длительной недоступности БД не даем буферу расти бесконечно
+            overflow = len(self._rows) - self.limit
+            if overflow > 0:
+                for _ in range(overflow):
+                    self._rows.popleft()
+                logger.error(f"❌ Буфер логов переполнен, отброшено {overflow} старых строк")
+            return 0
+
+        # Буфер очищается только после успешного commit
+        self._rows.clear()
+        self._last_flush = time.monotonic()
+        self.flushed += len(rows)
+        return len(rows)
+
+    def get_stats(self) -> dict:
+        """Состояние буфера"""
+        return {
+            'pending': len(self._rows),
+            'flushed': self.flushed,
+            'forced_flushes': self.forced_flushes
+        }
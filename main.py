@@ -44,8 +44,14 @@ try:
     from aiogram.dispatcher.filters.state import State, StatesGroup
     from aiogram.utils.markdown import hbold, hlink, hcode, hitalic, text
     from aiogram.utils.exceptions import TelegramAPIError, MessageNotModified, CantParseEntities
+    from aiogram.utils.exceptions import WrongFileIdentifier, WrongRemoteFileIdSpecified
+    from aiogram.utils.exceptions import RetryAfter, NetworkError
+    from aiogram.utils.exceptions import BotBlocked, UserDeactivated, ChatNotFound
     from aiogram.utils import executor
     from aiogram.contrib.middlewares.logging import LoggingMiddleware
+    from aiogram.dispatcher.middlewares import BaseMiddleware
+    from aiogram.bot.api import TelegramAPIServer
+    from aiohttp import web
     logger.info("✅ Aiogram 2.25.1 импортирован")
 except ImportError as e:
     logger.error(f"❌ Ошибка импорта aiogram: {e}")
@@ -90,6 +96,31 @@ except Exception as e:
     logger.error(f"❌ Ошибка в конфиге: {e}")
     sys.exit(1)
 
+# ==================== ИМПОРТ МОДУЛЕЙ ПРОЕКТА ====================
+from async_db import AsyncDatabase, DatabaseWorker
+from db_connection import connect_sqlite
+from user_locks import StripedLock
+from log_buffer import LogBuffer
+from coefficient_cache import CoefficientCache
+from user_cache import CachedUser, UserCache
+from fsm_storage import SQLiteStorage
+from asset_cache import AssetCache
+from screen_cache import Screen, ScreenCache
+from send_queue import SendQueue, PRIORITY_CHANNEL, PRIORITY_LOG
+from channel_publisher import (ChannelPublisher, CREATE_CHANNEL_POSTS_SQL, INSERT_CHANNEL_POST_SQL,
+                               SELECT_CHANNEL_POSTS_SQL, complete_posts)
+from broadcast import (BroadcastEngine, CREATE_BROADCASTS_SQL, SELECT_RECIPIENTS_SQL, COUNT_RECIPIENTS_SQL,
+                       save_progress)
+import rollups
+import user_search
+from retention import RetentionEngine, archive_files
+import payout_outbox
+from payout_outbox import PayoutOutbox, OUTBOX_COLUMNS
+import cryptopay_webhook
+from cryptopay_webhook import CryptoPayWebhook, reconcile
+from cryptobot_fast import CryptoBotTurbo
+from pagination import CountCache, keyset_page
+
 # ==================== НАСТРОЙКА ПУТЕЙ К ФОТО ====================
 PHOTO_DIR = 'photos/'
 
@@ -150,12 +181,37 @@ def get_photo_path(photo_type: str) -> Optional[str]:
     photo_file = PHOTO_MAPPING[photo_type]
     photo_path = os.path.join(PHOTO_DIR, photo_file)
     
-    if not os.path.exists(photo_path):
+    if not db.asset_cache.is_available(photo_path):
         logger.warning(f"⚠️ Фото не найдено: {photo_path}")
         return None
     
     return photo_path
 
+photo_upload_locks: Dict[str, asyncio.Lock] = {}
+# Что показывает каждое сообщение бота, чтобы не повторять одинаковые правки
+screens = ScreenCache()
+
+async def send_cached_photo(chat_id: int, photo_path: str, **kwargs) -> Message:
+    """Отправка картинки по сохраненному file_id, загрузка файла - только в первый раз"""
+    file_id = db.asset_cache.lookup(photo_path)
+    if file_id:
+        try:
+            return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+        except (WrongFileIdentifier, WrongRemoteFileIdSpecified):
+            logger.warning(f"⚠️ file_id для {photo_path} не принят, загружаю файл заново")
+            db.asset_cache.forget(photo_path)
+    
+    # Одновременные первые отправки одной картинки ждут одну загрузку
+    async with photo_upload_locks.setdefault(photo_path, asyncio.Lock()):
+        file_id = db.asset_cache.lookup(photo_path)
+        if not file_id:
+            message = await bot.send_photo(chat_id=chat_id, photo=types.InputFile(photo_path), **kwargs)
+            if message.photo:
+                await db.save_media_asset(photo_path, message.photo[-1].file_id)
+            return message
+    
+    return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+
 async def send_photo_message(chat_id: int, photo_type: str, caption: str = "", 
                            reply_markup=None, parse_mode=ParseMode.HTML):
     """Отправка сообщения с фото"""
@@ -163,14 +219,15 @@ async def send_photo_message(chat_id: int, photo_type: str, caption: str = "",
         photo_path = get_photo_path(photo_type)
         
         if photo_path:
-            with open(photo_path, 'rb') as photo:
-                return await bot.send_photo(
-                    chat_id=chat_id,
-                    photo=types.InputFile(photo_path),
-                    caption=caption,
-                    reply_markup=reply_markup,
-                    parse_mode=parse_mode
-                )
+            message = await send_cached_photo(
+                chat_id,
+                photo_path,
+                caption=caption,
+                reply_markup=reply_markup,
+                parse_mode=parse_mode
+            )
+            remember_screen(message, Screen(photo_path, caption, reply_markup.as_json() if reply_markup else None))
+            return message
         else:
             # Если фото нет, отправляем просто текст
             logger.warning(f"⚠️ Фото {photo_type} не найдено, отправляю текст")
@@ -190,40 +247,134 @@ async def send_photo_message(chat_id: int, photo_type: str, caption: str = "",
             parse_mode=parse_mode
         )
 
+def shown_text(message: Message) -> Optional[str]:
+    """Текст или подпись сообщения в том виде, в каком его хранит Telegram"""
+    return message.caption if message.photo else message.text
+
+def remember_screen(message, screen: Screen):
+    """Запись экрана, который теперь показывает сообщение"""
+    if isinstance(message, Message):
+        screen.shown_text = shown_text(message)
+        screens.put(message.chat.id, message.message_id, screen)
+
+async def edit_cached_media(message: Message, photo_path: str, caption: str, reply_markup, parse_mode) -> Message:
+    """Замена картинки в сообщении по file_id (загрузка файла - только в первый раз)"""
+    file_id = db.asset_cache.lookup(photo_path)
+    if file_id:
+        try:
+            media = InputMediaPhoto(media=file_id, caption=caption, parse_mode=parse_mode)
+            return await message.edit_media(media, reply_markup=reply_markup)
+        except (WrongFileIdentifier, WrongRemoteFileIdSpecified):
+            logger.warning(f"⚠️ file_id для {photo_path} не принят, загружаю файл заново")
+            db.asset_cache.forget(photo_path)
+    
+    # Одновременные первые показы одной картинки ждут одну загрузку
+    async with photo_upload_locks.setdefault(photo_path, asyncio.Lock()):
+        file_id = db.asset_cache.lookup(photo_path)
+        if not file_id:
+            media = InputMediaPhoto(media=types.InputFile(photo_path), caption=caption, parse_mode=parse_mode)
+            result = await message.edit_media(media, reply_markup=reply_markup)
+            if isinstance(result, Message) and result.photo:
+                await db.save_media_asset(photo_path, result.photo[-1].file_id)
+            return result
+    
+    media = InputMediaPhoto(media=file_id, caption=caption, parse_mode=parse_mode)
+    return await message.edit_media(media, reply_markup=reply_markup)
+
 async def edit_message_with_photo(callback: CallbackQuery, photo_type: str, caption: str = "",
                                 reply_markup=None, parse_mode=ParseMode.HTML):
-    """Редактирование сообщения с заменой на фото"""
+    """Показ экрана в сообщении callback: правка на месте, новое сообщение - только при смене типа"""
+    message = callback.message
+    photo_path = get_photo_path(photo_type)
+    screen = Screen(photo_path, caption, reply_markup.as_json() if reply_markup else None)
+    
     try:
-        photo_path = get_photo_path(photo_type)
-        
-        if photo_path:
-            # Удаляем старое сообщение и отправляем новое с фото
-            await callback.message.delete()
-            return await send_photo_message(
-                callback.message.chat.id,
-                photo_type,
-                caption,
-                reply_markup,
-                parse_mode
-            )
+        shown = screens.get(message.chat.id, message.message_id, shown_text(message))
+        
+        # Сообщение уже показывает этот экран
+        if shown and shown.same_content(screen):
+            screens.count('skipped')
+            return message
+        
+        if photo_path and message.photo:
+            if shown and shown.photo == photo_path:
+                # Та же картинка: меняем только подпись и клавиатуру
+                result = await message.edit_caption(caption, parse_mode=parse_mode, reply_markup=reply_markup)
+                screens.count('caption_edits')
+            else:
+                result = await edit_cached_media(message, photo_path, caption, reply_markup, parse_mode)
+                screens.count('media_edits')
+        elif not photo_path and not message.photo:
+            result = await message.edit_text(text=caption, reply_markup=reply_markup, parse_mode=parse_mode)
+            screens.count('text_edits')
         else:
-            # Если фото нет, редактируем текст
-            return await callback.message.edit_text(
-                text=caption,
-                reply_markup=reply_markup,
-                parse_mode=parse_mode
-            )
+            # Текст не превратить в фото (и наоборот): удаляем и отправляем заново
+            await message.delete()
+            screens.forget(message.chat.id, message.message_id)
+            screens.count('resends')
+            if photo_path:
+                return await send_photo_message(message.chat.id, photo_type, caption, reply_markup, parse_mode)
+            result = await bot.send_message(message.chat.id, caption, reply_markup=reply_markup, parse_mode=parse_mode)
+        
+        remember_screen(result, screen)
+        return result
+    except MessageNotModified:
+        remember_screen(message, screen)
+        return message
     except Exception as e:
         logger.error(f"❌ Ошибка редактирования с фото {photo_type}: {e}")
-        return await callback.message.edit_text(
+        screens.forget(message.chat.id, message.message_id)
+        return await message.edit_text(
             text=caption,
             reply_markup=reply_markup,
             parse_mode=parse_mode
         )
 
 # ==================== ИНИЦИАЛИЗАЦИЯ БОТА ====================
+# Методы, которые идут через очередь отправки (лимиты Telegram на сообщения в чат)
+QUEUED_METHOD_PREFIXES = ('send', 'edit', 'copy', 'forward')
+QUEUED_METHODS_EXTRA = {'deleteMessage'}
+
+
+class QueuedBot(Bot):
+    """Bot, у которого все отправки и правки сообщений проходят через SendQueue"""
+    
+    def __init__(self, *args, send_queue: SendQueue, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.send_queue = send_queue
+    
+    async def request(self, method, data=None, files=None, **kwargs):
+        chat_id = data.get('chat_id') if data else None
+        queued = method in QUEUED_METHODS_EXTRA or (
+            method.startswith(QUEUED_METHOD_PREFIXES) and method != 'sendChatAction'
+        )
+        if chat_id is None or not queued:
+            return await super().request(method, data, files, **kwargs)
+        
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        # Загрузку файла повторно не отправить: поток файла уже прочитан
+        return await self.send_queue.submit(
+            chat_id, lambda: super(QueuedBot, self).request(method, data, files, **kwargs), retryable=not files
+        )
+
+
+send_queue = SendQueue(
+    priorities={channel_id: PRIORITY_CHANNEL, URL_LOG_CHANNAL: PRIORITY_LOG},
+    retry_after_errors=(RetryAfter,),
+    network_errors=(NetworkError,)
+)
+
 try:
-    bot = Bot(token=BOT_TOKEN, parse_mode=ParseMode.HTML)
+    if TELEGRAM_API_SERVER:
+        # Свой Bot API сервер: локальный telegram-bot-api или эмулятор для тестов
+        bot = QueuedBot(token=BOT_TOKEN, parse_mode=ParseMode.HTML, send_queue=send_queue,
+                        server=TelegramAPIServer.from_base(TELEGRAM_API_SERVER))
+        logger.info(f"🔗 Bot API сервер: {TELEGRAM_API_SERVER}")
+    else:
+        bot = QueuedBot(token=BOT_TOKEN, parse_mode=ParseMode.HTML, send_queue=send_queue)
     logger.info(f"✅ Бот инициализирован")
     
     # Проверка токена
@@ -241,23 +392,84 @@ except Exception as e:
     sys.exit(1)
 
 # ==================== ИНИЦИАЛИЗАЦИЯ ДИСПЕТЧЕРА ====================
-storage = MemoryStorage()
+if FSM_STORAGE == 'sqlite':
+    storage = SQLiteStorage('casino.db')
+    logger.info("✅ FSM состояния хранятся в SQLite")
+else:
+    storage = MemoryStorage()
 dp = Dispatcher(bot, storage=storage)
 dp.middleware.setup(LoggingMiddleware())
 
+
+class InFlightMiddleware(BaseMiddleware):
+    """Счетчик апдейтов, которые сейчас обрабатываются (для остановки без потерь)"""
+    
+    def __init__(self):
+        super().__init__()
+        self.in_flight = 0
+        self.processed = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+    
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        self.in_flight += 1
+        self.idle.clear()
+    
+    async def on_post_process_update(self, update: types.Update, result, data: dict):
+        self.in_flight -= 1
+        self.processed += 1
+        if self.in_flight <= 0:
+            self.in_flight = 0
+            self.idle.set()
+    
+    async def wait_idle(self, timeout: float) -> bool:
+        """Ожидание завершения всех апдейтов, False - если не дождались"""
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+in_flight = InFlightMiddleware()
+dp.middleware.setup(in_flight)
+
 # ==================== БАЗА ДАННЫХ (ПОЛНАЯ ВЕРСИЯ) ====================
 class Database:
+    # Разрешенные сортировки списка пользователей: название -> (колонка, по убыванию).
+    # У каждой колонки есть индекс; user_id (rowid) входит в него неявно
+    USER_SORTS = {
+        'new': ('registration_date', True),
+        'balance': ('balance', True),
+        'bets': ('total_bet_amount', True),
+        'id': ('user_id', False)
+    }
+    
     def __init__(self, db_path: str = 'casino.db'):
         self.db_path = db_path
         self.connection = None
-        self.lock = asyncio.Lock()
+        # Блокировки балансов по пользователям вместо одной общей
+        self.user_locks = StripedLock()
+        # Отложенная запись логов пачками
+        self.log_buffer = LogBuffer()
+        # Коэффициенты читаются из памяти, БД - только при изменении
+        self.coefficients = CoefficientCache(DEFAULT_KEF)
+        # Компактные записи пользователей для горячего пути ставки
+        self.user_cache = UserCache()
+        # file_id картинок, уже загруженных в Telegram
+        self.asset_cache = AssetCache()
+        # Итоговые количества для подписи «страница N из M»
+        self.count_cache = CountCache()
+        # Поиск пользователей через FTS5 (False - SQLite без FTS5, поиск через LIKE)
+        self.fts_enabled = False
+        # Все запросы после инициализации выполняются в отдельном потоке
+        self.worker = DatabaseWorker()
         self.init_database()
     
     def init_database(self):
         """Инициализация всей базы данных с ВСЕМИ таблицами"""
         try:
-            self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.connection.row_factory = sqlite3.Row
+            self.connection = connect_sqlite(self.db_path)
             cursor = self.connection.cursor()
             
             # ========== ТАБЛИЦА ПОЛЬЗОВАТЕЛЕЙ ==========
@@ -283,6 +495,8 @@ class Database:
                     last_withdraw TIMESTAMP,
                     is_blocked INTEGER DEFAULT 0,
                     block_reason TEXT DEFAULT '',
+                    unreachable INTEGER DEFAULT 0,
+                    last_bet_at TIMESTAMP,
                     language_code TEXT DEFAULT 'ru',
                     phone_number TEXT,
                     email TEXT,
@@ -303,6 +517,7 @@ class Database:
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_balance ON users(balance)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_registration ON users(registration_date)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_referral ON users(referral_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_bet_amount ON users(total_bet_amount)')
             
             # ========== ТАБЛИЦА СТАВОК ==========
             cursor.execute('''
@@ -319,16 +534,21 @@ class Database:
                     dice_value INTEGER,
                     is_fake INTEGER DEFAULT 0,
                     channel_message_id INTEGER,
+                    coefficient_version INTEGER DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
                 )
             ''')
             
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_bets_user ON bets(user_id)')
+            # Составные индексы: фильтр по пользователю/игре и диапазон или сортировка по времени
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_bets_user_date ON bets(user_id, created_at)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_bets_date ON bets(created_at)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_bets_game ON bets(game_type)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_bets_game_date ON bets(game_type, created_at)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_bets_result ON bets(result)')
             
+            # ========== ОЧЕРЕДЬ ПОСТОВ В КАНАЛ ==========
+            cursor.execute(CREATE_CHANNEL_POSTS_SQL)
+            
             # ========== ТАБЛИЦА ДЕПОЗИТОВ ==========
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS deposits (
@@ -515,6 +735,10 @@ class Database:
                 )
             ''')
             
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_date ON logs(created_at)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_user_date ON logs(user_id, created_at)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_level_date ON logs(level, created_at)')
+            
             # ========== ТАБЛИЦА НАСТРОЕК ==========
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS settings (
@@ -541,6 +765,9 @@ class Database:
                 )
             ''')
             
+            # ========== ТАБЛИЦА РАССЫЛОК ==========
+            cursor.execute(CREATE_BROADCASTS_SQL)
+            
             # ========== ТАБЛИЦА УВЕДОМЛЕНИЙ ==========
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS notifications (
@@ -593,15 +820,74 @@ class Database:
             
             self.connection.commit()
             
+            # Добавление новых колонок в существующие таблицы
+            self.migrate_schema()
+            
+            # Итоги статистики, которые триггеры обновляют вместе с данными
+            rollups.install(self.connection)
+            
+            # Полнотекстовый индекс для поиска пользователей в админке
+            self.fts_enabled = user_search.install(self.connection)
+            
+            # Индексы очереди выплат и spend_id для старых выводов
+            payout_outbox.install(self.connection)
+            
+            # Индекс ожидающих пополнений для сверки счетов
+            cryptopay_webhook.install(self.connection)
+            
             # Инициализация данных по умолчанию
             self.init_default_data()
             
+            # Загрузка коэффициентов в кэш
+            self.reload_coefficients()
+            
+            # file_id загруженных ранее картинок
+            self.load_media_assets()
+            
             logger.info("✅ База данных инициализирована с 15 таблицами")
             
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации БД: {e}")
             raise
     
+    def migrate_schema(self):
+        """Добавление колонок, появившихся после создания таблиц"""
+        migrations = {
+            'bets': [('coefficient_version', 'INTEGER DEFAULT 0')],
+            'users': [
+                # Бот заблокирован пользователем или аккаунт удален (пропуск в рассылках)
+                ('unreachable', 'INTEGER DEFAULT 0'),
+                # Время последней ставки (активные пользователи без сканирования bets)
+                ('last_bet_at', 'TIMESTAMP')
+            ],
+            # Очередь выплат (payout_outbox)
+            'withdrawals': OUTBOX_COLUMNS
+        }
+        
+        cursor = self.connection.cursor()
+        for table, columns in migrations.items():
+            cursor.execute(f'PRAGMA table_info({table})')
+            existing = {row['name'] for row in cursor.fetchall()}
+            
+            for column, definition in columns:
+                if column not in existing:
+                    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+                    logger.info(f"✅ Добавлена колонка {table}.{column}")
+                    
+                    if (table, column) == ('users', 'last_bet_at'):
+                        cursor.execute('''
+                            UPDATE users
+                            SET last_bet_at = (SELECT MAX(created_at) FROM bets WHERE bets.user_id = users.user_id)
+                        ''')
+        
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_last_bet ON users(last_bet_at)')
+        
+        # Одноколоночные индексы, замененные составными (user_id, created_at) и (game_type, created_at)
+        for index in ('idx_bets_user', 'idx_bets_game'):
+            cursor.execute(f'DROP INDEX IF EXISTS {index}')
+        
+        self.connection.commit()
+    
     def init_default_data(self):
         """Инициализация данных по умолчанию"""
         try:
@@ -732,7 +1018,8 @@ class Database:
                 # Обновляем данные существующего пользователя
                 cursor.execute('''
                     UPDATE users 
-                    SET username = ?, first_name = ?, last_name = ?, language_code = ?, last_activity = CURRENT_TIMESTAMP
+                    SET username = ?, first_name = ?, last_name = ?, language_code = ?, unreachable = 0,
+                        last_activity = CURRENT_TIMESTAMP
                     WHERE user_id = ?
                 ''', (username, first_name, last_name, language_code, user_id))
             else:
@@ -759,6 +1046,7 @@ class Database:
                     ''', (referer_id,))
             
             self.connection.commit()
+            self.user_cache.invalidate(user_id)
             self.log_action('USER', f'User {user_id} added/updated')
             return True
             
@@ -789,6 +1077,35 @@ class Database:
             logger.error(f"❌ Ошибка получения пользователя {user_id}: {e}")
             return {}
     
+    def _load_user_profile(self, user_id: int) -> Optional[CachedUser]:
+        """Загрузка компактной записи пользователя в кэш (выполняется в потоке БД)"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(f'''
+                SELECT {', '.join(CachedUser.FIELDS)} FROM users WHERE user_id = ?
+            ''', (user_id,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            user = CachedUser.from_row(row)
+            self.user_cache.put(user)
+            return user
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки профиля {user_id}: {e}")
+            return None
+    
+    async def get_user_profile(self, user_id: int) -> Optional[CachedUser]:
+        """Профиль пользователя для горячего пути: из кэша, при промахе - из БД"""
+        user = self.user_cache.get(user_id)
+        if user is not None:
+            return user
+        return await self.worker.run(self._load_user_profile, user_id)
+    
+    async def get_cached_balance(self, user_id: int) -> float:
+        """Баланс пользователя из кэша (кэш обновляется при каждом изменении баланса)"""
+        user = await self.get_user_profile(user_id)
+        return user.balance if user else 0.0
+
     def get_user_balance(self, user_id: int) -> float:
         """Получение баланса пользователя"""
         try:
@@ -804,86 +1121,149 @@ class Database:
                           description: str = None, reference_id: int = None, reference_type: str = None) -> bool:
         """Обновление баланса пользователя с записью транзакции"""
         try:
-            async with self.lock:
-                cursor = self.connection.cursor()
-                
-                # Получаем текущий баланс
-                cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,))
-                row = cursor.fetchone()
-                if not row:
-                    return False
-                
-                balance_before = row['balance']
-                balance_after = amount
-                
-                # Обновляем баланс
-                cursor.execute('''
-                    UPDATE users 
-                    SET balance = ?, last_activity = CURRENT_TIMESTAMP 
-                    WHERE user_id = ?
-                ''', (balance_after, user_id))
-                
-                # Записываем транзакцию
-                cursor.execute('''
-                    INSERT INTO transactions (user_id, type, amount, balance_before, balance_after, description, reference_id, reference_type)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (user_id, transaction_type, balance_after - balance_before, balance_before, balance_after, 
-                      description, reference_id, reference_type))
-                
-                # Обновляем статистику пользователя
-                if transaction_type == 'deposit':
-                    cursor.execute('''
-                        UPDATE users 
-                        SET total_deposit = total_deposit + ?, last_deposit = CURRENT_TIMESTAMP 
-                        WHERE user_id = ?
-                    ''', (amount - balance_before, user_id))
-                elif transaction_type == 'withdraw':
-                    cursor.execute('''
-                        UPDATE users 
-                        SET total_withdraw = total_withdraw + ?, last_withdraw = CURRENT_TIMESTAMP 
-                        WHERE user_id = ?
-                    ''', (balance_before - amount, user_id))
-                elif transaction_type == 'win':
-                    cursor.execute('''
-                        UPDATE users 
-                        SET total_wins = total_wins + ? 
-                        WHERE user_id = ?
-                    ''', (amount - balance_before, user_id))
-                elif transaction_type == 'lose':
-                    cursor.execute('''
-                        UPDATE users 
-                        SET total_losses = total_losses + ? 
-                        WHERE user_id = ?
-                    ''', (balance_before - amount, user_id))
-                
-                self.connection.commit()
-                self.log_action('BALANCE', f'User {user_id} balance updated: {balance_before} -> {balance_after}')
-                return True
-                
+            async with self.user_locks.lock(user_id):
+                return await self.worker.run(
+                    self._apply_balance_update, user_id, amount, transaction_type,
+                    description, reference_id, reference_type
+                )
         except Exception as e:
             logger.error(f"❌ Ошибка обновления баланса {user_id}: {e}")
             return False
     
+    def _apply_balance_update(self, user_id: int, amount: float, transaction_type: str,
+                              description: str, reference_id: int, reference_type: str) -> bool:
+        """Запись нового баланса и транзакции (выполняется в потоке БД)"""
+        cursor = self.connection.cursor()
+        
+        # Получаем текущий баланс
+        cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,))
+        row = cursor.fetchone()
+        if not row:
+            return False
+        
+        balance_before = row['balance']
+        balance_after = amount
+        
+        # Обновляем баланс
+        cursor.execute('''
+            UPDATE users 
+            SET balance = ?, last_activity = CURRENT_TIMESTAMP 
+            WHERE user_id = ?
+        ''', (balance_after, user_id))
+        
+        # Записываем транзакцию
+        cursor.execute('''
+            INSERT INTO transactions (user_id, type, amount, balance_before, balance_after, description, reference_id, reference_type)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, transaction_type, balance_after - balance_before, balance_before, balance_after, 
+              description, reference_id, reference_type))
+        
+        # Обновляем статистику пользователя
+        if transaction_type == 'deposit':
+            cursor.execute('''
+                UPDATE users 
+                SET total_deposit = total_deposit + ?, last_deposit = CURRENT_TIMESTAMP 
+                WHERE user_id = ?
+            ''', (amount - balance_before, user_id))
+        elif transaction_type == 'withdraw':
+            cursor.execute('''
+                UPDATE users 
+                SET total_withdraw = total_withdraw + ?, last_withdraw = CURRENT_TIMESTAMP 
+                WHERE user_id = ?
+            ''', (balance_before - amount, user_id))
+        elif transaction_type == 'win':
+            cursor.execute('''
+                UPDATE users 
+                SET total_wins = total_wins + ? 
+                WHERE user_id = ?
+            ''', (amount - balance_before, user_id))
+        elif transaction_type == 'lose':
+            cursor.execute('''
+                UPDATE users 
+                SET total_losses = total_losses + ? 
+                WHERE user_id = ?
+            ''', (balance_before - amount, user_id))
+        
+        self.connection.commit()
+        self.user_cache.set_balance(user_id, balance_after)
+        self.log_action('BALANCE', f'User {user_id} balance updated: {balance_before} -> {balance_after}')
+        return True
+    
+    def _write_balance_delta(self, cursor, user_id: int, delta: float, transaction_type: str, description: str,
+                             reference_id: int, reference_type: str, require_funds: bool = False) -> Optional[float]:
+        """Изменение баланса на delta, транзакция и статистика без commit; новый баланс или None"""
+        cursor.execute(f'''
+            UPDATE users
+            SET balance = balance + ?, last_activity = CURRENT_TIMESTAMP
+            WHERE user_id = ?{' AND balance >= ?' if require_funds else ''}
+        ''', (delta, user_id, -delta) if require_funds else (delta, user_id))
+        if cursor.rowcount == 0:
+            return None
+        
+        balance_after = cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,)).fetchone()['balance']
+        
+        cursor.execute('''
+            INSERT INTO transactions (user_id, type, amount, balance_before, balance_after, description, reference_id, reference_type)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, transaction_type, delta, balance_after - delta, balance_after,
+              description, reference_id, reference_type))
+        
+        # Обновляем статистику пользователя
+        totals = {'deposit': ('total_deposit', 'last_deposit'), 'withdraw': ('total_withdraw', 'last_withdraw'),
+                  'win': ('total_wins', None), 'lose': ('total_losses', None)}
+        if transaction_type in totals:
+            column, moment = totals[transaction_type]
+            cursor.execute(f'''
+                UPDATE users
+                SET {column} = {column} + ?{f', {moment} = CURRENT_TIMESTAMP' if moment else ''}
+                WHERE user_id = ?
+            ''', (abs(delta), user_id))
+        return balance_after
+    
+    def _apply_balance_delta(self, user_id: int, delta: float, transaction_type: str, description: str,
+                             reference_id: int, reference_type: str, require_funds: bool = False) -> bool:
+        """Изменение баланса на delta одним относительным UPDATE и транзакция (выполняется в потоке БД)
+        
+        Чтение и запись в одном задании: списание или зачисление без блокировки
+        пользователя (вывод, депозит по webhook) не затирается.
+        """
+        try:
+            balance_after = self._write_balance_delta(self.connection.cursor(), user_id, delta, transaction_type,
+                                                      description, reference_id, reference_type, require_funds)
+            if balance_after is None:
+                self.connection.rollback()
+                return False
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        
+        self.user_cache.set_balance(user_id, balance_after)
+        self.log_action('BALANCE', f'User {user_id} balance updated: {balance_after - delta} -> {balance_after}')
+        return True
+    
     async def add_to_balance(self, user_id: int, amount: float, transaction_type: str = 'bonus', 
                           description: str = None, reference_id: int = None, reference_type: str = None) -> bool:
         """Пополнение баланса"""
         try:
-            current_balance = self.get_user_balance(user_id)
-            new_balance = current_balance + amount
-            return await self.update_balance(user_id, new_balance, transaction_type, description, reference_id, reference_type)
+            async with self.user_locks.lock(user_id):
+                return await self.worker.run(
+                    self._apply_balance_delta, user_id, amount, transaction_type,
+                    description, reference_id, reference_type
+                )
         except Exception as e:
             logger.error(f"❌ Ошибка пополнения баланса {user_id}: {e}")
             return False
     
     async def deduct_from_balance(self, user_id: int, amount: float, transaction_type: str = 'bet', 
                                description: str = None, reference_id: int = None, reference_type: str = None) -> bool:
-        """Списание с баланса"""
+        """Списание с баланса (не больше текущего баланса)"""
         try:
-            current_balance = self.get_user_balance(user_id)
-            if current_balance < amount:
-                return False
-            new_balance = current_balance - amount
-            return await self.update_balance(user_id, new_balance, transaction_type, description, reference_id, reference_type)
+            async with self.user_locks.lock(user_id):
+                return await self.worker.run(
+                    self._apply_balance_delta, user_id, -amount, transaction_type,
+                    description, reference_id, reference_type, True
+                )
         except Exception as e:
             logger.error(f"❌ Ошибка списания с баланса {user_id}: {e}")
             return False
@@ -951,20 +1331,115 @@ class Database:
             logger.error(f"❌ Ошибка добавления ставки {user_id}: {e}")
             return 0
     
-    def get_user_bets(self, user_id: int, limit: int = 10, offset: int = 0) -> List[Dict]:
-        """Получение ставок пользователя"""
+    def settle_bet(self, user_id: int, game_type: str, amount: float, outcome: str,
+                   result: str, win_amount: float = 0.0, multiplier: float = 1.0,
+                   dice_value: int = None, description: str = None, coefficient_version: int = 0,
+                   channel_post: Tuple[int, str] = None) -> Dict:
+        """Расчет ставки одной транзакцией: списание, выигрыш, ставка, статистика и лог"""
         try:
             cursor = self.connection.cursor()
+            
+            # Списание и зачисление одним условным UPDATE: баланс не уйдет в минус
+            # даже при одновременных ставках одного пользователя
             cursor.execute('''
-                SELECT * FROM bets 
-                WHERE user_id = ? 
-                ORDER BY created_at DESC 
-                LIMIT ? OFFSET ?
-            ''', (user_id, limit, offset))
-            return [dict(row) for row in cursor.fetchall()]
+                UPDATE users
+                SET balance = balance - ? + ?,
+                    total_bets = total_bets + 1, total_bet_amount = total_bet_amount + ?,
+                    total_wins = total_wins + ?, last_activity = CURRENT_TIMESTAMP,
+                    last_bet_at = CURRENT_TIMESTAMP
+                WHERE user_id = ? AND balance >= ?
+            ''', (amount, win_amount, amount, win_amount, user_id, amount))
+            
+            if cursor.rowcount == 0:
+                self.connection.rollback()
+                return {'success': False, 'error': 'Недостаточно средств'}
+            
+            cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,))
+            new_balance = cursor.fetchone()['balance']
+            balance_before = new_balance + amount - win_amount
+            
+            cursor.execute('''
+                INSERT INTO bets (user_id, game_type, amount, outcome, result, win_amount, multiplier, dice_value, is_fake, coefficient_version)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
+            ''', (user_id, game_type, amount, outcome, result, win_amount, multiplier, dice_value, coefficient_version))
+            bet_id = cursor.lastrowid
+            
+            # Пост в канал (chat_id, текст) ставится в очередь той же транзакцией
+            if channel_post:
+                cursor.execute(INSERT_CHANNEL_POST_SQL, (bet_id, *channel_post))
+            
+            # Транзакции ставки и выигрыша
+            cursor.execute('''
+                INSERT INTO transactions (user_id, type, amount, balance_before, balance_after, description, reference_id, reference_type)
+                VALUES (?, 'bet', ?, ?, ?, ?, ?, 'bet')
+            ''', (user_id, -amount, balance_before, balance_before - amount, description, bet_id))
+            
+            if win_amount > 0:
+                cursor.execute('''
+                    INSERT INTO transactions (user_id, type, amount, balance_before, balance_after, description, reference_id, reference_type)
+                    VALUES (?, 'win', ?, ?, ?, ?, ?, 'bet')
+                ''', (user_id, win_amount, balance_before - amount, new_balance, f'Выигрыш по ставке #{bet_id}', bet_id))
+            
+            # Обновляем общую статистику
+            today = datetime.datetime.now().strftime('%Y-%m-%d')
+            cursor.execute('INSERT OR IGNORE INTO statistics (date) VALUES (?)', (today,))
+            cursor.execute('''
+                UPDATE statistics
+                SET total_bets = total_bets + 1, total_bet_amount = total_bet_amount + ?,
+                    winning_bets = winning_bets + ?, losing_bets = losing_bets + ?,
+                    total_win_amount = total_win_amount + ?, total_loss_amount = total_loss_amount + ?,
+                    profit = profit + ?, updated_at = CURRENT_TIMESTAMP
+                WHERE date = ?
+            ''', (amount,
+                  1 if result == 'win' else 0,
+                  1 if result == 'lose' else 0,
+                  win_amount,
+                  amount if result == 'lose' else 0,
+                  (win_amount - amount) if result == 'win' else -amount,
+                  today))
+            
+            self.log_action('BET', f'User {user_id} placed bet #{bet_id}: {amount}$ on {game_type} - {result}')
+            
+            self.connection.commit()
+            self.user_cache.set_balance(user_id, new_balance)
+            
+            return {'success': True, 'bet_id': bet_id, 'new_balance': new_balance}
+        
+        except Exception as e:
+            self.connection.rollback()
+            logger.error(f"❌ Ошибка расчета ставки {user_id}: {e}")
+            return {'success': False, 'error': 'Ошибка списания средств'}
+    
+    def get_user_bets(self, user_id: int, limit: int = 10, cursor: str = None) -> List[Dict]:
+        """Получение ставок пользователя (новые первыми, страница после cursor)"""
+        return self.get_user_bets_page(user_id, cursor, limit)['items']
+    
+    def get_user_bets_page(self, user_id: int, cursor: str = None, limit: int = 10) -> Dict:
+        """Страница истории ставок по ключу (created_at, id) - индекс idx_bets_user_date"""
+        try:
+            def fetch(condition: str, order: str, params: List, fetch_limit: int) -> List[Dict]:
+                rows = self.connection.execute(f'''
+                    SELECT * FROM bets
+                    WHERE user_id = ? AND {condition}
+                    ORDER BY {order}
+                    LIMIT ?
+                ''', (user_id, *params, fetch_limit))
+                return [dict(row) for row in rows]
+            
+            page = keyset_page(fetch, 'created_at', 'id', True, cursor, limit)
+            page['total'] = self.count_cache.get(('bets', user_id), lambda: self.connection.execute(
+                'SELECT COUNT(*) FROM bets WHERE user_id = ?', (user_id,)
+            ).fetchone()[0])
+            return page
         except Exception as e:
             logger.error(f"❌ Ошибка получения ставок {user_id}: {e}")
-            return []
+            return {'items': [], 'prev': None, 'next': None, 'total': 0}
+    
+    @staticmethod
+    def _next_day(date_str: str) -> str:
+        """Начало следующего дня для верхней границы диапазона ('YYYY-MM-DD')"""
+        day = datetime.datetime.strptime(date_str[:10], '%Y-%m-%d') + datetime.timedelta(days=1)
+        return day.strftime('%Y-%m-%d')
     
     def get_bet_stats(self, user_id: int = None, game_type: str = None, date_from: str = None, date_to: str = None) -> Dict:
         """Статистика ставок"""
@@ -993,13 +1468,15 @@ class Database:
                 query += ' AND game_type = ?'
                 params.append(game_type)
             
+            # Полуоткрытый диапазон [date_from, date_to + 1 день) по самой колонке:
+            # DATE(created_at) не дает использовать индекс
             if date_from:
-                query += ' AND DATE(created_at) >= ?'
+                query += ' AND created_at >= ?'
                 params.append(date_from)
             
             if date_to:
-                query += ' AND DATE(created_at) <= ?'
-                params.append(date_to)
+                query += ' AND created_at < ?'
+                params.append(self._next_day(date_to))
             
             cursor.execute(query, params)
             row = cursor.fetchone()
@@ -1065,77 +1542,88 @@ class Database:
     async def activate_promo_code(self, user_id: int, code: str) -> Dict:
         """Активация промокода"""
         try:
-            cursor = self.connection.cursor()
-            
-            # Получаем информацию о промокоде
-            cursor.execute('''
-                SELECT * FROM promo_codes 
-                WHERE code = ? AND is_active = 1
-            ''', (code.upper(),))
-            
-            promo = cursor.fetchone()
-            if not promo:
-                return {'success': False, 'message': 'Промокод не найден'}
-            
-            promo = dict(promo)
-            
-            # Проверяем срок действия
-            if promo['expires_at']:
-                expires_at = datetime.datetime.strptime(promo['expires_at'], '%Y-%m-%d %H:%M:%S')
-                if expires_at < datetime.datetime.now():
-                    return {'success': False, 'message': 'Срок действия промокода истек'}
-            
-            # Проверяем лимит использований
-            if promo['max_uses'] > 0 and promo['used_count'] >= promo['max_uses']:
-                return {'success': False, 'message': 'Лимит использований промокода исчерпан'}
-            
-            # Проверяем, активировал ли пользователь уже этот промокод
-            cursor.execute('''
-                SELECT 1 FROM promo_activations 
-                WHERE user_id = ? AND promo_code = ?
-            ''', (user_id, code.upper()))
-            
-            if cursor.fetchone():
-                return {'success': False, 'message': 'Вы уже активировали этот промокод'}
-            
-            # Проверяем ограничения
-            restrictions = json.loads(promo['restrictions'] or '{}')
-            if restrictions:
-                user = self.get_user(user_id)
-                
-                # Минимальный депозит
-                if 'min_deposit' in restrictions and user['total_deposit'] < restrictions['min_deposit']:
-                    return {'success': False, 'message': f'Требуется минимальный депозит {restrictions["min_deposit"]}$'}
-                
-                # Минимальное количество ставок
-                if 'min_bets' in restrictions and user['total_bets'] < restrictions['min_bets']:
-                    return {'success': False, 'message': f'Требуется минимум {restrictions["min_bets"]} ставок'}
-            
-            # Активируем промокод
+            async with self.user_locks.lock(user_id):
+                return await self.worker.run(self._claim_promo_code, user_id, code)
+        except Exception as e:
+            logger.error(f"❌ Ошибка активации промокода {code} для {user_id}: {e}")
+            return {'success': False, 'message': f'Ошибка активации: {str(e)}'}
+    
+    def _claim_promo_code(self, user_id: int, code: str) -> Dict:
+        """Проверка промокода, активация и начисление бонуса одной транзакцией (выполняется в потоке БД)"""
+        cursor = self.connection.cursor()
+        
+        # Получаем информацию о промокоде
+        cursor.execute('''
+            SELECT * FROM promo_codes 
+            WHERE code = ? AND is_active = 1
+        ''', (code.upper(),))
+        
+        promo = cursor.fetchone()
+        if not promo:
+            return {'success': False, 'message': 'Промокод не найден'}
+        
+        promo = dict(promo)
+        
+        # Проверяем срок действия
+        if promo['expires_at']:
+            expires_at = datetime.datetime.strptime(promo['expires_at'], '%Y-%m-%d %H:%M:%S')
+            if expires_at < datetime.datetime.now():
+                return {'success': False, 'message': 'Срок действия промокода истек'}
+        
+        # Проверяем лимит использований
+        if promo['max_uses'] > 0 and promo['used_count'] >= promo['max_uses']:
+            return {'success': False, 'message': 'Лимит использований промокода исчерпан'}
+        
+        # Проверяем, активировал ли пользователь уже этот промокод
+        cursor.execute('''
+            SELECT 1 FROM promo_activations 
+            WHERE user_id = ? AND promo_code = ?
+        ''', (user_id, code.upper()))
+        
+        if cursor.fetchone():
+            return {'success': False, 'message': 'Вы уже активировали этот промокод'}
+        
+        # Проверяем ограничения
+        restrictions = json.loads(promo['restrictions'] or '{}')
+        if restrictions:
+            user = self.get_user(user_id)
+            
+            # Минимальный депозит
+            if 'min_deposit' in restrictions and user['total_deposit'] < restrictions['min_deposit']:
+                return {'success': False, 'message': f'Требуется минимальный депозит {restrictions["min_deposit"]}$'}
+            
+            # Минимальное количество ставок
+            if 'min_bets' in restrictions and user['total_bets'] < restrictions['min_bets']:
+                return {'success': False, 'message': f'Требуется минимум {restrictions["min_bets"]} ставок'}
+        
+        # Размер бонуса
+        if promo['bonus_type'] == 'percentage':
+            # Процентный бонус от депозита
+            user = self.get_user(user_id)
+            bonus_amount = user['total_deposit'] * (promo['amount'] / 100)
+        else:
+            # Фиксированный бонус
+            bonus_amount = promo['amount']
+        
+        # Активация, начисление и статистика фиксируются вместе: без бонуса активация откатывается
+        try:
             cursor.execute('''
                 UPDATE promo_codes 
                 SET used_count = used_count + 1 
                 WHERE code = ?
             ''', (code.upper(),))
             
-            # Записываем активацию
             cursor.execute('''
                 INSERT INTO promo_activations (user_id, promo_code, amount)
                 VALUES (?, ?, ?)
             ''', (user_id, code.upper(), promo['amount']))
             
-            # Начисляем бонус
-            if promo['bonus_type'] == 'percentage':
-                # Процентный бонус от депозита
-                user = self.get_user(user_id)
-                bonus_amount = user['total_deposit'] * (promo['amount'] / 100)
-            else:
-                # Фиксированный бонус
-                bonus_amount = promo['amount']
-            
-            await self.add_to_balance(user_id, bonus_amount, 'promo', f'Активация промокода {code}')
+            balance_after = self._write_balance_delta(cursor, user_id, bonus_amount, 'promo',
+                                                      f'Активация промокода {code}', None, None)
+            if balance_after is None:
+                self.connection.rollback()
+                return {'success': False, 'message': 'Пользователь не найден'}
             
-            # Обновляем статистику
             today = datetime.datetime.now().strftime('%Y-%m-%d')
             cursor.execute('''
                 UPDATE statistics 
@@ -1144,18 +1632,19 @@ class Database:
             ''', (bonus_amount, today))
             
             self.connection.commit()
-            self.log_action('PROMO', f'User {user_id} activated promo {code} for {bonus_amount}$')
-            
-            return {
-                'success': True,
-                'message': 'Промокод успешно активирован',
-                'amount': bonus_amount,
-                'promo': promo
-            }
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка активации промокода {code} для {user_id}: {e}")
-            return {'success': False, 'message': f'Ошибка активации: {str(e)}'}
+        except Exception:
+            self.connection.rollback()
+            raise
+        
+        self.user_cache.set_balance(user_id, balance_after)
+        self.log_action('PROMO', f'User {user_id} activated promo {code} for {bonus_amount}$')
+        
+        return {
+            'success': True,
+            'message': 'Промокод успешно активирован',
+            'amount': bonus_amount,
+            'promo': promo
+        }
     
     def get_promo_codes(self, is_active: bool = True, created_by: int = None) -> List[Dict]:
         """Получение списка промокодов"""
@@ -1188,7 +1677,7 @@ class Database:
         """Пополнение баланса пользователя администратором"""
         try:
             # Получаем текущий баланс
-            current_balance = self.get_user_balance(user_id)
+            current_balance = await self.worker.run(self.get_user_balance, user_id)
             
             # Добавляем средства
             success = await self.add_to_balance(
@@ -1202,7 +1691,7 @@ class Database:
             
             if success:
                 # Логируем действие
-                self.log_action('ADMIN_BALANCE', 
+                await self.worker.run(self.log_action, 'ADMIN_BALANCE', 
                     f'Admin {admin_id} added {amount}$ to user {user_id}. Reason: {reason}',
                     admin_id,
                     {'user_id': user_id, 'amount': amount, 'reason': reason}
@@ -1232,7 +1721,7 @@ class Database:
         """Списание баланса пользователя администратором"""
         try:
             # Получаем текущий баланс
-            current_balance = self.get_user_balance(user_id)
+            current_balance = await self.worker.run(self.get_user_balance, user_id)
             
             if current_balance < amount:
                 logger.warning(f"⚠️ Недостаточно средств у пользователя {user_id} для списания")
@@ -1250,7 +1739,7 @@ class Database:
             
             if success:
                 # Логируем действие
-                self.log_action('ADMIN_BALANCE', 
+                await self.worker.run(self.log_action, 'ADMIN_BALANCE', 
                     f'Admin {admin_id} deducted {amount}$ from user {user_id}. Reason: {reason}',
                     admin_id,
                     {'user_id': user_id, 'amount': amount, 'reason': reason}
@@ -1280,7 +1769,7 @@ class Database:
         """Установка баланса пользователя администратором"""
         try:
             # Получаем текущий баланс
-            current_balance = self.get_user_balance(user_id)
+            current_balance = await self.worker.run(self.get_user_balance, user_id)
             
             # Устанавливаем баланс
             success = await self.update_balance(
@@ -1294,7 +1783,7 @@ class Database:
             
             if success:
                 # Логируем действие
-                self.log_action('ADMIN_BALANCE', 
+                await self.worker.run(self.log_action, 'ADMIN_BALANCE', 
                     f'Admin {admin_id} set balance {amount}$ for user {user_id}. Reason: {reason}',
                     admin_id,
                     {'user_id': user_id, 'old_balance': current_balance, 'new_balance': amount, 'reason': reason}
@@ -1334,27 +1823,31 @@ class Database:
     # ==================== МЕТОДЫ ДЛЯ КОЭФФИЦИЕНТОВ ====================
     
     def get_coefficient(self, name: str) -> float:
-        """Получение коэффициента"""
+        """Получение коэффициента (из кэша)"""
+        return self.coefficients.get(name)
+    
+    def reload_coefficients(self) -> int:
+        """Перечитывание коэффициентов из БД в кэш, возвращает новую версию"""
         try:
             cursor = self.connection.cursor()
-            cursor.execute('SELECT value FROM coefficients WHERE name = ?', (name,))
-            row = cursor.fetchone()
-            return row['value'] if row else DEFAULT_KEF.get(name, 1.0)
+            cursor.execute('SELECT name, value FROM coefficients')
+            self.coefficients.load({row['name']: row['value'] for row in cursor.fetchall()})
         except Exception as e:
-            logger.error(f"❌ Ошибка получения коэффициента {name}: {e}")
-            return DEFAULT_KEF.get(name, 1.0)
+            logger.error(f"❌ Ошибка загрузки коэффициентов: {e}")
+        return self.coefficients.version
     
     def update_coefficient(self, name: str, value: float, updated_by: int = None) -> bool:
         """Обновление коэффициента"""
         try:
             cursor = self.connection.cursor()
             cursor.execute('''
-                UPDATE coefficients 
+                UPDATE coefficients
                 SET value = ?, updated_at = CURRENT_TIMESTAMP, updated_by = ?
                 WHERE name = ?
             ''', (value, updated_by, name))
             self.connection.commit()
-            self.log_action('COEFFICIENT', f'Coefficient {name} updated to {value} by {updated_by}')
+            version = self.reload_coefficients()
+            self.log_action('COEFFICIENT', f'Coefficient {name} updated to {value} by {updated_by} (version {version})')
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка обновления коэффициента {name}: {e}")
@@ -1362,14 +1855,190 @@ class Database:
     
     def get_all_coefficients(self) -> Dict:
         """Получение всех коэффициентов"""
+        return self.coefficients.all()
+    
+    # ==================== МЕТОДЫ ДЛЯ КАРТИНОК ====================
+    
+    def load_media_assets(self) -> int:
+        """Загрузка сохраненных file_id картинок в кэш"""
+        try:
+            count = self.asset_cache.load(self.connection)
+            logger.info(f"✅ Загружено file_id картинок: {count}")
+            return count
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки file_id картинок: {e}")
+            return 0
+    
+    def save_media_asset(self, path: str, file_id: str) -> bool:
+        """Сохранение file_id после первой загрузки картинки"""
+        try:
+            self.asset_cache.remember(self.connection, path, file_id)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения file_id {path}: {e}")
+            return False
+    
+    # ==================== МЕТОДЫ ДЛЯ ПУБЛИКАЦИИ В КАНАЛ ====================
+    
+    def fetch_channel_posts(self, limit: int) -> List[Dict]:
+        """Посты ставок, ожидающие отправки в канал (по порядку bet_id)"""
         try:
             cursor = self.connection.cursor()
-            cursor.execute('SELECT name, value FROM coefficients')
-            return {row['name']: row['value'] for row in cursor.fetchall()}
+            cursor.execute(SELECT_CHANNEL_POSTS_SQL, (limit,))
+            return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
-            logger.error(f"❌ Ошибка получения всех коэффициентов: {e}")
+            logger.error(f"❌ Ошибка получения постов для канала: {e}")
+            return []
+    
+    def complete_channel_posts(self, published: List[Tuple[int, int]], failed: List[Tuple[str, int]],
+                               max_attempts: int) -> int:
+        """Запись channel_message_id отправленных постов и ошибок пачкой"""
+        try:
+            return complete_posts(self.connection, published, failed, max_attempts)
+        except Exception as e:
+            self.connection.rollback()
+            logger.error(f"❌ Ошибка записи результатов публикации: {e}")
+            return 0
+    
+    def count_channel_posts(self) -> int:
+        """Количество постов в очереди на публикацию"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('SELECT COUNT(*) FROM channel_posts')
+            return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"❌ Ошибка подсчета постов для канала: {e}")
+            return 0
+    
+    # ==================== МЕТОДЫ ДЛЯ ВЫПЛАТ ====================
+    
+    def create_withdrawal(self, user_id: int, amount: float, currency: str = 'USDT') -> Dict:
+        """Списание с баланса и выплата в очереди payout_outbox одной транзакцией"""
+        try:
+            result = payout_outbox.enqueue(self.connection, user_id, amount, currency)
+            if result['success']:
+                self.user_cache.set_balance(user_id, result['new_balance'])
+                self.log_action('WITHDRAW', f"User {user_id} requested withdrawal #{result['withdrawal_id']}: {amount} {currency}")
+            return result
+        except Exception as e:
+            self.connection.rollback()
+            logger.error(f"❌ Ошибка создания вывода {user_id}: {e}")
+            return {'success': False, 'error': 'Ошибка создания вывода'}
+    
+    def get_dead_withdrawals(self, limit: int = 5) -> List[Dict]:
+        """Выплаты в dead-letter (последние)"""
+        try:
+            return payout_outbox.dead_letters(self.connection, limit)
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения неудачных выплат: {e}")
+            return []
+    
+    # ==================== МЕТОДЫ ДЛЯ ПОПОЛНЕНИЙ ====================
+    
+    def create_deposit(self, user_id: int, amount: float, invoice: Dict) -> Optional[int]:
+        """Ожидающий депозит по счету CryptoBot"""
+        try:
+            return cryptopay_webhook.create_deposit(self.connection, user_id, amount, invoice)
+        except Exception as e:
+            self.connection.rollback()
+            logger.error(f"❌ Ошибка создания депозита {user_id}: {e}")
+            return None
+    
+    def get_deposit_owner(self, invoice_id) -> Optional[int]:
+        """Владелец депозита по счету CryptoBot"""
+        return cryptopay_webhook.deposit_owner(self.connection, invoice_id)
+    
+    def credit_deposit(self, invoice: Dict) -> Optional[Dict]:
+        """Зачисление оплаченного счета; None - уже зачислен (повтор webhook или сверки)"""
+        result = cryptopay_webhook.credit_invoice(self.connection, invoice)
+        if result:
+            self.user_cache.set_balance(result['user_id'], result['new_balance'])
+            self.log_action('DEPOSIT', f"User {result['user_id']} deposit #{result['deposit_id']}: "
+                                       f"{result['amount']} (invoice {invoice['invoice_id']})")
+        return result
+    
+    # ==================== МЕТОДЫ ДЛЯ РАССЫЛОК ====================
+    
+    def create_broadcast(self, text: str, created_by: int) -> Dict:
+        """Создание рассылки, число получателей фиксируется при создании"""
+        try:
+            cursor = self.connection.cursor()
+            total = cursor.execute(COUNT_RECIPIENTS_SQL).fetchone()[0]
+            cursor.execute(
+                'INSERT INTO broadcasts (text, created_by, total) VALUES (?, ?, ?)', (text, created_by, total)
+            )
+            broadcast_id = cursor.lastrowid
+            self.connection.commit()
+            self.log_action('BROADCAST', f'Admin {created_by} started broadcast #{broadcast_id} to {total} users')
+            return self.get_broadcast(broadcast_id)
+        except Exception as e:
+            logger.error(f"❌ Ошибка создания рассылки: {e}")
             return {}
     
+    def get_broadcast(self, broadcast_id: int) -> Dict:
+        """Получение рассылки по ID"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('SELECT * FROM broadcasts WHERE id = ?', (broadcast_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else {}
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения рассылки {broadcast_id}: {e}")
+            return {}
+    
+    def get_running_broadcast(self) -> Dict:
+        """Рассылка, прерванная перезапуском бота"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id DESC LIMIT 1")
+            row = cursor.fetchone()
+            return dict(row) if row else {}
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения активной рассылки: {e}")
+            return {}
+    
+    def count_broadcast_recipients(self) -> int:
+        """Количество пользователей, которым можно отправить рассылку"""
+        try:
+            return self.connection.execute(COUNT_RECIPIENTS_SQL).fetchone()[0]
+        except Exception as e:
+            logger.error(f"❌ Ошибка подсчета получателей рассылки: {e}")
+            return 0
+    
+    def fetch_broadcast_recipients(self, after_user_id: int, limit: int) -> List[int]:
+        """Следующая страница получателей после after_user_id"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(SELECT_RECIPIENTS_SQL, (after_user_id, limit))
+            return [row['user_id'] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения получателей рассылки: {e}")
+            return []
+    
+    def save_broadcast_progress(self, broadcast_id: int, last_user_id: int, sent: int, failed: int,
+                                unreachable: List[int]) -> bool:
+        """Контрольная точка рассылки и пометка недоступных пользователей"""
+        try:
+            save_progress(self.connection, broadcast_id, last_user_id, sent, failed, unreachable)
+            return True
+        except Exception as e:
+            self.connection.rollback()
+            logger.error(f"❌ Ошибка сохранения прогресса рассылки #{broadcast_id}: {e}")
+            return False
+    
+    def finish_broadcast(self, broadcast_id: int, status: str) -> bool:
+        """Завершение рассылки (done/cancelled)"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(
+                'UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?', (status, broadcast_id)
+            )
+            self.connection.commit()
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка завершения рассылки #{broadcast_id}: {e}")
+            return False
+    
     # ==================== МЕТОДЫ ДЛЯ ФЕЙК ИГР ====================
     
     def get_fake_games_settings(self) -> Dict:
@@ -1528,56 +2197,37 @@ class Database:
             return {}
     
     def get_overall_statistics(self) -> Dict:
-        """Общая статистика за все время"""
+        """Общая статистика за все время (из итогов, без сканирования таблиц)"""
         try:
-            cursor = self.connection.cursor()
-            
-            # Статистика пользователей
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as total_users,
-                    SUM(balance) as total_balance,
-                    SUM(total_deposit) as total_deposit,
-                    SUM(total_withdraw) as total_withdraw,
-                    SUM(total_wins) as total_wins,
-                    SUM(total_losses) as total_losses,
-                    SUM(total_bets) as total_bets,
-                    SUM(total_bet_amount) as total_bet_amount
-                FROM users
-            ''')
-            user_stats = dict(cursor.fetchone())
-            
-            # Статистика ставок
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as total_bets_all,
-                    SUM(amount) as total_bet_amount_all,
-                    SUM(CASE WHEN result = 'win' THEN 1 ELSE 0 END) as total_wins_all,
-                    SUM(CASE WHEN result = 'lose' THEN 1 ELSE 0 END) as total_losses_all,
-                    SUM(CASE WHEN result = 'win' THEN win_amount ELSE 0 END) as total_win_amount_all,
-                    SUM(CASE WHEN result = 'lose' THEN amount ELSE 0 END) as total_loss_amount_all
-                FROM bets
-            ''')
-            bet_stats = dict(cursor.fetchone())
-            
-            # Статистика депозитов и выводов
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as total_deposits_all,
-                    SUM(amount) as total_deposit_amount_all
-                FROM deposits 
-                WHERE status = 'completed'
-            ''')
-            deposit_stats = dict(cursor.fetchone())
-            
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as total_withdrawals_all,
-                    SUM(amount) as total_withdraw_amount_all
-                FROM withdrawals 
-                WHERE status = 'completed'
-            ''')
-            withdraw_stats = dict(cursor.fetchone())
+            totals = rollups.read_totals(self.connection)
+            
+            user_stats = {
+                'total_users': int(totals['users']),
+                'total_balance': totals['user_balance'],
+                'total_deposit': totals['user_deposit'],
+                'total_withdraw': totals['user_withdraw'],
+                'total_wins': totals['user_wins'],
+                'total_losses': totals['user_losses'],
+                'total_bets': int(totals['user_bets']),
+                'total_bet_amount': totals['user_bet_amount']
+            }
+            bet_stats = {
+                'total_bets_all': int(totals['bets']),
+                'total_bet_amount_all': totals['bet_amount'],
+                'total_wins_all': int(totals['win_bets']),
+                'total_losses_all': int(totals['lose_bets']),
+                'total_win_amount_all': totals['win_amount'],
+                'total_loss_amount_all': totals['loss_amount']
+            }
+            deposit_stats = {
+                'total_deposits_all': int(totals['deposits']),
+                'total_deposit_amount_all': totals['deposit_amount']
+            }
+            withdraw_stats = {
+                'total_withdrawals_all': int(totals['withdrawals']),
+                'total_withdraw_amount_all': totals['withdraw_amount']
+            }
+            active = self.get_active_users_counts((1, 7, 30))
             
             # Объединяем статистику
             stats = {
@@ -1586,14 +2236,13 @@ class Database:
                 'deposits': deposit_stats,
                 'withdrawals': withdraw_stats,
                 'overall': {
-                    'total_profit': (deposit_stats.get('total_deposit_amount_all', 0) or 0) - 
-                                   (withdraw_stats.get('total_withdraw_amount_all', 0) or 0) - 
-                                   (user_stats.get('total_balance', 0) or 0),
-                    'game_profit': (bet_stats.get('total_loss_amount_all', 0) or 0) - 
-                                  (bet_stats.get('total_win_amount_all', 0) or 0),
-                    'active_today': self.get_active_users_count(1),
-                    'active_week': self.get_active_users_count(7),
-                    'active_month': self.get_active_users_count(30)
+                    'total_profit': deposit_stats['total_deposit_amount_all'] - 
+                                   withdraw_stats['total_withdraw_amount_all'] - 
+                                   user_stats['total_balance'],
+                    'game_profit': bet_stats['total_loss_amount_all'] - bet_stats['total_win_amount_all'],
+                    'active_today': active[1],
+                    'active_week': active[7],
+                    'active_month': active[30]
                 }
             }
             
@@ -1603,27 +2252,56 @@ class Database:
             logger.error(f"❌ Ошибка получения общей статистики: {e}")
             return {}
     
-    def get_active_users_count(self, days: int = 1) -> int:
-        """Количество активных пользователей за N дней"""
+    def get_active_users_counts(self, periods=(1, 7, 30)) -> Dict[int, int]:
+        """Количество активных пользователей за каждый из периодов (в днях) одним запросом"""
         try:
             cursor = self.connection.cursor()
-            date_limit = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
-            cursor.execute('''
-                SELECT COUNT(DISTINCT user_id) as count 
-                FROM bets 
-                WHERE created_at >= ?
-            ''', (date_limit,))
+            now = datetime.datetime.now()
+            limits = [(now - datetime.timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S') for days in periods]
+            columns = ', '.join(f'SUM(last_bet_at >= ?) AS active_{days}' for days in periods)
+            # Диапазон по индексу idx_users_last_bet: читаются только активные за самый длинный период
+            cursor.execute(f'SELECT {columns} FROM users WHERE last_bet_at >= ?', (*limits, min(limits)))
             row = cursor.fetchone()
-            return row['count'] if row else 0
+            return {days: row[f'active_{days}'] or 0 for days in periods}
         except Exception as e:
             logger.error(f"❌ Ошибка получения активных пользователей: {e}")
+            return {days: 0 for days in periods}
+    
+    def get_active_users_count(self, days: int = 1) -> int:
+        """Количество активных пользователей за N дней"""
+        return self.get_active_users_counts((days,))[days]
+    
+    # ==================== МЕТОДЫ ДЛЯ ИТОГОВ СТАТИСТИКИ ====================
+    
+    def refresh_rollups(self) -> int:
+        """Досчет почасовых и суточных итогов по новым ставкам"""
+        try:
+            return rollups.refresh(self.connection)
+        except Exception as e:
+            self.connection.rollback()
+            logger.error(f"❌ Ошибка обновления итогов статистики: {e}")
             return 0
     
+    def get_recent_bet_stats(self, hours: int = 24) -> Dict:
+        """Итоги ставок за последние N часов из stats_hourly"""
+        try:
+            since = (datetime.datetime.utcnow() - datetime.timedelta(hours=hours)).strftime('%Y-%m-%d %H')
+            return rollups.read_series(self.connection, 'stats_hourly', since)
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения итогов за {hours} ч: {e}")
+            return {}
+    
     # ==================== МЕТОДЫ ДЛЯ АДМИНИСТРИРОВАНИЯ ====================
     
     def get_all_users(self, limit: int = 100, offset: int = 0, order_by: str = 'registration_date DESC') -> List[Dict]:
-        """Получение всех пользователей"""
+        """Получение всех пользователей (для постраничного просмотра - get_users_page)"""
         try:
+            # order_by подставляется в SQL, поэтому только из списка разрешенных сортировок
+            allowed = {f"{column} {'DESC' if descending else 'ASC'}" for column, descending in self.USER_SORTS.values()}
+            if order_by not in allowed:
+                logger.warning(f"⚠️ Недопустимая сортировка пользователей: {order_by!r}")
+                order_by = 'registration_date DESC'
+            
             cursor = self.connection.cursor()
             cursor.execute(f'''
                 SELECT * FROM users 
@@ -1635,12 +2313,51 @@ class Database:
             logger.error(f"❌ Ошибка получения всех пользователей: {e}")
             return []
     
+    def get_users_page(self, sort: str = 'new', cursor: str = None, limit: int = 10) -> Dict:
+        """Страница списка пользователей по ключу (колонка сортировки, user_id)"""
+        try:
+            column, descending = self.USER_SORTS.get(sort, self.USER_SORTS['new'])
+            
+            def fetch(condition: str, order: str, params: List, fetch_limit: int) -> List[Dict]:
+                rows = self.connection.execute(f'''
+                    SELECT user_id, username, first_name, balance, total_bet_amount, is_blocked, registration_date
+                    FROM users
+                    WHERE {condition}
+                    ORDER BY {order}
+                    LIMIT ?
+                ''', (*params, fetch_limit))
+                return [dict(row) for row in rows]
+            
+            page = keyset_page(fetch, column, 'user_id', descending, cursor, limit)
+            page['total'] = int(rollups.read_totals(self.connection)['users'])
+            return page
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения страницы пользователей: {e}")
+            return {'items': [], 'prev': None, 'next': None, 'total': 0}
+    
+    def get_user_counts(self) -> Dict:
+        """Заблокированные, VIP и верифицированные пользователи (кэшируется)"""
+        def count() -> Dict:
+            row = self.connection.execute('''
+                SELECT SUM(is_blocked = 1) AS blocked,
+                       SUM(vip_level != 'STANDARD') AS vip,
+                       SUM(kyc_verified = 1) AS kyc
+                FROM users
+            ''').fetchone()
+            return {key: row[key] or 0 for key in ('blocked', 'vip', 'kyc')}
+        
+        try:
+            return self.count_cache.get(('user_counts',), count)
+        except Exception as e:
+            logger.error(f"❌ Ошибка подсчета пользователей: {e}")
+            return {'blocked': 0, 'vip': 0, 'kyc': 0}
+    
     def search_users(self, query: str, limit: int = 50) -> List[Dict]:
         """Поиск пользователей"""
         try:
             cursor = self.connection.cursor()
             
-            # Поиск по ID
+            # Поиск по ID - по первичному ключу
             if query.isdigit():
                 cursor.execute('''
                     SELECT * FROM users 
@@ -1648,6 +2365,10 @@ class Database:
                     LIMIT ?
                 ''', (int(query), limit))
             
+            # Полнотекстовый индекс: начало слова и подстроки, с ранжированием
+            elif self.fts_enabled:
+                return user_search.search(self.connection, query, limit)
+            
             # Поиск по username
             elif query.startswith('@'):
                 cursor.execute('''
@@ -1680,6 +2401,7 @@ class Database:
                 WHERE user_id = ?
             ''', (reason, user_id))
             self.connection.commit()
+            self.user_cache.set_blocked(user_id, True, reason)
             self.log_action('ADMIN', f'User {user_id} blocked by {admin_id}. Reason: {reason}')
             return True
         except Exception as e:
@@ -1696,6 +2418,7 @@ class Database:
                 WHERE user_id = ?
             ''', (user_id,))
             self.connection.commit()
+            self.user_cache.set_blocked(user_id, False)
             self.log_action('ADMIN', f'User {user_id} unblocked by {admin_id}')
             return True
         except Exception as e:
@@ -1704,30 +2427,42 @@ class Database:
     
     # ==================== ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ ====================
     
-    def log_action(self, action_type: str, message: str, user_id: int = None, data: Dict = None):
-        """Логирование действий"""
+    def log_action(self, action_type: str, message: str, user_id: int = None, data: Dict = None,
+                   caller_info: bool = LOG_CALLER_INFO):
+        """Логирование действий (строка попадает в буфер и пишется пачкой)"""
         try:
-            cursor = self.connection.cursor()
-            data_json = json.dumps(data or {})
-            
-            # Получаем информацию о вызове
-            frame = inspect.currentframe().f_back
-            module = frame.f_globals.get('__name__', 'unknown')
-            function = frame.f_code.co_name
-            
-            cursor.execute('''
-                INSERT INTO logs (level, module, function, message, user_id, data)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (action_type, module, function, message, user_id, data_json))
+            data_json = json.dumps(data) if data else '{}'
             
-            self.connection.commit()
+            # Информация о вызове собирается только по запросу: inspect дорог на горячем пути
+            if caller_info:
+                frame = inspect.currentframe().f_back
+                module = frame.f_globals.get('__name__', 'unknown')
+                function = frame.f_code.co_name
+            else:
+                module = __name__
+                function = action_type.lower()
             
+            created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+            self.log_buffer.append(
+                self.connection,
+                (action_type, module, function, message, user_id, data_json, created_at)
+            )
+        
         except Exception as e:
             logger.error(f"❌ Ошибка логирования: {e}")
     
+    def flush_logs(self) -> int:
+        """Принудительная запись буфера логов в БД"""
+        try:
+            return self.log_buffer.flush(self.connection)
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи буфера логов: {e}")
+            return 0
+
     def get_logs(self, limit: int = 100, level: str = None, user_id: int = None) -> List[Dict]:
         """Получение логов"""
         try:
+            self.flush_logs()
             cursor = self.connection.cursor()
             
             query = 'SELECT * FROM logs WHERE 1=1'
@@ -1751,44 +2486,18 @@ class Database:
             logger.error(f"❌ Ошибка получения логов: {e}")
             return []
     
-    def cleanup_old_data(self, days: int = 30) -> bool:
-        """Очистка старых данных"""
-        try:
-            cursor = self.connection.cursor()
-            date_limit = (datetime.datetime.now() - datetime.timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
-            
-            # Очищаем старые логи
-            cursor.execute('DELETE FROM logs WHERE created_at < ?', (date_limit,))
-            
-            # Очищаем старые ставки (кроме последних 1000 на пользователя)
-            cursor.execute('''
-                DELETE FROM bets 
-                WHERE id NOT IN (
-                    SELECT id FROM bets 
-                    ORDER BY created_at DESC 
-                    LIMIT 10000
-                ) AND created_at < ?
-            ''', (date_limit,))
-            
-            # Очищаем старые уведомления
-            cursor.execute('DELETE FROM notifications WHERE created_at < ? AND is_read = 1', (date_limit,))
-            
-            self.connection.commit()
-            self.log_action('SYSTEM', f'Cleaned up data older than {days} days')
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка очистки данных: {e}")
-            return False
-    
     def backup_database(self, backup_path: str = None) -> bool:
         """Бэкап базы данных"""
         try:
             if backup_path is None:
                 backup_path = f'casino_backup_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.db'
             
-            import shutil
-            shutil.copy2(self.db_path, backup_path)
+            # В режиме WAL часть данных еще в -wal файле, поэтому копируем через backup API
+            backup_connection = sqlite3.connect(backup_path)
+            try:
+                self.connection.backup(backup_connection)
+            finally:
+                backup_connection.close()
             
             self.log_action('SYSTEM', f'Database backed up to {backup_path}')
             return True
@@ -1797,10 +2506,39 @@ class Database:
             logger.error(f"❌ Ошибка бэкапа БД: {e}")
             return False
     
+    def add_notification(self, user_id: int, title: str, message: str, notification_type: str = 'system',
+                         is_important: bool = False, action_url: str = None, action_text: str = None) -> bool:
+        """Сохранение уведомления пользователя"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute('''
+                INSERT INTO notifications (user_id, type, title, message, is_important, action_url, action_text)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, notification_type, title, message, 1 if is_important else 0, action_url, action_text))
+            self.connection.commit()
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения уведомления {user_id}: {e}")
+            return False
+    
+    def execute(self, query: str, params: tuple = ()) -> int:
+        """Выполнение произвольного изменяющего запроса, возвращает число затронутых строк"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(query, params)
+            self.connection.commit()
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"❌ Ошибка выполнения запроса: {e}")
+            return 0
+    
     def close(self):
         """Закрытие соединения с БД"""
         try:
             if self.connection:
+                flushed = self.flush_logs()
+                if flushed:
+                    logger.info(f"✅ Записано {flushed} строк логов из буфера")
                 self.connection.close()
                 logger.info("✅ Соединение с БД закрыто")
         except Exception as e:
@@ -1808,12 +2546,74 @@ class Database:
 
 # ==================== ИНИЦИАЛИЗАЦИЯ БАЗЫ ДАННЫХ ====================
 try:
-    db = Database()
+    db = AsyncDatabase(Database())
     logger.info("✅ База данных инициализирована")
 except Exception as e:
     logger.error(f"❌ Ошибка инициализации БД: {e}")
     sys.exit(1)
 
+async def publish_to_channel(chat_id: int, text: str) -> int:
+    """Отправка поста фоновым публикатором, возвращает message_id"""
+    message = await bot.send_message(chat_id=chat_id, text=text, parse_mode=ParseMode.HTML)
+    return message.message_id
+
+
+channel_publisher = ChannelPublisher(db, publish_to_channel)
+
+
+async def broadcast_send(chat_id: int, text: str):
+    """Отправка одного сообщения рассылки"""
+    await bot.send_message(chat_id=chat_id, text=text, parse_mode=ParseMode.HTML)
+
+
+broadcaster = BroadcastEngine(db, broadcast_send, unreachable_errors=(BotBlocked, UserDeactivated, ChatNotFound))
+
+# Архивирование и удаление старых данных порциями (config.RETENTION_POLICIES)
+retention_engine = RetentionEngine(db)
+
+# ==================== ВЫПЛАТЫ ====================
+crypto = CryptoBotTurbo(api_cryptobot) if api_cryptobot else None
+
+async def payout_transfer(user_id: int, amount: float, currency: str, spend_id: str) -> Dict:
+    """Перевод CryptoBot для очереди выплат"""
+    return await crypto.transfer(user_id, amount, currency, spend_id=spend_id)
+
+async def payout_find_transfer(spend_id: str) -> Optional[Dict]:
+    """Перевод CryptoBot с этим spend_id (проведен в попытке с потерянным ответом)"""
+    transfers = await crypto.get_transfers(spend_id=spend_id, count=1)
+    return transfers[0] if transfers else None
+
+payouts = PayoutOutbox(db, payout_transfer, find_transfer=payout_find_transfer)
+
+# ==================== ПОПОЛНЕНИЯ ====================
+
+async def on_invoice_paid(invoice: Dict) -> bool:
+    """Зачисление оплаченного счета (webhook или сверка) и уведомление игрока"""
+    owner = await db.get_deposit_owner(invoice['invoice_id'])
+    if owner is None:
+        # Счет не от бота: credit_deposit только запишет его в лог
+        return bool(await db.credit_deposit(invoice))
+    
+    # Под блокировкой владельца зачисление не пересекается с его ставками и выводами
+    async with db.user_locks.lock(owner):
+        result = await db.credit_deposit(invoice)
+    if not result:
+        return False
+    
+    await send_message_with_retry(
+        result['user_id'],
+        f"✅ <b>Баланс пополнен</b>\n\n"
+        f"📥 <b>Сумма:</b> <code>{format_balance(result['amount'])}</code>\n"
+        f"💰 <b>Новый баланс:</b> <code>{format_balance(result['new_balance'])}</code>",
+        parse_mode=ParseMode.HTML
+    )
+    return True
+
+cryptopay_handler = CryptoPayWebhook(api_cryptobot, on_invoice_paid)
+
+# Сервер для webhook Crypto Pay в режиме polling
+cryptopay_runner = None
+
 # ==================== ИНИЦИАЛИЗАЦИЯ ПЛАНИРОВЩИКА ====================
 try:
     import asyncio
@@ -2085,6 +2885,7 @@ def get_admin_users_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура управления пользователями"""
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton('🔍 Поиск пользователя', callback_data='admin_search_user')],
+        [InlineKeyboardButton('📋 Список пользователей', callback_data='ul_new_page_1')],
         [InlineKeyboardButton('📊 Топ пользователей', callback_data='admin_top_users')],
         [InlineKeyboardButton('📈 Активность пользователей', callback_data='admin_user_activity')],
         [InlineKeyboardButton('🚫 Заблокировать', callback_data='admin_block_user')],
@@ -2123,10 +2924,19 @@ def get_admin_tech_keyboard() -> InlineKeyboardMarkup:
         [InlineKeyboardButton('🔄 Обновить статистику', callback_data='admin_update_stats')],
         [InlineKeyboardButton('⚙️ Перезагрузить настройки', callback_data='admin_reload_settings')],
         [InlineKeyboardButton('📊 Проверить состояние', callback_data='admin_health_check')],
+        [InlineKeyboardButton('💸 Очередь выплат', callback_data='admin_payouts')],
         [InlineKeyboardButton('🔧 Техническое обслуживание', callback_data='admin_maintenance')],
         [InlineKeyboardButton('🔙 В админку', callback_data='back_to_admin')]
     ])
 
+def get_broadcast_keyboard(running: bool) -> InlineKeyboardMarkup:
+    """Клавиатура статуса рассылки"""
+    buttons = [[InlineKeyboardButton('🔄 Обновить', callback_data='broadcast_status')]]
+    if running:
+        buttons.append([InlineKeyboardButton('⏹ Остановить рассылку', callback_data='broadcast_stop')])
+    buttons.append([InlineKeyboardButton('🔙 В админку', callback_data='back_to_admin')])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
 def get_cancel_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура отмены"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -2145,6 +2955,13 @@ def get_back_menu_keyboard() -> InlineKeyboardMarkup:
         [InlineKeyboardButton('🔙 В меню', callback_data='back_to_menu')]
     ])
 
+def get_deposit_pay_keyboard(pay_url: str) -> InlineKeyboardMarkup:
+    """Оплата счета CryptoBot"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton('💳 Оплатить в @CryptoBot', url=pay_url)],
+        [InlineKeyboardButton('🔙 В меню', callback_data='back_to_menu')]
+    ])
+
 def get_confirm_keyboard(confirm_data: str, cancel_data: str = 'cancel') -> InlineKeyboardMarkup:
     """Клавиатура подтверждения"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -2154,10 +2971,25 @@ def get_confirm_keyboard(confirm_data: str, cancel_data: str = 'cancel') -> Inli
         ]
     ])
 
-def get_pagination_keyboard(current_page: int, total_pages: int, prefix: str) -> InlineKeyboardMarkup:
-    """Клавиатура пагинации"""
+def get_pagination_keyboard(current_page: int, total_pages: int, prefix: str,
+                            page: Dict = None) -> InlineKeyboardMarkup:
+    """Клавиатура пагинации
+    
+    С page (результат keyset_page) кнопки несут курсоры: {prefix}_page_{N}_{курсор},
+    и соседняя страница читается по индексу, а не через OFFSET.
+    """
     keyboard = []
     
+    if page is not None:
+        # Итог кэшируется и может отставать - номер страницы важнее
+        total_pages = max(total_pages, current_page + (1 if page['next'] else 0))
+        if page['prev']:
+            keyboard.append(InlineKeyboardButton('⬅️ Назад', callback_data=f"{prefix}_page_{current_page-1}_{page['prev']}"))
+        keyboard.append(InlineKeyboardButton(f'{current_page}/{total_pages}', callback_data=f'{prefix}_current'))
+        if page['next']:
+            keyboard.append(InlineKeyboardButton('Вперед ➡️', callback_data=f"{prefix}_page_{current_page+1}_{page['next']}"))
+        return InlineKeyboardMarkup(inline_keyboard=[keyboard])
+    
     if current_page > 1:
         keyboard.append(InlineKeyboardButton('⬅️ Назад', callback_data=f'{prefix}_page_{current_page-1}'))
     
@@ -2168,42 +3000,43 @@ def get_pagination_keyboard(current_page: int, total_pages: int, prefix: str) ->
     
     return InlineKeyboardMarkup(inline_keyboard=[keyboard])
 
+def parse_page_callback(data: str, prefix: str) -> Tuple[int, Optional[str]]:
+    """Номер страницы и курсор из {prefix}_page_{N}[_{курсор}]"""
+    page_number, _, cursor = data[len(prefix) + len('_page_'):].partition('_')
+    return int(page_number), cursor or None
+
 # ==================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ====================
 
+# Повторы после RetryAfter и сетевых ошибок выполняет очередь отправки (send_queue)
+
 async def send_message_with_retry(chat_id: int, text: str, **kwargs) -> bool:
     """Отправка сообщения с повторными попытками"""
-    for attempt in range(3):
-        try:
-            await bot.send_message(chat_id, text, **kwargs)
-            return True
-        except Exception as e:
-            logger.error(f"❌ Ошибка отправки сообщения (попытка {attempt+1}): {e}")
-            await asyncio.sleep(1)
-    return False
+    try:
+        await bot.send_message(chat_id, text, **kwargs)
+        return True
+    except Exception as e:
+        logger.error(f"❌ Ошибка отправки сообщения: {e}")
+        return False
 
 async def edit_message_with_retry(message: Message, text: str, **kwargs) -> bool:
     """Редактирование сообщения с повторными попытками"""
-    for attempt in range(3):
-        try:
-            await message.edit_text(text, **kwargs)
-            return True
-        except MessageNotModified:
-            return True
-        except Exception as e:
-            logger.error(f"❌ Ошибка редактирования сообщения (попытка {attempt+1}): {e}")
-            await asyncio.sleep(1)
-    return False
+    try:
+        await message.edit_text(text, **kwargs)
+        return True
+    except MessageNotModified:
+        return True
+    except Exception as e:
+        logger.error(f"❌ Ошибка редактирования сообщения: {e}")
+        return False
 
 async def delete_message_with_retry(message: Message) -> bool:
     """Удаление сообщения с повторными попытками"""
-    for attempt in range(3):
-        try:
-            await message.delete()
-            return True
-        except Exception as e:
-            logger.error(f"❌ Ошибка удаления сообщения (попытка {attempt+1}): {e}")
-            await asyncio.sleep(1)
-    return False
+    try:
+        await message.delete()
+        return True
+    except Exception as e:
+        logger.error(f"❌ Ошибка удаления сообщения: {e}")
+        return False
 
 def format_balance(amount: float) -> str:
     """Форматирование суммы баланса"""
@@ -2303,31 +3136,31 @@ def get_outcome_name(outcome: str, game_type: str = None) -> str:
     return outcome
 
 def get_multiplier(game_type: str, outcome: str) -> float:
-    """Получение коэффициента для игры и исхода"""
+    """Получение коэффициента для игры и исхода (из кэша, без обращения к БД)"""
     try:
         if game_type == 'more_less':
-            return db.get_coefficient('KEF1')
+            return db.coefficients.get('KEF1')
         elif game_type == 'number':
-            return db.get_coefficient('KEF2')
+            return db.coefficients.get('KEF2')
         elif game_type == 'even_odd':
-            return db.get_coefficient('KEF3')
+            return db.coefficients.get('KEF3')
         elif game_type == 'roulette':
             if outcome == 'green':
-                return db.get_coefficient('KEF6')
+                return db.coefficients.get('KEF6')
             else:
-                return db.get_coefficient('KEF5')
+                return db.coefficients.get('KEF5')
         elif game_type == 'football':
             if outcome == 'goal':
-                return db.get_coefficient('KEF12')
+                return db.coefficients.get('KEF12')
             else:
-                return db.get_coefficient('KEF13')
+                return db.coefficients.get('KEF13')
         elif game_type == 'basketball':
             if outcome == 'basket_goal':
-                return db.get_coefficient('KEF10')
+                return db.coefficients.get('KEF10')
             else:
-                return db.get_coefficient('KEF11')
+                return db.coefficients.get('KEF11')
         elif game_type == 'knb':
-            return db.get_coefficient('KEF15')
+            return db.coefficients.get('KEF15')
         elif game_type == 'slots':
             return random.choice([2.0, 3.0, 5.0, 10.0, 20.0])
         else:
@@ -2335,58 +3168,61 @@ def get_multiplier(game_type: str, outcome: str) -> float:
     except:
         return 2.0
 
-async def process_game(user_id: int, game_type: str, outcome: str, bet_amount: float) -> Dict:
-    """Обработка игры"""
+async def process_game(user_id: int, game_type: str, outcome: str, bet_amount: float,
+                       user_info: Dict = None) -> Dict:
+    """Обработка игры (с user_info - с постом результата в канал)"""
     try:
-        # Проверяем баланс
-        balance = db.get_user_balance(user_id)
-        if balance < bet_amount:
-            return {'success': False, 'error': 'Недостаточно средств'}
-        
-        # Списание ставки
-        if not await db.deduct_from_balance(user_id, bet_amount, 'bet', f'Ставка в {get_game_name(game_type)}'):
-            return {'success': False, 'error': 'Ошибка списания средств'}
-        
         # Определяем результат игры
         result = determine_game_result(game_type, outcome)
         dice_value = result.get('dice_value')
         win = result.get('win', False)
         
-        # Получаем коэффициент
+        # Получаем коэффициент и версию кэша, из которой он взят
+        coefficient_version = db.coefficients.version
         multiplier = get_multiplier(game_type, outcome) if win else 1.0
         win_amount = calculate_win_amount(bet_amount, multiplier) if win else 0
         
-        if win:
-            # Зачисление выигрыша
-            await db.add_to_balance(user_id, win_amount, 'win', f'Выигрыш в {get_game_name(game_type)}')
-        
-        # Записываем ставку в БД
-        bet_id = db.add_bet(
-            user_id=user_id,
-            game_type=game_type,
-            amount=bet_amount,
-            outcome=outcome,
-            result='win' if win else 'lose',
-            win_amount=win_amount,
-            multiplier=multiplier,
-            dice_value=dice_value,
-            is_fake=False
-        )
+        channel_post = None
+        if user_info and channel_id:
+            post_text = format_channel_post(user_info, game_type, outcome, bet_amount, {
+                'success': True, 'win': win, 'win_amount': win_amount,
+                'multiplier': multiplier, 'dice_value': dice_value
+            })
+            channel_post = (channel_id, post_text)
+        
+        # Списание, выигрыш и запись ставки одной транзакцией
+        async with db.user_locks.lock(user_id):
+            settlement = await db.settle_bet(
+                user_id=user_id,
+                game_type=game_type,
+                amount=bet_amount,
+                outcome=outcome,
+                result='win' if win else 'lose',
+                win_amount=win_amount,
+                multiplier=multiplier,
+                dice_value=dice_value,
+                description=f'Ставка в {get_game_name(game_type)}',
+                coefficient_version=coefficient_version,
+                channel_post=channel_post
+            )
         
-        # Обновляем статистику пользователя
-        db.update_user_activity(user_id)
+        if not settlement['success']:
+            return {'success': False, 'error': settlement['error']}
+        
+        if channel_post:
+            channel_publisher.notify()
         
         return {
             'success': True,
             'win': win,
-            'bet_id': bet_id,
+            'bet_id': settlement['bet_id'],
             'dice_value': dice_value,
             'multiplier': multiplier,
             'win_amount': win_amount,
-            'new_balance': db.get_user_balance(user_id),
+            'new_balance': settlement['new_balance'],
             'result_text': f"Выпало: {dice_value}" if dice_value else ""
         }
-        
+    
     except Exception as e:
         logger.error(f"❌ Ошибка обработки игры: {e}")
         return {'success': False, 'error': str(e)}
@@ -2459,9 +3295,9 @@ def determine_game_result(game_type: str, outcome: str) -> Dict:
     
     return result
 
-async def send_game_result_to_channel(user_info: Dict, game_type: str, outcome: str, 
-                                     bet_amount: float, result: Dict) -> Optional[int]:
-    """Отправка результата игры в канал"""
+def format_channel_post(user_info: Dict, game_type: str, outcome: str, 
+                        bet_amount: float, result: Dict) -> str:
+    """Текст поста о результате игры для канала"""
     try:
         user_name = get_user_display_name(user_info)
         game_name = get_game_name(game_type)
@@ -2513,18 +3349,11 @@ async def send_game_result_to_channel(user_info: Dict, game_type: str, outcome:
                 f"🛠️ <b>Обратитесь в поддержку для решения проблемы</b>"
             )
         
-        # Отправляем сообщение в канал
-        message = await bot.send_message(
-            chat_id=channel_id,
-            text=text,
-            parse_mode=ParseMode.HTML
-        )
-        
-        return message.message_id
+        return text
         
     except Exception as e:
-        logger.error(f"❌ Ошибка отправки результата в канал: {e}")
-        return None
+        logger.error(f"❌ Ошибка формирования поста для канала: {e}")
+        return f"🎮 <b>Ставка:</b> {format_balance(bet_amount)}"
 
 async def process_promo_activation(user_id: int, promo_code: str) -> Dict:
     """Обработка активации промокода"""
@@ -2534,7 +3363,7 @@ async def process_promo_activation(user_id: int, promo_code: str) -> Dict:
         
         if result['success']:
             # Обновляем баланс пользователя
-            new_balance = db.get_user_balance(user_id)
+            new_balance = await db.get_user_balance(user_id)
             
             return {
                 'success': True,
@@ -2561,12 +3390,7 @@ async def send_notification(user_id: int, title: str, message: str,
     """Отправка уведомления пользователю"""
     try:
         # Сохраняем в БД
-        cursor = db.connection.cursor()
-        cursor.execute('''
-            INSERT INTO notifications (user_id, type, title, message, is_important, action_url, action_text)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, 'system', title, message, 1 if is_important else 0, action_url, action_text))
-        db.connection.commit()
+        await db.add_notification(user_id, title, message, 'system', is_important, action_url, action_text)
         
         # Отправляем в Telegram
         text = f"🔔 <b>{title}</b>\n\n{message}"
@@ -2588,7 +3412,7 @@ async def send_notification(user_id: int, title: str, message: str,
 async def check_user_blocked(user_id: int) -> bool:
     """Проверка блокировки пользователя"""
     try:
-        user = db.get_user(user_id)
+        user = await db.get_user_profile(user_id)
         if user and user.get('is_blocked'):
             await bot.send_message(
                 user_id,
@@ -2623,7 +3447,7 @@ async def cmd_start(message: Message, state: FSMContext):
             pass
     
     # Добавляем/обновляем пользователя
-    db.add_user(
+    await db.add_user(
         user_id=user_id,
         username=message.from_user.username,
         first_name=message.from_user.first_name,
@@ -2633,8 +3457,8 @@ async def cmd_start(message: Message, state: FSMContext):
     )
     
     # Получаем информацию о пользователе
-    user_info = db.get_user(user_id)
-    balance = db.get_user_balance(user_id)
+    user_info = await db.get_user(user_id)
+    balance = await db.get_user_balance(user_id)
     
     # Формируем приветственное сообщение
     welcome_text = (
@@ -2719,16 +3543,16 @@ async def cmd_help(message: Message):
 async def cmd_balance(message: Message):
     """Обработка команды /balance"""
     user_id = message.from_user.id
-    balance = db.get_user_balance(user_id)
+    balance = await db.get_user_balance(user_id)
     
     balance_text = (
         f"💰 <b>Ваш баланс:</b> <code>{format_balance(balance)}</code>\n\n"
         
         f"📊 <b>Финансовая статистика:</b>\n"
-        f"├ Общий депозит: <code>{format_balance(db.get_user(user_id).get('total_deposit', 0))}</code>\n"
-        f"├ Общий вывод: <code>{format_balance(db.get_user(user_id).get('total_withdraw', 0))}</code>\n"
-        f"├ Выигрыши: <code>{format_balance(db.get_user(user_id).get('total_wins', 0))}</code>\n"
-        f"└ Проигрыши: <code>{format_balance(db.get_user(user_id).get('total_losses', 0))}</code>\n\n"
+        f"├ Общий депозит: <code>{format_balance((await db.get_user(user_id)).get('total_deposit', 0))}</code>\n"
+        f"├ Общий вывод: <code>{format_balance((await db.get_user(user_id)).get('total_withdraw', 0))}</code>\n"
+        f"├ Выигрыши: <code>{format_balance((await db.get_user(user_id)).get('total_wins', 0))}</code>\n"
+        f"└ Проигрыши: <code>{format_balance((await db.get_user(user_id)).get('total_losses', 0))}</code>\n\n"
         
         f"⚡ <b>Быстрые действия:</b>"
     )
@@ -2744,14 +3568,14 @@ async def cmd_balance(message: Message):
 async def cmd_stats(message: Message):
     """Обработка команды /stats"""
     user_id = message.from_user.id
-    user_info = db.get_user(user_id)
+    user_info = await db.get_user(user_id)
     
     if not user_info:
         await send_photo_message(user_id, 'error', "❌ Информация о пользователе не найдена.")
         return
     
     # Получаем статистику ставок
-    bet_stats = db.get_bet_stats(user_id=user_id)
+    bet_stats = await db.get_bet_stats(user_id=user_id)
     
     # Формируем текст статистики
     stats_text = (
@@ -2783,11 +3607,49 @@ async def cmd_stats(message: Message):
         f"⭐ <b>VIP очки:</b> {user_info.get('vip_points', 0)}"
     )
     
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton('📜 История ставок', callback_data='bh_page_1')]
+    ])
+    
     await send_photo_message(
         user_id,
         'stats_user',
-        stats_text
+        stats_text,
+        keyboard
+    )
+
+@dp.callback_query_handler(lambda c: c.data.startswith('bh_page_'))
+async def callback_bet_history(callback: CallbackQuery):
+    """История ставок игрока по страницам (bh_page_{N}_{курсор})"""
+    user_id = callback.from_user.id
+    page_number, cursor = parse_page_callback(callback.data, 'bh')
+    
+    page = await db.get_user_bets_page(user_id, cursor, PAGE_SIZE)
+    total_pages = max(1, -(-page['total'] // PAGE_SIZE))
+    
+    lines = [
+        f"{'✅' if bet['result'] == 'win' else '❌'} {get_game_name(bet['game_type'])}: "
+        f"{format_balance(bet['amount'])} → {format_balance(bet['win_amount'])}\n"
+        f"    <i>{bet['created_at']}</i>"
+        for bet in page['items']
+    ]
+    
+    history_text = (
+        f"📜 <b>История ставок</b>\n"
+        f"Всего: <code>{page['total']}</code>\n\n"
+        + ("\n".join(lines) or "Ставок пока нет")
     )
+    
+    keyboard = get_pagination_keyboard(page_number, total_pages, 'bh', page)
+    keyboard.add(InlineKeyboardButton('🔙 В меню', callback_data='back_to_menu'))
+    
+    await edit_message_with_photo(callback, 'stats_user', history_text, keyboard)
+    await callback.answer()
+
+@dp.callback_query_handler(lambda c: c.data == 'bh_current' or c.data.startswith('ul_') and c.data.endswith('_current'))
+async def callback_page_current(callback: CallbackQuery):
+    """Нажатие на номер страницы"""
+    await callback.answer()
 
 @dp.message_handler(commands=['promo'])
 async def cmd_promo(message: Message):
@@ -2875,10 +3737,10 @@ async def cmd_admin(message: Message):
         f"👑 <b>Админ панель {NAME_CASINO}</b>\n\n"
         
         f"📊 <b>Статистика системы:</b>\n"
-        f"├ Пользователей: <code>{db.get_statistics().get('total_users', 0)}</code>\n"
-        f"├ Онлайн: <code>{db.get_active_users_count(1)}</code>\n"
-        f"├ Ставок сегодня: <code>{db.get_statistics().get('total_bets', 0)}</code>\n"
-        f"├ Прибыль сегодня: <code>{format_balance(db.get_statistics().get('profit', 0))}</code>\n"
+        f"├ Пользователей: <code>{(await db.get_statistics()).get('total_users', 0)}</code>\n"
+        f"├ Онлайн: <code>{await db.get_active_users_count(1)}</code>\n"
+        f"├ Ставок сегодня: <code>{(await db.get_statistics()).get('total_bets', 0)}</code>\n"
+        f"├ Прибыль сегодня: <code>{format_balance((await db.get_statistics()).get('profit', 0))}</code>\n"
         f"└ Баланс системы: <code>{format_balance(0)}</code>\n\n"
         
         f"⚡ <b>Выберите раздел для управления:</b>"
@@ -2907,7 +3769,7 @@ async def menu_bet(message: Message):
     if await check_user_blocked(user_id):
         return
     
-    balance = db.get_user_balance(user_id)
+    balance = await db.get_user_balance(user_id)
     
     if balance < MIN_STAVKA:
         await send_photo_message(
@@ -2941,7 +3803,7 @@ async def menu_bet(message: Message):
 async def menu_referral(message: Message):
     """Обработка кнопки 'Реферальная программа'"""
     user_id = message.from_user.id
-    user_info = db.get_user(user_id)
+    user_info = await db.get_user(user_id)
     
     referral_link = f"https://t.me/{NICNAME}?start={user_id}"
     
@@ -3006,7 +3868,7 @@ async def menu_info(message: Message):
         f"• Вывод: от {MIN_WITHDRAW}$\n"
         f"• Комиссия на вывод: 0%\n"
         f"• Время вывода: 1-15 минут\n"
-        f"• Поддерживаемые валюты: USDT (TRC-20)\n\n"
+        f"• Пополнение и вывод: USDT через @CryptoBot\n\n"
         
         f"🎮 <b>Игры:</b>\n"
         f"• 10+ различных игр\n"
@@ -3058,7 +3920,7 @@ async def menu_support(message: Message):
 async def menu_settings(message: Message):
     """Обработка кнопки 'Настройки'"""
     user_id = message.from_user.id
-    user_info = db.get_user(user_id)
+    user_info = await db.get_user(user_id)
     
     settings_text = (
         f"⚙️ <b>Настройки аккаунта</b>\n\n"
@@ -3134,7 +3996,7 @@ async def callback_back_to_games(callback: CallbackQuery, state: FSMContext):
     """Возврат к выбору игры"""
     await state.finish()
     user_id = callback.from_user.id
-    balance = db.get_user_balance(user_id)
+    balance = await db.get_user_balance(user_id)
     
     games_text = (
         f"🎮 <b>Выберите игру</b>\n\n"
@@ -3161,7 +4023,7 @@ async def callback_select_game(callback: CallbackQuery, state: FSMContext):
             f"Бросается игральная кость (1-6).\n"
             f"• <b>Больше</b> (4-6) - выигрыш если выпадет 4, 5 или 6\n"
             f"• <b>Меньше</b> (1-3) - выигрыш если выпадет 1, 2 или 3\n\n"
-            f"💰 <b>Коэффициент:</b> {db.get_coefficient('KEF1')}x\n"
+            f"💰 <b>Коэффициент:</b> {db.coefficients.get('KEF1')}x\n"
             f"🎯 <b>Шанс победы:</b> 50%\n"
             f"⚡ <b>Результат:</b> Мгновенный\n\n"
             f"✨ <b>Выберите исход:</b>"
@@ -3176,7 +4038,7 @@ async def callback_select_game(callback: CallbackQuery, state: FSMContext):
             f"Бросается игральная кость (1-6).\n"
             f"Выберите число от 1 до 6.\n"
             f"Если вы угадаете выпавшее число - вы выигрываете!\n\n"
-            f"💰 <b>Коэффициент:</b> {db.get_coefficient('KEF2')}x\n"
+            f"💰 <b>Коэффициент:</b> {db.coefficients.get('KEF2')}x\n"
             f"🎯 <b>Шанс победы:</b> 16.67%\n"
             f"⚡ <b>Результат:</b> Мгновенный\n\n"
             f"✨ <b>Выберите число:</b>"
@@ -3191,7 +4053,7 @@ async def callback_select_game(callback: CallbackQuery, state: FSMContext):
             f"Бросается игральная кость (1-6).\n"
             f"• <b>Чет</b> - выигрыш если выпадет четное число (2, 4, 6)\n"
             f"• <b>Нечет</b> - выигрыш если выпадет нечетное число (1, 3, 5)\n\n"
-            f"💰 <b>Коэффициент:</b> {db.get_coefficient('KEF3')}x\n"
+            f"💰 <b>Коэффициент:</b> {db.coefficients.get('KEF3')}x\n"
             f"🎯 <b>Шанс победы:</b> 50%\n"
             f"⚡ <b>Результат:</b> Мгновенный\n\n"
             f"✨ <b>Выберите исход:</b>"
@@ -3208,8 +4070,8 @@ async def callback_select_game(callback: CallbackQuery, state: FSMContext):
             f"• <b>⚫️ Черное</b> - выигрыш если выпадет черное число\n"
             f"• <b>🟢 Зеленое</b> - выигрыш если выпадет 0\n\n"
             f"💰 <b>Коэффициенты:</b>\n"
-            f"├ Красное/Черное: {db.get_coefficient('KEF5')}x\n"
-            f"└ Зеленое: {db.get_coefficient('KEF6')}x\n\n"
+            f"├ Красное/Черное: {db.coefficients.get('KEF5')}x\n"
+            f"└ Зеленое: {db.coefficients.get('KEF6')}x\n\n"
             f"🎯 <b>Шанс победы:</b>\n"
             f"├ Красное/Черное: 48.65%\n"
             f"└ Зеленое: 2.70%\n\n"
@@ -3227,8 +4089,8 @@ async def callback_select_game(callback: CallbackQuery, state: FSMContext):
             f"• <b>⚽️ Гол</b> - выигрыш если мяч попадет в ворота\n"
             f"• <b>❌ Мимо</b> - выигрыш если мяч не попадет в ворота\n\n"
             f"💰 <b>Коэффициенты:</b>\n"
-            f"├ Гол: {db.get_coefficient('KEF12')}x\n"
-            f"└ Мимо: {db.get_coefficient('KEF13')}x\n\n"
+            f"├ Гол: {db.coefficients.get('KEF12')}x\n"
+            f"└ Мимо: {db.coefficients.get('KEF13')}x\n\n"
             f"🎯 <b>Шанс победы:</b> 50%\n"
             f"⚡ <b>Результат:</b> Мгновенный\n\n"
             f"✨ <b>Выберите исход:</b>"
@@ -3244,8 +4106,8 @@ async def callback_select_game(callback: CallbackQuery, state: FSMContext):
             f"• <b>🏀 Гол</b> - выигрыш если мяч попадет в кольцо\n"
             f"• <b>❌ Мимо</b> - выигрыш если мяч не попадет в кольцо\n\n"
             f"💰 <b>Коэффициенты:</b>\n"
-            f"├ Гол: {db.get_coefficient('KEF10')}x\n"
-            f"└ Мимо: {db.get_coefficient('KEF11')}x\n\n"
+            f"├ Гол: {db.coefficients.get('KEF10')}x\n"
+            f"└ Мимо: {db.coefficients.get('KEF11')}x\n\n"
             f"🎯 <b>Шанс победы:</b> 50%\n"
             f"⚡ <b>Результат:</b> Мгновенный\n\n"
             f"✨ <b>Выберите исход:</b>"
@@ -3261,8 +4123,8 @@ async def callback_select_game(callback: CallbackQuery, state: FSMContext):
             f"• <b>✊ Камень</b> бьет ножницы\n"
             f"• <b>✌️ Ножницы</b> бьют бумагу\n"
             f"• <b>✋ Бумага</b> бьет камень\n\n"
-            f"💰 <b>Коэффициент:</b> {db.get_coefficient('KEF15')}x\n"
-            f"🎯 <b>Шанс победы:</b> {db.get_coefficient('KNB_CHANCE')}%\n"
+            f"💰 <b>Коэффициент:</b> {db.coefficients.get('KEF15')}x\n"
+            f"🎯 <b>Шанс победы:</b> {db.coefficients.get('KNB_CHANCE')}%\n"
             f"⚡ <b>Результат:</b> Мгновенный\n\n"
             f"✨ <b>Выберите ваш ход:</b>"
         )
@@ -3274,10 +4136,10 @@ async def callback_select_game(callback: CallbackQuery, state: FSMContext):
             f"🎰 <b>Слоты</b>\n\n"
             f"📖 <b>Правила игры:</b>\n"
             f"Вращение 3 барабанов с символами.\n"
-            f"• 3 одинаковых символа: {db.get_coefficient('KEF9')}x\n"
-            f"• 2 одинаковых символа: {db.get_coefficient('KEF8')}x\n"
-            f"• Любая комбинация: {db.get_coefficient('KEF7')}x\n\n"
-            f"💰 <b>Джекпот:</b> {db.get_coefficient('KEF9')}x\n"
+            f"• 3 одинаковых символа: {db.coefficients.get('KEF9')}x\n"
+            f"• 2 одинаковых символа: {db.coefficients.get('KEF8')}x\n"
+            f"• Любая комбинация: {db.coefficients.get('KEF7')}x\n\n"
+            f"💰 <b>Джекпот:</b> {db.coefficients.get('KEF9')}x\n"
             f"🎯 <b>Шанс победы:</b> 30%\n"
             f"⚡ <b>Результат:</b> Мгновенный\n\n"
             f"✨ <b>Сделайте ставку:</b>"
@@ -3309,7 +4171,7 @@ async def callback_select_outcome(callback: CallbackQuery, state: FSMContext):
     await state.update_data(outcome=outcome)
     
     # Проверяем баланс
-    balance = db.get_user_balance(user_id)
+    balance = await db.get_cached_balance(user_id)
     
     # Получаем информацию об игре
     game_name = get_game_name(game_type)
@@ -3379,7 +4241,7 @@ async def process_bet_amount(message: Message, state: FSMContext):
             return
         
         # Проверяем баланс
-        balance = db.get_user_balance(user_id)
+        balance = await db.get_cached_balance(user_id)
         if amount > balance:
             await send_photo_message(
                 user_id,
@@ -3404,21 +4266,11 @@ async def process_bet_amount(message: Message, state: FSMContext):
             return
         
         # Обрабатываем игру
-        user_info = db.get_user(user_id)
-        result = await process_game(user_id, game_type, outcome, amount)
+        # Пост в канал публикуется в фоне (channel_publisher), игрок получает ответ сразу
+        user_info = await db.get_user_profile(user_id)
+        result = await process_game(user_id, game_type, outcome, amount, user_info)
         
         if result['success']:
-            # Отправляем результат в канал
-            channel_message_id = await send_game_result_to_channel(user_info, game_type, outcome, amount, result)
-            
-            # Обновляем сообщение в канале ID если есть
-            if channel_message_id:
-                db.connection.cursor().execute(
-                    'UPDATE bets SET channel_message_id = ? WHERE user_id = ? ORDER BY id DESC LIMIT 1',
-                    (channel_message_id, user_id)
-                )
-                db.connection.commit()
-            
             # Формируем сообщение для пользователя
             game_name = get_game_name(game_type)
             outcome_name = get_outcome_name(outcome, game_type)
@@ -3477,17 +4329,14 @@ async def process_bet_amount(message: Message, state: FSMContext):
             await send_photo_message(user_id, photo_type, result_text, keyboard)
             
         else:
-            # Ошибка в игре
+            # settle_bet откатывает всю транзакцию: при ошибке ничего не списано, возвращать нечего
             error_text = (
-                f"⚠️ <b>ОШИБКА В ИГРЕ</b>\n\n"
+                f"⚠️ <b>Ставка не принята</b>\n\n"
                 f"❌ <b>Причина:</b> {result.get('error', 'Неизвестная ошибка')}\n\n"
-                f"🛠️ <b>Средства возвращены на ваш баланс.</b>\n"
+                f"💰 <b>Баланс не изменился:</b> <code>{format_balance(await db.get_user_balance(user_id))}</code>\n"
                 f"📞 <b>Если ошибка повторяется, обратитесь в поддержку:</b> {SUPPORT_USERNAME}"
             )
             
-            # Возвращаем средства
-            await db.add_to_balance(user_id, amount, 'refund', 'Возврат средств при ошибке в игре')
-            
             await send_photo_message(user_id, 'error', error_text, get_back_menu_keyboard())
         
         await state.finish()
@@ -3527,13 +4376,13 @@ async def callback_deposit(callback: CallbackQuery):
     deposit_text = (
         f"💳 <b>Пополнение баланса</b>\n\n"
         
-        f"💰 <b>Ваш баланс:</b> <code>{format_balance(db.get_user_balance(callback.from_user.id))}</code>\n\n"
+        f"💰 <b>Ваш баланс:</b> <code>{format_balance(await db.get_user_balance(callback.from_user.id))}</code>\n\n"
         
         f"🎯 <b>Требования:</b>\n"
         f"├ Минимальный депозит: <code>{MIN_STAVKA}$</code>\n"
-        f"├ Валюта: USDT (TRC-20)\n"
+        f"├ Валюта: USDT (@CryptoBot)\n"
         f"├ Комиссия: 0%\n"
-        f"└ Время зачисления: 1-15 минут\n\n"
+        f"└ Время зачисления: сразу после оплаты\n\n"
         
         f"🎁 <b>Бонусы при пополнении:</b>\n"
         f"├ Первый депозит: +{WELCOME_BONUS}%\n"
@@ -3542,28 +4391,87 @@ async def callback_deposit(callback: CallbackQuery):
         
         f"📝 <b>Инструкция:</b>\n"
         f"1. Введите сумму депозита\n"
-        f"2. Получите адрес для перевода\n"
-        f"3. Переведите USDT на указанный адрес\n"
+        f"2. Получите счет @CryptoBot\n"
+        f"3. Оплатите счет в течение 30 минут\n"
         f"4. Средства зачислятся автоматически\n\n"
         
         f"⚠️ <b>Внимание:</b>\n"
-        f"• Отправляйте только USDT (TRC-20)\n"
-        f"• Минимальная сумма перевода: 1 USDT\n"
-        f"• Сохраняйте TXID транзакции\n"
+        f"• Оплачивайте только выданный ботом счет\n"
+        f"• Неоплаченный счет закроется через 30 минут\n"
         f"• При проблемах - обращайтесь в поддержку\n\n"
         
         f"💎 <b>Введите сумму для пополнения (в долларах):</b>"
     )
     
-    await edit_message_with_photo(callback, 'deposit', deposit_text, get_cancel_keyboard())
-    await UserStates.waiting_for_deposit_amount.set()
-    await callback.answer()
+    await edit_message_with_photo(callback, 'deposit', deposit_text, get_cancel_keyboard())
+    await UserStates.waiting_for_deposit_amount.set()
+    await callback.answer()
+
+@dp.message_handler(state=UserStates.waiting_for_deposit_amount)
+async def process_deposit_amount(message: Message, state: FSMContext):
+    """Обработка суммы депозита: счет CryptoBot и ожидающий депозит"""
+    user_id = message.from_user.id
+    
+    if await check_user_blocked(user_id):
+        await state.finish()
+        return
+    
+    try:
+        amount = round(float(message.text.replace(',', '.').strip()), 2)
+    except ValueError:
+        await send_photo_message(
+            user_id,
+            'error',
+            "❌ <b>Неверный формат суммы</b>\n\n"
+            "Введите сумму цифрами (например: 1.5 или 10):",
+            get_cancel_keyboard()
+        )
+        return
+    
+    if amount < MIN_STAVKA:
+        await send_photo_message(
+            user_id,
+            'error',
+            f"❌ <b>Слишком маленькая сумма</b>\n\n"
+            f"Минимальный депозит: <code>{MIN_STAVKA}$</code>\n\n"
+            f"📝 <b>Введите сумму еще раз:</b>",
+            get_cancel_keyboard()
+        )
+        return
+    
+    if not crypto:
+        await state.finish()
+        await send_photo_message(user_id, 'error', "❌ <b>Пополнение временно недоступно</b>", get_back_menu_keyboard())
+        return
+    
+    # payload - для ручной проверки счета в @CryptoBot; зачисление только по строке deposits
+    invoice = await crypto.create_invoice(amount, payload=str(user_id))
+    deposit_id = await db.create_deposit(user_id, amount, invoice) if invoice['success'] else None
+    await state.finish()
+    
+    if not deposit_id:
+        await send_photo_message(
+            user_id,
+            'error',
+            "❌ <b>Не удалось создать счет</b>\n\n"
+            "Попробуйте еще раз через минуту",
+            get_back_menu_keyboard()
+        )
+        return
+    
+    invoice_text = (
+        f"📥 <b>Счет #{invoice['invoice_id']} создан</b>\n\n"
+        f"💰 <b>Сумма:</b> <code>{format_balance(amount)}</code>\n"
+        f"⏳ <b>Действителен:</b> 30 минут\n\n"
+        f"Нажмите кнопку ниже и оплатите счет в @CryptoBot, баланс пополнится автоматически"
+    )
+    await send_photo_message(user_id, 'deposit', invoice_text, get_deposit_pay_keyboard(invoice['pay_url']))
 
 @dp.callback_query_handler(lambda c: c.data == 'withdraw')
 async def callback_withdraw(callback: CallbackQuery):
     """Обработка кнопки 'Вывести средства'"""
     user_id = callback.from_user.id
-    balance = db.get_user_balance(user_id)
+    balance = await db.get_user_balance(user_id)
     
     if balance < MIN_WITHDRAW:
         await edit_message_with_photo(
@@ -3586,20 +4494,19 @@ async def callback_withdraw(callback: CallbackQuery):
         
         f"🎯 <b>Требования:</b>\n"
         f"├ Минимальный вывод: <code>{MIN_WITHDRAW}$</code>\n"
-        f"├ Валюта: USDT (TRC-20)\n"
+        f"├ Валюта: USDT в @CryptoBot\n"
         f"├ Комиссия: 0%\n"
         f"└ Время выплаты: 1-15 минут\n\n"
         
         f"📝 <b>Инструкция:</b>\n"
         f"1. Введите сумму вывода\n"
-        f"2. Введите адрес кошелька USDT (TRC-20)\n"
-        f"3. Подтвердите вывод\n"
-        f"4. Средства будут отправлены на ваш кошелек\n\n"
+        f"2. Сумма спишется с баланса, выплата встанет в очередь\n"
+        f"3. Средства придут в @CryptoBot на ваш аккаунт\n\n"
         
         f"⚠️ <b>Внимание:</b>\n"
-        f"• Вывод только на кошельки USDT (TRC-20)\n"
-        f"• Проверяйте правильность адреса\n"
-        f"• Вывод только на кошелек отправителя\n"
+        f"• Выплата - перевод в @CryptoBot, адрес кошелька не нужен\n"
+        f"• Средства придут на аккаунт Telegram, с которого сделан запрос\n"
+        f"• Для получения запустите @CryptoBot, если еще не пользовались им\n"
         f"• При проблемах - обращайтесь в поддержку\n\n"
         
         f"💎 <b>Введите сумму для вывода (в долларах):</b>"
@@ -3609,6 +4516,69 @@ async def callback_withdraw(callback: CallbackQuery):
     await UserStates.waiting_for_withdraw_amount.set()
     await callback.answer()
 
+@dp.message_handler(state=UserStates.waiting_for_withdraw_amount)
+async def process_withdraw_amount(message: Message, state: FSMContext):
+    """Обработка суммы вывода: списание и постановка выплаты в очередь"""
+    user_id = message.from_user.id
+    
+    if await check_user_blocked(user_id):
+        await state.finish()
+        return
+    
+    # Без CryptoBot выплата не уйдет: баланс не списываем
+    if not crypto:
+        await state.finish()
+        await send_photo_message(user_id, 'error', "❌ <b>Вывод временно недоступен</b>", get_back_menu_keyboard())
+        return
+    
+    try:
+        amount = round(float(message.text.replace(',', '.').strip()), 2)
+    except ValueError:
+        await send_photo_message(
+            user_id,
+            'error',
+            "❌ <b>Неверный формат суммы</b>\n\n"
+            "Введите сумму цифрами (например: 1.5 или 10):",
+            get_cancel_keyboard()
+        )
+        return
+    
+    if not check_min_withdraw(amount):
+        await send_photo_message(
+            user_id,
+            'error',
+            f"❌ <b>Слишком маленькая сумма</b>\n\n"
+            f"Минимальный вывод: <code>{MIN_WITHDRAW}$</code>\n\n"
+            f"📝 <b>Введите сумму еще раз:</b>",
+            get_cancel_keyboard()
+        )
+        return
+    
+    async with db.user_locks.lock(user_id):
+        result = await db.create_withdrawal(user_id, amount)
+    
+    if not result['success']:
+        await send_photo_message(
+            user_id,
+            'error',
+            f"❌ <b>{result['error']}</b>\n\n"
+            f"💰 Ваш баланс: <code>{format_balance(await db.get_user_balance(user_id))}</code>\n\n"
+            f"📝 <b>Введите меньшую сумму:</b>",
+            get_cancel_keyboard()
+        )
+        return
+    
+    payouts.notify()
+    await state.finish()
+    
+    success_text = (
+        f"✅ <b>Вывод #{result['withdrawal_id']} принят</b>\n\n"
+        f"📤 <b>Сумма:</b> <code>{format_balance(amount)}</code>\n"
+        f"💰 <b>Новый баланс:</b> <code>{format_balance(result['new_balance'])}</code>\n\n"
+        f"⏳ Средства придут в @CryptoBot в течение нескольких минут"
+    )
+    await send_photo_message(user_id, 'success', success_text, get_back_menu_keyboard())
+
 @dp.callback_query_handler(lambda c: c.data == 'activate_promo')
 async def callback_activate_promo(callback: CallbackQuery, state: FSMContext):
     """Обработка кнопки 'Активировать промокод'"""
@@ -3700,10 +4670,10 @@ async def callback_back_to_admin(callback: CallbackQuery, state: FSMContext):
         f"👑 <b>Админ панель {NAME_CASINO}</b>\n\n"
         
         f"📊 <b>Статистика системы:</b>\n"
-        f"├ Пользователей: <code>{db.get_statistics().get('total_users', 0)}</code>\n"
-        f"├ Онлайн: <code>{db.get_active_users_count(1)}</code>\n"
-        f"├ Ставок сегодня: <code>{db.get_statistics().get('total_bets', 0)}</code>\n"
-        f"├ Прибыль сегодня: <code>{format_balance(db.get_statistics().get('profit', 0))}</code>\n"
+        f"├ Пользователей: <code>{(await db.get_statistics()).get('total_users', 0)}</code>\n"
+        f"├ Онлайн: <code>{await db.get_active_users_count(1)}</code>\n"
+        f"├ Ставок сегодня: <code>{(await db.get_statistics()).get('total_bets', 0)}</code>\n"
+        f"├ Прибыль сегодня: <code>{format_balance((await db.get_statistics()).get('profit', 0))}</code>\n"
         f"└ Баланс системы: <code>{format_balance(0)}</code>\n\n"
         
         f"⚡ <b>Выберите раздел для управления:</b>"
@@ -3722,33 +4692,40 @@ async def callback_admin_stats_project(callback: CallbackQuery):
         return
     
     # Получаем статистику
-    today_stats = db.get_statistics()
-    fake_settings = db.get_fake_games_settings()
+    today_stats = await db.get_statistics()
+    overall = await db.get_overall_statistics()
+    recent = await db.get_recent_bet_stats(24)
+    fake_settings = await db.get_fake_games_settings()
+    users_stats = overall.get('users', {})
+    bets_stats = overall.get('bets', {})
+    totals = overall.get('overall', {})
     
     stats_text = (
         f"📊 <b>Статистика проекта {NAME_CASINO}</b>\n\n"
         
         f"👥 <b>Пользователи:</b>\n"
-        f"├ Всего: <code>{today_stats.get('total_users', 0)}</code>\n"
-        f"├ Активных сегодня: <code>{today_stats.get('active_users', 0)}</code>\n"
+        f"├ Всего: <code>{users_stats.get('total_users', 0)}</code>\n"
+        f"├ Активных сегодня: <code>{totals.get('active_today', 0)}</code>\n"
         f"├ Новых сегодня: <code>{today_stats.get('new_users', 0)}</code>\n"
-        f"├ Активных за неделю: <code>{db.get_active_users_count(7)}</code>\n"
-        f"└ Активных за месяц: <code>{db.get_active_users_count(30)}</code>\n\n"
+        f"├ Активных за неделю: <code>{totals.get('active_week', 0)}</code>\n"
+        f"└ Активных за месяц: <code>{totals.get('active_month', 0)}</code>\n\n"
         
         f"💰 <b>Финансы:</b>\n"
-        f"├ Общий баланс: <code>{format_balance(0)}</code>\n"
-        f"├ Всего депозитов: <code>{format_balance(today_stats.get('total_deposit_amount', 0))}</code>\n"
-        f"├ Всего выводов: <code>{format_balance(today_stats.get('total_withdraw_amount', 0))}</code>\n"
-        f"├ Прибыль системы: <code>{format_balance(0)}</code>\n"
-        f"└ Прибыль от игр: <code>{format_balance(today_stats.get('profit', 0))}</code>\n\n"
+        f"├ Общий баланс: <code>{format_balance(users_stats.get('total_balance', 0))}</code>\n"
+        f"├ Всего депозитов: <code>{format_balance(overall.get('deposits', {}).get('total_deposit_amount_all', 0))}</code>\n"
+        f"├ Всего выводов: <code>{format_balance(overall.get('withdrawals', {}).get('total_withdraw_amount_all', 0))}</code>\n"
+        f"├ Прибыль системы: <code>{format_balance(totals.get('total_profit', 0))}</code>\n"
+        f"└ Прибыль от игр: <code>{format_balance(totals.get('game_profit', 0))}</code>\n\n"
         
         f"🎮 <b>Статистика игр:</b>\n"
-        f"├ Всего ставок: <code>{today_stats.get('total_bets', 0)}</code>\n"
-        f"├ Общая сумма ставок: <code>{format_balance(today_stats.get('total_bet_amount', 0))}</code>\n"
-        f"├ Выигрышей: <code>{today_stats.get('winning_bets', 0)}</code>\n"
-        f"├ Проигрышей: <code>{today_stats.get('losing_bets', 0)}</code>\n"
-        f"├ Выиграно: <code>{format_balance(today_stats.get('total_win_amount', 0))}</code>\n"
-        f"└ Проиграно: <code>{format_balance(today_stats.get('total_loss_amount', 0))}</code>\n\n"
+        f"├ Всего ставок: <code>{bets_stats.get('total_bets_all', 0)}</code>\n"
+        f"├ Общая сумма ставок: <code>{format_balance(bets_stats.get('total_bet_amount_all', 0))}</code>\n"
+        f"├ Выигрышей: <code>{bets_stats.get('total_wins_all', 0)}</code>\n"
+        f"├ Проигрышей: <code>{bets_stats.get('total_losses_all', 0)}</code>\n"
+        f"├ Выиграно: <code>{format_balance(bets_stats.get('total_win_amount_all', 0))}</code>\n"
+        f"├ Проиграно: <code>{format_balance(bets_stats.get('total_loss_amount_all', 0))}</code>\n"
+        f"└ За 24 часа: <code>{int(recent.get('bets', 0))}</code> ставок на "
+        f"<code>{format_balance(recent.get('bet_amount', 0))}</code>\n\n"
         
         f"📅 <b>Статистика за сегодня ({datetime.datetime.now().strftime('%d.%m.%Y')}):</b>\n"
         f"├ Пользователей: <code>{today_stats.get('total_users', 0)}</code>\n"
@@ -3793,14 +4770,16 @@ async def callback_admin_users(callback: CallbackQuery):
         await callback.answer("❌ Доступ запрещен")
         return
     
+    user_counts = await db.get_user_counts()
+    
     users_text = (
         f"👤 <b>Управление пользователями</b>\n\n"
         
         f"📊 <b>Статистика:</b>\n"
-        f"├ Всего пользователей: <code>{db.get_statistics().get('total_users', 0)}</code>\n"
-        f"├ Заблокированных: <code>{len([u for u in db.get_all_users(1000) if u.get('is_blocked')])}</code>\n"
-        f"├ VIP пользователей: <code>{len([u for u in db.get_all_users(1000) if u.get('vip_level') != 'STANDARD'])}</code>\n"
-        f"└ KYC верифицированных: <code>{len([u for u in db.get_all_users(1000) if u.get('kyc_verified')])}</code>\n\n"
+        f"├ Всего пользователей: <code>{(await db.get_statistics()).get('total_users', 0)}</code>\n"
+        f"├ Заблокированных: <code>{user_counts['blocked']}</code>\n"
+        f"├ VIP пользователей: <code>{user_counts['vip']}</code>\n"
+        f"└ KYC верифицированных: <code>{user_counts['kyc']}</code>\n\n"
         
         f"⚡ <b>Выберите действие:</b>"
     )
@@ -3808,6 +4787,50 @@ async def callback_admin_users(callback: CallbackQuery):
     await edit_message_with_photo(callback, 'admin', users_text, get_admin_users_keyboard())
     await callback.answer()
 
+USER_SORT_NAMES = {'new': '🆕 Новые', 'balance': '💰 Баланс', 'bets': '🎲 Ставки', 'id': '🔢 ID'}
+
+@dp.callback_query_handler(lambda c: c.data.startswith('ul_') and '_page_' in c.data)
+async def callback_admin_users_list(callback: CallbackQuery):
+    """Список пользователей по страницам (ul_{сортировка}_page_{N}_{курсор})"""
+    user_id = callback.from_user.id
+    
+    if user_id not in ADMIN:
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    sort = callback.data[len('ul_'):callback.data.index('_page_')]
+    if sort not in Database.USER_SORTS:
+        await callback.answer("❌ Неизвестная сортировка")
+        return
+    prefix = f'ul_{sort}'
+    page_number, cursor = parse_page_callback(callback.data, prefix)
+    
+    page = await db.get_users_page(sort, cursor, PAGE_SIZE)
+    total_pages = max(1, -(-page['total'] // PAGE_SIZE))
+    
+    lines = [
+        f"{'🚫' if user.get('is_blocked') else '👤'} <code>{user['user_id']}</code> "
+        f"{html.escape('@' + user['username'] if user.get('username') else user.get('first_name') or '')} - "
+        f"{format_balance(user.get('balance', 0))}, ставок на {format_balance(user.get('total_bet_amount', 0))}"
+        for user in page['items']
+    ]
+    
+    list_text = (
+        f"📋 <b>Пользователи</b> ({USER_SORT_NAMES[sort]})\n"
+        f"Всего: <code>{page['total']}</code>\n\n"
+        + ("\n".join(lines) or "Нет пользователей")
+    )
+    
+    keyboard = get_pagination_keyboard(page_number, total_pages, prefix, page)
+    keyboard.row(*[
+        InlineKeyboardButton(('• ' if name == sort else '') + title, callback_data=f'ul_{name}_page_1')
+        for name, title in USER_SORT_NAMES.items()
+    ])
+    keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data='admin_users'))
+    
+    await edit_message_with_photo(callback, 'admin', list_text, keyboard)
+    await callback.answer()
+
 @dp.callback_query_handler(lambda c: c.data == 'admin_promos')
 async def callback_admin_promos(callback: CallbackQuery):
     """Управление промокодами"""
@@ -3817,7 +4840,7 @@ async def callback_admin_promos(callback: CallbackQuery):
         await callback.answer("❌ Доступ запрещен")
         return
     
-    promos = db.get_promo_codes(is_active=True)
+    promos = await db.get_promo_codes(is_active=True)
     
     promos_text = (
         f"🎁 <b>Управление промокодами</b>\n\n"
@@ -3843,7 +4866,7 @@ async def callback_admin_balance(callback: CallbackQuery):
         await callback.answer("❌ Доступ запрещен")
         return
     
-    users = db.get_all_users(limit=100)
+    users = await db.get_all_users(limit=100)
     total_balance = sum(user.get('balance', 0) for user in users)
     
     balance_text = (
@@ -3867,6 +4890,221 @@ async def callback_admin_balance(callback: CallbackQuery):
     await edit_message_with_photo(callback, 'add_balance', balance_text, get_admin_balance_keyboard())
     await callback.answer()
 
+@dp.callback_query_handler(lambda c: c.data == 'admin_tech')
+async def callback_admin_tech(callback: CallbackQuery):
+    """Технические операции"""
+    user_id = callback.from_user.id
+    
+    if user_id not in ADMIN:
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    tech_text = (
+        f"🧹 <b>Технические операции</b>\n\n"
+        f"⚡ <b>Выберите действие:</b>"
+    )
+    
+    await edit_message_with_photo(callback, 'stats', tech_text, get_admin_tech_keyboard())
+    await callback.answer()
+
+@dp.callback_query_handler(lambda c: c.data == 'admin_health_check')
+async def callback_admin_health_check(callback: CallbackQuery):
+    """Состояние системы: метрики блокировок и очередей"""
+    user_id = callback.from_user.id
+    
+    if user_id not in ADMIN:
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    lock_stats = db.user_locks.get_stats()
+    cache_stats = db.user_cache.get_stats()
+    asset_stats = db.asset_cache.get_stats()
+    screen_stats = screens.get_stats()
+    queue_stats = send_queue.get_stats()
+    publisher_stats = channel_publisher.get_stats()
+    pending_posts = await db.count_channel_posts()
+    retention_run = retention_engine.last_run
+    crypto_stats = crypto.get_metrics() if crypto else None
+    crypto_endpoints = "\n".join(
+        f"├ {endpoint}: {stats['requests']} запр., ошибок {stats['error_rate']:.1f}%, "
+        f"p50 {stats['p50']:.0f} мс, p95 {stats['p95']:.0f} мс"
+        for endpoint, stats in crypto_stats['endpoints'].items() if stats['p50'] is not None
+    ) if crypto_stats else ""
+    crypto_text = (
+        f"├ Выключатель: <code>{crypto_stats['breaker']}</code> "
+        f"(сбоев подряд {crypto_stats['breaker_failures']}, срабатываний {crypto_stats['breaker_opened']})\n"
+        f"{crypto_endpoints or '├ Нет запросов'}\n"
+        f"└ Отклонено выключателем: <code>{sum(s['rejected'] for s in crypto_stats['endpoints'].values())}</code>"
+    ) if crypto_stats else "└ API ключ не указан"
+    cryptopay_stats = cryptopay_handler.get_stats()
+    queue_waits = "\n".join(
+        f"├ {name}: p50 {wait['p50'] * 1000:.0f} мс, p95 {wait['p95'] * 1000:.0f} мс, макс. {wait['max'] * 1000:.0f} мс"
+        for name, wait in queue_stats['wait'].items()
+    ) or "├ Нет данных"
+    hottest = "\n".join(
+        f"├ #{stripe['stripe']}: {stripe['acquisitions']} захв., "
+        f"ожидание {stripe['wait_total_ms']:.1f} мс (макс. {stripe['wait_max_ms']:.1f} мс)"
+        for stripe in lock_stats['hottest']
+    ) or "├ Нет данных"
+    
+    health_text = (
+        f"📊 <b>Состояние системы</b>\n\n"
+        
+        f"🔒 <b>Блокировки балансов:</b>\n"
+        f"├ Полос: <code>{lock_stats['stripes']}</code>\n"
+        f"├ Захватов: <code>{lock_stats['acquisitions']}</code>\n"
+        f"├ С ожиданием: <code>{lock_stats['contended']}</code>\n"
+        f"├ Среднее ожидание: <code>{lock_stats['wait_avg_ms']:.2f} мс</code>\n"
+        f"└ Максимальное ожидание: <code>{lock_stats['wait_max_ms']:.2f} мс</code>\n\n"
+        
+        f"👤 <b>Кэш пользователей:</b>\n"
+        f"├ Записей: <code>{cache_stats['size']}/{cache_stats['max_size']}</code>\n"
+        f"├ Попаданий: <code>{cache_stats['hits']}</code>\n"
+        f"├ Промахов: <code>{cache_stats['misses']}</code>\n"
+        f"└ Hit rate: <code>{cache_stats['hit_rate']:.1f}%</code>\n\n"
+        
+        f"🖼 <b>Картинки (file_id):</b>\n"
+        f"├ С file_id: <code>{asset_stats['cached']}/{asset_stats['assets']}</code>\n"
+        f"├ Отправок по file_id: <code>{asset_stats['hits']}</code>\n"
+        f"└ Загрузок файлов: <code>{asset_stats['uploads']}</code>\n\n"
+        
+        f"🖥 <b>Правки экранов:</b>\n"
+        f"├ Пропущено без изменений: <code>{screen_stats['skipped']}</code>\n"
+        f"├ Только подпись: <code>{screen_stats['caption_edits']}</code>\n"
+        f"├ Замена картинки: <code>{screen_stats['media_edits']}</code>\n"
+        f"├ Текст: <code>{screen_stats['text_edits']}</code>\n"
+        f"└ Удаление и отправка заново: <code>{screen_stats['resends']}</code>\n\n"
+        
+        f"📤 <b>Очередь отправки:</b>\n"
+        f"├ В очереди: <code>{queue_stats['depth']}</code> (макс. {queue_stats['max_depth']})\n"
+        f"├ Игроки/канал/логи: <code>{queue_stats['depth_by_priority']['user']}/"
+        f"{queue_stats['depth_by_priority']['channel']}/{queue_stats['depth_by_priority']['log']}</code>\n"
+        f"{queue_waits}\n"
+        f"├ Отправлено: <code>{queue_stats['sent']}</code>, ошибок: <code>{queue_stats['failed']}</code>\n"
+        f"└ RetryAfter: <code>{queue_stats['retry_after']}</code>, повторов: <code>{queue_stats['retries']}</code>\n\n"
+        
+        f"📢 <b>Публикация в канал:</b>\n"
+        f"├ Ожидают отправки: <code>{pending_posts}</code>\n"
+        f"├ Опубликовано: <code>{publisher_stats['published']}</code>\n"
+        f"├ Ошибок: <code>{publisher_stats['failed']}</code>\n"
+        f"└ Снято после повторов: <code>{publisher_stats['dropped']}</code>\n\n"
+        
+        f"🔌 <b>CryptoBot API:</b>\n"
+        f"{crypto_text}\n\n"
+        
+        f"📥 <b>Webhook пополнений:</b>\n"
+        f"├ Получено: <code>{cryptopay_stats['received']}</code>, зачислено: <code>{cryptopay_stats['credited']}</code>\n"
+        f"├ Повторов: <code>{cryptopay_stats['duplicates']}</code>, ошибок: <code>{cryptopay_stats['errors']}</code>\n"
+        f"└ Неверная подпись: <code>{cryptopay_stats['rejected']}</code>\n\n"
+        
+        f"🧹 <b>Очистка данных:</b>\n"
+        f"├ Последняя: {html.escape(RetentionEngine.format_summary(retention_run)) if retention_run else 'еще не запускалась'}\n"
+        f"└ Архивов: <code>{len(archive_files())}</code>{' (идет очистка)' if retention_engine.running else ''}\n\n"
+        
+        f"🔥 <b>Самые нагруженные полосы:</b>\n"
+        f"{hottest}\n\n"
+        
+        f"🔄 <b>Обновлено:</b> {datetime.datetime.now().strftime('%H:%M:%S')}"
+    )
+    
+    await edit_message_with_photo(callback, 'stats', health_text, get_admin_tech_keyboard())
+    await callback.answer()
+
+def format_seconds(seconds: Optional[float]) -> str:
+    """Длительность для админки: 45 с, 12 мин, 3.5 ч"""
+    if seconds is None:
+        return '—'
+    if seconds < 60:
+        return f'{seconds:.0f} с'
+    if seconds < 3600:
+        return f'{seconds / 60:.0f} мин'
+    return f'{seconds / 3600:.1f} ч'
+
+async def format_payouts_status() -> str:
+    """Глубина очереди выплат, задержка и dead-letter"""
+    stats = await payouts.get_stats()
+    text = (
+        f"💸 <b>Очередь выплат</b>\n\n"
+        
+        f"📥 <b>Очередь:</b>\n"
+        f"├ Ожидают: <code>{stats['pending']}</code>\n"
+        f"├ В работе: <code>{stats['processing']}</code>\n"
+        f"├ Dead-letter: <code>{stats['dead']}</code>\n"
+        f"└ Старейшая в очереди: <code>{format_seconds(stats['oldest_pending'])}</code>\n\n"
+        
+        f"⏱ <b>Задержка выплаты (последние {stats['latency_samples']}):</b>\n"
+        f"├ Медиана: <code>{format_seconds(stats['latency_median'])}</code>\n"
+        f"└ p95: <code>{format_seconds(stats['latency_p95'])}</code>\n\n"
+        
+        f"⚙️ <b>С запуска:</b>\n"
+        f"├ Обработчиков: <code>{stats['workers']}</code> {'✅' if stats['running'] else '❌ остановлены'}\n"
+        f"├ Выплачено: <code>{stats['session_completed']}</code>\n"
+        f"├ Из них найдено по spend_id: <code>{stats['session_reconciled']}</code>\n"
+        f"├ Неудачных попыток: <code>{stats['session_failed']}</code>\n"
+        f"└ В dead-letter: <code>{stats['session_dead']}</code>"
+    )
+    
+    dead = await db.get_dead_withdrawals(5)
+    if dead:
+        text += "\n\n❌ <b>Не выплачены:</b>\n" + "\n".join(
+            f"• #{row['id']} <code>{row['user_id']}</code> {format_balance(row['amount'])}: "
+            f"{html.escape(str(row['last_error'] or ''))[:80]}"
+            for row in dead
+        )
+    return text
+
+def get_payouts_keyboard(has_dead: bool) -> InlineKeyboardMarkup:
+    """Клавиатура очереди выплат"""
+    buttons = [[InlineKeyboardButton('🔄 Обновить', callback_data='admin_payouts')]]
+    if has_dead:
+        buttons.append([InlineKeyboardButton('🔁 Повторить неудачные', callback_data='admin_payouts_retry')])
+    buttons.append([InlineKeyboardButton('🔙 Назад', callback_data='admin_tech')])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+@dp.callback_query_handler(lambda c: c.data in ('admin_payouts', 'admin_payouts_retry'))
+async def callback_admin_payouts(callback: CallbackQuery):
+    """Очередь выплат и повтор выплат из dead-letter"""
+    user_id = callback.from_user.id
+    
+    if user_id not in ADMIN:
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    notice = None
+    if callback.data == 'admin_payouts_retry':
+        # Тот же spend_id: уже проведенный перевод CryptoBot не повторит
+        requeued = await payouts.requeue_dead()
+        notice = f"🔁 Возвращено в очередь: {requeued}"
+    
+    text = await format_payouts_status()
+    await edit_message_with_photo(callback, 'admin', text, get_payouts_keyboard(bool(await db.get_dead_withdrawals(1))))
+    await callback.answer(notice)
+
+@dp.callback_query_handler(lambda c: c.data == 'admin_cleanup')
+async def callback_admin_cleanup(callback: CallbackQuery):
+    """Внеплановая очистка старых данных"""
+    user_id = callback.from_user.id
+    
+    if user_id not in ADMIN:
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    if retention_engine.running:
+        await callback.answer("⏳ Очистка уже идет", show_alert=True)
+        return
+    
+    await callback.answer("🧹 Очистка запущена, результат придет сообщением")
+    report = await retention_engine.run()
+    
+    result_text = (
+        f"🧹 <b>Очистка данных завершена</b>\n\n"
+        f"{html.escape(RetentionEngine.format_summary(report))}"
+    )
+    if report['errors']:
+        result_text += "\n\n❌ <b>Ошибки:</b>\n" + "\n".join(html.escape(error) for error in report['errors'])
+    
+    await send_message_with_retry(user_id, result_text, parse_mode=ParseMode.HTML)
+
 @dp.callback_query_handler(lambda c: c.data == 'admin_create_promo')
 async def callback_admin_create_promo(callback: CallbackQuery, state: FSMContext):
     """Создание промокода - начало"""
@@ -3910,7 +5148,7 @@ async def process_admin_create_promo_code(message: Message, state: FSMContext):
         return
     
     # Проверяем существование промокода
-    existing_promo = db.get_promo_code(promo_code)
+    existing_promo = await db.get_promo_code(promo_code)
     if existing_promo:
         await send_photo_message(
             user_id,
@@ -4127,7 +5365,7 @@ async def process_admin_promo_description(message: Message, state: FSMContext):
     expires_at = data.get('promo_expires')
     
     # Создаем промокод
-    success = db.create_promo_code(
+    success = await db.create_promo_code(
         code=promo_code,
         amount=amount,
         max_uses=max_uses,
@@ -4206,7 +5444,7 @@ async def process_admin_user_id_for_balance(message: Message, state: FSMContext)
         return
     
     query = message.text.strip()
-    users = db.search_users(query, limit=5)
+    users = await db.search_users(query, limit=5)
     
     if not users:
         await send_photo_message(
@@ -4292,7 +5530,7 @@ async def process_admin_balance_amount(message: Message, state: FSMContext):
         data = await state.get_data()
         target_user_id = data.get('target_user_id')
         
-        target_user = db.get_user(target_user_id)
+        target_user = await db.get_user(target_user_id)
         current_balance = target_user.get('balance', 0)
         new_balance = current_balance + amount
         
@@ -4343,7 +5581,7 @@ async def process_admin_balance_reason(message: Message, state: FSMContext):
     amount = data.get('balance_amount')
     
     # Получаем информацию о пользователе
-    target_user = db.get_user(target_user_id)
+    target_user = await db.get_user(target_user_id)
     current_balance = target_user.get('balance', 0)
     
     # Пополняем баланс
@@ -4465,6 +5703,148 @@ async def callback_admin_check_balance(callback: CallbackQuery, state: FSMContex
     await state.update_data(action_type='check')
     await callback.answer()
 
+# ==================== РАССЫЛКА ====================
+
+def format_broadcast_status() -> str:
+    """Текст с прогрессом и скоростью рассылки"""
+    stats = broadcaster.get_stats()
+    if not stats:
+        return "📣 <b>Рассылка</b>\n\nРассылок с момента запуска бота не было."
+    
+    status = "🟢 Идет" if stats['running'] else "✅ Завершена"
+    if stats['eta'] is not None:
+        eta = f"~{int(stats['eta'] // 60)} мин {int(stats['eta'] % 60)} сек"
+    else:
+        eta = "—"
+    
+    return (
+        f"📣 <b>Рассылка #{stats['id']}</b>\n\n"
+        f"Статус: {status}\n"
+        f"├ Прогресс: <code>{stats['progress']:.1f}%</code>\n"
+        f"├ Получателей: <code>{stats['total']}</code>\n"
+        f"├ Отправлено: <code>{stats['sent']}</code>\n"
+        f"├ Бот заблокирован/аккаунт удален: <code>{stats['unreachable']}</code>\n"
+        f"├ Ошибок: <code>{stats['failed']}</code>\n"
+        f"├ Скорость: <code>{stats['rate']:.1f} сообщ/сек</code> (средняя {stats['avg_rate']:.1f})\n"
+        f"└ Осталось: <code>{eta}</code>\n\n"
+        f"🔄 <b>Обновлено:</b> {datetime.datetime.now().strftime('%H:%M:%S')}"
+    )
+
+@dp.callback_query_handler(lambda c: c.data == 'admin_broadcast')
+async def callback_admin_broadcast(callback: CallbackQuery, state: FSMContext):
+    """Рассылка - начало (или статус идущей рассылки)"""
+    user_id = callback.from_user.id
+    
+    if user_id not in ADMIN:
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    if broadcaster.running:
+        await edit_message_with_photo(callback, 'admin', format_broadcast_status(), get_broadcast_keyboard(True))
+        await callback.answer()
+        return
+    
+    recipients = await db.count_broadcast_recipients()
+    await edit_message_with_photo(
+        callback,
+        'admin',
+        f"📣 <b>Рассылка сообщений</b>\n\n"
+        f"👥 Получателей: <code>{recipients}</code>\n\n"
+        f"Отправьте текст сообщения. Форматирование (жирный, ссылки и т.д.) сохранится.",
+        InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton('❌ Отмена', callback_data='broadcast_cancel')]
+        ])
+    )
+    
+    await AdminStates.waiting_for_broadcast_message.set()
+    await callback.answer()
+
+@dp.message_handler(state=AdminStates.waiting_for_broadcast_message)
+async def process_admin_broadcast_message(message: Message, state: FSMContext):
+    """Текст рассылки и подтверждение"""
+    user_id = message.from_user.id
+    
+    if user_id not in ADMIN:
+        await state.finish()
+        return
+    
+    if not message.text:
+        await send_photo_message(
+            user_id,
+            'error',
+            "❌ <b>Рассылка поддерживает только текст</b>\n\nОтправьте текст сообщения:",
+            InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton('❌ Отмена', callback_data='broadcast_cancel')]
+            ])
+        )
+        return
+    
+    await state.update_data(broadcast_text=message.html_text)
+    recipients = await db.count_broadcast_recipients()
+    
+    await send_photo_message(
+        user_id,
+        'admin',
+        f"📣 <b>Предпросмотр рассылки</b>\n\n"
+        f"{message.html_text}\n\n"
+        f"👥 <b>Получателей:</b> <code>{recipients}</code>\n"
+        f"⏱ <b>Примерное время:</b> ~{recipients // max(1, int(broadcaster.rate)) // 60 + 1} мин\n\n"
+        f"Отправить?",
+        get_confirm_keyboard('broadcast_confirm', 'broadcast_cancel')
+    )
+
+@dp.callback_query_handler(lambda c: c.data == 'broadcast_confirm', state=AdminStates.waiting_for_broadcast_message)
+async def callback_broadcast_confirm(callback: CallbackQuery, state: FSMContext):
+    """Запуск рассылки"""
+    user_id = callback.from_user.id
+    data = await state.get_data()
+    await state.finish()
+    
+    if user_id not in ADMIN:
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    if broadcaster.running:
+        await callback.answer("⚠️ Рассылка уже идет", show_alert=True)
+        return
+    
+    broadcast = await db.create_broadcast(data.get('broadcast_text', ''), user_id)
+    if not broadcast:
+        await callback.answer("❌ Не удалось создать рассылку", show_alert=True)
+        return
+    
+    broadcaster.start(broadcast)
+    await edit_message_with_photo(callback, 'admin', format_broadcast_status(), get_broadcast_keyboard(True))
+    await callback.answer("✅ Рассылка запущена")
+
+@dp.callback_query_handler(lambda c: c.data == 'broadcast_cancel', state='*')
+async def callback_broadcast_cancel(callback: CallbackQuery, state: FSMContext):
+    """Отмена создания рассылки"""
+    await callback_back_to_admin(callback, state)
+
+@dp.callback_query_handler(lambda c: c.data == 'broadcast_status')
+async def callback_broadcast_status(callback: CallbackQuery):
+    """Обновление статуса рассылки"""
+    if callback.from_user.id not in ADMIN:
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    await edit_message_with_photo(
+        callback, 'admin', format_broadcast_status(), get_broadcast_keyboard(broadcaster.running)
+    )
+    await callback.answer()
+
+@dp.callback_query_handler(lambda c: c.data == 'broadcast_stop')
+async def callback_broadcast_stop(callback: CallbackQuery):
+    """Остановка рассылки"""
+    if callback.from_user.id not in ADMIN:
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    broadcaster.cancel()
+    await callback.answer("⏹ Рассылка останавливается")
+    await edit_message_with_photo(callback, 'admin', format_broadcast_status(), get_broadcast_keyboard(False))
+
 # Обработка остальных админ функций будет аналогично...
 
 # ==================== ПЛАНИРОВЩИК ЗАДАЧ ====================
@@ -4476,19 +5856,40 @@ async def scheduled_statistics_update():
         
         # Создаем запись на сегодня если ее нет
         today = datetime.datetime.now().strftime('%Y-%m-%d')
-        db.get_statistics(today)
+        await db.get_statistics(today)
         
-        # Очищаем старые данные
-        db.cleanup_old_data(30)
+        # Архивируем и удаляем старые данные порциями
+        await retention_engine.run()
         
         logger.info("✅ Статистика обновлена")
     except Exception as e:
         logger.error(f"❌ Ошибка обновления статистики: {e}")
 
+async def scheduled_log_flush():
+    """Запись буфера логов по таймеру"""
+    try:
+        await db.flush_logs()
+    except Exception as e:
+        logger.error(f"❌ Ошибка записи буфера логов: {e}")
+
+async def scheduled_rollup_refresh():
+    """Досчет почасовых и суточных итогов ставок"""
+    try:
+        await db.refresh_rollups()
+    except Exception as e:
+        logger.error(f"❌ Ошибка обновления итогов статистики: {e}")
+
+async def scheduled_deposit_reconcile():
+    """Сверка ожидающих пополнений с getInvoices (потерянные webhook, просроченные счета)"""
+    try:
+        await reconcile(db, crypto, on_invoice_paid)
+    except Exception as e:
+        logger.error(f"❌ Ошибка сверки пополнений: {e}")
+
 async def scheduled_fake_games():
     """Запуск фейк игр по расписанию"""
     try:
-        settings = db.get_fake_games_settings()
+        settings = await db.get_fake_games_settings()
         
         if not settings.get('enabled'):
             return
@@ -4507,7 +5908,7 @@ async def scheduled_fake_games():
         interval = random.randint(min_interval, max_interval)
         
         # Обновляем время последнего запуска
-        db.update_fake_games_settings(last_run=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        await db.update_fake_games_settings(last_run=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
         
         # Ждем перед следующей фейк игрой
         await asyncio.sleep(interval)
@@ -4521,7 +5922,7 @@ async def scheduled_fake_games():
 async def run_fake_game():
     """Запуск одной фейк игры"""
     try:
-        settings = db.get_fake_games_settings()
+        settings = await db.get_fake_games_settings()
         
         if not settings.get('enabled'):
             return
@@ -4596,7 +5997,7 @@ async def run_fake_game():
         )
         
         # Записываем в статистику
-        db.add_fake_game_stat(bet_amount, win_amount, 'win' if win else 'lose')
+        await db.add_fake_game_stat(bet_amount, win_amount, 'win' if win else 'lose')
         
         logger.info(f"✅ Фейк игра запущена: {fake_name} - {game_name} - {'Выигрыш' if win else 'Проигрыш'}")
         
@@ -4607,6 +6008,7 @@ async def run_fake_game():
 
 async def on_startup(dp: Dispatcher):
     """Действия при запуске бота"""
+    global cryptopay_runner
     try:
         # Проверяем токен бота
         me = await bot.get_me()
@@ -4639,16 +6041,61 @@ async def on_startup(dp: Dispatcher):
                 id='fake_games'
             )
             
+            # Запись буфера логов, даже если новых действий нет
+            scheduler.add_job(
+                scheduled_log_flush,
+                IntervalTrigger(seconds=LOG_FLUSH_INTERVAL),
+                id='log_flush'
+            )
+            
+            # Почасовые и суточные итоги ставок
+            scheduler.add_job(
+                scheduled_rollup_refresh,
+                IntervalTrigger(seconds=ROLLUP_REFRESH_INTERVAL),
+                id='rollup_refresh'
+            )
+            
+            # Пополнения, webhook которых не дошел, и просроченные счета
+            if crypto:
+                scheduler.add_job(
+                    scheduled_deposit_reconcile,
+                    IntervalTrigger(seconds=CRYPTOPAY_RECONCILE_INTERVAL),
+                    id='deposit_reconcile'
+                )
+            
             logger.info("✅ Планировщик задач запущен")
         
+        # Посты ставок, не отправленные до перезапуска, уйдут первыми
+        channel_publisher.start()
+        
+        # Выплаты из очереди, включая прерванные перезапуском
+        if crypto:
+            await payouts.start()
+        else:
+            logger.warning("⚠️ CryptoBot API ключ не указан, выплаты копятся в очереди")
+        
+        # В режиме webhook маршрут Crypto Pay уже в create_web_app()
+        if crypto and CRYPTOPAY_WEBHOOK and BOT_MODE != 'webhook':
+            cryptopay_runner = web.AppRunner(create_web_app())
+            await cryptopay_runner.setup()
+            await web.TCPSite(cryptopay_runner, WEBAPP_HOST, WEBAPP_PORT).start()
+            logger.info(f"🌐 Webhook Crypto Pay: {WEBAPP_HOST}:{WEBAPP_PORT}{CRYPTOPAY_WEBHOOK_PATH}")
+        
+        # Продолжаем рассылку, прерванную перезапуском
+        interrupted = await db.get_running_broadcast()
+        if interrupted:
+            broadcaster.start(interrupted)
+        
+        total_users = (await db.get_statistics()).get('total_users', 0)
+        
         # Отправляем сообщение о запуске
         startup_text = (
             f"🚀 <b>Бот {NAME_CASINO} успешно запущен!</b>\n\n"
             f"🤖 <b>Бот:</b> @{me.username}\n"
             f"👑 <b>Админы:</b> {len(ADMIN)}\n"
-            f"👥 <b>Пользователей в БД:</b> {db.get_statistics().get('total_users', 0)}\n"
+            f"👥 <b>Пользователей в БД:</b> {total_users}\n"
             f"💰 <b>Общий баланс:</b> {format_balance(0)}\n"
-            f"🎮 <b>Фейк игры:</b> {'✅ Включены' if db.get_fake_games_settings().get('enabled') else '❌ Выключены'}\n\n"
+            f"🎮 <b>Фейк игры:</b> {'✅ Включены' if (await db.get_fake_games_settings()).get('enabled') else '❌ Выключены'}\n\n"
             f"🔄 <b>Время запуска:</b> {datetime.datetime.now().strftime('%d.%m.%Y %H:%M:%S')}"
         )
         
@@ -4665,9 +6112,9 @@ async def on_startup(dp: Dispatcher):
         print(f"{'='*60}")
         print(f"🤖 Бот: @{me.username}")
         print(f"👑 Админы: {len(ADMIN)}")
-        print(f"👥 Пользователей: {db.get_statistics().get('total_users', 0)}")
+        print(f"👥 Пользователей: {total_users}")
         print(f"💰 Минимальная ставка: {MIN_STAVKA}$")
-        print(f"🎮 Фейк игры: {'ВКЛ' if db.get_fake_games_settings().get('enabled') else 'ВЫКЛ'}")
+        print(f"🎮 Фейк игры: {'ВКЛ' if (await db.get_fake_games_settings()).get('enabled') else 'ВЫКЛ'}")
         print(f"🔄 Версия: AIOGRAM 2.25.1")
         print(f"⏰ Время: {datetime.datetime.now().strftime('%d.%m.%Y %H:%M:%S')}")
         print(f"{'='*60}")
@@ -4690,8 +6137,24 @@ async def on_shutdown(dp: Dispatcher):
             scheduler.shutdown()
             logger.info("✅ Планировщик остановлен")
         
-        db.connection.commit()
-        db.close()
+        # Текущая пачка постов в канал и страница рассылки; остальное - после запуска
+        await broadcaster.close(SEND_DRAIN_TIMEOUT)
+        await channel_publisher.close(SEND_DRAIN_TIMEOUT)
+        
+        # Текущие выплаты; остальные и прерванные - после запуска с тем же spend_id
+        await payouts.close(SEND_DRAIN_TIMEOUT)
+        if cryptopay_runner:
+            await cryptopay_runner.cleanup()
+        if crypto:
+            await crypto.close()
+        
+        # Собираем статистику до закрытия БД
+        total_users = (await db.get_statistics()).get('total_users', 0)
+        online_users = await db.get_active_users_count(1)
+        
+        # Записываем буфер логов до закрытия соединения
+        await db.flush_logs()
+        await db.close()
         logger.info("✅ База данных сохранена и закрыта")
         
         # Отправляем сообщение о выключении
@@ -4699,8 +6162,8 @@ async def on_shutdown(dp: Dispatcher):
             f"🛑 <b>Бот {NAME_CASINO} завершает работу</b>\n\n"
             f"⏰ <b>Время:</b> {datetime.datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n"
             f"📊 <b>Статистика:</b>\n"
-            f"├ Пользователей: {db.get_statistics().get('total_users', 0)}\n"
-            f"├ Онлайн: {db.get_active_users_count(1)}\n"
+            f"├ Пользователей: {total_users}\n"
+            f"├ Онлайн: {online_users}\n"
             f"└ Сессия: {datetime.datetime.now().strftime('%H:%M:%S')}\n\n"
             f"🔧 <b>Технические работы</b>"
         )
@@ -4711,6 +6174,9 @@ async def on_shutdown(dp: Dispatcher):
             except:
                 pass
         
+        if not await send_queue.close(SEND_DRAIN_TIMEOUT):
+            logger.warning(f"⚠️ Не отправлено сообщений из очереди: {send_queue.depth}")
+        
         await dp.storage.close()
         await dp.storage.wait_closed()
         await bot.close()
@@ -4718,7 +6184,7 @@ async def on_shutdown(dp: Dispatcher):
         print(f"\n{'='*60}")
         print(f"🛑 {NAME_CASINO} завершает работу")
         print(f"⏰ Время: {datetime.datetime.now().strftime('%d.%m.%Y %H:%M:%S')}")
-        print(f"👥 Пользователей: {db.get_statistics().get('total_users', 0)}")
+        print(f"👥 Пользователей: {total_users}")
         print(f"{'='*60}")
         
         logger.info("✅ Бот успешно завершил работу")
@@ -4726,12 +6192,99 @@ async def on_shutdown(dp: Dispatcher):
     except Exception as e:
         logger.error(f"❌ Ошибка при завершении работы: {e}")
 
+# ==================== РЕЖИМ WEBHOOK ====================
+
+webhook_state = {'started_at': None, 'draining': False}
+
+
+async def health_handler(request: web.Request) -> web.Response:
+    """Проверка живости для балансировщика: 503 во время остановки"""
+    status = 503 if webhook_state['draining'] else 200
+    uptime = time.monotonic() - webhook_state['started_at'] if webhook_state['started_at'] else 0
+    return web.json_response({
+        'status': 'draining' if webhook_state['draining'] else 'ok',
+        'mode': BOT_MODE,
+        'uptime': round(uptime, 1),
+        'in_flight': in_flight.in_flight,
+        'processed': in_flight.processed
+    }, status=status)
+
+
+@web.middleware
+async def webhook_secret_middleware(request: web.Request, handler):
+    """Отклонение запросов на webhook без секретного заголовка Telegram"""
+    if WEBHOOK_SECRET and request.path == WEBHOOK_PATH:
+        if request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+            logger.warning(f"⚠️  Запрос на webhook без секрета от {request.remote}")
+            return web.Response(status=403)
+    return await handler(request)
+
+
+async def on_startup_webhook(dp: Dispatcher):
+    """Регистрация webhook в Telegram и обычный запуск"""
+    webhook_url = WEBHOOK_HOST.rstrip('/') + WEBHOOK_PATH
+    webhook_state['started_at'] = time.monotonic()
+    
+    # Апдейты, накопленные за время перезапуска, не выбрасываем
+    params = {'drop_pending_updates': False}
+    if WEBHOOK_SECRET:
+        params['secret_token'] = WEBHOOK_SECRET
+    await bot.set_webhook(webhook_url, **params)
+    logger.info(f"✅ Webhook установлен: {webhook_url}")
+    
+    await on_startup(dp)
+
+
+async def on_shutdown_webhook(dp: Dispatcher):
+    """Остановка без потери апдейтов: дожидаемся обработки, затем закрываем БД"""
+    webhook_state['draining'] = True
+    
+    # Telegram придержит новые апдейты до следующего запуска
+    try:
+        await bot.delete_webhook(drop_pending_updates=False)
+        logger.info("✅ Webhook снят, новые апдейты останутся в очереди Telegram")
+    except Exception as e:
+        logger.error(f"❌ Ошибка снятия webhook: {e}")
+    
+    if not await in_flight.wait_idle(WEBHOOK_DRAIN_TIMEOUT):
+        logger.warning(f"⚠️  Не дождались обработки {in_flight.in_flight} апдейтов за {WEBHOOK_DRAIN_TIMEOUT} сек")
+    
+    await on_shutdown(dp)
+
+
+def create_web_app() -> web.Application:
+    """aiohttp приложение: webhook Telegram, webhook Crypto Pay и проверка живости"""
+    app = web.Application(middlewares=[webhook_secret_middleware])
+    app.router.add_get(HEALTH_PATH, health_handler)
+    if CRYPTOPAY_WEBHOOK and api_cryptobot:
+        cryptopay_handler.register(app, CRYPTOPAY_WEBHOOK_PATH)
+    return app
+
+
+def start_webhook():
+    """Запуск aiohttp сервера, принимающего апдейты от Telegram"""
+    logger.info(f"🌐 Webhook сервер: {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+    webhook_executor = executor.set_webhook(
+        dispatcher=dp,
+        webhook_path=WEBHOOK_PATH,
+        on_startup=on_startup_webhook,
+        on_shutdown=on_shutdown_webhook,
+        skip_updates=False,
+        web_app=create_web_app()
+    )
+    # shutdown_timeout: сколько aiohttp ждет незавершенные запросы перед on_shutdown
+    webhook_executor.run_app(host=WEBAPP_HOST, port=WEBAPP_PORT, shutdown_timeout=WEBHOOK_DRAIN_TIMEOUT)
+
 # ==================== ЗАПУСК ОСНОВНОГО ЦИКЛА ====================
 
 def main():
     """Основная функция запуска бота"""
     try:
-        logger.info(f"🚀 Запуск {NAME_CASINO}...")
+        logger.info(f"🚀 Запуск {NAME_CASINO} (режим: {BOT_MODE})...")
+        
+        if BOT_MODE == 'webhook':
+            start_webhook()
+            return
         
         # Запускаем бота
         executor.start_polling(
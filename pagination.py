@@ -0,0 +1,142 @@
+# pagination.py
+import base64
+import calendar
+import datetime
+import re
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    from config import PAGE_SIZE, PAGINATION_COUNT_TTL
+except ImportError:
+    PAGE_SIZE = 10
+    PAGINATION_COUNT_TTL = 60
+
+FORWARD = 'n'
+BACKWARD = 'p'
+
+_TIMESTAMP = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$')
+_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def _base36(number: int) -> str:
+    sign, number = ('-', -number) if number < 0 else ('', number)
+    digits = ''
+    while True:
+        number, rest = divmod(number, 36)
+        digits = _DIGITS[rest] + digits
+        if not number:
+            return sign + digits
+
+
+def _pack_value(value) -> str:
+    # Метки времени и целые - в base36: callback_data ограничена 64 байтами
+    if isinstance(value, str) and _TIMESTAMP.match(value):
+        epoch = calendar.timegm(datetime.datetime.strptime(value, '%Y-%m-%d %H:%M:%S').timetuple())
+        return 't' + _base36(epoch)
+    if isinstance(value, bool) or value is None:
+        raise ValueError(f'Неподдерживаемое значение курсора: {value!r}')
+    if isinstance(value, int):
+        return 'i' + _base36(value)
+    if isinstance(value, float):
+        return 'f' + repr(value)
+    return 's' + str(value)
+
+
+def _unpack_value(packed: str):
+    kind, raw = packed[:1], packed[1:]
+    if kind == 't':
+        moment = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=int(raw, 36))
+        return moment.strftime('%Y-%m-%d %H:%M:%S')
+    if kind == 'i':
+        return int(raw, 36)
+    if kind == 'f':
+        return float(raw)
+    if kind == 's':
+        return raw
+    raise ValueError(f'Неизвестный тип значения курсора: {kind!r}')
+
+
+def encode_cursor(direction: str, value, row_id: int) -> str:
+    """Непрозрачный курсор для callback_data: направление, ключ сортировки и id строки"""
+    raw = f'{direction}{_pack_value(value)}|{_base36(row_id)}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> Tuple[str, object, int]:
+    """(направление, значение, id); ValueError для испорченного курсора"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        direction, rest = raw[:1], raw[1:]
+        packed, row_id = rest.rsplit('|', 1)
+        if direction not in (FORWARD, BACKWARD):
+            raise ValueError(direction)
+        return direction, _unpack_value(packed), int(row_id, 36)
+    except Exception as e:
+        raise ValueError(f'Некорректный курсор: {token!r}') from e
+
+
+def keyset_page(fetch: Callable[[str, str, List, int], List[Dict]], column: str, id_column: str,
+                descending: bool, cursor: Optional[str], limit: int = PAGE_SIZE) -> Dict:
+    """Страница по ключу (column, id_column) вместо OFFSET
+
+    fetch(условие, ORDER BY, параметры, лимит) выполняет запрос и возвращает
+    строки. Стоимость страницы - поиск по индексу и limit строк, независимо
+    от номера страницы. Возвращает items и курсоры prev/next (None - края).
+    """
+    direction, params = FORWARD, []
+    condition = '1=1'
+    if cursor:
+        direction, value, row_id = decode_cursor(cursor)
+        # Вперед по убыванию - к меньшим ключам; назад - наоборот
+        smaller = (direction == FORWARD) == descending
+        condition = f"({column}, {id_column}) {'<' if smaller else '>'} (?, ?)"
+        params = [value, row_id]
+
+    # Назад читаем в обратном порядке от первой строки страницы и переворачиваем
+    reverse = direction == BACKWARD
+    order = 'DESC' if descending != reverse else 'ASC'
+    rows = fetch(condition, f'{column} {order}, {id_column} {order}', params, limit + 1)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if reverse:
+        rows.reverse()
+
+    page = {'items': rows, 'prev': None, 'next': None}
+    if rows:
+        first, last = rows[0], rows[-1]
+        if has_more if reverse else cursor is not None:
+            page['prev'] = encode_cursor(BACKWARD, first[column], first[id_column])
+        if reverse or has_more:
+            page['next'] = encode_cursor(FORWARD, last[column], last[id_column])
+    return page
+
+
+class CountCache:
+    """Итоговые количества для «страница N из M» с временем жизни
+
+    COUNT(*) по большой выборке дорог, а точное значение для подписи к
+    пагинации не нужно. Используется из потока БД.
+    """
+
+    def __init__(self, ttl: float = PAGINATION_COUNT_TTL):
+        self.ttl = ttl
+        self._values: Dict[tuple, Tuple[int, float]] = {}
+
+    def get(self, key: tuple, count: Callable[[], int]) -> int:
+        now = time.monotonic()
+        cached = self._values.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+        value = count()
+        self._values[key] = (value, now + self.ttl)
+        if len(self._values) > 10000:
+            self._values = {k: v for k, v in self._values.items() if v[1] > now}
+        return value
+
+    def invalidate(self, key: tuple = None):
+        if key is None:
+            self._values.clear()
+        else:
+            self._values.pop(key, None)
@@ -0,0 +1,341 @@
+# payout_outbox.py
+import asyncio
+import logging
+import random
+import statistics
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import (PAYOUT_WORKERS, PAYOUT_POLL_INTERVAL, PAYOUT_MAX_ATTEMPTS, PAYOUT_BACKOFF_BASE,
+                        PAYOUT_BACKOFF_MAX)
+except ImportError:
+    PAYOUT_WORKERS = 3
+    PAYOUT_POLL_INTERVAL = 5.0
+    PAYOUT_MAX_ATTEMPTS = 8
+    PAYOUT_BACKOFF_BASE = 5.0
+    PAYOUT_BACKOFF_MAX = 600.0
+
+# Колонки withdrawals для очереди выплат (добавляются в migrate_schema)
+OUTBOX_COLUMNS = [
+    # Ключ идемпотентности CryptoBot: один на строку, не меняется между попытками
+    ('spend_id', 'TEXT'),
+    ('attempts', 'INTEGER DEFAULT 0'),
+    ('next_attempt_at', 'TIMESTAMP'),
+    ('last_error', 'TEXT')
+]
+
+OUTBOX_INDEXES = [
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_withdrawals_spend_id ON withdrawals(spend_id)',
+    'CREATE INDEX IF NOT EXISTS idx_withdrawals_status ON withdrawals(status, id)',
+    'CREATE INDEX IF NOT EXISTS idx_withdrawals_user_status ON withdrawals(user_id, status, id)'
+]
+
+# Старейшая готовая выплата пользователя, у которого нет более ранней
+# выплаты в очереди или в работе - порядок выплат одного пользователя
+SELECT_DUE_SQL = '''
+    SELECT w.* FROM withdrawals AS w
+    WHERE w.status = 'pending'
+      AND (w.next_attempt_at IS NULL OR w.next_attempt_at <= CURRENT_TIMESTAMP)
+      AND NOT EXISTS (
+          SELECT 1 FROM withdrawals AS earlier
+          WHERE earlier.user_id = w.user_id AND earlier.status IN ('pending', 'processing') AND earlier.id < w.id
+      )
+    ORDER BY w.id
+    LIMIT 1
+'''
+
+# Колонка с ID перевода CryptoBot
+TRANSFER_ID_COLUMN = 'tx_hash'
+
+
+def spend_id_for(withdrawal_id: int) -> str:
+    return f'withdraw-{withdrawal_id}'
+
+
+# ==================== ШАГИ ОЧЕРЕДИ (ВЫПОЛНЯЮТСЯ В ПОТОКЕ БД) ====================
+
+def install(connection):
+    for statement in OUTBOX_INDEXES:
+        connection.execute(statement)
+    # Выплаты, созданные до очереди, получают свой spend_id
+    connection.execute("UPDATE withdrawals SET spend_id = 'withdraw-' || id WHERE spend_id IS NULL")
+    connection.commit()
+
+
+def enqueue(connection, user_id: int, amount: float, currency: str = 'USDT',
+            wallet_address: str = 'cryptobot') -> Dict:
+    """Списание с баланса и постановка выплаты в очередь одной транзакцией"""
+    cursor = connection.cursor()
+    cursor.execute('''
+        UPDATE users
+        SET balance = balance - ?, total_withdraw = total_withdraw + ?,
+            last_withdraw = CURRENT_TIMESTAMP, last_activity = CURRENT_TIMESTAMP
+        WHERE user_id = ? AND balance >= ?
+    ''', (amount, amount, user_id, amount))
+    if cursor.rowcount == 0:
+        connection.rollback()
+        return {'success': False, 'error': 'Недостаточно средств'}
+
+    new_balance = cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,)).fetchone()['balance']
+
+    cursor.execute('''
+        INSERT INTO withdrawals (user_id, amount, currency, wallet_address, status)
+        VALUES (?, ?, ?, ?, 'pending')
+    ''', (user_id, amount, currency, wallet_address))
+    withdrawal_id = cursor.lastrowid
+    cursor.execute('UPDATE withdrawals SET spend_id = ? WHERE id = ?', (spend_id_for(withdrawal_id), withdrawal_id))
+
+    cursor.execute('''
+        INSERT INTO transactions (user_id, type, amount, balance_before, balance_after, description, reference_id, reference_type)
+        VALUES (?, 'withdraw', ?, ?, ?, ?, ?, 'withdrawal')
+    ''', (user_id, -amount, new_balance + amount, new_balance, f'Вывод #{withdrawal_id}', withdrawal_id))
+    connection.commit()
+    return {'success': True, 'withdrawal_id': withdrawal_id, 'new_balance': new_balance}
+
+
+def recover(connection) -> int:
+    """Выплаты, прерванные остановкой бота, снова в очередь (тот же spend_id)"""
+    count = connection.execute("UPDATE withdrawals SET status = 'pending' WHERE status = 'processing'").rowcount
+    connection.commit()
+    return count
+
+
+def claim(connection) -> Optional[Dict]:
+    """Следующая выплата в работу: status = 'processing', attempts + 1"""
+    row = connection.execute(SELECT_DUE_SQL).fetchone()
+    if row is None:
+        return None
+    connection.execute('''
+        UPDATE withdrawals
+        SET status = 'processing', attempts = attempts + 1, processed_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (row['id'],))
+    connection.commit()
+    claimed = dict(row)
+    claimed['attempts'] += 1
+    return claimed
+
+
+def complete(connection, withdrawal_id: int, transfer_id) -> Optional[float]:
+    """Выплата проведена; возвращает задержку от создания до выплаты в секундах"""
+    connection.execute(f'''
+        UPDATE withdrawals
+        SET status = 'completed', {TRANSFER_ID_COLUMN} = ?, completed_at = CURRENT_TIMESTAMP, last_error = NULL
+        WHERE id = ?
+    ''', (str(transfer_id), withdrawal_id))
+    connection.commit()
+    row = connection.execute('''
+        SELECT (julianday(completed_at) - julianday(created_at)) * 86400 FROM withdrawals WHERE id = ?
+    ''', (withdrawal_id,)).fetchone()
+    return row[0] if row else None
+
+
+def fail(connection, withdrawal_id: int, error: str, delay: float, dead: bool):
+    """Неудачная попытка: повтор через delay секунд или dead-letter"""
+    connection.execute('''
+        UPDATE withdrawals
+        SET status = ?, last_error = ?, next_attempt_at = datetime('now', ?)
+        WHERE id = ?
+    ''', ('dead' if dead else 'pending', error[:500], f'+{int(delay)} seconds', withdrawal_id))
+    connection.commit()
+
+
+def requeue_dead(connection) -> int:
+    """Выплаты из dead-letter снова в очередь с прежним spend_id (повторно не заплатит)"""
+    count = connection.execute('''
+        UPDATE withdrawals SET status = 'pending', attempts = 0, next_attempt_at = NULL
+        WHERE status = 'dead'
+    ''').rowcount
+    connection.commit()
+    return count
+
+
+def queue_stats(connection, latency_window: int = 100) -> Dict:
+    """Глубина очереди по статусам, возраст старейшей выплаты и задержка последних выплат"""
+    counts = {status: connection.execute(
+        'SELECT COUNT(*) FROM withdrawals WHERE status = ?', (status,)
+    ).fetchone()[0] for status in ('pending', 'processing', 'dead')}
+
+    oldest = connection.execute('''
+        SELECT (julianday('now') - julianday(created_at)) * 86400 FROM withdrawals
+        WHERE status = 'pending' ORDER BY id LIMIT 1
+    ''').fetchone()
+
+    latencies = [row[0] for row in connection.execute('''
+        SELECT (julianday(completed_at) - julianday(created_at)) * 86400 FROM withdrawals
+        WHERE status = 'completed' ORDER BY id DESC LIMIT ?
+    ''', (latency_window,)) if row[0] is not None]
+
+    return {
+        **counts,
+        'oldest_pending': oldest[0] if oldest else None,
+        'latency_median': statistics.median(latencies) if latencies else None,
+        'latency_p95': sorted(latencies)[int(len(latencies) * 0.95) - 1] if latencies else None,
+        'latency_samples': len(latencies)
+    }
+
+
+def dead_letters(connection, limit: int = 5) -> List[Dict]:
+    return [dict(row) for row in connection.execute('''
+        SELECT id, user_id, amount, currency, attempts, last_error, created_at FROM withdrawals
+        WHERE status = 'dead' ORDER BY id DESC LIMIT ?
+    ''', (limit,))]
+
+
+# ==================== ОЧЕРЕДЬ ВЫПЛАТ ====================
+
+class PayoutOutbox:
+    """Выплаты через CryptoBot из таблицы withdrawals
+
+    Выплата записывается в withdrawals той же транзакцией, что и списание
+    с баланса, поэтому не теряется при перезапуске. workers фоновых задач
+    забирают выплаты по порядку id; у одного пользователя одновременно в
+    работе не больше одной выплаты, следующая ждет завершения предыдущей.
+    Каждая строка имеет постоянный spend_id, поэтому повтор после таймаута
+    или перезапуска не заплатит дважды. Crypto Pay отклоняет повтор spend_id
+    ошибкой, а не возвращает первый перевод, поэтому перед записью неудачи
+    find_transfer(spend_id) проверяет, не прошел ли перевод в попытке, ответ
+    на которую потерян; найденный перевод завершает выплату. Неудачная
+    попытка повторяется с экспоненциальной паузой со случайным разбросом;
+    после max_attempts выплата переходит в status = 'dead' и ждет решения
+    администратора.
+    """
+
+    def __init__(self, db, transfer: Callable[..., Awaitable[Dict]], workers: int = PAYOUT_WORKERS,
+                 poll_interval: float = PAYOUT_POLL_INTERVAL, max_attempts: int = PAYOUT_MAX_ATTEMPTS,
+                 backoff_base: float = PAYOUT_BACKOFF_BASE, backoff_max: float = PAYOUT_BACKOFF_MAX,
+                 find_transfer: Callable[[str], Awaitable[Optional[Dict]]] = None):
+        self.db = db
+        self.transfer = transfer
+        self.find_transfer = find_transfer
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._closed = False
+        self.completed = 0
+        self.reconciled = 0
+        self.failed = 0
+        self.dead = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    async def start(self):
+        if self._tasks:
+            return
+        recovered = await self._call(recover)
+        if recovered:
+            logger.warning(f"⚠️ Выплат, прерванных перезапуском, возвращено в очередь: {recovered}")
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker(number)) for number in range(self.workers)]
+
+    def notify(self):
+        """Новая выплата в очереди: не ждать следующего интервала"""
+        self._wakeup.set()
+
+    def _call(self, func, *args):
+        return self.db.run(lambda: func(self.db.database.connection, *args))
+
+    def backoff(self, attempt: int) -> float:
+        """Пауза перед следующей попыткой: полный случайный разброс до BASE * 2^(attempt-1)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    async def _worker(self, number: int):
+        while not self._closed:
+            try:
+                payout = await self._call(claim)
+            except Exception as e:
+                logger.error(f"❌ Ошибка очереди выплат: {e}")
+                payout = None
+
+            if payout is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            await self._pay(payout)
+
+    async def _pay(self, payout: Dict):
+        try:
+            result = await self.transfer(payout['user_id'], payout['amount'], payout['currency'],
+                                         spend_id=payout['spend_id'])
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+
+        if not result.get('success') and self.find_transfer:
+            result = await self._reconcile(payout, result)
+
+        try:
+            if result.get('success'):
+                await self._call(complete, payout['id'], result.get('transfer_id'))
+                self.completed += 1
+                logger.info(f"✅ Выплата #{payout['id']}: {payout['amount']} {payout['currency']} "
+                            f"пользователю {payout['user_id']}")
+                # Следующая выплата этого пользователя уже может быть готова
+                self.notify()
+                return
+
+            error = str(result.get('error', 'Unknown error'))
+            dead = payout['attempts'] >= self.max_attempts
+            delay = 0 if dead else self.backoff(payout['attempts'])
+            await self._call(fail, payout['id'], error, delay, dead)
+            self.failed += 1
+            if dead:
+                self.dead += 1
+                logger.error(f"❌ Выплата #{payout['id']} в dead-letter после {payout['attempts']} попыток: {error}")
+            else:
+                logger.warning(f"⚠️ Выплата #{payout['id']} (попытка {payout['attempts']}): {error}, "
+                               f"повтор через {delay:.0f} с")
+        except Exception as e:
+            # Строка останется в processing и вернется в очередь при запуске
+            logger.error(f"❌ Ошибка записи результата выплаты #{payout['id']}: {e}")
+
+    async def _reconcile(self, payout: Dict, result: Dict) -> Dict:
+        """Перевод с этим spend_id уже проведен - выплата успешна, иначе прежняя ошибка"""
+        try:
+            existing = await self.find_transfer(payout['spend_id'])
+        except Exception as e:
+            logger.error(f"❌ Ошибка поиска перевода {payout['spend_id']}: {e}")
+            return result
+        if not existing:
+            return result
+        self.reconciled += 1
+        logger.warning(f"⚠️ Выплата #{payout['id']} уже проведена (перевод {existing.get('transfer_id')}), "
+                       f"ответ на прежнюю попытку был потерян")
+        return {'success': True, 'transfer_id': existing.get('transfer_id')}
+
+    async def requeue_dead(self) -> int:
+        count = await self._call(requeue_dead)
+        if count:
+            self.notify()
+        return count
+
+    async def close(self, timeout: float):
+        """Остановка после текущих выплат; остальные остаются в БД"""
+        self._closed = True
+        self._wakeup.set()
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning("⚠️ Выплаты прерваны, будут повторены после запуска с тем же spend_id")
+
+    async def get_stats(self) -> Dict:
+        stats = await self._call(queue_stats)
+        stats.update({'workers': self.workers, 'running': self.running,
+                      'session_completed': self.completed, 'session_reconciled': self.reconciled,
+                      'session_failed': self.failed,
+                      'session_dead': self.dead})
+        return stats
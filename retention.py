@@ -0,0 +1,292 @@
+# retention.py
+"""Хранение данных: архивирование и удаление старых строк небольшими порциями
+
+Запуск вручную: python retention.py [casino.db] [--dry-run] [--vacuum]
+
+Строки старше срока из RETENTION_POLICIES удаляются порциями по диапазону
+первичного ключа (id > a AND id <= b). Каждая порция - отдельное
+задание потока БД, между ними - пауза, поэтому запросы игроков ждут не
+дольше одной порции. Если у таблицы включен архив, порция сначала
+копируется в месячный файл archive/casino-YYYY-MM.db (по месяцу
+created_at строки), затем удаляется из основной БД. Повторное
+копирование после сбоя между этими шагами безопасно (INSERT OR IGNORE по id).
+
+После удаления освободившиеся страницы возвращаются файловой системе
+через PRAGMA incremental_vacuum (нужен auto_vacuum = INCREMENTAL).
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import (RETENTION_POLICIES, RETENTION_CHUNK_SIZE, RETENTION_PAUSE, RETENTION_ARCHIVE_DIR,
+                        RETENTION_VACUUM_PAGES)
+except ImportError:
+    RETENTION_POLICIES = {
+        'bets': {'days': 90, 'archive': True},
+        'logs': {'days': 30, 'archive': False},
+        'notifications': {'days': 30, 'archive': False, 'where': 'is_read = 1'}
+    }
+    RETENTION_CHUNK_SIZE = 500
+    RETENTION_PAUSE = 0.05
+    RETENTION_ARCHIVE_DIR = 'archive'
+    RETENTION_VACUUM_PAGES = 1000
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+# ==================== ПОРЦИИ (ВЫПОЛНЯЮТСЯ В ПОТОКЕ БД) ====================
+
+def _condition(policy: Dict) -> str:
+    extra = policy.get('where')
+    return f'created_at < ? AND ({extra})' if extra else 'created_at < ?'
+
+
+def next_chunk(connection, table: str, after_id: int, chunk_size: int, cutoff: str) -> Optional[int]:
+    """Верхняя граница следующей порции по id или None, если старые строки кончились
+
+    id растет вместе с created_at, поэтому порция, которая начинается со
+    строки не старше cutoff, означает конец старых данных.
+    """
+    row = connection.execute(f'''
+        SELECT MAX(id) AS upper, MIN(created_at) AS oldest FROM (
+            SELECT id, created_at FROM {table} WHERE id > ? ORDER BY id LIMIT ?
+        )
+    ''', (after_id, chunk_size)).fetchone()
+    if row['upper'] is None or row['oldest'] is None or row['oldest'] >= cutoff:
+        return None
+    return row['upper']
+
+
+def _archive_path(archive_dir: str, month: str) -> str:
+    return os.path.join(archive_dir, f'casino-{month}.db')
+
+
+def _ensure_archive_table(connection, table: str):
+    """Таблица в подключенном архиве с теми же колонками и id как первичным ключом"""
+    columns = connection.execute(f'PRAGMA main.table_info({table})').fetchall()
+    existing = {row['name'] for row in connection.execute(f'PRAGMA archive.table_info({table})')}
+    if not existing:
+        definition = ', '.join(
+            f"{column['name']} {column['type']}{' PRIMARY KEY' if column['name'] == 'id' else ''}"
+            for column in columns
+        )
+        connection.execute(f'CREATE TABLE archive.{table} ({definition})')
+        return
+    # Колонки, добавленные миграциями после создания архива
+    for column in columns:
+        if column['name'] not in existing:
+            connection.execute(f"ALTER TABLE archive.{table} ADD COLUMN {column['name']} {column['type']}")
+
+
+def archive_chunk(connection, table: str, policy: Dict, after_id: int, upper_id: int, cutoff: str,
+                  archive_dir: str) -> int:
+    """Копирование порции в месячные архивы (отдельная транзакция каждого файла)"""
+    condition = _condition(policy)
+    months = [row[0] for row in connection.execute(f'''
+        SELECT DISTINCT substr(created_at, 1, 7) FROM {table}
+        WHERE id > ? AND id <= ? AND {condition}
+    ''', (after_id, upper_id, cutoff))]
+
+    copied = 0
+    os.makedirs(archive_dir, exist_ok=True)
+    for month in months:
+        # ATTACH нельзя внутри транзакции
+        connection.commit()
+        connection.execute('ATTACH DATABASE ? AS archive', (_archive_path(archive_dir, month),))
+        try:
+            _ensure_archive_table(connection, table)
+            columns = ', '.join(row['name'] for row in connection.execute(f'PRAGMA main.table_info({table})'))
+            copied += connection.execute(f'''
+                INSERT OR IGNORE INTO archive.{table} ({columns})
+                SELECT {columns} FROM main.{table}
+                WHERE id > ? AND id <= ? AND {condition} AND substr(created_at, 1, 7) = ?
+            ''', (after_id, upper_id, cutoff, month)).rowcount
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.execute('DETACH DATABASE archive')
+    return copied
+
+
+def delete_chunk(connection, table: str, policy: Dict, after_id: int, upper_id: int, cutoff: str) -> int:
+    deleted = connection.execute(f'''
+        DELETE FROM {table} WHERE id > ? AND id <= ? AND {_condition(policy)}
+    ''', (after_id, upper_id, cutoff)).rowcount
+    connection.commit()
+    return deleted
+
+
+def vacuum_step(connection, pages: int) -> int:
+    """Возврат до pages свободных страниц файловой системе, возвращает остаток"""
+    connection.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+    return connection.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def checkpoint(connection):
+    """Перенос WAL в основной файл, чтобы его размер действительно уменьшился"""
+    connection.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+
+
+# ==================== ЗАДАЧА ХРАНЕНИЯ ====================
+
+class RetentionEngine:
+    """Очистка старых данных по политикам из config.RETENTION_POLICIES
+
+    run() не держит поток БД дольше одной порции: каждая порция передается
+    в db.run() отдельно, между порциями - asyncio.sleep(pause).
+    """
+
+    def __init__(self, db, policies: Dict = None, chunk_size: int = RETENTION_CHUNK_SIZE,
+                 pause: float = RETENTION_PAUSE, archive_dir: str = RETENTION_ARCHIVE_DIR,
+                 vacuum_pages: int = RETENTION_VACUUM_PAGES):
+        self.db = db
+        self.policies = RETENTION_POLICIES if policies is None else policies
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.archive_dir = archive_dir
+        self.vacuum_pages = vacuum_pages
+        self._lock = asyncio.Lock()
+        self.last_run: Optional[Dict] = None
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def _call(self, func, *args):
+        # Соединение берется внутри потока БД из обернутого Database:
+        # AsyncDatabase превращает вызываемые атрибуты в корутины
+        return self.db.run(lambda: func(self.db.database.connection, *args))
+
+    async def run(self) -> Dict:
+        """Один проход по всем таблицам; параллельный запуск ждет текущий"""
+        async with self._lock:
+            started = time.monotonic()
+            report = {'tables': {}, 'freed_pages': 0, 'chunks': 0, 'errors': []}
+
+            for table, policy in self.policies.items():
+                try:
+                    report['tables'][table] = await self._purge_table(table, policy, report)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка очистки {table}: {e}")
+                    report['errors'].append(f'{table}: {e}')
+
+            try:
+                report['freed_pages'] = await self._vacuum()
+            except Exception as e:
+                logger.error(f"❌ Ошибка incremental_vacuum: {e}")
+                report['errors'].append(f'vacuum: {e}')
+
+            report['elapsed'] = time.monotonic() - started
+            report['finished_at'] = time.time()
+            self.last_run = report
+            logger.info(f"🧹 Очистка данных: {self.format_summary(report)}")
+            return report
+
+    async def _purge_table(self, table: str, policy: Dict, report: Dict) -> Dict:
+        cutoff = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - policy['days'] * 86400))
+        result = {'archived': 0, 'deleted': 0}
+        after_id = 0
+
+        while True:
+            upper_id = await self._call(next_chunk, table, after_id, self.chunk_size, cutoff)
+            if upper_id is None:
+                return result
+
+            if policy.get('archive'):
+                result['archived'] += await self._call(
+                    archive_chunk, table, policy, after_id, upper_id, cutoff, self.archive_dir
+                )
+            result['deleted'] += await self._call(delete_chunk, table, policy, after_id, upper_id, cutoff)
+            report['chunks'] += 1
+            after_id = upper_id
+            await asyncio.sleep(self.pause)
+
+    async def _vacuum(self) -> int:
+        freed = 0
+        mode = await self._call(lambda connection: connection.execute('PRAGMA auto_vacuum').fetchone()[0])
+        if mode != AUTO_VACUUM_INCREMENTAL:
+            logger.warning("⚠️ auto_vacuum не INCREMENTAL: файл БД не уменьшится, "
+                           "однократно выполните python retention.py --vacuum при остановленном боте")
+            return 0
+        remaining = await self._call(lambda connection: connection.execute('PRAGMA freelist_count').fetchone()[0])
+        while remaining:
+            left = await self._call(vacuum_step, self.vacuum_pages)
+            if left >= remaining:
+                break
+            freed += remaining - left
+            remaining = left
+            await asyncio.sleep(self.pause)
+        await self._call(checkpoint)
+        return freed
+
+    @staticmethod
+    def format_summary(report: Dict) -> str:
+        tables = ', '.join(
+            f"{table}: -{result['deleted']}" + (f" (в архив {result['archived']})" if result['archived'] else '')
+            for table, result in report['tables'].items()
+        )
+        return (f"{tables or 'нет таблиц'}; порций {report['chunks']}, освобождено страниц "
+                f"{report['freed_pages']}, {report['elapsed']:.1f} с")
+
+
+def archive_files(archive_dir: str = RETENTION_ARCHIVE_DIR) -> List[str]:
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(name for name in os.listdir(archive_dir) if name.startswith('casino-') and name.endswith('.db'))
+
+
+# ==================== ЗАПУСК ВРУЧНУЮ ====================
+
+class _SyncDatabase:
+    """Минимальный db для RetentionEngine вне бота: run() выполняет функцию сразу"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.database = self
+
+    async def run(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+
+def main():
+    import sqlite3
+
+    parser = argparse.ArgumentParser(description='Архивирование и удаление старых данных')
+    parser.add_argument('db_path', nargs='?', default='casino.db')
+    parser.add_argument('--dry-run', action='store_true', help='только посчитать строки старше срока')
+    parser.add_argument('--vacuum', action='store_true',
+                        help='перевести БД в auto_vacuum=INCREMENTAL (полный VACUUM, бот должен быть остановлен)')
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.db_path)
+    connection.row_factory = sqlite3.Row
+
+    if args.vacuum:
+        connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        connection.execute('VACUUM')
+        print(f"✅ auto_vacuum = {connection.execute('PRAGMA auto_vacuum').fetchone()[0]}")
+        return
+
+    if args.dry_run:
+        for table, policy in RETENTION_POLICIES.items():
+            cutoff = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - policy['days'] * 86400))
+            count = connection.execute(f'SELECT COUNT(*) FROM {table} WHERE {_condition(policy)}', (cutoff,)).fetchone()[0]
+            print(f"  {table}: {count} строк старше {policy['days']} дн.{' (в архив)' if policy.get('archive') else ''}")
+        return
+
+    report = asyncio.run(RetentionEngine(_SyncDatabase(connection), pause=0).run())
+    print(f"✅ {RetentionEngine.format_summary(report)}")
+    for error in report['errors']:
+        print(f"❌ {error}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+# rollups.py
+"""Счетчики статистики, которые обновляются вместе с данными
+
+Запуск проверки: python rollups.py [casino.db] [--fix]
+
+Итоги за все время (stats_totals) поддерживаются триггерами SQLite в той
+же транзакции, что и изменение users/bets/deposits/withdrawals, поэтому
+их не обойти ни одним путем записи. Почасовые и суточные итоги ставок
+(stats_hourly, stats_daily) достраиваются пачкой по новым bets.id после
+последнего обработанного (водяной знак в rollup_state).
+
+Удаление старых ставок (очистка) не уменьшает итоги: удаленные суммы
+копятся в bets_pruned, и проверка сверяет итоги с «сырые строки + удалено».
+"""
+import argparse
+import logging
+import sqlite3
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Итоги по пользователям: колонка stats_totals -> колонка users
+USER_COLUMNS = {
+    'user_balance': 'balance',
+    'user_deposit': 'total_deposit',
+    'user_withdraw': 'total_withdraw',
+    'user_wins': 'total_wins',
+    'user_losses': 'total_losses',
+    'user_bets': 'total_bets',
+    'user_bet_amount': 'total_bet_amount'
+}
+
+# Итоги по ставкам: колонка -> выражение над строкой bets (ROW.)
+BET_COLUMNS = {
+    'bets': '1',
+    'bet_amount': 'ROW.amount',
+    'win_bets': "(ROW.result = 'win')",
+    'lose_bets': "(ROW.result = 'lose')",
+    'win_amount': "CASE WHEN ROW.result = 'win' THEN ROW.win_amount ELSE 0 END",
+    'loss_amount': "CASE WHEN ROW.result = 'lose' THEN ROW.amount ELSE 0 END"
+}
+
+PAYMENT_TABLES = {'deposits': ('deposits', 'deposit_amount'), 'withdrawals': ('withdrawals', 'withdraw_amount')}
+
+TOTAL_COLUMNS = ['users', *USER_COLUMNS, *BET_COLUMNS, 'deposits', 'deposit_amount', 'withdrawals', 'withdraw_amount']
+
+
+def _columns_sql(columns) -> str:
+    return ',\n'.join(f'        {column} REAL DEFAULT 0' for column in columns)
+
+
+CREATE_ROLLUP_TABLES = [
+    f'''
+    CREATE TABLE IF NOT EXISTS stats_totals (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+{_columns_sql(TOTAL_COLUMNS)}
+    )
+    ''',
+    f'''
+    CREATE TABLE IF NOT EXISTS bets_pruned (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+{_columns_sql(BET_COLUMNS)},
+        pruned_until TEXT
+    )
+    ''',
+    f'''
+    CREATE TABLE IF NOT EXISTS stats_hourly (
+        hour TEXT PRIMARY KEY,
+{_columns_sql(BET_COLUMNS)}
+    ) WITHOUT ROWID
+    ''',
+    f'''
+    CREATE TABLE IF NOT EXISTS stats_daily (
+        date TEXT PRIMARY KEY,
+{_columns_sql(BET_COLUMNS)}
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        key TEXT PRIMARY KEY,
+        value INTEGER
+    )
+    '''
+]
+
+
+def _bet_deltas(row: str, sign: str = '+') -> str:
+    return ', '.join(f"{column} = {column} {sign} {expr.replace('ROW', row)}" for column, expr in BET_COLUMNS.items())
+
+
+def _user_deltas(sign: str, row: str) -> str:
+    return ', '.join(f'{column} = {column} {sign} {row}.{source}' for column, source in USER_COLUMNS.items())
+
+
+def _payment_triggers() -> List[str]:
+    triggers = []
+    for table, (count, amount) in PAYMENT_TABLES.items():
+        triggers += [
+            f'''
+            CREATE TRIGGER IF NOT EXISTS rollup_{table}_insert AFTER INSERT ON {table}
+            WHEN NEW.status = 'completed'
+            BEGIN
+                UPDATE stats_totals SET {count} = {count} + 1, {amount} = {amount} + NEW.amount WHERE id = 1;
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS rollup_{table}_update AFTER UPDATE OF status, amount ON {table}
+            WHEN NEW.status = 'completed' OR OLD.status = 'completed'
+            BEGIN
+                UPDATE stats_totals
+                SET {count} = {count} + (NEW.status = 'completed') - (OLD.status = 'completed'),
+                    {amount} = {amount} + CASE WHEN NEW.status = 'completed' THEN NEW.amount ELSE 0 END
+                                        - CASE WHEN OLD.status = 'completed' THEN OLD.amount ELSE 0 END
+                WHERE id = 1;
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS rollup_{table}_delete AFTER DELETE ON {table}
+            WHEN OLD.status = 'completed'
+            BEGIN
+                UPDATE stats_totals SET {count} = {count} - 1, {amount} = {amount} - OLD.amount WHERE id = 1;
+            END
+            '''
+        ]
+    return triggers
+
+
+CREATE_ROLLUP_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS rollup_users_insert AFTER INSERT ON users
+    BEGIN
+        UPDATE stats_totals SET users = users + 1, {_user_deltas('+', 'NEW')} WHERE id = 1;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS rollup_users_delete AFTER DELETE ON users
+    BEGIN
+        UPDATE stats_totals SET users = users - 1, {_user_deltas('-', 'OLD')} WHERE id = 1;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS rollup_users_update AFTER UPDATE OF {', '.join(USER_COLUMNS.values())} ON users
+    BEGIN
+        UPDATE stats_totals
+        SET {', '.join(f'{column} = {column} + NEW.{source} - OLD.{source}' for column, source in USER_COLUMNS.items())}
+        WHERE id = 1;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS rollup_bets_insert AFTER INSERT ON bets
+    BEGIN
+        UPDATE stats_totals SET {_bet_deltas('NEW')} WHERE id = 1;
+    END
+    ''',
+    # Итоги за все время при очистке ставок не уменьшаются: удаленное копится отдельно
+    f'''
+    CREATE TRIGGER IF NOT EXISTS rollup_bets_delete AFTER DELETE ON bets
+    BEGIN
+        UPDATE bets_pruned
+        SET {_bet_deltas('OLD')}, pruned_until = MAX(COALESCE(pruned_until, ''), OLD.created_at)
+        WHERE id = 1;
+    END
+    ''',
+    *_payment_triggers()
+]
+
+# Пересчет из сырых строк (полные сканирования - только для инициализации и проверки)
+RAW_USERS_SQL = f'''
+    SELECT COUNT(*) AS users,
+           {', '.join(f'COALESCE(SUM({source}), 0) AS {column}' for column, source in USER_COLUMNS.items())}
+    FROM users
+'''
+
+RAW_BETS_SQL = f'''
+    SELECT {', '.join(f"COALESCE(SUM({expr.replace('ROW.', '')}), 0) AS {column}" for column, expr in BET_COLUMNS.items())}
+    FROM bets
+'''
+
+RAW_PAYMENTS_SQL = '''
+    SELECT COUNT(*) AS count, COALESCE(SUM(amount), 0) AS amount FROM {table} WHERE status = 'completed'
+'''
+
+BET_SUMS_SQL = ', '.join(f"SUM({expr.replace('ROW.', '')})" for expr in BET_COLUMNS.values())
+
+REFRESH_SQL = '''
+    INSERT INTO {table} ({key}, {columns})
+    SELECT {bucket} AS bucket, {sums}
+    FROM bets
+    WHERE id > ? AND id <= ?
+    GROUP BY bucket
+    ON CONFLICT({key}) DO UPDATE SET {updates}
+'''
+
+ROLLUP_LEVELS = {
+    'stats_hourly': ('hour', "strftime('%Y-%m-%d %H', created_at)"),
+    'stats_daily': ('date', 'date(created_at)')
+}
+
+# Длина ключа часа/дня в created_at ('YYYY-MM-DD HH' / 'YYYY-MM-DD')
+BUCKET_LENGTH = {'stats_hourly': 13, 'stats_daily': 10}
+
+# Допуск сравнения сумм REAL
+TOLERANCE = 1e-6
+
+
+def _refresh_sql(table: str) -> str:
+    key, bucket = ROLLUP_LEVELS[table]
+    return REFRESH_SQL.format(
+        table=table, key=key, bucket=bucket, sums=BET_SUMS_SQL,
+        columns=', '.join(BET_COLUMNS),
+        updates=', '.join(f'{column} = {column} + excluded.{column}' for column in BET_COLUMNS)
+    )
+
+
+def _get_state(connection, key: str) -> int:
+    row = connection.execute('SELECT value FROM rollup_state WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else 0
+
+
+def _set_state(connection, key: str, value: int):
+    connection.execute('INSERT OR REPLACE INTO rollup_state (key, value) VALUES (?, ?)', (key, value))
+
+
+def compute_raw(connection) -> Dict:
+    """Итоги, посчитанные заново по сырым строкам (без учета удаленных ставок)"""
+    totals = dict(zip(TOTAL_COLUMNS, [0] * len(TOTAL_COLUMNS)))
+    for query in (RAW_USERS_SQL, RAW_BETS_SQL):
+        row = connection.execute(query).fetchone()
+        totals.update({key: row[key] for key in row.keys()})
+    for table, (count, amount) in PAYMENT_TABLES.items():
+        row = connection.execute(RAW_PAYMENTS_SQL.format(table=table)).fetchone()
+        totals[count], totals[amount] = row['count'], row['amount']
+    return totals
+
+
+def rebuild(connection):
+    """Пересчет итогов и почасовых/суточных данных по сырым строкам (первый запуск и --fix)"""
+    raw = compute_raw(connection)
+    pruned = read_row(connection, 'bets_pruned', BET_COLUMNS)
+    for column in BET_COLUMNS:
+        raw[column] += pruned[column]
+
+    connection.execute('INSERT OR IGNORE INTO stats_totals (id) VALUES (1)')
+    connection.execute(
+        f"UPDATE stats_totals SET {', '.join(f'{column} = ?' for column in TOTAL_COLUMNS)} WHERE id = 1",
+        [raw[column] for column in TOTAL_COLUMNS]
+    )
+    # Часы и дни до последней очистки пересчитать не из чего - они сохраняются
+    pruned_until = read_row(connection, 'bets_pruned', ['pruned_until'])['pruned_until'] or ''
+    max_id = connection.execute('SELECT COALESCE(MAX(id), 0) FROM bets').fetchone()[0]
+    for table, (key, bucket) in ROLLUP_LEVELS.items():
+        since = pruned_until[:BUCKET_LENGTH[table]]
+        connection.execute(f'DELETE FROM {table} WHERE {key} > ?', (since,))
+        connection.execute(
+            f"INSERT INTO {table} ({key}, {', '.join(BET_COLUMNS)}) "
+            f"SELECT {bucket} AS bucket, {BET_SUMS_SQL} FROM bets WHERE {bucket} > ? GROUP BY bucket",
+            (since,)
+        )
+    _set_state(connection, 'last_bet_id', max_id)
+    connection.commit()
+
+
+def install(connection):
+    """Создание таблиц и триггеров; при первом запуске - заполнение по текущим данным"""
+    for statement in CREATE_ROLLUP_TABLES + CREATE_ROLLUP_TRIGGERS:
+        connection.execute(statement)
+    connection.execute('INSERT OR IGNORE INTO bets_pruned (id) VALUES (1)')
+    if connection.execute('SELECT 1 FROM stats_totals WHERE id = 1').fetchone() is None:
+        logger.info("🔄 Первичный расчет итогов статистики")
+        rebuild(connection)
+    connection.commit()
+
+
+def refresh(connection, commit: bool = True) -> int:
+    """Досчет почасовых и суточных итогов по ставкам после водяного знака"""
+    last_id = _get_state(connection, 'last_bet_id')
+    max_id = connection.execute('SELECT COALESCE(MAX(id), 0) FROM bets').fetchone()[0]
+    if max_id <= last_id:
+        return 0
+    for table in ROLLUP_LEVELS:
+        connection.execute(_refresh_sql(table), (last_id, max_id))
+    _set_state(connection, 'last_bet_id', max_id)
+    if commit:
+        connection.commit()
+    return max_id - last_id
+
+
+def read_row(connection, table: str, columns) -> Dict:
+    row = connection.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE id = 1").fetchone()
+    return {column: (row[column] if row else 0) or 0 for column in columns}
+
+
+def read_totals(connection) -> Dict:
+    return read_row(connection, 'stats_totals', TOTAL_COLUMNS)
+
+
+def read_series(connection, table: str, since: str) -> Dict:
+    """Сумма почасовых или суточных итогов начиная с since (не больше десятков строк)"""
+    key = ROLLUP_LEVELS[table][0]
+    row = connection.execute(
+        f"SELECT {', '.join(f'COALESCE(SUM({column}), 0) AS {column}' for column in BET_COLUMNS)} "
+        f"FROM {table} WHERE {key} >= ?", (since,)
+    ).fetchone()
+    return {column: row[column] for column in BET_COLUMNS}
+
+
+def _differs(a: float, b: float) -> bool:
+    return abs((a or 0) - (b or 0)) > TOLERANCE * max(1.0, abs(a or 0), abs(b or 0))
+
+
+def verify(connection) -> List[Tuple[str, float, float]]:
+    """Расхождения (показатель, сохранено, по сырым данным); пустой список - все сходится"""
+    refresh(connection)
+    drift = []
+
+    stored = read_totals(connection)
+    raw = compute_raw(connection)
+    pruned = read_row(connection, 'bets_pruned', [*BET_COLUMNS, 'pruned_until'])
+    for column in TOTAL_COLUMNS:
+        expected = raw[column] + (pruned[column] if column in BET_COLUMNS else 0)
+        if _differs(stored[column], expected):
+            drift.append((f'stats_totals.{column}', stored[column], expected))
+
+    # Почасовые и суточные итоги в сумме равны итогам за все время
+    for table in ROLLUP_LEVELS:
+        summed = read_series(connection, table, '')
+        for column in BET_COLUMNS:
+            if _differs(summed[column], stored[column]):
+                drift.append((f'{table}.{column} (сумма)', summed[column], stored[column]))
+
+    # Часы после последней очистки сверяются с сырыми строками по отдельности
+    key, bucket = ROLLUP_LEVELS['stats_hourly']
+    since = (pruned['pruned_until'] or '')[:BUCKET_LENGTH['stats_hourly']]
+    raw_hours = {
+        row['bucket']: row for row in connection.execute(
+            f"SELECT {bucket} AS bucket, {', '.join(f'{s} AS {c}' for s, c in zip(BET_SUMS_SQL.split(', '), BET_COLUMNS))} "
+            f"FROM bets WHERE {bucket} > ? GROUP BY bucket", (since,)
+        )
+    }
+    stored_hours = {
+        row['hour']: row for row in connection.execute('SELECT * FROM stats_hourly WHERE hour > ?', (since,))
+    }
+    for hour in sorted(set(raw_hours) | set(stored_hours)):
+        for column in BET_COLUMNS:
+            stored_value = stored_hours[hour][column] if hour in stored_hours else 0
+            raw_value = raw_hours[hour][column] if hour in raw_hours else 0
+            if _differs(stored_value, raw_value):
+                drift.append((f'stats_hourly[{hour}].{column}', stored_value, raw_value))
+
+    return drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка итогов статистики по сырым данным')
+    parser.add_argument('db_path', nargs='?', default='casino.db')
+    parser.add_argument('--fix', action='store_true', help='пересчитать итоги заново при расхождении')
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.db_path)
+    connection.row_factory = sqlite3.Row
+    install(connection)
+
+    drift = verify(connection)
+    if not drift:
+        print("✅ Итоги статистики совпадают с сырыми данными")
+        return
+
+    print(f"❌ Расхождений: {len(drift)}")
+    for name, stored, expected in drift:
+        print(f"  {name}: сохранено {stored}, по данным {expected} (разница {stored - expected:+})")
+
+    if args.fix:
+        rebuild(connection)
+        print("🔄 Итоги пересчитаны" if not verify(connection) else "❌ Расхождения остались после пересчета")
+
+
+if __name__ == '__main__':
+    main()
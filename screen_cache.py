@@ -0,0 +1,64 @@
+# screen_cache.py
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+try:
+    from config import SCREEN_CACHE_SIZE
+except ImportError:
+    SCREEN_CACHE_SIZE = 10000
+
+
+class Screen:
+    """Что показывает сообщение бота: картинка, подпись и клавиатура"""
+
+    __slots__ = ('photo', 'text', 'markup', 'shown_text')
+
+    def __init__(self, photo: Optional[str], text: str, markup: Optional[str], shown_text: Optional[str] = None):
+        self.photo = photo
+        self.text = text
+        self.markup = markup
+        # Текст без разметки, как его вернул Telegram: по нему видно,
+        # что сообщение не меняли в обход edit_message_with_photo
+        self.shown_text = shown_text
+
+    def same_content(self, other: 'Screen') -> bool:
+        return (self.photo, self.text, self.markup) == (other.photo, other.text, other.markup)
+
+
+class ScreenCache:
+    """Последний экран каждого сообщения бота (LRU по chat_id, message_id)
+
+    Позволяет не вызывать API, если кнопка открывает тот же экран, и
+    менять только подпись, если картинка уже та же.
+    """
+
+    def __init__(self, max_size: int = SCREEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._screens: 'OrderedDict[Tuple[int, int], Screen]' = OrderedDict()
+        self.stats = {'skipped': 0, 'caption_edits': 0, 'media_edits': 0, 'text_edits': 0, 'resends': 0}
+
+    def get(self, chat_id: int, message_id: int, shown_text: Optional[str] = None) -> Optional[Screen]:
+        """Экран сообщения, если он совпадает с тем, что сейчас видно в Telegram"""
+        screen = self._screens.get((chat_id, message_id))
+        if screen is None:
+            return None
+        if screen.shown_text != shown_text:
+            del self._screens[(chat_id, message_id)]
+            return None
+        self._screens.move_to_end((chat_id, message_id))
+        return screen
+
+    def put(self, chat_id: int, message_id: int, screen: Screen):
+        self._screens[(chat_id, message_id)] = screen
+        self._screens.move_to_end((chat_id, message_id))
+        while len(self._screens) > self.max_size:
+            self._screens.popitem(last=False)
+
+    def forget(self, chat_id: int, message_id: int):
+        self._screens.pop((chat_id, message_id), None)
+
+    def count(self, action: str):
+        self.stats[action] += 1
+
+    def get_stats(self) -> Dict:
+        return {'size': len(self._screens), 'max_size': self.max_size, **self.stats}
@@ -0,0 +1,323 @@
+# send_queue.py
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import (SEND_GLOBAL_RATE, SEND_GLOBAL_BURST, SEND_CHAT_RATE, SEND_CHAT_BURST,
+                        SEND_GROUP_RATE, SEND_GROUP_BURST, SEND_MAX_RETRIES)
+except ImportError:
+    SEND_GLOBAL_RATE = 30
+    SEND_GLOBAL_BURST = 30
+    SEND_CHAT_RATE = 1.0
+    SEND_CHAT_BURST = 5
+    SEND_GROUP_RATE = 20 / 60
+    SEND_GROUP_BURST = 20
+    SEND_MAX_RETRIES = 3
+
+# Приоритеты: меньше - раньше
+PRIORITY_USER = 0
+PRIORITY_CHANNEL = 1
+PRIORITY_LOG = 2
+PRIORITY_BROADCAST = 3
+PRIORITY_NAMES = {PRIORITY_USER: 'user', PRIORITY_CHANNEL: 'channel', PRIORITY_LOG: 'log',
+                  PRIORITY_BROADCAST: 'broadcast'}
+
+# Приоритет запросов текущей задачи (например, рассылки); None - по чату
+current_priority: ContextVar[Optional[int]] = ContextVar('send_priority', default=None)
+
+WAIT_SAMPLES = 1000
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше burst про запас (rate <= 0 - без ограничения)"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        if self.rate > 0:
+            self._refill(now)
+            self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        if self.rate <= 0:
+            return True
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class _Job:
+    __slots__ = ('call', 'future', 'priority', 'enqueued_at', 'attempts', 'retryable')
+
+    def __init__(self, call: Callable[[], Awaitable], future: asyncio.Future, priority: int, retryable: bool):
+        self.call = call
+        self.future = future
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        self.retryable = retryable
+
+
+class _Chat:
+    __slots__ = ('chat_id', 'priority', 'jobs', 'bucket', 'busy', 'scheduled', 'paused_until')
+
+    def __init__(self, chat_id, priority: int, bucket: TokenBucket):
+        self.chat_id = chat_id
+        self.priority = priority
+        self.jobs = deque()
+        self.bucket = bucket
+        self.busy = False
+        self.scheduled = False
+        self.paused_until = 0.0
+
+
+class SendQueue:
+    """Единая очередь исходящих запросов к Telegram
+
+    Лимиты Telegram соблюдаются двумя token bucket: общим на бота
+    (SEND_GLOBAL_RATE в секунду) и отдельным на каждый чат (личные чаты -
+    SEND_CHAT_RATE, группы и каналы - SEND_GROUP_RATE). Запросы в один чат
+    выполняются строго по очереди, поэтому сообщения не перемешиваются.
+    Из чатов, готовых к отправке, первым обслуживается чат с высшим
+    приоритетом: ответы игрокам, затем игровой канал, затем канал логов,
+    последней - рассылка (current_priority).
+
+    RetryAfter приостанавливает чат на указанное Telegram время, запрос
+    повторяется до SEND_MAX_RETRIES раз. Сетевые ошибки повторяются с
+    растущей паузой, если запрос можно безопасно повторить.
+    """
+
+    def __init__(self, global_rate: float = SEND_GLOBAL_RATE, global_burst: float = SEND_GLOBAL_BURST,
+                 chat_rate: float = SEND_CHAT_RATE, chat_burst: float = SEND_CHAT_BURST,
+                 group_rate: float = SEND_GROUP_RATE, group_burst: float = SEND_GROUP_BURST,
+                 max_retries: int = SEND_MAX_RETRIES, priorities: Dict = None,
+                 retry_after_errors: Tuple = (), network_errors: Tuple = ()):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_limits = (chat_rate, chat_burst)
+        self.group_limits = (group_rate, group_burst)
+        self.max_retries = max_retries
+        self.priorities = priorities or {}
+        self.retry_after_errors = retry_after_errors
+        self.network_errors = network_errors
+
+        self._chats: Dict[object, _Chat] = {}
+        self._ready = []  # (приоритет, порядковый номер, chat_id) - можно отправлять сейчас
+        self._timers = []  # (время, порядковый номер, chat_id) - ждут токен или конец RetryAfter
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._last_sweep = time.monotonic()
+
+        self.depth = 0
+        self.max_depth = 0
+        self.in_flight = 0
+        self.sent = 0
+        self.failed = 0
+        self.retry_after = 0
+        self.retries = 0
+        self._waits = {priority: deque(maxlen=WAIT_SAMPLES) for priority in PRIORITY_NAMES}
+
+    # ==================== ПОСТАНОВКА В ОЧЕРЕДЬ ====================
+
+    def priority_of(self, chat_id) -> int:
+        return self.priorities.get(chat_id, PRIORITY_USER)
+
+    def _get_chat(self, chat_id) -> _Chat:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            priority = self.priority_of(chat_id)
+            # Отрицательный chat_id - группа или канал, у них лимит строже
+            is_group = isinstance(chat_id, int) and chat_id < 0 or isinstance(chat_id, str)
+            rate, burst = self.group_limits if is_group else self.chat_limits
+            chat = self._chats[chat_id] = _Chat(chat_id, priority, TokenBucket(rate, burst))
+        return chat
+
+    async def submit(self, chat_id, call: Callable[[], Awaitable], retryable: bool = True):
+        """Выполнить call() в порядке очереди чата и вернуть его результат"""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+
+        chat = self._get_chat(chat_id)
+        priority = current_priority.get()
+        job = _Job(call, loop.create_future(), chat.priority if priority is None else priority, retryable)
+        chat.jobs.append(job)
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        self._schedule(chat)
+        return await job.future
+
+    def _schedule(self, chat: _Chat):
+        """Постановка чата в ready или в таймеры (если у него есть задания)"""
+        if chat.busy or chat.scheduled or not chat.jobs:
+            return
+        chat.scheduled = True
+        now = time.monotonic()
+        delay = max(chat.paused_until - now, chat.bucket.delay(now))
+        if delay <= 0:
+            heapq.heappush(self._ready, (chat.jobs[0].priority, next(self._seq), chat.chat_id))
+        else:
+            heapq.heappush(self._timers, (now + delay, next(self._seq), chat.chat_id))
+        self._wakeup.set()
+
+    # ==================== ОБРАБОТКА ОЧЕРЕДИ ====================
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            while self._timers and self._timers[0][0] <= now:
+                _, _, chat_id = heapq.heappop(self._timers)
+                chat = self._chats[chat_id]
+                heapq.heappush(self._ready, (chat.jobs[0].priority, next(self._seq), chat_id))
+
+            if not self._ready:
+                self._sweep(now)
+                timeout = self._timers[0][0] - now if self._timers else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Общий лимит: ждем токен, после паузы заново выбираем самый приоритетный чат
+            delay = self.global_bucket.delay(now)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            _, _, chat_id = heapq.heappop(self._ready)
+            chat = self._chats[chat_id]
+            chat.scheduled = False
+            job = chat.jobs.popleft()
+            self.depth -= 1
+            if job.future.done():
+                # Вызвавший перестал ждать (отмена задачи) - не отправляем
+                self._schedule(chat)
+                continue
+            self.global_bucket.consume(now)
+            chat.bucket.consume(now)
+            chat.busy = True
+            self.in_flight += 1
+            self._waits[job.priority].append(now - job.enqueued_at)
+            asyncio.get_running_loop().create_task(self._execute(chat, job))
+
+    async def _execute(self, chat: _Chat, job: _Job):
+        try:
+            result = await job.call()
+        except self.retry_after_errors as e:
+            self.retry_after += 1
+            timeout = getattr(e, 'timeout', None) or getattr(e, 'retry_after', 1)
+            logger.warning(f"⚠️ Flood control для чата {chat.chat_id}: пауза {timeout} сек")
+            self._retry(chat, job, e, timeout)
+        except self.network_errors as e:
+            self._retry(chat, job, e, 2 ** job.attempts)
+        except Exception as e:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self.in_flight -= 1
+            chat.busy = False
+            self._schedule(chat)
+
+    def _retry(self, chat: _Chat, job: _Job, error: Exception, delay: float):
+        """Повтор задания первым в очереди чата после паузы"""
+        job.attempts += 1
+        if not job.retryable or job.attempts > self.max_retries or job.future.done():
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(error)
+            return
+        self.retries += 1
+        chat.paused_until = time.monotonic() + delay
+        chat.jobs.appendleft(job)
+        self.depth += 1
+
+    def _sweep(self, now: float):
+        """Удаление простаивающих чатов с полным bucket (раз в минуту)"""
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        idle = [chat_id for chat_id, chat in self._chats.items()
+                if not chat.jobs and not chat.busy and not chat.scheduled and chat.bucket.is_full(now)]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    async def drain(self, timeout: float) -> bool:
+        """Ожидание отправки всего, что уже в очереди (перед остановкой бота)"""
+        deadline = time.monotonic() + timeout
+        while self.depth or self.in_flight:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    async def close(self, timeout: float) -> bool:
+        """Отправка оставшегося и остановка обработчика очереди"""
+        drained = await self.drain(timeout)
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        return drained
+
+    # ==================== МЕТРИКИ ====================
+
+    def get_stats(self) -> Dict:
+        waits = {}
+        for priority, samples in self._waits.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            waits[PRIORITY_NAMES[priority]] = {
+                'p50': ordered[len(ordered) // 2],
+                'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                'max': ordered[-1]
+            }
+
+        depth_by_priority = {name: 0 for name in PRIORITY_NAMES.values()}
+        for chat in self._chats.values():
+            for job in chat.jobs:
+                depth_by_priority[PRIORITY_NAMES[job.priority]] += 1
+
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'depth_by_priority': depth_by_priority,
+            'in_flight': self.in_flight,
+            'chats': len(self._chats),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retry_after': self.retry_after,
+            'retries': self.retries,
+            'wait': waits
+        }
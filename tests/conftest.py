@@ -0,0 +1,35 @@
+# tests/conftest.py
+"""Общие фикстуры: main.py импортируется один раз во временном каталоге (своя casino.db)
+
+Запуск: python -m pytest -q tests
+"""
+import itertools
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_user_ids = itertools.count(7_000_000)
+
+
+@pytest.fixture(scope='session')
+def main(tmp_path_factory):
+    """Модуль main без настоящего токена; поток БД останавливается в конце сессии"""
+    os.environ.update({'BOT_TOKEN': '123456:TESTS', 'BOT_MODE': 'polling', 'TELEGRAM_API_SERVER': ''})
+    # Настройки по умолчанию из config.py, а не из окружения
+    os.environ.pop('CRYPTOPAY_WEBHOOK', None)
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('main'))
+    import main as module
+    yield module
+    module.db.database.worker.shutdown()
+    os.chdir(cwd)
+
+
+@pytest.fixture
+def user_id():
+    """Новый id пользователя для каждого теста"""
+    return next(_user_ids)
@@ -0,0 +1,58 @@
+# tests/test_bets.py
+"""Расчет ставок: одновременные ставки не уводят баланс в минус и не создают денег"""
+import asyncio
+from types import SimpleNamespace
+
+
+class _State:
+    def __init__(self, data):
+        self.data = data
+        self.finished = False
+
+    async def get_data(self):
+        return self.data
+
+    async def finish(self):
+        self.finished = True
+
+
+def test_concurrent_bets_over_balance(main, user_id, monkeypatch):
+    sent = []
+
+    async def fake_send(chat_id, photo_type, caption='', reply_markup=None, **kwargs):
+        sent.append((photo_type, caption))
+
+    monkeypatch.setattr(main, 'send_photo_message', fake_send)
+    # Проигрыш всегда: итоговый баланс однозначен
+    monkeypatch.setattr(main, 'determine_game_result', lambda game_type, outcome: {'win': False, 'dice_value': 3})
+
+    async def scenario():
+        await main.db.add_user(user_id, 'bettor', 'Bettor')
+        await main.db.add_to_balance(user_id, 10.0, 'deposit', 'Тест')
+
+        # Обе ставки проходят предварительную проверку баланса до списания:
+        # гонку должен решить settle_bet
+        get_cached_balance = main.db.get_cached_balance
+        both_checked, checked = asyncio.Event(), []
+
+        async def racing_balance(uid):
+            balance = await get_cached_balance(uid)
+            checked.append(uid)
+            if len(checked) == 2:
+                both_checked.set()
+            await both_checked.wait()
+            return balance
+
+        monkeypatch.setattr(main.db, 'get_cached_balance', racing_balance)
+        message = lambda: SimpleNamespace(from_user=SimpleNamespace(id=user_id), text='7')
+        state = lambda: _State({'game_type': 'even_odd', 'outcome': 'even'})
+        await asyncio.gather(main.process_bet_amount(message(), state()),
+                             main.process_bet_amount(message(), state()))
+        return await main.db.get_user_balance(user_id)
+
+    balance = asyncio.run(scenario())
+
+    assert balance == 3.0
+    assert [photo_type for photo_type, _ in sent].count('lose') == 1
+    assert [photo_type for photo_type, _ in sent].count('error') == 1
+    assert any('Ставка не принята' in caption for _, caption in sent)
@@ -0,0 +1,75 @@
+# tests/test_check_cleanup.py
+"""Массовое удаление чеков: ошибка getChecks не считается пустой страницей"""
+import asyncio
+
+from check_cleanup import purge_checks
+
+
+class FakeChecksApi:
+    """Активные чеки в памяти; get_checks возвращает None (ошибка API) для вызовов из fail_calls"""
+
+    def __init__(self, count: int, fail_calls=(), fail_after: int = None):
+        self.checks = {check_id: {'check_id': check_id} for check_id in range(1, count + 1)}
+        self.fail_calls = set(fail_calls)
+        self.fail_after = fail_after
+        self.list_calls = 0
+        self.undeletable = set()
+
+    async def get_checks(self, asset=None, status=None, offset=0, count=100):
+        self.list_calls += 1
+        if self.list_calls in self.fail_calls or (self.fail_after is not None and self.list_calls > self.fail_after):
+            return None
+        return list(self.checks.values())[offset:offset + count]
+
+    async def delete_check(self, check_id):
+        if check_id in self.undeletable:
+            return False
+        return self.checks.pop(check_id, None) is not None
+
+
+def _purge(api, **kwargs):
+    return asyncio.run(purge_checks(api, rate=0, backoff=0, page_size=10, **kwargs))
+
+
+def test_transient_listing_error_is_retried():
+    # Ошибка на второй странице: без повтора список оборвался бы на 10 чеках
+    api = FakeChecksApi(25, fail_calls={2})
+    report = _purge(api)
+    assert report['error'] is None
+    assert report['total'] == 25
+    assert report['deleted'] == 25
+    assert not api.checks
+
+
+def test_listing_failure_aborts_with_error():
+    api = FakeChecksApi(25, fail_after=0)
+    report = _purge(api)
+    assert report['error']
+    assert report['total'] == 0
+    assert len(api.checks) == 25
+
+
+def test_failed_verification_counts_leftovers_as_failed():
+    api = FakeChecksApi(5, fail_after=1)
+    api.undeletable = {4, 5}
+    report = _purge(api, attempts=2)
+    assert report['deleted'] == 3
+    assert report['failed'] == 2
+    assert report['gone'] == 0
+
+
+def test_cashed_checks_are_gone_not_failed():
+    api = FakeChecksApi(5)
+    api.undeletable = {4, 5}
+
+    async def delete_check(check_id):
+        # Чек 5 обналичен во время очистки: deleteCheck не проходит, в списке его уже нет
+        if check_id == 5:
+            api.checks.pop(5, None)
+        return check_id not in api.undeletable and api.checks.pop(check_id, None) is not None
+
+    api.delete_check = delete_check
+    report = _purge(api, attempts=2)
+    assert report['deleted'] == 3
+    assert report['gone'] == 1
+    assert report['failed'] == 1
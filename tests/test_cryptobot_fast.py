@@ -0,0 +1,151 @@
+# tests/test_cryptobot_fast.py
+"""CryptoBotTurbo против локального заглушечного сервера: повторы и автоматический выключатель"""
+import asyncio
+
+from aiohttp import web
+
+from cryptobot_fast import CircuitBreaker, CryptoBotTurbo
+
+
+class StubApi:
+    """Отвечает по сценарию: для каждого метода очередь (код, тело), дальше - последний ответ"""
+
+    def __init__(self, script):
+        self.script = {method: list(responses) for method, responses in script.items()}
+        self.calls = {}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] = self.calls.get(method, 0) + 1
+        responses = self.script[method]
+        status, body = responses.pop(0) if len(responses) > 1 else responses[0]
+        return web.json_response(body, status=status)
+
+
+OK = (200, {'ok': True, 'result': {'items': []}})
+FAIL = (500, {'ok': False, 'error': {'code': 500, 'name': 'INTERNAL_ERROR'}})
+
+
+async def _with_stub(script, scenario, breaker=None):
+    stub = StubApi(script)
+    app = web.Application()
+    app.router.add_route('*', '/api/{method}', stub.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    client = CryptoBotTurbo('stub:token', base_url=f'http://127.0.0.1:{port}', retry_backoff=0,
+                            breaker=breaker or CircuitBreaker(threshold=100))
+    try:
+        return await scenario(client, stub)
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+def test_idempotent_method_is_retried():
+    async def scenario(client, stub):
+        invoices = await client.get_invoices(invoice_ids=[1])
+        return invoices, stub.calls['getInvoices']
+
+    invoices, calls = asyncio.run(_with_stub({'getInvoices': [FAIL, FAIL, OK]}, scenario))
+    assert invoices == []
+    assert calls == 3
+
+
+def test_create_invoice_and_transfer_are_not_retried():
+    async def scenario(client, stub):
+        invoice = await client.create_invoice(1.0)
+        transfer = await client.transfer(1, 1.0, spend_id='withdraw-1')
+        return invoice, transfer, stub.calls
+
+    invoice, transfer, calls = asyncio.run(_with_stub({'createInvoice': [FAIL, OK], 'transfer': [FAIL, OK]},
+                                                      scenario))
+    assert not invoice['success']
+    assert not transfer['success']
+    assert calls == {'createInvoice': 1, 'transfer': 1}
+
+
+def test_breaker_opens_and_recovers_after_probe():
+    breaker = CircuitBreaker(threshold=2, reset_timeout=0.2)
+
+    async def scenario(client, stub):
+        rejected = await client.get_me()
+        state_open = breaker.state
+        calls_while_open = stub.calls['getMe']
+        await asyncio.sleep(0.25)
+        probe = await client.get_me()
+        return rejected, state_open, calls_while_open, probe, breaker.state
+
+    rejected, state_open, calls_while_open, probe, state_after = asyncio.run(
+        _with_stub({'getMe': [FAIL, FAIL, OK]}, scenario, breaker))
+    # getMe повторяется дважды: 2 сбоя открывают цепь, третья попытка отклоняется без запроса
+    assert state_open == CircuitBreaker.OPEN
+    assert rejected == {'ok': False, 'error': 'circuit_open'}
+    assert calls_while_open == 2
+    assert probe['ok']
+    assert state_after == CircuitBreaker.CLOSED
+
+
+def test_probe_with_unexpected_exception_releases_breaker():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0.1)
+
+    async def scenario(client, stub):
+        await client.get_me()
+        await asyncio.sleep(0.15)
+        send = client._send
+
+        async def broken_send(*args):
+            raise RuntimeError('ошибка в коде')
+
+        client._send = broken_send
+        failed_probe = await client.get_me()
+        client._send = send
+        next_probe = await client.get_me()
+        return failed_probe, next_probe
+
+    failed_probe, next_probe = asyncio.run(_with_stub({'getMe': [FAIL, OK]}, scenario, breaker))
+    assert failed_probe == {'ok': False, 'error': 'ошибка в коде'}
+    assert next_probe['ok']
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_probe_releases_breaker():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0.1)
+
+    async def scenario(client, stub):
+        await client.get_me()
+        await asyncio.sleep(0.15)
+        send = client._send
+
+        async def hanging_send(*args):
+            await asyncio.sleep(10)
+
+        client._send = hanging_send
+        probe = asyncio.get_running_loop().create_task(client.get_me())
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+        client._send = send
+        return await client.get_me()
+
+    next_probe = asyncio.run(_with_stub({'getMe': [FAIL, OK]}, scenario, breaker))
+    assert next_probe['ok']
+
+
+def test_throttled_probe_does_not_close_breaker():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0.1)
+    throttled = (429, {'ok': False, 'error': {'code': 429, 'name': 'TOO_MANY_REQUESTS'}})
+
+    async def scenario(client, stub):
+        await client.get_me()
+        await asyncio.sleep(0.15)
+        probe = await client.get_me()
+        return probe, stub.calls['getMe']
+
+    probe, calls = asyncio.run(_with_stub({'getMe': [FAIL, throttled]}, scenario, breaker))
+    assert not probe['ok']
+    # Каждая попытка после 429 снова пробная: цепь не закрыта и не заблокирована
+    assert calls > 2
+    assert breaker.state == CircuitBreaker.HALF_OPEN
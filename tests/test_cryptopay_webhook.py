@@ -0,0 +1,89 @@
+# tests/test_cryptopay_webhook.py
+"""Webhook Crypto Pay: зачисление только по депозиту бота и только один раз"""
+import asyncio
+import json
+
+import aiohttp
+from aiohttp import web
+
+from cryptopay_webhook import SIGNATURE_HEADER, CryptoPayWebhook, sign
+
+TOKEN = 'webhook:token'
+
+
+def _paid_invoice(invoice_id: int, amount: float, payload: str) -> dict:
+    return {'invoice_id': invoice_id, 'status': 'paid', 'asset': 'USDT', 'amount': str(amount), 'payload': payload}
+
+
+async def _post_updates(main, updates, signature=None):
+    """Обновления invoice_paid на локальный сервер с CryptoPayWebhook; коды ответов и счетчики"""
+    handler = CryptoPayWebhook(TOKEN, main.on_invoice_paid)
+    app = web.Application()
+    handler.register(app, '/cryptopay')
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/cryptopay"
+    statuses = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            for invoice in updates:
+                body = json.dumps({'update_type': 'invoice_paid', 'payload': invoice}).encode()
+                headers = {SIGNATURE_HEADER: signature or sign(TOKEN, body)}
+                async with session.post(url, data=body, headers=headers) as response:
+                    statuses.append(response.status)
+    finally:
+        await runner.cleanup()
+    return statuses, handler.get_stats()
+
+
+def _silence_notifications(main, monkeypatch):
+    async def fake_send(chat_id, text, **kwargs):
+        return None
+
+    monkeypatch.setattr(main, 'send_message_with_retry', fake_send)
+
+
+def test_duplicate_webhook_credits_once(main, user_id, monkeypatch):
+    _silence_notifications(main, monkeypatch)
+    invoice_id = user_id
+
+    async def scenario():
+        await main.db.add_user(user_id, 'payer', 'Payer')
+        await main.db.create_deposit(user_id, 5.0, {'invoice_id': invoice_id, 'pay_url': 'https://t.me/CryptoBot'})
+        invoice = _paid_invoice(invoice_id, 5.0, str(user_id))
+        rejected = await _post_updates(main, [invoice], signature='0' * 64)
+        accepted = await _post_updates(main, [invoice, invoice])
+        return rejected, accepted, await main.db.get_user_balance(user_id)
+
+    (rejected, _), (statuses, stats), balance = asyncio.run(scenario())
+    assert rejected == [401]
+    assert statuses == [200, 200]
+    assert stats['credited'] == 1
+    assert stats['duplicates'] == 1
+    assert balance == 5.0
+
+
+def test_invoice_without_bot_deposit_is_not_credited(main, user_id, monkeypatch):
+    _silence_notifications(main, monkeypatch)
+    invoice_id = user_id
+
+    async def scenario():
+        await main.db.add_user(user_id, 'target', 'Target')
+        # Счет создан не ботом, но payload указывает на существующего игрока
+        statuses, stats = await _post_updates(main, [_paid_invoice(invoice_id, 50.0, str(user_id))])
+        deposits = await main.db.run(lambda: main.db.database.connection.execute(
+            'SELECT COUNT(*) FROM deposits WHERE invoice_id = ?', (str(invoice_id),)).fetchone()[0])
+        return statuses, stats, deposits, await main.db.get_user_balance(user_id)
+
+    statuses, stats, deposits, balance = asyncio.run(scenario())
+    assert statuses == [200]
+    assert stats['credited'] == 0
+    assert deposits == 0
+    assert balance == 0
+
+
+def test_listener_is_off_by_default(main):
+    assert main.CRYPTOPAY_WEBHOOK is False
+    assert all(route.resource.canonical != main.CRYPTOPAY_WEBHOOK_PATH for route in main.create_web_app().router.routes())
@@ -0,0 +1,45 @@
+# tests/test_log_buffer.py
+"""Буфер логов не пишет в чужую транзакцию"""
+import sqlite3
+
+from log_buffer import LogBuffer
+
+
+def _connection():
+    connection = sqlite3.connect(':memory:')
+    connection.execute('''
+        CREATE TABLE logs (level TEXT, module TEXT, function TEXT, message TEXT,
+                           user_id INTEGER, data TEXT, created_at TEXT)
+    ''')
+    connection.execute('CREATE TABLE users (user_id INTEGER)')
+    connection.commit()
+    return connection
+
+
+def _row(message):
+    return ('INFO', 'tests', 'test', message, None, None, '2026-01-01 00:00:00')
+
+
+def test_rows_survive_rollback_of_callers_transaction():
+    connection = _connection()
+    buffer = LogBuffer(flush_size=1)
+
+    connection.execute('INSERT INTO users VALUES (1)')
+    buffer.append(connection, _row('во время транзакции'))
+    connection.rollback()
+
+    assert len(buffer) == 1
+    assert buffer.flush(connection) == 1
+    assert connection.execute('SELECT message FROM logs').fetchall() == [('во время транзакции',)]
+    assert len(buffer) == 0
+
+
+def test_failed_commit_keeps_rows():
+    connection = _connection()
+    buffer = LogBuffer(flush_size=10)
+    buffer.append(connection, _row('первая'))
+    connection.execute('DROP TABLE logs')
+    connection.commit()
+
+    assert buffer.flush(connection) == 0
+    assert len(buffer) == 1
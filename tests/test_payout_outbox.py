@@ -0,0 +1,102 @@
+# tests/test_payout_outbox.py
+"""Очередь выплат: повтор после потерянного ответа не отправляет выплату в dead-letter"""
+import asyncio
+
+from cryptobot_emulator import CryptoBotEmulator, start_emulator
+from cryptobot_fast import CryptoBotTurbo
+from payout_outbox import PayoutOutbox
+
+TOKEN = 'outbox:token'
+
+
+def _pay_with_lost_response(main, user_id, lookup_failures: int):
+    """Первый transfer проходит, но его ответ теряется; find_transfer недоступен lookup_failures раз"""
+    db = main.db
+
+    async def scenario():
+        emulator = CryptoBotEmulator(token=TOKEN)
+        runner, base_url = await start_emulator(emulator)
+        client = CryptoBotTurbo(TOKEN, base_url=base_url, retry_backoff=0)
+        calls, lookups = [], []
+
+        async def transfer(uid, amount, currency, spend_id):
+            result = await client.transfer(uid, amount, currency, spend_id=spend_id)
+            calls.append(result)
+            if len(calls) == 1:
+                # Перевод проведен, но ответ потерян: для очереди это таймаут
+                return {'success': False, 'error': 'timeout'}
+            return result
+
+        async def find_transfer(spend_id):
+            lookups.append(spend_id)
+            if len(lookups) <= lookup_failures:
+                raise RuntimeError('getTransfers недоступен')
+            transfers = await client.get_transfers(spend_id=spend_id, count=1)
+            return transfers[0] if transfers else None
+
+        outbox = PayoutOutbox(db, transfer, workers=1, poll_interval=0.05, max_attempts=3, backoff_base=0,
+                              find_transfer=find_transfer)
+        try:
+            await db.add_user(user_id, 'payee', 'Payee')
+            await db.add_to_balance(user_id, 10.0, 'deposit', 'Тест')
+            withdrawal = await db.create_withdrawal(user_id, 4.0)
+            await outbox.start()
+            outbox.notify()
+            for _ in range(100):
+                stats = await outbox.get_stats()
+                if not stats['pending'] and not stats['processing']:
+                    break
+                await asyncio.sleep(0.05)
+            await outbox.close(1)
+            row = await db.run(lambda: dict(db.database.connection.execute(
+                'SELECT status, attempts, tx_hash FROM withdrawals WHERE id = ?',
+                (withdrawal['withdrawal_id'],)).fetchone()))
+            return row, calls, emulator.stats, outbox.reconciled
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    return asyncio.run(scenario())
+
+
+def test_timeout_of_successful_transfer_is_reconciled(main, user_id):
+    row, calls, emulator_stats, reconciled = _pay_with_lost_response(main, user_id, lookup_failures=0)
+
+    assert len(calls) == 1
+    assert row['status'] == 'completed'
+    assert row['attempts'] == 1
+    assert row['tx_hash'] == str(calls[0]['transfer_id'])
+    assert reconciled == 1
+    assert emulator_stats['transfers'] == 1
+
+
+def test_retry_after_timeout_of_successful_transfer(main, user_id):
+    row, calls, emulator_stats, reconciled = _pay_with_lost_response(main, user_id, lookup_failures=1)
+
+    # Вторая попытка отклонена как повтор spend_id, перевод найден через getTransfers
+    assert len(calls) == 2
+    assert not calls[1]['success']
+    assert row['status'] == 'completed'
+    assert row['attempts'] == 2
+    assert row['tx_hash'] == str(calls[0]['transfer_id'])
+    assert reconciled == 1
+    assert emulator_stats['transfers'] == 1
+    assert emulator_stats['duplicate_transfers'] == 1
+
+
+def test_withdrawal_during_deposit_is_not_overwritten(main, user_id):
+    db = main.db
+
+    async def scenario():
+        await db.add_user(user_id, 'payee', 'Payee')
+        await db.add_to_balance(user_id, 10.0, 'deposit', 'Тест')
+        # Вывод без блокировки пользователя встает в очередь потока БД рядом с зачислением
+        credited, withdrawal = await asyncio.gather(db.add_to_balance(user_id, 5.0, 'deposit', 'Тест'),
+                                                    db.create_withdrawal(user_id, 3.0))
+        return credited, withdrawal, await db.run(lambda: db.database.connection.execute(
+            'SELECT balance FROM users WHERE user_id = ?', (user_id,)).fetchone()[0])
+
+    credited, withdrawal, balance = asyncio.run(scenario())
+    assert credited
+    assert withdrawal['success']
+    assert balance == 12.0
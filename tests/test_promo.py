@@ -0,0 +1,44 @@
+# tests/test_promo.py
+"""Промокоды: активация и начисление бонуса фиксируются одной транзакцией"""
+import asyncio
+
+
+def _promo_state(main, user_id, code):
+    connection = main.db.database.connection
+    used = connection.execute('SELECT used_count FROM promo_codes WHERE code = ?', (code,)).fetchone()[0]
+    activations = connection.execute('SELECT COUNT(*) FROM promo_activations WHERE user_id = ? AND promo_code = ?',
+                                     (user_id, code)).fetchone()[0]
+    credits = connection.execute("SELECT COUNT(*) FROM transactions WHERE user_id = ? AND type = 'promo'",
+                                 (user_id,)).fetchone()[0]
+    return used, activations, credits
+
+
+def test_repeated_activation_credits_once(main, user_id):
+    db = main.db
+    code = f'BONUS{user_id}'
+
+    async def scenario():
+        await db.add_user(user_id, 'promo', 'Promo')
+        await db.create_promo_code(code, 2.0, max_uses=5)
+        results = await asyncio.gather(db.activate_promo_code(user_id, code), db.activate_promo_code(user_id, code))
+        return results, await db.get_user_balance(user_id), await db.run(_promo_state, main, user_id, code)
+
+    results, balance, state = asyncio.run(scenario())
+    assert sorted(result['success'] for result in results) == [False, True]
+    assert balance == 2.0
+    assert state == (1, 1, 1)
+
+
+def test_failed_credit_rolls_back_activation(main, user_id):
+    db = main.db
+    code = f'GHOST{user_id}'
+
+    async def scenario():
+        # Пользователя нет в users: начислить бонус некуда
+        await db.create_promo_code(code, 2.0, max_uses=5)
+        result = await db.activate_promo_code(user_id, code)
+        return result, await db.run(_promo_state, main, user_id, code)
+
+    result, state = asyncio.run(scenario())
+    assert not result['success']
+    assert state == (0, 0, 0)
@@ -0,0 +1,129 @@
+# user_cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+try:
+    from config import USER_CACHE_SIZE, USER_CACHE_TTL
+except ImportError:
+    USER_CACHE_SIZE = 10000
+    USER_CACHE_TTL = 300
+
+
+class CachedUser:
+    """Компактная запись пользователя для горячего пути (ставки, проверка блокировки)
+
+    Поддерживает user.get('field') и user['field'], поэтому подходит туда,
+    где раньше передавался словарь из get_user.
+    """
+
+    FIELDS = ('user_id', 'username', 'first_name', 'balance', 'is_blocked', 'block_reason', 'vip_level')
+    __slots__ = FIELDS + ('loaded_at',)
+
+    def __init__(self, user_id: int, username: str = None, first_name: str = None, balance: float = 0.0,
+                 is_blocked: int = 0, block_reason: str = '', vip_level: str = 'STANDARD'):
+        self.user_id = user_id
+        self.username = username
+        self.first_name = first_name
+        self.balance = balance
+        self.is_blocked = is_blocked
+        self.block_reason = block_reason
+        self.vip_level = vip_level
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def from_row(cls, row) -> 'CachedUser':
+        return cls(*(row[field] for field in cls.FIELDS))
+
+    def get(self, key: str, default=None):
+        value = getattr(self, key, None) if key in self.FIELDS else None
+        return default if value is None else value
+
+    def __getitem__(self, key: str):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __bool__(self) -> bool:
+        return True
+
+
+class UserCache:
+    """LRU-кэш пользователей с ограничением по размеру и времени жизни
+
+    Заполняется при чтении и обновляется при записи (write-through) из методов
+    Database, меняющих баланс или блокировку, поэтому устаревший баланс не
+    отдается. Читается из event loop, пишется из потока БД, отсюда lock.
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._users: 'OrderedDict[int, CachedUser]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: int) -> Optional[CachedUser]:
+        """Запись из кэша или None (промах или истек TTL)"""
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                self.misses += 1
+                return None
+
+            if time.monotonic() - user.loaded_at > self.ttl:
+                del self._users[user_id]
+                self.misses += 1
+                return None
+
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return user
+
+    def put(self, user: CachedUser):
+        """Добавление или замена записи"""
+        with self._lock:
+            self._users[user.user_id] = user
+            self._users.move_to_end(user.user_id)
+
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+                self.evictions += 1
+
+    def set_balance(self, user_id: int, balance: float):
+        """Запись нового баланса в уже закэшированного пользователя"""
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is not None:
+                user.balance = balance
+
+    def set_blocked(self, user_id: int, is_blocked: bool, reason: str = ''):
+        """Запись статуса блокировки в уже закэшированного пользователя"""
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is not None:
+                user.is_blocked = 1 if is_blocked else 0
+                user.block_reason = reason
+
+    def invalidate(self, user_id: int = None):
+        """Удаление пользователя из кэша (или очистка всего кэша)"""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+
+    def get_stats(self) -> Dict:
+        """Счетчики попаданий и промахов"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._users),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits / total * 100) if total else 0.0
+        }
@@ -0,0 +1,85 @@
+# user_locks.py
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List
+
+try:
+    from config import USER_LOCK_STRIPES
+except ImportError:
+    USER_LOCK_STRIPES = 64
+
+
+class StripedLock:
+    """Блокировки по пользователям с фиксированным числом полос
+
+    Пользователь всегда попадает в одну и ту же полосу (user_id % stripes),
+    поэтому операции одного игрока выполняются строго по очереди, а игроки
+    из разных полос не ждут друг друга. Память не растет с числом пользователей.
+    """
+
+    def __init__(self, stripes: int = USER_LOCK_STRIPES):
+        self.stripes = stripes
+        self._locks = [asyncio.Lock() for _ in range(stripes)]
+        self._acquisitions = [0] * stripes
+        self._contended = [0] * stripes
+        self._wait_total = [0.0] * stripes
+        self._wait_max = [0.0] * stripes
+
+    def _index(self, user_id: int) -> int:
+        return hash(user_id) % self.stripes
+
+    @asynccontextmanager
+    async def lock(self, user_id: int):
+        """Захват полосы пользователя с учетом времени ожидания"""
+        index = self._index(user_id)
+        stripe = self._locks[index]
+
+        if stripe.locked():
+            self._contended[index] += 1
+
+        start = time.perf_counter()
+        async with stripe:
+            waited = time.perf_counter() - start
+            self._acquisitions[index] += 1
+            self._wait_total[index] += waited
+            if waited > self._wait_max[index]:
+                self._wait_max[index] = waited
+            yield
+
+    def get_stats(self, top: int = 5) -> Dict:
+        """Метрика конкуренции: ожидание захвата по полосам"""
+        acquisitions = sum(self._acquisitions)
+        wait_total = sum(self._wait_total)
+
+        hottest: List[Dict] = sorted(
+            (
+                {
+                    'stripe': index,
+                    'acquisitions': self._acquisitions[index],
+                    'contended': self._contended[index],
+                    'wait_total_ms': self._wait_total[index] * 1000,
+                    'wait_max_ms': self._wait_max[index] * 1000
+                }
+                for index in range(self.stripes) if self._acquisitions[index]
+            ),
+            key=lambda stripe: stripe['wait_total_ms'],
+            reverse=True
+        )[:top]
+
+        return {
+            'stripes': self.stripes,
+            'acquisitions': acquisitions,
+            'contended': sum(self._contended),
+            'wait_total_ms': wait_total * 1000,
+            'wait_avg_ms': (wait_total / acquisitions * 1000) if acquisitions else 0.0,
+            'wait_max_ms': max(self._wait_max) * 1000,
+            'hottest': hottest
+        }
+
+    def reset_stats(self):
+        """Сброс счетчиков конкуренции"""
+        self._acquisitions = [0] * self.stripes
+        self._contended = [0] * self.stripes
+        self._wait_total = [0.0] * self.stripes
+        self._wait_max = [0.0] * self.stripes
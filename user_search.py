@@ -0,0 +1,133 @@
+# user_search.py
+"""Полнотекстовый поиск пользователей для админки (FTS5)
+
+Два индекса над users (external content - хранят только индекс, не копию строк):
+- users_fts_words: слова (unicode61) с префиксным индексом - «ива» находит «Иван»;
+- users_fts_trigram: триграммы - подстрока внутри слова, как LIKE '%...%'.
+Триггеры обновляют оба индекса в той же транзакции, что и users, и только
+при изменении username/first_name/last_name (не на каждое изменение баланса).
+"""
+import logging
+import re
+import sqlite3
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLES = {
+    'users_fts_words': "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4'",
+    'users_fts_trigram': "tokenize = 'trigram'"
+}
+
+COLUMNS = ('username', 'first_name', 'last_name')
+
+# Вес совпадения в username выше, чем в имени
+BM25_WEIGHTS = '10.0, 4.0, 4.0'
+
+# Сколько совпадений ранжируется (редкие запросы ранжируются полностью)
+RANK_WINDOW = 200
+
+# Триграммный индекс ищет подстроки не короче трех символов
+TRIGRAM_MIN_LENGTH = 3
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def _create_statements(table: str, options: str) -> List[str]:
+    columns = ', '.join(COLUMNS)
+    new_values = ', '.join(f'new.{column}' for column in COLUMNS)
+    old_values = ', '.join(f'old.{column}' for column in COLUMNS)
+    changed = ' OR '.join(f'old.{column} IS NOT new.{column}' for column in COLUMNS)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+        f"{columns}, content = 'users', content_rowid = 'user_id', {options})",
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON users
+        BEGIN
+            INSERT INTO {table} (rowid, {columns}) VALUES (new.user_id, {new_values});
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON users
+        BEGIN
+            INSERT INTO {table} ({table}, rowid, {columns}) VALUES ('delete', old.user_id, {old_values});
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE OF {columns} ON users
+        WHEN {changed}
+        BEGIN
+            INSERT INTO {table} ({table}, rowid, {columns}) VALUES ('delete', old.user_id, {old_values});
+            INSERT INTO {table} (rowid, {columns}) VALUES (new.user_id, {new_values});
+        END
+        '''
+    ]
+
+
+def install(connection) -> bool:
+    """Создание индексов и триггеров; False - SQLite собран без FTS5 (остается LIKE)"""
+    try:
+        for table, options in FTS_TABLES.items():
+            exists = connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()
+            for statement in _create_statements(table, options):
+                connection.execute(statement)
+            if not exists:
+                # Индекс по уже существующим пользователям
+                connection.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+                logger.info(f"✅ Построен индекс поиска {table}")
+        connection.commit()
+        return True
+    except sqlite3.OperationalError as e:
+        connection.rollback()
+        logger.warning(f"⚠️ FTS5 недоступен, поиск пользователей через LIKE: {e}")
+        return False
+
+
+def _quote(token: str) -> str:
+    return '"' + token.replace('"', '""') + '"'
+
+
+def search(connection, query: str, limit: int = 50) -> List[Dict]:
+    """Пользователи по словам запроса: точные слова, начало слов, затем подстроки
+
+    Запрос с @ ищется только в username. Результаты ранжируются bm25
+    (совпадение в username весит больше).
+    """
+    tokens = _TOKEN.findall(query.lstrip('@'))
+    if not tokens:
+        return []
+    column_filter = 'username : ' if query.startswith('@') else ''
+
+    found: List[Dict] = []
+    seen = set()
+
+    def collect(table: str, match: str):
+        # bm25 считается только для первых RANK_WINDOW совпадений: для частого
+        # слова («Иван») сортировка всех совпадений стоила бы сотни мс
+        rows = connection.execute(f'''
+            SELECT users.* FROM (
+                SELECT rowid, bm25({table}, {BM25_WEIGHTS}) AS score FROM {table}
+                WHERE {table} MATCH ?
+                LIMIT ?
+            ) AS matched
+            JOIN users ON users.user_id = matched.rowid
+            ORDER BY matched.score
+            LIMIT ?
+        ''', (match, RANK_WINDOW, limit))
+        for row in rows:
+            if row['user_id'] not in seen and len(found) < limit:
+                seen.add(row['user_id'])
+                found.append(dict(row))
+
+    # Сначала слова целиком, затем каждое слово запроса - начало слова в username или имени
+    collect('users_fts_words', ' AND '.join(column_filter + _quote(token) for token in tokens))
+    if len(found) < limit:
+        collect('users_fts_words', ' AND '.join(column_filter + _quote(token) + '*' for token in tokens))
+
+    # Добор подстрок внутри слов («ван» -> «Иван»), если слова запроса достаточно длинные
+    if len(found) < limit and all(len(token) >= TRIGRAM_MIN_LENGTH for token in tokens):
+        collect('users_fts_trigram', ' AND '.join(column_filter + _quote(token) for token in tokens))
+
+    return found